@@ -1,10 +1,15 @@
 #!/bin/env python3
 import sys
 import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from typing import List, Dict, Tuple, Union, Set, Optional
 
+import numpy as np
+
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # ARAXQuery directory
 from ARAX_response import ARAXResponse
+from kg_adjacency_index import KGAdjacencyIndex
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/Expand/")
 import expand_utilities as eu
 from expand_utilities import QGOrganizedKnowledgeGraph
@@ -23,6 +28,7 @@ class ARAXExpander:
 
     def __init__(self):
         self.default_kp = "ARAX/KG2"
+        self.single_node_query_kps = ["ARAX/KG1", "ARAX/KG2"]
         self.protein_category = "biolink:Protein"
         self.gene_category = "biolink:Gene"
         self.edge_key_parameter_info = {
@@ -61,6 +67,26 @@ class ARAXExpander:
             "type": "boolean",
             "description": "Whether to consider curie synonyms and merge synonymous nodes."
         }
+        self.kp_timeout_parameter_info = {
+            "is_required": False,
+            "examples": [60, 300],
+            "min": 1,
+            "max": 3600,
+            "type": "integer",
+            "description": "The maximum number of seconds to wait for each KP to answer a query edge (default is no "
+                           "limit). KPs that don't answer in time are skipped; when several KPs are listed (e.g., "
+                           "kp=[ARAX/KG2, BTE]), they are queried concurrently and the others' answers are still used."
+        }
+        self.max_edges_parameter_info = {
+            "is_required": False,
+            "examples": [1000, 50000],
+            "min": 1,
+            "max": 1000000,
+            "type": "integer",
+            "description": "The maximum number of edges to retrieve per query edge; results are streamed back from "
+                           "Neo4j and the query stops once this many edges are found (default is no limit). Only "
+                           "applies when Neo4j is queried directly (KG1, or KG2 in RTXKG2 mode)."
+        }
         self.command_definitions = {
             "ARAX/KG1": {
                 "dsl_command": "expand(kp=ARAX/KG1)",
@@ -70,8 +96,10 @@ class ARAXExpander:
                     "edge_key": self.edge_key_parameter_info,
                     "node_key": self.node_key_parameter_info,
                     "continue_if_no_results": self.continue_if_no_results_parameter_info,
+                    "kp_timeout": self.kp_timeout_parameter_info,
                     "enforce_directionality": self.enforce_directionality_parameter_info,
-                    "use_synonyms": self.use_synonyms_parameter_info
+                    "use_synonyms": self.use_synonyms_parameter_info,
+                    "max_edges": self.max_edges_parameter_info
                 }
             },
             "ARAX/KG2": {
@@ -83,8 +111,10 @@ class ARAXExpander:
                     "edge_key": self.edge_key_parameter_info,
                     "node_key": self.node_key_parameter_info,
                     "continue_if_no_results": self.continue_if_no_results_parameter_info,
+                    "kp_timeout": self.kp_timeout_parameter_info,
                     "enforce_directionality": self.enforce_directionality_parameter_info,
-                    "use_synonyms": self.use_synonyms_parameter_info
+                    "use_synonyms": self.use_synonyms_parameter_info,
+                    "max_edges": self.max_edges_parameter_info
                 }
             },
             "BTE": {
@@ -99,6 +129,7 @@ class ARAXExpander:
                     "edge_key": self.edge_key_parameter_info,
                     "node_key": self.node_key_parameter_info,
                     "continue_if_no_results": self.continue_if_no_results_parameter_info,
+                    "kp_timeout": self.kp_timeout_parameter_info,
                     "enforce_directionality": self.enforce_directionality_parameter_info,
                     "use_synonyms": self.use_synonyms_parameter_info
                 }
@@ -111,6 +142,7 @@ class ARAXExpander:
                     "edge_key": self.edge_key_parameter_info,
                     "node_key": self.node_key_parameter_info,
                     "continue_if_no_results": self.continue_if_no_results_parameter_info,
+                    "kp_timeout": self.kp_timeout_parameter_info,
                     "use_synonyms": self.use_synonyms_parameter_info,
                     "COHD_method": {
                         "is_required": False,
@@ -146,6 +178,7 @@ class ARAXExpander:
                     "edge_key": self.edge_key_parameter_info,
                     "node_key": self.node_key_parameter_info,
                     "continue_if_no_results": self.continue_if_no_results_parameter_info,
+                    "kp_timeout": self.kp_timeout_parameter_info,
                     "use_synonyms": self.use_synonyms_parameter_info,
                     "include_all_scores": {
                         "is_required": False,
@@ -170,6 +203,7 @@ class ARAXExpander:
                     "edge_key": self.edge_key_parameter_info,
                     "node_key": self.node_key_parameter_info,
                     "continue_if_no_results": self.continue_if_no_results_parameter_info,
+                    "kp_timeout": self.kp_timeout_parameter_info,
                     "use_synonyms": self.use_synonyms_parameter_info,
                 }
             },
@@ -183,6 +217,7 @@ class ARAXExpander:
                     "edge_key": self.edge_key_parameter_info,
                     "node_key": self.node_key_parameter_info,
                     "continue_if_no_results": self.continue_if_no_results_parameter_info,
+                    "kp_timeout": self.kp_timeout_parameter_info,
                     "use_synonyms": self.use_synonyms_parameter_info
                 }
             },
@@ -198,6 +233,7 @@ class ARAXExpander:
                     "edge_key": self.edge_key_parameter_info,
                     "node_key": self.node_key_parameter_info,
                     "continue_if_no_results": self.continue_if_no_results_parameter_info,
+                    "kp_timeout": self.kp_timeout_parameter_info,
                     "use_synonyms": self.use_synonyms_parameter_info,
                     "DTD_threshold": {
                         "is_required": False,
@@ -262,17 +298,19 @@ class ARAXExpander:
             log.error("Provided parameters is not a dict", error_code="ParametersNotDict")
             return response
 
-        # Define a complete set of allowed parameters and their defaults
+        # Define a complete set of allowed parameters and their defaults (multiple KPs may be specified)
         kp = input_parameters.get("kp", self.default_kp)
-        if kp not in self.command_definitions:
+        kps = eu.convert_string_or_list_to_list(kp)
+        if not kps or any(kp_name not in self.command_definitions for kp_name in kps):
             log.error(f"Invalid KP. Options are: {set(self.command_definitions)}", error_code="InvalidKP")
             return response
         parameters = {"kp": kp}
-        for kp_parameter_name, info_dict in self.command_definitions[kp]["parameters"].items():
-            if info_dict["type"] == "boolean":
-                parameters[kp_parameter_name] = self._convert_bool_string_to_bool(info_dict.get("default", ""))
-            else:
-                parameters[kp_parameter_name] = info_dict.get("default", None)
+        for kp_name in kps:
+            for kp_parameter_name, info_dict in self.command_definitions[kp_name]["parameters"].items():
+                if info_dict["type"] == "boolean":
+                    parameters[kp_parameter_name] = self._convert_bool_string_to_bool(info_dict.get("default", ""))
+                else:
+                    parameters[kp_parameter_name] = info_dict.get("default", None)
 
         # Override default values for any parameters passed in
         parameter_names_for_all_kps = {param for kp_documentation in self.command_definitions.values() for param in kp_documentation["parameters"]}
@@ -284,8 +322,9 @@ class ARAXExpander:
                 parameters[param_name] = self._convert_bool_string_to_bool(value) if isinstance(value, str) else value
 
         # Handle situation where 'ARAX/KG2c' is entered as the kp (technically invalid, but we won't error out)
-        if parameters['kp'].upper() == "ARAX/KG2C":
-            parameters['kp'] = "ARAX/KG2"
+        if any(kp_name.upper() == "ARAX/KG2C" for kp_name in kps):
+            kps = ["ARAX/KG2" if kp_name.upper() == "ARAX/KG2C" else kp_name for kp_name in kps]
+            parameters['kp'] = kps if len(kps) > 1 else kps[0]
             if not parameters['use_synonyms']:
                 log.warning(f"KG2c is only used when use_synonyms=true; overriding use_synonyms to True")
                 parameters['use_synonyms'] = True
@@ -313,9 +352,10 @@ class ARAXExpander:
         log.debug(f"Applying Expand to Message with parameters {parameters}")
         input_qedge_keys = eu.convert_string_or_list_to_list(parameters['edge_key'])
         input_qnode_keys = eu.convert_string_or_list_to_list(parameters['node_key'])
-        kp_to_use = parameters['kp']
+        kps_to_use = eu.convert_string_or_list_to_list(parameters['kp'])
         continue_if_no_results = parameters['continue_if_no_results']
         use_synonyms = parameters['use_synonyms']
+        kp_timeout = float(parameters['kp_timeout']) if parameters.get('kp_timeout') is not None else None
 
         # Convert message knowledge graph to format organized by QG keys, for faster processing
         dict_kg = eu.convert_standard_kg_to_qg_organized_kg(message.knowledge_graph)
@@ -333,42 +373,50 @@ class ARAXExpander:
                 return response
             log.debug(f"Query graph for this Expand() call is: {query_sub_graph.to_dict()}")
 
-            # Expand the query graph edge by edge (much faster for neo4j queries, and allows easy integration with BTE)
+            # Expand the query graph edge by edge (much faster for neo4j queries, and allows easy integration with BTE);
+            # independent qedges (and all KPs for a given qedge) are queried concurrently
             ordered_qedge_keys_to_expand = self._get_order_to_expand_qedges_in(query_sub_graph, log)
 
-            for qedge_key in ordered_qedge_keys_to_expand:
-                qedge = query_graph.edges[qedge_key]
-                answer_kg, edge_node_usage_map = self._expand_edge(qedge_key, kp_to_use, dict_kg, continue_if_no_results,
-                                                                   query_graph, use_synonyms, mode, log)
-                if log.status != 'OK':
-                    return response
-                elif qedge.exclude and not answer_kg.is_empty():
-                    self._store_kryptonite_edge_info(edge_node_usage_map, qedge_key, query_graph, encountered_kryptonite_edges_info, log)
-                else:
-                    # Update our map of which qnodes each of an edge's nodes fulfill (differs from source vs. target)
-                    if qedge_key not in node_usages_by_edges_map:
-                        node_usages_by_edges_map[qedge_key] = dict()
-                    node_usages_by_edges_map[qedge_key].update(edge_node_usage_map)
-                    self._merge_answer_into_message_kg(answer_kg, dict_kg, log)
+            for qedge_keys_in_wave in self._get_concurrent_expansion_waves(ordered_qedge_keys_to_expand, query_graph):
+                answers_by_qedge = self._expand_edges_concurrently(qedge_keys_in_wave, kps_to_use, dict_kg,
+                                                                   continue_if_no_results, query_graph, use_synonyms,
+                                                                   mode, kp_timeout, log)
                 if log.status != 'OK':
                     return response
 
-                self._apply_any_kryptonite_edges(dict_kg, query_graph, node_usages_by_edges_map, encountered_kryptonite_edges_info, log)
-                self._prune_dead_end_paths(dict_kg, query_sub_graph, node_usages_by_edges_map, qedge, log)
-                if log.status != 'OK':
-                    return response
+                for qedge_key in qedge_keys_in_wave:
+                    qedge = query_graph.edges[qedge_key]
+                    for answer_kg, edge_node_usage_map in answers_by_qedge[qedge_key]:
+                        if qedge.exclude and not answer_kg.is_empty():
+                            self._store_kryptonite_edge_info(edge_node_usage_map, qedge_key, query_graph, encountered_kryptonite_edges_info, log)
+                        else:
+                            # Update our map of which qnodes each of an edge's nodes fulfill (differs from source vs. target)
+                            if qedge_key not in node_usages_by_edges_map:
+                                node_usages_by_edges_map[qedge_key] = dict()
+                            node_usages_by_edges_map[qedge_key].update(edge_node_usage_map)
+                            self._merge_answer_into_message_kg(answer_kg, dict_kg, log)
+                        if log.status != 'OK':
+                            return response
+
+                    self._apply_any_kryptonite_edges(dict_kg, query_graph, node_usages_by_edges_map, encountered_kryptonite_edges_info, log)
+                    self._prune_dead_end_paths(dict_kg, query_sub_graph, node_usages_by_edges_map, qedge, log)
+                    if log.status != 'OK':
+                        return response
 
         # Expand any specified nodes
         if input_qnode_keys:
+            # Only some KPs can answer single-node queries; fall back to the first KP (for a proper error) if none can
+            node_kps_to_use = [kp_name for kp_name in kps_to_use if kp_name in self.single_node_query_kps] or kps_to_use[:1]
             for qnode_key in input_qnode_keys:
-                answer_kg = self._expand_node(qnode_key, kp_to_use, continue_if_no_results, query_graph, use_synonyms,
-                                              mode, log)
-                if log.status != 'OK':
-                    return response
+                for kp_to_use in node_kps_to_use:
+                    answer_kg = self._expand_node(qnode_key, kp_to_use, continue_if_no_results, query_graph, use_synonyms,
+                                                  mode, log)
+                    if log.status != 'OK':
+                        return response
 
-                self._merge_answer_into_message_kg(answer_kg, dict_kg, log)
-                if log.status != 'OK':
-                    return response
+                    self._merge_answer_into_message_kg(answer_kg, dict_kg, log)
+                    if log.status != 'OK':
+                        return response
 
         # Convert message knowledge graph back to API standard format
         message.knowledge_graph = eu.convert_qg_organized_kg_to_standard_kg(dict_kg)
@@ -386,7 +434,7 @@ class ARAXExpander:
         # Return the response and done
         only_kryptonite_qedges_expanded = all([query_graph.edges[qedge_key].exclude for qedge_key in input_qedge_keys])
         if not kg.nodes and not continue_if_no_results and not only_kryptonite_qedges_expanded:
-            log.error(f"No paths were found in {kp_to_use} satisfying this query graph", error_code="NoResults")
+            log.error(f"No paths were found in {', '.join(kps_to_use)} satisfying this query graph", error_code="NoResults")
         else:
             log.info(f"After Expand, the KG has {len(kg.nodes)} nodes and {len(kg.edges)} edges "
                      f"({eu.get_printable_counts_by_qg_id(dict_kg)})")
@@ -464,6 +512,85 @@ class ARAXExpander:
 
             return answer_kg, edge_to_nodes_map
 
+    def _expand_edges_concurrently(self, qedge_keys: List[str], kps_to_use: List[str], dict_kg: QGOrganizedKnowledgeGraph,
+                                   continue_if_no_results: bool, query_graph: QueryGraph, use_synonyms: bool, mode: str,
+                                   kp_timeout: Optional[float], log: ARAXResponse) -> Dict[str, List[Tuple[QGOrganizedKnowledgeGraph, Dict[str, Dict[str, str]]]]]:
+        """
+        This function expands each of the given (independent) qedges using each of the given KPs, all at once. Each KP
+        query logs to its own response object, whose messages are streamed as they are logged and which is merged into
+        the main log as soon as that KP is done (whether it succeeded or not). KPs that don't answer within kp_timeout
+        seconds are abandoned: each KP query works on its own copy of the KG, so one that is still running can't touch
+        anything that's used afterwards. When multiple KPs are used, a failure by one of them is only a warning, as long
+        as some KP fulfills the qedge.
+        """
+        tolerate_kp_failures = len(kps_to_use) > 1
+        executor = ThreadPoolExecutor(max_workers=len(qedge_keys) * len(kps_to_use))
+        futures = dict()
+        for qedge_key in qedge_keys:
+            for kp_to_use in kps_to_use:
+                kp_log = ARAXResponse()
+                kp_log.data['parameters'] = dict(log.data.get('parameters', dict()), kp=kp_to_use)
+                kp_log.message_queue = log.message_queue
+                kg_snapshot = QGOrganizedKnowledgeGraph(nodes={key: dict(nodes) for key, nodes in dict_kg.nodes_by_qg_id.items()},
+                                                        edges={key: dict(edges) for key, edges in dict_kg.edges_by_qg_id.items()})
+                future = executor.submit(self._expand_edge, qedge_key, kp_to_use, kg_snapshot,
+                                         continue_if_no_results or tolerate_kp_failures, query_graph, use_synonyms, mode,
+                                         kp_log)
+                futures[future] = (qedge_key, kp_to_use, kp_log)
+
+        answers = dict()
+        try:
+            for future in as_completed(futures, timeout=kp_timeout):
+                qedge_key, kp_to_use, kp_log = futures[future]
+                if future.exception():
+                    tb = "".join(traceback.format_exception(type(future.exception()), future.exception(),
+                                                            future.exception().__traceback__))
+                    kp_log.error(f"Encountered a problem expanding qedge {qedge_key} using {kp_to_use}: {tb}",
+                                 error_code=type(future.exception()).__name__)
+                self._merge_kp_log(kp_log, qedge_key, kp_to_use, tolerate_kp_failures, log)
+                if kp_log.status == 'OK':
+                    answers[future] = future.result()
+        except FuturesTimeoutError:
+            for future, (qedge_key, kp_to_use, kp_log) in futures.items():
+                if not future.done():
+                    future.cancel()
+                    kp_log.error(f"{kp_to_use} did not answer qedge {qedge_key} within {kp_timeout} seconds",
+                                 error_code="KPTimeout")
+                    self._merge_kp_log(kp_log, qedge_key, kp_to_use,
+                                       tolerate_kp_failures or continue_if_no_results, log)
+                    kp_log.message_queue = None  # Anything it logs from now on is dropped
+        executor.shutdown(wait=False)  # Don't let a KP that timed out hold us up
+
+        # Use the KP answers in a deterministic order (the order they were submitted in)
+        answers_by_qedge = {qedge_key: [] for qedge_key in qedge_keys}
+        for future, (qedge_key, kp_to_use, kp_log) in futures.items():
+            if future in answers:
+                answers_by_qedge[qedge_key].append(answers[future])
+
+        # Make sure our query has been fulfilled by at least one KP (single KP case is handled within _expand_edge())
+        if tolerate_kp_failures and log.status == 'OK':
+            for qedge_key in qedge_keys:
+                qedge = query_graph.edges[qedge_key]
+                qedge_answered = any(answer_kg.edges_by_qg_id.get(qedge_key) for answer_kg, _ in answers_by_qedge[qedge_key])
+                if not qedge_answered and not qedge.exclude and not qedge.option_group_id:
+                    if continue_if_no_results:
+                        log.warning(f"No paths were found in {', '.join(kps_to_use)} satisfying qedge {qedge_key}")
+                    else:
+                        log.error(f"No paths were found in {', '.join(kps_to_use)} satisfying qedge {qedge_key}",
+                                  error_code="NoResults")
+        return answers_by_qedge
+
+    @staticmethod
+    def _merge_kp_log(kp_log: ARAXResponse, qedge_key: str, kp_to_use: str, tolerate_failure: bool, log: ARAXResponse):
+        # A KP's messages always go into the main log, but its failure only fails the query if it can't be tolerated
+        if kp_log.status != 'OK' and tolerate_failure:
+            log.merge(kp_log, merge_status=False)
+            log.warning(f"Skipping {kp_to_use}'s answer for qedge {qedge_key}: {kp_log.message}")
+            # The query still succeeds, but without this KP's part of the answer, so it must not go in the query cache
+            log.data.setdefault('kp_failures', []).append(kp_to_use)
+        else:
+            log.merge(kp_log)
+
     def _expand_node(self, qnode_key: str, kp_to_use: str, continue_if_no_results: bool, query_graph: QueryGraph,
                      use_synonyms: bool, mode: str, log: ARAXResponse) -> QGOrganizedKnowledgeGraph:
         # This function expands a single node using the specified knowledge provider
@@ -478,7 +605,7 @@ class ARAXExpander:
             return answer_kg
 
         # Answer the query using the proper KP
-        valid_kps_for_single_node_queries = ["ARAX/KG1", "ARAX/KG2"]
+        valid_kps_for_single_node_queries = self.single_node_query_kps
         if kp_to_use in valid_kps_for_single_node_queries:
             if (kp_to_use == 'ARAX/KG2' and mode == 'RTXKG2') or kp_to_use == "ARAX/KG1":
                 from Expand.kg2_querier import KG2Querier
@@ -758,49 +885,51 @@ class ARAXExpander:
                     other_qnode_key = qedge.object if qedge.object != qnode_key else qedge.subject
                     qnode_connections_map[qnode_key].add(other_qnode_key)
 
-        # Create a map of which nodes each node is connected to (organized by the qnode_key they're fulfilling)
+        # Index which nodes each node is connected to, via edges for the (already expanded) qedges in this part of the QG
         # Example node_usages_by_edges_map: {'e00': {'KG1:111221': {'n00': 'UMLS:122', 'n01': 'UMLS:124'}}}
-        # Example node_connections_map: {'n01': {'UMLS:1222': {'n00': {'DOID:122'}, 'n02': {'UniProtKB:22'}}}, ...}
-        node_connections_map = dict()
-        for current_qedge_key, edges_to_nodes_dict in node_usages_by_edges_map.items():
-            if current_qedge_key in sub_qg.edges:  # Only collect info for edges in the portion of the QG we're considering
-                current_qedge = sub_qg.edges[current_qedge_key]
-                edges_to_nodes_dict = node_usages_by_edges_map[current_qedge_key]
-                current_qedges_qnode_keys = {current_qedge.subject, current_qedge.object}
-                for edge_key, node_usages_dict in edges_to_nodes_dict.items():
-                    for current_qnode_key in current_qedges_qnode_keys:
-                        other_qnode_key = list(current_qedges_qnode_keys.difference({current_qnode_key}))[0]
-                        current_node_key = node_usages_dict[current_qnode_key]
-                        other_node_key = node_usages_dict[other_qnode_key]
-                        if current_qnode_key not in node_connections_map:
-                            node_connections_map[current_qnode_key] = dict()
-                        if current_node_key not in node_connections_map[current_qnode_key]:
-                            node_connections_map[current_qnode_key][current_node_key] = dict()
-                        if other_qnode_key not in node_connections_map[current_qnode_key][current_node_key]:
-                            node_connections_map[current_qnode_key][current_node_key][other_qnode_key] = set()
-                        node_connections_map[current_qnode_key][current_node_key][other_qnode_key].add(other_node_key)
+        kg_index = KGAdjacencyIndex()
+        for current_qedge_key, current_qedge in sub_qg.edges.items():
+            for edge_key, node_usages_dict in node_usages_by_edges_map.get(current_qedge_key, dict()).items():
+                kg_index.add_edge(current_qedge_key, node_usages_dict[current_qedge.subject], node_usages_dict[current_qedge.object])
+        # Organize the indexed edges by the pair of qnodes they connect, oriented both ways
+        # Example edge_node_indices_by_qnode_pair: {('n00', 'n01'): [(array([0, 1]), array([2, 2]))], ...}
+        edge_node_indices_by_qnode_pair = dict()
+        for current_qedge_key in kg_index.get_qedge_keys():
+            current_qedge = sub_qg.edges[current_qedge_key]
+            subject_indices, object_indices = kg_index.get_edge_node_indices(current_qedge_key)
+            edge_node_indices_by_qnode_pair.setdefault((current_qedge.subject, current_qedge.object), []).append((subject_indices, object_indices))
+            edge_node_indices_by_qnode_pair.setdefault((current_qedge.object, current_qedge.subject), []).append((object_indices, subject_indices))
 
         # Iteratively remove all disconnected nodes until there are none left (for the relevant portion of the QG)
-        qnode_keys_already_expanded = set(node_connections_map)
+        qnode_keys_already_expanded = {qnode_key for qnode_pair in edge_node_indices_by_qnode_pair for qnode_key in qnode_pair}
         qnode_keys_to_prune = qnode_keys_already_expanded.intersection(set(sub_qg.nodes))
+        # Only nodes used by an indexed edge in a given qnode's role are candidates for pruning from that qnode
+        is_candidate_by_qnode_key = {qnode_key: np.zeros(kg_index.num_nodes, dtype=bool) for qnode_key in qnode_keys_to_prune}
+        for (qnode_key, _), edge_node_indices in edge_node_indices_by_qnode_pair.items():
+            for node_indices, _ in edge_node_indices:
+                is_candidate_by_qnode_key[qnode_key][node_indices] = True
+        is_in_kg_by_qnode_key = {qnode_key: kg_index.get_node_mask(dict_kg.nodes_by_qg_id.get(qnode_key, dict()))
+                                 for qnode_key in qnode_keys_already_expanded}
+        was_in_kg_by_qnode_key = {qnode_key: is_in_kg.copy() for qnode_key, is_in_kg in is_in_kg_by_qnode_key.items()}
         found_dead_end = True
         while found_dead_end:
             found_dead_end = False
             for qnode_key in qnode_keys_to_prune:
                 qnode_keys_should_be_connected_to = qnode_connections_map[qnode_key].intersection(qnode_keys_already_expanded)
-                for node_key, node_mappings_dict in node_connections_map[qnode_key].items():
-                    # Check if any mappings are even entered for all qnode_keys this node should be connected to
-                    if set(node_mappings_dict.keys()) != qnode_keys_should_be_connected_to:
-                        if node_key in dict_kg.nodes_by_qg_id[qnode_key]:
-                            dict_kg.nodes_by_qg_id[qnode_key].pop(node_key)
-                            found_dead_end = True
-                    else:
-                        # Verify that at least one of the entered connections still exists (for each connected qnode_key)
-                        for other_qnode_key, connected_node_keys in node_mappings_dict.items():
-                            if not connected_node_keys.intersection(set(dict_kg.nodes_by_qg_id[other_qnode_key].keys())):
-                                if node_key in dict_kg.nodes_by_qg_id[qnode_key]:
-                                    dict_kg.nodes_by_qg_id[qnode_key].pop(node_key)
-                                    found_dead_end = True
+                # Each node must still be linked to at least one remaining node for every qnode it should connect to
+                is_dead_end = np.zeros(kg_index.num_nodes, dtype=bool)
+                for other_qnode_key in qnode_keys_should_be_connected_to:
+                    has_connection = np.zeros(kg_index.num_nodes, dtype=bool)
+                    for node_indices, other_node_indices in edge_node_indices_by_qnode_pair.get((qnode_key, other_qnode_key), []):
+                        has_connection[node_indices[is_in_kg_by_qnode_key[other_qnode_key][other_node_indices]]] = True
+                    is_dead_end |= ~has_connection
+                is_dead_end &= is_candidate_by_qnode_key[qnode_key] & is_in_kg_by_qnode_key[qnode_key]
+                if is_dead_end.any():
+                    is_in_kg_by_qnode_key[qnode_key] &= ~is_dead_end
+                    found_dead_end = True
+        for qnode_key, is_in_kg in is_in_kg_by_qnode_key.items():
+            for node_index in np.flatnonzero(was_in_kg_by_qnode_key[qnode_key] & ~is_in_kg):
+                dict_kg.nodes_by_qg_id[qnode_key].pop(kg_index.node_keys[node_index])
 
         # Then remove all orphaned edges
         for current_qedge_key, edges_dict in node_usages_by_edges_map.items():
@@ -859,6 +988,29 @@ class ARAXExpander:
                     return []
         return ordered_qedge_keys
 
+    @staticmethod
+    def _get_concurrent_expansion_waves(ordered_qedge_keys: List[str], query_graph: QueryGraph) -> List[List[str]]:
+        """
+        This function groups qedges (in the order they should be expanded in) into 'waves' that can be expanded
+        concurrently. A qedge can join the current wave only if it and the rest of the wave are required and
+        non-kryptonite, and any qnode it shares with the wave has curies specified in the QG (meaning its query doesn't
+        depend on answers to the other qedges in the wave).
+        """
+        waves = []
+        for qedge_key in ordered_qedge_keys:
+            current_wave = waves[-1] if waves else []
+            candidate_qedges = [query_graph.edges[qe_key] for qe_key in current_wave + [qedge_key]]
+            all_simple = all(not qedge.exclude and not qedge.option_group_id for qedge in candidate_qedges)
+            wave_qnode_keys = {qnode_key for qe_key in current_wave
+                               for qnode_key in {query_graph.edges[qe_key].subject, query_graph.edges[qe_key].object}}
+            qedge = query_graph.edges[qedge_key]
+            shared_qnode_keys = {qedge.subject, qedge.object}.intersection(wave_qnode_keys)
+            if current_wave and all_simple and all(query_graph.nodes[qnode_key].id for qnode_key in shared_qnode_keys):
+                current_wave.append(qedge_key)
+            else:
+                waves.append([qedge_key])
+        return waves
+
     @staticmethod
     def _find_qedge_connected_to_subgraph(subgraph_qedge_keys: List[str], qedge_keys_to_choose_from: List[str],
                                           qg: QueryGraph) -> Optional[str]:
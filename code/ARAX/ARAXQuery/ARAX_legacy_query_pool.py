@@ -0,0 +1,257 @@
+#!/bin/env python3
+# This file contains the pool of worker processes that answers the legacy canned queries (Q0, Q1, Q3, ...) with the
+# solution scripts in reasoningtool/QuestionAnswering, instead of starting a new python3 process for every question
+import sys
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+import os
+import io
+import json
+import time
+import queue
+import shlex
+import runpy
+import signal
+import itertools
+import importlib
+import threading
+import traceback
+import contextlib
+import subprocess
+import multiprocessing
+from typing import List, Optional
+
+from ARAX_response import ARAXResponse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from openapi_server.models.message import Message
+
+QUESTION_ANSWERING_DIR = os.path.realpath(os.path.dirname(os.path.abspath(__file__))+"/../../reasoningtool/QuestionAnswering")
+DEFAULT_NUM_WORKERS = 2
+DEFAULT_TIMEOUT = 600  # seconds
+
+
+def get_solution_scripts(question_answering_dir: str) -> List[str]:
+    """
+    Returns the solution scripts named in the Questions.tsv file of question_answering_dir (eg. ['Q0Solution.py', 'Q3Solution.py']),
+    in the order they first appear
+    """
+    scripts = []
+    with open(os.path.join(question_answering_dir, "Questions.tsv")) as questions_file:
+        for line in questions_file:
+            if line.startswith("#") or not line.strip():
+                continue
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) > 4 and columns[4].split() and columns[4].split()[0].endswith(".py"):
+                script = columns[4].split()[0]
+                if script not in scripts and os.path.exists(os.path.join(question_answering_dir, script)):
+                    scripts.append(script)
+    return scripts
+
+
+#### State of each worker process, set up once by _init_worker()
+_question_answering_dir = None
+_parse_question = None
+_started_jobs = None
+
+
+def _init_worker(question_answering_dir: str, scripts: List[str], ready_semaphore, started_jobs):
+    """
+    Runs once in each worker process: makes the QuestionAnswering area the CWD (of this process only) and imports
+    ParseQuestion and every solution script, so their dependencies, data files and database connections are loaded before
+    the first question arrives
+    """
+    global _question_answering_dir, _parse_question, _started_jobs
+    _question_answering_dir = question_answering_dir
+    _started_jobs = started_jobs
+    os.chdir(question_answering_dir)
+    sys.path.insert(0, question_answering_dir)
+    try:
+        from ParseQuestion import ParseQuestion
+        _parse_question = ParseQuestion()
+    except Exception:
+        eprint(f"ERROR: Unable to load ParseQuestion in legacy query worker {os.getpid()}: {traceback.format_exc()}")
+    for script in scripts:
+        try:
+            importlib.import_module(os.path.splitext(script)[0])
+        except BaseException:
+            # The script is imported again (and reports the same error) when a question needs it
+            eprint(f"WARNING: Unable to preload {script} in legacy query worker {os.getpid()}: {traceback.format_exc()}")
+    ready_semaphore.release()
+
+
+def _run_legacy_query(job_id: int, query_type_id: str, terms: dict):
+    """
+    Runs in a worker process: answers one canned question by running its solution script as __main__ with the command
+    line arguments ParseQuestion gives for it, as the shell would
+    :return: a tuple (the text the script printed on stdout, an error message or None)
+    """
+    #### Tell the server which process runs this job, so that it can kill it if the job takes too long
+    _started_jobs.put((job_id, os.getpid()))
+    if _parse_question is None:
+        return "", "ParseQuestion could not be loaded in the legacy query worker"
+    try:
+        argv = shlex.split(_parse_question.get_execution_string(query_type_id, terms))
+    except Exception as error:
+        return "", f"Unable to build the command for query type id '{query_type_id}': {error}"
+
+    #### Run the script body again for every question, so that module-level state (eg. Q1Solution's response) starts
+    #### afresh as it did in a new process; the modules it imports are already loaded
+    stdout = io.StringIO()
+    saved_argv = sys.argv
+    sys.argv = argv
+    try:
+        with contextlib.redirect_stdout(stdout):
+            runpy.run_path(os.path.join(_question_answering_dir, argv[0]), run_name="__main__")
+    except SystemExit:
+        pass
+    except BaseException:
+        eprint(traceback.format_exc())
+    finally:
+        sys.argv = saved_argv
+    return stdout.getvalue(), None
+
+
+class ARAXLegacyQueryPool:
+    """
+    A pool of worker processes that answer the legacy canned queries. Each worker imports ParseQuestion and the solution
+    scripts once, and then runs the script of each question it is given in-process, so a question no longer pays for a
+    new interpreter, the imports and the Neo4j connection, and the server's CWD is never changed. A question is only
+    handed to a worker when one is free, and a worker that does not answer within the timeout is killed and replaced by
+    the pool. With num_workers=0, every question is answered by a new python3 process as before.
+    """
+
+    _pool = None
+    _pool_lock = threading.Lock()
+
+    def __init__(self, num_workers: int = DEFAULT_NUM_WORKERS, question_answering_dir: str = QUESTION_ANSWERING_DIR,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.num_workers = num_workers
+        self.question_answering_dir = os.path.realpath(question_answering_dir)
+        self.timeout = timeout
+        self.workers = None
+        self.ready_semaphore = None
+        if num_workers > 0:
+            # spawn rather than fork, since the server process has threads (and maybe open connections) of its own
+            context = multiprocessing.get_context("spawn")
+            self.ready_semaphore = context.Semaphore(0)
+            self.started_jobs = context.Queue()
+            self.free_workers = threading.BoundedSemaphore(num_workers)
+            self.job_ids = itertools.count()
+            self.job_pids = dict()
+            self.job_pids_lock = threading.Lock()
+            self.workers = context.Pool(num_workers, initializer=_init_worker,
+                                        initargs=(self.question_answering_dir, get_solution_scripts(self.question_answering_dir),
+                                                  self.ready_semaphore, self.started_jobs))
+
+    @classmethod
+    def get_pool(cls):
+        """
+        Returns the pool shared by this process, starting it on the first call (the server calls this at startup)
+        """
+        with cls._pool_lock:
+            if cls._pool is None:
+                cls._pool = cls()
+            return cls._pool
+
+    def _get_job_pid(self, job_id: int, timeout: float = 0) -> Optional[int]:
+        """
+        Returns the pid of the worker that started the job, waiting up to timeout seconds for it to start
+        """
+        deadline = time.monotonic() + timeout
+        with self.job_pids_lock:
+            while job_id not in self.job_pids:
+                try:
+                    started_job_id, pid = self.started_jobs.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    return None
+                self.job_pids[started_job_id] = pid
+            return self.job_pids.pop(job_id)
+
+    def _run_in_worker(self, query_type_id: str, terms: dict):
+        deadline = time.monotonic() + self.timeout
+        if not self.free_workers.acquire(timeout=self.timeout):
+            raise multiprocessing.TimeoutError()
+        try:
+            job_id = next(self.job_ids)
+            result = self.workers.apply_async(_run_legacy_query, (job_id, query_type_id, terms))
+            try:
+                answer = result.get(max(deadline - time.monotonic(), 0))
+            except multiprocessing.TimeoutError:
+                #### The job would keep its worker busy, so kill the worker (the pool starts a new one in its place). The
+                #### job was given a free worker, so it has started or is about to
+                pid = self._get_job_pid(job_id, timeout=10)
+                if pid is not None:
+                    eprint(f"WARNING: Killing legacy query worker {pid}, which did not answer within {self.timeout} seconds")
+                    try:
+                        os.kill(pid, signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+                raise
+            self._get_job_pid(job_id, timeout=10)
+            return answer
+        finally:
+            self.free_workers.release()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until every worker has finished loading the solution scripts
+        :return: False if that did not happen within timeout seconds
+        """
+        for _ in range(self.num_workers):
+            if not self.ready_semaphore.acquire(timeout=timeout):
+                return False
+        for _ in range(self.num_workers):
+            self.ready_semaphore.release()
+        return True
+
+    def close(self):
+        if self.workers is not None:
+            self.workers.terminate()
+            self.workers.join()
+            self.workers = None
+
+    def _run_in_subprocess(self, query_type_id: str, terms: dict):
+        try:
+            sys.path.insert(0, self.question_answering_dir)
+            from ParseQuestion import ParseQuestion
+            argv = shlex.split(ParseQuestion().get_execution_string(query_type_id, terms))
+        except Exception as error:
+            return "", f"Unable to build the command for query type id '{query_type_id}': {error}"
+        finally:
+            sys.path.remove(self.question_answering_dir)
+        returned_text = subprocess.run(["python3", *argv], stdout=subprocess.PIPE, cwd=self.question_answering_dir, timeout=self.timeout)
+        return returned_text.stdout.decode('utf-8'), None
+
+    def answer(self, query_type_id: str, terms: dict, response: ARAXResponse) -> Optional[Message]:
+        """
+        Answers a canned question with its solution script
+        :return: the Message the script returned, or None after logging an error to the response
+        """
+        response.debug(f"Running the solution script for query type id '{query_type_id}' with terms {terms}")
+        try:
+            if self.workers is None:
+                reformatted_text, error = self._run_in_subprocess(query_type_id, terms)
+            else:
+                reformatted_text, error = self._run_in_worker(query_type_id, terms)
+        except (multiprocessing.TimeoutError, subprocess.TimeoutExpired):
+            response.error(f"The solution script for query type id '{query_type_id}' did not answer within {self.timeout} seconds",
+                           error_code="LegacyQueryTimeout")
+            return None
+        if error is not None:
+            response.error(error, error_code="UnsupportedQueryTypeID")
+            return None
+
+        #### Try to decode the text the script printed into a Message object
+        try:
+            data = json.loads(reformatted_text)
+            message = Message.from_dict(data)
+            if getattr(message, 'message_code', None) is None:
+                if getattr(message, 'result_code', None) is not None:
+                    message.message_code = message.result_code
+                else:
+                    message.message_code = "wha??"
+        except Exception:
+            response.error("Error parsing the message from the reasoner. This is an internal bug that needs to be fixed. Unable to respond to this question at this time. The unparsable message was: " + reformatted_text, error_code="InternalError551")
+            return None
+        return message
@@ -6,13 +6,12 @@ import os
 import json
 import ast
 import re
-import time
 from datetime import datetime
-import subprocess
 import traceback
 from collections import Counter
 import numpy as np
 import threading
+import queue
 import json
 import uuid
 
@@ -25,6 +24,8 @@ from ARAX_resultify import ARAXResultify
 from ARAX_query_graph_interpreter import ARAXQueryGraphInterpreter
 from ARAX_messenger import ARAXMessenger
 from ARAX_ranker import ARAXRanker
+from ARAX_query_cache import ARAXQueryCache
+from ARAX_legacy_query_pool import ARAXLegacyQueryPool
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.response import Response
@@ -34,6 +35,8 @@ from openapi_server.models.query_graph import QueryGraph
 from openapi_server.models.q_node import QNode
 from openapi_server.models.q_edge import QEdge
 from openapi_server.models.operations import Operations
+from openapi_server.models.log_entry import LogEntry
+from openapi_server import codec
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../..")
 from RTXConfiguration import RTXConfiguration
@@ -49,6 +52,26 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../reasoningtool
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ResponseCache")
 from response_cache import ResponseCache
 
+# Put on ARAXQuery.message_queue after the last logging message of a streamed query
+END_OF_STREAM = object()
+
+#### The ResponseCache shared by all the queries answered in this process (it gives each thread its own session)
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Returns this process's ResponseCache, with a new session for the calling thread, so that a query sees whatever
+    other processes have stored since this thread last used it
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+    _response_cache.session.remove()
+    return _response_cache
+
 
 class ARAXQuery:
 
@@ -56,68 +79,46 @@ class ARAXQuery:
     def __init__(self):
         self.response = None
         self.message = None
+        self.response_id = None
+        self.message_queue = None
         self.rtxConfig = RTXConfiguration()
 
 
     def query_return_stream(self,query, mode='ARAX'):
 
+        # The query thread puts each log message on this queue as it is logged, followed by END_OF_STREAM when it is done
+        message_queue = queue.Queue()
+        self.message_queue = message_queue
         main_query_thread = threading.Thread(target=self.asynchronous_query, args=(query,mode,))
         main_query_thread.start()
 
-        if self.response is None or "DONE" not in self.response.status:
-
-            # Sleep until a response object has been created
-            while self.response is None:
-                time.sleep(0.1)
-
-            i_message = 0
-            n_messages = len(self.response.messages)
+        # Relay the logging messages to the client as soon as they arrive
+        while True:
+            message = message_queue.get()
+            if message is END_OF_STREAM:
+                break
+            yield(json.dumps(message)+"\n")
 
-            while "DONE" not in self.response.status:
-                n_messages = len(self.response.messages)
-                while i_message < n_messages:
-                    yield(json.dumps(self.response.messages[i_message])+"\n")
-                    i_message += 1
-                time.sleep(0.2)
-
-            # #### If there are any more logging messages in the queue, send them first
-            n_messages = len(self.response.messages)
-            while i_message < n_messages:
-                yield(json.dumps(self.response.messages[i_message])+"\n")
-                i_message += 1
-
-            # Remove the little DONE flag the other thread used to signal this thread that it is done
-            self.response.status = re.sub('DONE,','',self.response.status)
-
-            # Stream the resulting message back to the client
-            yield(json.dumps(self.response.envelope.to_dict()))
+        # Stream the resulting message back to the client a piece at a time, so that the client starts receiving it
+        # right away and the whole serialized message never has to be held in memory
+        if self.response is not None and self.response.envelope is not None:
+            yield from codec.iter_dumps(self.response.envelope, include_nulls=True)
 
         # Wait until both threads rejoin here and the return
         main_query_thread.join()
+        self.message_queue = None
         return { 'DONE': True }
 
 
     def asynchronous_query(self,query, mode='ARAX'):
 
-        #### Define a new response object if one does not yet exist
-        if self.response is None:
-            self.response = ARAXResponse()
-
-        #### Execute the query
-        self.query(query, mode=mode)
-
-        #### Do we still need all this cruft?
-        #result = self.query(query)
-        #message = self.message
-        #if message is None:
-        #    message = Message()
-        #    self.message = message
-        #message.message_code = result.error_code
-        #message.code_description = result.message
-        #message.log = result.messages
-
-        # Insert a little flag into the response status to denote that this thread is done
-        self.response.status = f"DONE,{self.response.status}"
+        #### Execute the query, and tell the streaming thread when it is done, no matter how it ends
+        try:
+            self.query(query, mode=mode)
+        except Exception:
+            eprint(traceback.format_exc())
+        finally:
+            self.message_queue.put(END_OF_STREAM)
         return
 
 
@@ -132,7 +133,9 @@ class ARAXQuery:
 
         #### Create the skeleton of the response
         response = ARAXResponse()
+        response.message_queue = self.message_queue
         self.response = response
+        self.response_id = None
 
         #### Announce the launch of query()
         #### Note that setting ARAXResponse.output = 'STDERR' means that we get noisy output to the logs
@@ -150,6 +153,21 @@ class ARAXQuery:
             return response
         query_attributes = result.data
 
+        #### If this query has already been answered by this version of the system, return the stored response
+        query_cache = ARAXQueryCache(get_response_cache(), self.rtxConfig)
+        query_cache_key = query_cache.get_query_key(query, response, mode=mode)
+        if query_cache_key is not None:
+            if str(query.get('bypass_cache')).lower() == 'true':
+                response.info(f"bypass_cache is set, so the query will be answered anew rather than from the query cache")
+                query_cache.count_bypass()
+            else:
+                cached_envelope = query_cache.get_cached_envelope(query_cache_key, response)
+                if cached_envelope is not None:
+                    response.envelope = Response().from_dict(cached_envelope)
+                    response.info(f"Returning the cached response rather than answering the query anew (use bypass_cache to override)")
+                    response.envelope.logs = (response.envelope.logs or []) + [LogEntry.from_dict(message) for message in response.messages]
+                    return response
+
         # #### If we have a query_graph in the input query
         if "have_query_graph" in query_attributes:
 
@@ -191,6 +209,8 @@ class ARAXQuery:
         if "have_operations" in query_attributes:
             response.info(f"Found input processing plan. Sending to the ProcessingPlanExecutor")
             result = self.execute_processing_plan(query, mode=mode)
+            if query_cache_key is not None and response.status == 'OK' and self.response_id is not None:
+                query_cache.store(query_cache_key, self.response_id, response)
             return response
 
         #### Otherwise extract the id and the terms from the incoming parameters
@@ -200,30 +220,6 @@ class ARAXQuery:
             id = query["query_type_id"]
             terms = query["terms"]
 
-        #### Create an RTX Feedback management object
-        #response.info(f"Try to find a cached message for this canned query")
-        #rtxFeedback = RTXFeedback()
-        #rtxFeedback.connect()
-        #cachedMessage = rtxFeedback.getCachedMessage(query)
-        cachedMessage = None
-
-        #### If we can find a cached message for this query and this version of RTX, then return the cached message
-        if ( cachedMessage is not None ):
-            response.info(f"Loaded cached message for return")
-            apiMessage = Message().from_dict(cachedMessage)
-            #rtxFeedback.disconnect()
-            self.limit_message(apiMessage,query)
-
-            if apiMessage.message_code is None:
-                if apiMessage.result_code is not None:
-                    apiMessage.message_code = apiMessage.result_code
-                else:
-                    apiMessage.message_code = "wha??"
-
-            #self.log_query(query,apiMessage,'cached')
-            self.message = apiMessage
-            return response
-
         #### Still have special handling for Q0
         if id == 'Q0':
             response.info(f"Answering 'what is' question with Q0 handler")
@@ -247,36 +243,10 @@ class ARAXQuery:
 
             response.info(f"Entering legacy handler for a canned query")
 
-            #### Use the ParseQuestion system to determine what the execution_string should be
-            txltr = ParseQuestion()
+            #### Have a worker of the legacy query pool run the solution script (eg. Q1Solution.py) for this question
             eprint(terms)
-            command = "python3 " + txltr.get_execution_string(id,terms)
-
-            #### Set CWD to the QuestioningAnswering area and then invoke from the shell the Q1Solution code
-            cwd = os.getcwd()
-            os.chdir(os.path.dirname(os.path.abspath(__file__))+"/../../reasoningtool/QuestionAnswering")
-            eprint(command)
-            returnedText = subprocess.run( [ command ], stdout=subprocess.PIPE, shell=True )
-            os.chdir(cwd)
-
-            #### reformat the stdout result of the shell command into a string
-            reformattedText = returnedText.stdout.decode('utf-8')
-            #eprint(reformattedText)
-
-            #### Try to decode that string into a message object
-            try:
-                #data = ast.literal_eval(reformattedText)
-                data = json.loads(reformattedText)
-                message = Message.from_dict(data)
-                if message.message_code is None:
-                    if message.result_code is not None:
-                        message.message_code = message.result_code
-                    else:
-                        message.message_code = "wha??"
-
-            #### If it fails, the just create a new Message object with a notice about the failure
-            except:
-                response.error("Error parsing the message from the reasoner. This is an internal bug that needs to be fixed. Unable to respond to this question at this time. The unparsable message was: " + reformattedText, error_code="InternalError551")
+            message = ARAXLegacyQueryPool.get_pool().answer(id, terms, response)
+            if message is None:
                 return response
 
             #print(query)
@@ -416,9 +386,8 @@ class ARAXQuery:
         #### Pull out the main processing plan
         operations = Operations.from_dict(input_operations_dict["operations"])
 
-        #### Connect to the message store just once, even if we won't use it
-        response_cache = ResponseCache()
-        response_cache.connect()
+        #### Use this process's connection to the message store, even if we won't use it
+        response_cache = get_response_cache()
 
         #### Create a messenger object for basic message processing
         messenger = ARAXMessenger()
@@ -676,6 +645,7 @@ class ARAXQuery:
             if return_action['parameters']['store'] == 'true':
                 response.debug(f"Storing resulting Message")
                 response_id = response_cache.add_new_response(response)
+                self.response_id = response_id
                 
             #### If asking for the full message back
             if return_action['parameters']['response'] == 'true':
@@ -0,0 +1,193 @@
+#!/bin/env python3
+# This file contains the query-level cache that lets ARAXQuery answer a query it has already answered (with the same
+# version of the system) by returning the stored response, rather than running the whole processing plan again
+import sys
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+import os
+import re
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+from ARAX_response import ARAXResponse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../NodeSynonymizer")
+from node_synonymizer import NodeSynonymizer
+
+QUERY_CACHE_FORMAT_VERSION = 1
+QUERY_CACHE_TTL = 7 * 24 * 3600  # seconds
+MAX_CACHED_QUERIES = 10000
+
+# ARAXi commands whose outcome depends on something other than the query itself
+UNCACHEABLE_ACTION_COMMANDS = {'fetch_message'}
+
+# The NodeSynonymizer shared by all the queries answered in this process (its lookups use per-thread connections)
+_node_synonymizer = None
+_node_synonymizer_lock = threading.Lock()
+
+
+def get_node_synonymizer() -> NodeSynonymizer:
+    global _node_synonymizer
+    with _node_synonymizer_lock:
+        if _node_synonymizer is None:
+            _node_synonymizer = NodeSynonymizer()
+        return _node_synonymizer
+
+
+class ARAXQueryCache:
+    """
+    Maps a canonical form of each incoming query to the response_id of its stored response in the ResponseCache. The
+    canonical form has sorted keys, its qnode curies replaced with their canonical curies (via the NodeSynonymizer),
+    blank/comment ARAXi lines dropped and insignificant whitespace removed, so trivially different copies of the same
+    query (as the UI and the ARS tend to resend) map to the same entry. It is hashed together with the tool version and
+    the KG the system is configured to use, so a new release or KG never serves old answers.
+    """
+
+    # Hit/miss counts, shared by all instances in this process (like NodeSynonymizerCache's)
+    stats = {'lookups': 0, 'hits': 0, 'misses': 0, 'bypasses': 0, 'uncacheable': 0, 'stores': 0, 'degraded': 0}
+    stats_lock = threading.Lock()
+
+    def __init__(self, response_cache, rtx_config, ttl: int = QUERY_CACHE_TTL, max_entries: int = MAX_CACHED_QUERIES):
+        self.response_cache = response_cache
+        self.rtx_config = rtx_config
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get_query_key(self, query: dict, response: ARAXResponse, mode: str = 'ARAX') -> Optional[str]:
+        """
+        Returns the cache key for an incoming query (as the dict received by ARAXQuery.query()), or None if the query
+        can't be answered from the cache (e.g., because it refers to previously stored messages).
+        """
+        canonical_query = self._get_canonical_query(query, response)
+        if canonical_query is None:
+            self._count('uncacheable')
+            return None
+        key_contents = {'query': canonical_query,
+                        'mode': mode,
+                        'format_version': QUERY_CACHE_FORMAT_VERSION,
+                        'tool_version': self.rtx_config.version,
+                        'kg': [self.rtx_config.live, self.rtx_config.neo4j_bolt, self.rtx_config.neo4j_database]}
+        return hashlib.sha256(json.dumps(key_contents, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def get_cached_envelope(self, query_key: str, response: ARAXResponse) -> Optional[dict]:
+        self._count('lookups')
+        response_id = None
+        try:
+            response_id = self.response_cache.get_cached_query_response_id(query_key, self.ttl)
+            envelope = self.response_cache.get_response(response_id) if response_id is not None else None
+        except Exception as error:
+            response.warning(f"Unable to look up this query in the query cache: {error}")
+            envelope = None
+        if not isinstance(envelope, dict) or 'message' not in envelope:
+            self._count('misses')
+            return None
+        self._count('hits')
+        response.info(f"Found a cached response for this query (response_id {response_id})")
+        return envelope
+
+    def store(self, query_key: str, response_id: int, response: ARAXResponse):
+        # An answer that some KPs failed to contribute to (see ARAXExpander._merge_kp_log) may be complete next time
+        kp_failures = response.data.get('kp_failures')
+        if kp_failures:
+            response.debug(f"Not storing this response in the query cache, since these KPs failed to answer: {', '.join(sorted(set(kp_failures)))}")
+            self._count('degraded')
+            return
+        try:
+            self.response_cache.add_cached_query(query_key, response_id, self.max_entries)
+            self._count('stores')
+        except Exception as error:
+            response.warning(f"Unable to store response_id {response_id} in the query cache: {error}")
+
+    def count_bypass(self):
+        self._count('bypasses')
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, float]:
+        with cls.stats_lock:
+            stats = dict(cls.stats)
+        stats['hit_rate'] = stats['hits'] / stats['lookups'] if stats['lookups'] else 0.0
+        return stats
+
+    @classmethod
+    def _count(cls, stat_name: str):
+        with cls.stats_lock:
+            cls.stats[stat_name] += 1
+
+    def _get_canonical_query(self, query: dict, response: ARAXResponse) -> Optional[dict]:
+        message = query.get('message')
+        operations = query.get('operations')
+        if not isinstance(message, dict) and not isinstance(operations, dict):
+            return None  # Legacy canned queries aren't cached here
+        if isinstance(message, dict):
+            knowledge_graph = message.get('knowledge_graph')
+            if message.get('results') or (isinstance(knowledge_graph, dict) and (knowledge_graph.get('nodes') or knowledge_graph.get('edges'))):
+                return None
+        canonical_operations = None
+        if isinstance(operations, dict):
+            if operations.get('message_uris') or operations.get('messages'):
+                return None
+            actions = self._get_canonical_actions(operations.get('actions') or [])
+            if {re.match(r'[A-Za-z_]*', action).group(0) for action in actions} & UNCACHEABLE_ACTION_COMMANDS:
+                return None
+            canonical_operations = {'actions': actions, 'options': sorted(operations.get('options') or [])}
+        query_graph = message.get('query_graph') if isinstance(message, dict) else None
+        return {'query_graph': self._get_canonical_query_graph(query_graph, response) if query_graph else None,
+                'operations': canonical_operations,
+                'max_results': query.get('max_results'),
+                'page_size': query.get('page_size'),
+                'page_number': query.get('page_number'),
+                'reasoner_ids': sorted(query.get('reasoner_ids') or [])}
+
+    @staticmethod
+    def _get_canonical_actions(actions: List[str]) -> List[str]:
+        canonical_actions = []
+        for action in actions:
+            action = action.strip()
+            if action == '' or action.startswith('#'):
+                continue
+            # ActionsParser strips whitespace around each comma-separated parameter and inside the parentheses
+            action = re.sub(r'\s*,\s*', ',', action)
+            action = re.sub(r'\(\s+', '(', action)
+            action = re.sub(r'\s+\)', ')', action)
+            canonical_actions.append(action)
+        return canonical_actions
+
+    @staticmethod
+    def _get_canonical_query_graph(query_graph: dict, response: ARAXResponse) -> dict:
+        qnodes = query_graph.get('nodes') or dict()
+        qedges = query_graph.get('edges') or dict()
+        curies = {curie for qnode in qnodes.values() if isinstance(qnode, dict)
+                  for curie in _as_list(qnode.get('id'))}
+        canonical_curies = dict()
+        if curies:
+            try:
+                canonicalized_curies = get_node_synonymizer().get_canonical_curies(curies=sorted(curies))
+                canonical_curies = {curie: canonical_info['preferred_curie'] for curie, canonical_info in canonicalized_curies.items()
+                                    if canonical_info is not None and canonical_info.get('preferred_curie')}
+            except Exception as error:
+                response.debug(f"Unable to canonicalize query graph curies for the query cache; using them as given: {error}")
+        canonical_qnodes = dict()
+        for qnode_key, qnode in qnodes.items():
+            qnode = qnode if isinstance(qnode, dict) else dict()
+            canonical_qnodes[qnode_key] = {'id': sorted({canonical_curies.get(curie, curie) for curie in _as_list(qnode.get('id'))}),
+                                           'category': sorted(set(_as_list(qnode.get('category')))),
+                                           'is_set': bool(qnode.get('is_set')),
+                                           'option_group_id': qnode.get('option_group_id')}
+        canonical_qedges = dict()
+        for qedge_key, qedge in qedges.items():
+            qedge = qedge if isinstance(qedge, dict) else dict()
+            canonical_qedges[qedge_key] = {'subject': qedge.get('subject'),
+                                           'object': qedge.get('object'),
+                                           'predicate': sorted(set(_as_list(qedge.get('predicate')))),
+                                           'relation': qedge.get('relation'),
+                                           'exclude': bool(qedge.get('exclude')),
+                                           'option_group_id': qedge.get('option_group_id')}
+        return {'nodes': canonical_qnodes, 'edges': canonical_qedges}
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
@@ -9,24 +9,18 @@ import json
 import ast
 import re
 
-from typing import Set, Union, Dict, List, Callable
+from typing import Union, Dict, List, Tuple
 from ARAX_response import ARAXResponse
 from query_graph_info import QueryGraphInfo
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.query_graph import QueryGraph
 from openapi_server.models.result import Result
-from openapi_server.models.edge import Edge
 from openapi_server.models.attribute import Attribute
 
 
-def _get_nx_edges_by_attr(G: Union[nx.MultiDiGraph, nx.MultiGraph], key: str, val: str) -> Set[tuple]:
-    res_set = set()
-    for edge_tuple in G.edges(data=True):
-        edge_val = edge_tuple[2].get(key, None)
-        if edge_val is not None and edge_val == val:
-            res_set.add(edge_tuple)
-    return res_set
+# Above this many qnodes, max flow is computed one result at a time with networkx rather than by trying every cut
+MAX_QNODES_FOR_BATCH_MAX_FLOW = 12
 
 
 def _get_query_graph_networkx_from_query_graph(query_graph: QueryGraph) -> nx.MultiDiGraph:
@@ -37,37 +31,53 @@ def _get_query_graph_networkx_from_query_graph(query_graph: QueryGraph) -> nx.Mu
     return query_graph_nx
 
 
-def _get_weighted_graph_networkx_from_result_graph(kg_edge_id_to_edge: Dict[str, Edge],
-                                                   qg_nx: Union[nx.MultiDiGraph, nx.MultiGraph],
-                                                   result: Result) -> Union[nx.MultiDiGraph,
-                                                                            nx.MultiGraph]:
-    res_graph = qg_nx.copy()
-    qg_edge_tuples = tuple(qg_nx.edges(keys=True, data=True))
-    qg_edge_key_to_edge_tuple = {edge_tuple[2]: edge_tuple for edge_tuple in qg_edge_tuples}
-    for key, edge_binding_list in result.edge_bindings.items():
-        # FIXME: EWD: there's a problem here, but I'm baffled by what this is supposed to be doing
-        for edge_binding in edge_binding_list:
-            kg_edge = kg_edge_id_to_edge[edge_binding.id]
-            kg_edge_attributes = {x.name:x.value for x in kg_edge.attributes}
-            kg_edge_conf = kg_edge.confidence
-            #kg_edge_conf = kg_edge_attributes["confidence"]
-            qedge_keys = kg_edge.qedge_keys
-            for qedge_key in qedge_keys:
-                qedge_tuple = qg_edge_key_to_edge_tuple[qedge_key]
-                res_graph[qedge_tuple[0]][qedge_tuple[1]][qedge_key]['weight'] = kg_edge_conf
-    return res_graph
-
-
-def _get_weighted_graphs_networkx_from_result_graphs(kg_edge_id_to_edge: Dict[str, Edge],
-                                                     qg_nx: Union[nx.MultiDiGraph, nx.MultiGraph],
-                                                     results: List[Result]) -> List[Union[nx.MultiDiGraph,
-                                                                                          nx.MultiGraph]]:
-    res_list = []
-    for result in results:
-        res_list.append(_get_weighted_graph_networkx_from_result_graph(kg_edge_id_to_edge,
-                                                                       qg_nx,
-                                                                       result))
-    return res_list
+def _get_result_edge_weights(kg_edge_id_to_confidence: Dict[str, float],
+                             kg_edge_id_to_qedge_keys: Dict[str, List[str]],
+                             qg_nx: nx.MultiDiGraph,
+                             results: List[Result]) -> np.ndarray:
+    """
+    Returns a (number of results) x (number of qedges) array holding the confidence of the KG edge bound to each qedge
+    in each result (0 for qedges with no bound edge). As before, when several KG edges are bound to the same qedge, the
+    last one bound wins.
+    """
+    qedge_key_to_index = {qedge_key: qedge_index for qedge_index, (_, _, qedge_key) in enumerate(qg_nx.edges(keys=True))}
+    edge_weights = np.zeros((len(results), len(qedge_key_to_index)))
+    for result_index, result in enumerate(results):
+        for edge_binding_list in result.edge_bindings.values():
+            for edge_binding in edge_binding_list:
+                kg_edge_conf = kg_edge_id_to_confidence[edge_binding.id]
+                for qedge_key in kg_edge_id_to_qedge_keys[edge_binding.id]:
+                    if qedge_key in qedge_key_to_index:
+                        edge_weights[result_index, qedge_key_to_index[qedge_key]] = kg_edge_conf
+    return edge_weights
+
+
+def _get_weighted_adjacency_tensor(edge_weights: np.ndarray, qg_nx: nx.MultiDiGraph) -> np.ndarray:
+    """
+    Stacks the (weighted) adjacency matrix of every result graph into a (number of results) x (number of qnodes) x
+    (number of qnodes) tensor; every result graph has the shape of the query graph, so only the weights differ. Weights
+    of parallel qedges are summed (like networkx does for multigraphs).
+    """
+    num_qnodes = len(qg_nx)
+    qnode_key_to_index = {qnode_key: qnode_index for qnode_index, qnode_key in enumerate(qg_nx.nodes)}
+    qedge_to_matrix_cell = np.zeros((edge_weights.shape[1], num_qnodes * num_qnodes))
+    for qedge_index, (subject_key, object_key) in enumerate(qg_nx.edges()):
+        qedge_to_matrix_cell[qedge_index, qnode_key_to_index[subject_key] * num_qnodes + qnode_key_to_index[object_key]] = 1.0
+    return (edge_weights @ qedge_to_matrix_cell).reshape(len(edge_weights), num_qnodes, num_qnodes)
+
+
+def _get_node_pairs_with_max_path_length(qg_nx: nx.MultiDiGraph) -> Tuple[int, List[Tuple[int, int]]]:
+    """
+    Finds the length of the longest (unweighted, directed) shortest path in the query graph and the (indices of the)
+    node pairs it connects. Result graphs share the query graph's shape, so this only needs to be done once.
+    """
+    qnode_key_to_index = {qnode_key: qnode_index for qnode_index, qnode_key in enumerate(qg_nx.nodes)}
+    apsp_dict = dict(nx.algorithms.shortest_paths.unweighted.all_pairs_shortest_path_length(qg_nx))
+    max_path_len = max(path_len for node_i_dict in apsp_dict.values() for path_len in node_i_dict.values())
+    pairs_with_max_path_len = [(qnode_key_to_index[node_i], qnode_key_to_index[node_j])
+                               for node_i, node_i_dict in apsp_dict.items() for node_j, path_len in node_i_dict.items()
+                               if path_len == max_path_len]
+    return max_path_len, pairs_with_max_path_len
 
 
 # credit: StackOverflow:15590812
@@ -95,72 +105,55 @@ def _quantile_rank_list(x: List[float]) -> np.array:
     return y/len(y)
 
 
-def _score_networkx_graphs_by_max_flow(result_graphs_nx: List[Union[nx.MultiDiGraph,
-                                                                    nx.MultiGraph]]) -> List[float]:
+def _get_max_flow_values_using_networkx(adjacency_tensor: np.ndarray, source_index: int, target_index: int) -> np.ndarray:
     max_flow_values = []
-    for result_graph_nx in result_graphs_nx:
-        if len(result_graph_nx) > 1:
-            apsp_dict = dict(nx.algorithms.shortest_paths.unweighted.all_pairs_shortest_path_length(result_graph_nx))
-            path_len_with_pairs_list = [(node_i, node_j, path_len) for node_i, node_i_dict in apsp_dict.items() for node_j, path_len in node_i_dict.items()]
-            max_path_len = max([path_len_with_pair_list_item[2] for path_len_with_pair_list_item in
-                                path_len_with_pairs_list])
-            pairs_with_max_path_len = [path_len_with_pair_list_item[0:2] for path_len_with_pair_list_item in path_len_with_pairs_list if
-                                       path_len_with_pair_list_item[2] == max_path_len]
-            max_flow_values_for_node_pairs = []
-            result_graph_collapsed_nx = _collapse_nx_multigraph_to_weighted_graph(result_graph_nx)
-            for source_node_id, target_node_id in pairs_with_max_path_len:
-                max_flow_values_for_node_pairs.append(nx.algorithms.flow.maximum_flow_value(result_graph_collapsed_nx,
-                                                                                            source_node_id,
-                                                                                            target_node_id,
-                                                                                            capacity="weight"))
-            max_flow_value = 0.0
-            if len(max_flow_values_for_node_pairs) > 0:
-                max_flow_value = sum(max_flow_values_for_node_pairs)/float(len(max_flow_values_for_node_pairs))
+    for adjacency_matrix in adjacency_tensor:
+        graph_nx = nx.from_numpy_array(adjacency_matrix, create_using=nx.DiGraph)
+        max_flow_values.append(nx.algorithms.flow.maximum_flow_value(graph_nx, source_index, target_index,
+                                                                     capacity="weight"))
+    return np.array(max_flow_values)
+
+
+def _get_max_flow_values_using_cuts(adjacency_tensor: np.ndarray, source_index: int, target_index: int) -> np.ndarray:
+    # By max-flow/min-cut, the max flow is the smallest total weight crossing from the source's side to the target's
+    # side over all ways of splitting the nodes; for query-graph-sized graphs we can simply try every split at once
+    num_nodes = adjacency_tensor.shape[1]
+    other_node_indices = [node_index for node_index in range(num_nodes) if node_index not in {source_index, target_index}]
+    is_on_source_side = np.zeros((2 ** len(other_node_indices), num_nodes), dtype=bool)
+    is_on_source_side[:, source_index] = True
+    for bit, node_index in enumerate(other_node_indices):
+        is_on_source_side[:, node_index] = (np.arange(len(is_on_source_side)) >> bit) & 1
+    crosses_cut = is_on_source_side[:, :, None] & ~is_on_source_side[:, None, :]
+    cut_values = np.einsum('rij,cij->rc', adjacency_tensor, crosses_cut.astype(adjacency_tensor.dtype))
+    return cut_values.min(axis=1)
+
+
+def _score_weighted_adjacency_tensor_by_max_flow(adjacency_tensor: np.ndarray,
+                                                 pairs_with_max_path_len: List[Tuple[int, int]]) -> np.ndarray:
+    if adjacency_tensor.shape[1] <= 1:
+        return np.ones(len(adjacency_tensor))
+    max_flow_values_for_node_pairs = []
+    for source_index, target_index in pairs_with_max_path_len:
+        if source_index == target_index:
+            continue
+        if adjacency_tensor.shape[1] <= MAX_QNODES_FOR_BATCH_MAX_FLOW:
+            max_flow_values_for_node_pairs.append(_get_max_flow_values_using_cuts(adjacency_tensor, source_index, target_index))
         else:
-            max_flow_value = 1.0
-        max_flow_values.append(max_flow_value)
-    return max_flow_values
-
-
-def _score_networkx_graphs_by_longest_path(result_graphs_nx: List[Union[nx.MultiDiGraph,
-                                                                        nx.MultiGraph]]) -> List[float]:
-    result_scores = []
-    for result_graph_nx in result_graphs_nx:
-        apsp_dict = dict(nx.algorithms.shortest_paths.unweighted.all_pairs_shortest_path_length(result_graph_nx))
-        path_len_with_pairs_list = [(node_i, node_j, path_len) for node_i, node_i_dict in apsp_dict.items() for node_j, path_len in node_i_dict.items()]
-        max_path_len = max([path_len_with_pair_list_item[2] for path_len_with_pair_list_item in
-                            path_len_with_pairs_list])
-        pairs_with_max_path_len = [path_len_with_pair_list_item[0:2] for path_len_with_pair_list_item in path_len_with_pairs_list if
-                                   path_len_with_pair_list_item[2] == max_path_len]
-        map_node_name_to_index = {node_id: node_index for node_index, node_id in enumerate(result_graph_nx.nodes)}
-        adj_matrix = nx.to_numpy_matrix(result_graph_nx)
-        adj_matrix_power = np.linalg.matrix_power(adj_matrix, max_path_len)/math.factorial(max_path_len)
-        score_list = [adj_matrix_power[map_node_name_to_index[node_i],
-                                       map_node_name_to_index[node_j]] for node_i, node_j in pairs_with_max_path_len]
-        result_score = np.mean(score_list)
-        result_scores.append(result_score)
-    return result_scores
-
-
-def _score_networkx_graphs_by_frobenius_norm(result_graphs_nx: List[Union[nx.MultiDiGraph,
-                                                                          nx.MultiGraph]]) -> List[float]:
-    result_scores = []
-    for result_graph_nx in result_graphs_nx:
-        adj_matrix = nx.to_numpy_matrix(result_graph_nx)
-        result_score = np.linalg.norm(adj_matrix, ord='fro')
-        result_scores.append(result_score)
-    return result_scores
-
-
-def _score_result_graphs_by_networkx_graph_scorer(kg_edge_id_to_edge: Dict[str, Edge],
-                                                  qg_nx: Union[nx.MultiDiGraph, nx.MultiGraph],
-                                                  results: List[Result],
-                                                  nx_graph_scorer: Callable[[List[Union[nx.MultiDiGraph,
-                                                                                        nx.MultiGraph]]], np.array]) -> List[float]:
-    result_graphs_nx = _get_weighted_graphs_networkx_from_result_graphs(kg_edge_id_to_edge,
-                                                                        qg_nx,
-                                                                        results)
-    return nx_graph_scorer(result_graphs_nx)
+            max_flow_values_for_node_pairs.append(_get_max_flow_values_using_networkx(adjacency_tensor, source_index, target_index))
+    if not max_flow_values_for_node_pairs:
+        return np.zeros(len(adjacency_tensor))
+    return np.mean(max_flow_values_for_node_pairs, axis=0)
+
+
+def _score_weighted_adjacency_tensor_by_longest_path(adjacency_tensor: np.ndarray, max_path_len: int,
+                                                     pairs_with_max_path_len: List[Tuple[int, int]]) -> np.ndarray:
+    adjacency_tensor_power = np.linalg.matrix_power(adjacency_tensor, max_path_len)/math.factorial(max_path_len)
+    source_indices, target_indices = zip(*pairs_with_max_path_len)
+    return adjacency_tensor_power[:, list(source_indices), list(target_indices)].mean(axis=1)
+
+
+def _score_weighted_adjacency_tensor_by_frobenius_norm(adjacency_tensor: np.ndarray) -> np.ndarray:
+    return np.linalg.norm(adjacency_tensor, ord='fro', axis=(1, 2))
 
 
 class ARAXRanker:
@@ -533,6 +526,9 @@ and [frobenius norm](https://en.wikipedia.org/wiki/Matrix_norm#Frobenius_norm).
         response.info(f"Summary of available edge metrics: {score_stats}")
 
         # Loop over the entire KG and normalize and combine the score of each edge, place that information in the confidence attribute of the edge
+        # (and record it, along with the edge's qedge_keys, so results can be scored without going back to the edges)
+        kg_edge_id_to_confidence = dict()
+        kg_edge_id_to_qedge_keys = dict()
         for edge_key,edge in message.knowledge_graph.edges.items():
             edge_attributes = {x.name:x.value for x in edge.attributes}
             if edge_attributes.get("confidence", None) is not None:
@@ -545,6 +541,8 @@ and [frobenius norm](https://en.wikipedia.org/wiki/Matrix_norm#Frobenius_norm).
                 confidence = self.edge_attribute_score_combiner(edge)
                 #edge.attributes.append(Attribute(name="confidence", value=confidence))
                 edge.confidence = confidence
+            kg_edge_id_to_confidence[edge_key] = edge.confidence
+            kg_edge_id_to_qedge_keys[edge_key] = edge.qedge_keys if hasattr(edge, 'qedge_keys') and edge.qedge_keys else []
 
         # Now that each edge has a confidence attached to it based on it's attributes, we can now:
         # 1. consider edge types of the results
@@ -554,17 +552,17 @@ and [frobenius norm](https://en.wikipedia.org/wiki/Matrix_norm#Frobenius_norm).
         ###################################
         # TODO: Replace this with a more "intelligent" separate function
         # now we can loop over all the results, and combine their edge confidences (now populated)
+        # All result graphs have the shape of the query graph, so we score them all at once as a stack of adjacency matrices
         qg_nx = _get_query_graph_networkx_from_query_graph(message.query_graph)
-        kg_edge_id_to_edge = self.kg_edge_id_to_edge
         results = message.results
+        edge_weights = _get_result_edge_weights(kg_edge_id_to_confidence, kg_edge_id_to_qedge_keys, qg_nx, results)
+        adjacency_tensor = _get_weighted_adjacency_tensor(edge_weights, qg_nx)
+        max_path_len, pairs_with_max_path_len = _get_node_pairs_with_max_path_length(qg_nx)
         ranks_list = list(map(_quantile_rank_list,
-                              map(lambda scorer_func: _score_result_graphs_by_networkx_graph_scorer(kg_edge_id_to_edge,
-                                                                                                    qg_nx,
-                                                                                                    results,
-                                                                                                    scorer_func),
-                                  [_score_networkx_graphs_by_max_flow,
-                                   _score_networkx_graphs_by_longest_path,
-                                   _score_networkx_graphs_by_frobenius_norm])))
+                              [_score_weighted_adjacency_tensor_by_max_flow(adjacency_tensor, pairs_with_max_path_len),
+                               _score_weighted_adjacency_tensor_by_longest_path(adjacency_tensor, max_path_len,
+                                                                                pairs_with_max_path_len),
+                               _score_weighted_adjacency_tensor_by_frobenius_norm(adjacency_tensor)]))
         #print(ranks_list)
         result_scores = sum(ranks_list)/float(len(ranks_list))
         #print(result_scores)
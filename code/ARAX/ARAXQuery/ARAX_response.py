@@ -34,6 +34,8 @@ class ARAXResponse:
         self.n_warnings = 0
         self.data = {}
         self.envelope = None
+        # If set (to a queue.Queue), every message added to this response is also put on it as it is logged
+        self.message_queue = None
 
 
     #### Add a debugging message
@@ -123,7 +125,7 @@ class ARAXResponse:
         """
 
         timestamp = str(datetime.datetime.now().isoformat())
-        self.messages.append( { 'timestamp': timestamp, 'level': self.level_names[level], 'code': code, 'message': message } )
+        self.__append_message( { 'timestamp': timestamp, 'level': self.level_names[level], 'code': code, 'message': message } )
         self.n_messages += 1
 
         # Create a pretty printable message prefix
@@ -138,23 +140,35 @@ class ARAXResponse:
                 eprint(f"{prefix}{message}", flush=True)
 
 
+    #### Append a message to the log and pass it on to any listener
+    def __append_message(self, message, queue_message=True):
+        self.messages.append(message)
+        if self.message_queue is not None and queue_message:
+            self.message_queue.put(message)
+
+
     #### Merge a new response into an existing response
-    def merge(self, response_to_merge):
+    def merge(self, response_to_merge, merge_status=True):
         """Public method that merges the content of the passed response to the self response
         When the result of a called object method returns a new response object, this method
         should be used to merge the contents of the returned response object into the
         current response object. If the passed response is in and ERROR state, the current
-        response is also set to an error state.
+        response is also set to an error state (unless merge_status is False).
+        Messages that the passed response already put on this response's message_queue
+        as they were logged are not put on it again.
 
         :param response_to_merge: A response object received by the caller to be merged into the callers response object.
         :type response_to_merge: Response
+        :param merge_status: Whether the passed response's status (e.g. an ERROR) also becomes this response's status.
+        :type merge_status: bool
         """
         self.n_messages += response_to_merge.n_messages
         self.n_errors += response_to_merge.n_errors
         self.n_warnings += response_to_merge.n_warnings
-        for message in response_to_merge.messages:
-            self.messages.append(message)
-        if response_to_merge.status != 'OK':
+        already_queued = response_to_merge.message_queue is not None and response_to_merge.message_queue is self.message_queue
+        for message in list(response_to_merge.messages):
+            self.__append_message(message, queue_message=not already_queued)
+        if response_to_merge.status != 'OK' and merge_status:
             self.status = response_to_merge.status
             self.error_code = response_to_merge.error_code
             self.message = response_to_merge.message
@@ -236,6 +250,28 @@ class ResponseTests(unittest.TestCase):
     def test_show(self):
         self.assertGreater(len(self.response.show(level=self.response.INFO)), 285)
 
+    def test_message_queue(self):
+        import queue
+        response = ARAXResponse()
+        response.message_queue = queue.Queue()
+        response.info('First')
+        response.merge(self.response)
+        self.assertEqual([response.message_queue.get_nowait()['message'] for i in range(5)],
+                         ['First', 'And we are off', 'So far so good', 'This does not look good', 'Bad news, Pal'])
+        self.assertTrue(response.message_queue.empty())
+
+    def test_merge_streamed_response(self):
+        import queue
+        response = ARAXResponse()
+        response.message_queue = queue.Queue()
+        sub_response = ARAXResponse()
+        sub_response.message_queue = response.message_queue
+        sub_response.error('Streamed as it was logged', error_code='KPError')
+        response.merge(sub_response, merge_status=False)
+        self.assertEqual(response.message_queue.qsize(), 1)
+        self.assertEqual(len(response.messages), 1)
+        self.assertEqual(response.status, 'OK')
+
 
 ##########################################################################################
 def main():
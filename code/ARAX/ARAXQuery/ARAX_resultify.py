@@ -19,8 +19,10 @@ import collections
 import math
 import os
 import sys
+import numpy as np
 from typing import List, Dict, Set, Union, Iterable, cast, Optional, Tuple
 from ARAX_response import ARAXResponse
+from kg_adjacency_index import KGAdjacencyIndex
 
 __author__ = 'Stephen Ramsey and Amy Glen'
 __copyright__ = 'Oregon State University'
@@ -35,9 +37,7 @@ __status__ = 'Prototype'
 # is there a better way to import swagger_server?  Following SO posting 16981921
 PACKAGE_PARENT = '../../UI/OpenAPI/python-flask-server'
 sys.path.append(os.path.normpath(os.path.join(os.getcwd(), PACKAGE_PARENT)))
-from openapi_server.models.edge import Edge
 from openapi_server.models.node import Node
-from openapi_server.models.q_edge import QEdge
 from openapi_server.models.q_node import QNode
 from openapi_server.models.query_graph import QueryGraph
 from openapi_server.models.knowledge_graph import KnowledgeGraph
@@ -533,7 +533,9 @@ def _get_results_for_kg_by_qg(kg: KnowledgeGraph,              # all nodes *must
         if qg_is_disconnected:
             raise ValueError(f"Required portion of QG is disconnected. This isn't allowed! 'Required' qnode IDs are: "
                              f"{[qnode_key for qnode_key in required_qg.nodes]}")
-        result_graphs_required = _create_result_graphs(kg, required_qg, ignore_edge_direction)
+        # Index the KG's connectivity once, for use in creating both the required and the option group results
+        kg_index = KGAdjacencyIndex.from_knowledge_graph(kg)
+        result_graphs_required = _create_result_graphs(kg, required_qg, kg_index, ignore_edge_direction)
 
         # Then create results for each of the "option groups" in the QG (including the required portion of the QG with each)
         option_groups_in_qg = {qedge.option_group_id for qedge in qg.edges.values() if qedge.option_group_id}
@@ -549,7 +551,7 @@ def _get_results_for_kg_by_qg(kg: KnowledgeGraph,              # all nodes *must
                 raise ValueError(f"Required + option group {option_group_id} portion of the QG is disconnected. "
                                  f"This isn't allowed! 'Required'/group {option_group_id} qnode IDs are: "
                                  f"{[qnode_key for qnode_key in option_group_qg.nodes]}")
-            result_graphs_for_option_group = _create_result_graphs(kg, option_group_qg, ignore_edge_direction)
+            result_graphs_for_option_group = _create_result_graphs(kg, option_group_qg, kg_index, ignore_edge_direction)
             option_group_results_dict[option_group_id] = result_graphs_for_option_group
 
         # Organize our results for the 'required' portion of the QG by the IDs of their is_set=False nodes
@@ -677,14 +679,6 @@ def _get_kg_edge_keys_by_qg_key(knowledge_graph: KnowledgeGraph) -> Dict[str, Se
     return edge_keys_by_qg_key
 
 
-def _get_connected_qnode_keys(qnode_key: str, query_graph: QueryGraph) -> Set[str]:
-    qnode_keys_used_on_same_qedges = set()
-    for qedge in query_graph.edges.values():
-        qnode_keys_used_on_same_qedges.add(qedge.subject)
-        qnode_keys_used_on_same_qedges.add(qedge.object)
-    return qnode_keys_used_on_same_qedges.difference({qnode_key})
-
-
 def _create_new_empty_result_graph(query_graph: QueryGraph) -> Dict[str, Dict[str, Set[str]]]:
     empty_result_graph = {'nodes': {qnode_key: set() for qnode_key in query_graph.nodes},
                           'edges': {qedge_key: set() for qedge_key in query_graph.edges}}
@@ -697,54 +691,6 @@ def _copy_result_graph(result_graph: Dict[str, Dict[str, Set[str]]]) -> Dict[str
     return result_graph_copy
 
 
-def _get_edge_node_pair_key(edge: Edge) -> str:
-    return "--".join(sorted([edge.subject, edge.object]))
-
-
-def _get_parallel_qedge_keys(input_qedge: QEdge, query_graph: QueryGraph) -> Set[str]:
-    input_qedge_node_keys = {input_qedge.subject, input_qedge.object}
-    parallel_qedge_keys = {qedge_key for qedge_key, qedge in query_graph.edges.items() if {qedge.subject, qedge.object} == input_qedge_node_keys}
-    return parallel_qedge_keys
-
-
-def _get_kg_node_adj_map_by_qg_key(kg_node_keys_by_qg_key: Dict[str, Set[str]], knowledge_graph: KnowledgeGraph, query_graph: QueryGraph) -> Dict[str, Dict[str, Dict[str, Set[str]]]]:
-    # Returned dict looks like {'n00': {'UMLS:11234': {'n01': {UniProtKB:122}}}}
-    # First initiate the overall structure of our (QG-organized) adjacency map
-    kg_node_to_node_map = {qnode_key: dict() for qnode_key in kg_node_keys_by_qg_key}
-    for qnode_key in query_graph.nodes:
-        node_keys_set = kg_node_keys_by_qg_key[qnode_key]
-        connected_qnode_keys = _get_connected_qnode_keys(qnode_key, query_graph)
-        for node_key in node_keys_set:
-            kg_node_to_node_map[qnode_key][node_key] = {connected_qnode_key: set() for connected_qnode_key in connected_qnode_keys}
-
-    # Create a record of which qedge IDs are fulfilled between which node pairs
-    node_pair_to_qedge_key_map = dict()
-    for edge in knowledge_graph.edges.values():
-        node_pair_key = _get_edge_node_pair_key(edge)
-        if node_pair_key not in node_pair_to_qedge_key_map:
-            node_pair_to_qedge_key_map[node_pair_key] = set()
-        node_pair_to_qedge_key_map[node_pair_key] = node_pair_to_qedge_key_map[node_pair_key].union(set(edge.qedge_keys))
-
-    # Fill out which KG nodes are connected to which
-    for edge in knowledge_graph.edges.values():
-        for qedge_key in edge.qedge_keys:
-            # Note: KG may contain some qedge IDs not in this version of the QG due to option group handling
-            if qedge_key in query_graph.edges:
-                qedge = query_graph.edges[qedge_key]
-                # Make sure ALL qedges between these two nodes have been fulfilled before marking them as 'connected'
-                parallel_qedge_keys = _get_parallel_qedge_keys(qedge, query_graph)
-                if parallel_qedge_keys.issubset(node_pair_to_qedge_key_map[_get_edge_node_pair_key(edge)]):
-                    qnode_key_1 = qedge.subject
-                    qnode_key_2 = qedge.object
-                    if edge.subject in kg_node_keys_by_qg_key[qnode_key_1] and edge.object in kg_node_keys_by_qg_key[qnode_key_2]:
-                        kg_node_to_node_map[qnode_key_1][edge.subject][qnode_key_2].add(edge.object)
-                        kg_node_to_node_map[qnode_key_2][edge.object][qnode_key_1].add(edge.subject)
-                    if edge.subject in kg_node_keys_by_qg_key[qnode_key_2] and edge.object in kg_node_keys_by_qg_key[qnode_key_1]:
-                        kg_node_to_node_map[qnode_key_2][edge.subject][qnode_key_1].add(edge.object)
-                        kg_node_to_node_map[qnode_key_1][edge.object][qnode_key_2].add(edge.subject)
-    return kg_node_to_node_map
-
-
 def _result_graph_is_fulfilled(result_graph: Dict[str, Dict[str, Set[str]]], query_graph: QueryGraph) -> bool:
     if not set(query_graph.nodes).issubset(set(result_graph['nodes'])):
         return False
@@ -753,17 +699,6 @@ def _result_graph_is_fulfilled(result_graph: Dict[str, Dict[str, Set[str]]], que
     return True
 
 
-def _get_all_adjacent_nodes(kg_node_keys: Set[str], start_qnode_key: str, target_qnode_key: str,
-                            kg_node_adj_map_by_qg_key: Dict[str, Dict[str, Dict[str, Set[str]]]]) -> Set[str]:
-    """
-    This function returns all nodes adjacent to a set of nodes (kg_node_keys) that fulfill the target_qnode_key. The
-    start_qnode_key is the qnode ID that the set of input nodes fulfill. Being adjacent to the set of nodes means that
-    the node is connected to ANY of the individual input nodes in the set (not ALL).
-    """
-    connections = [kg_node_adj_map_by_qg_key[start_qnode_key][kg_node_key][target_qnode_key] for kg_node_key in kg_node_keys]
-    return {node_key for node_key_set in connections for node_key in node_key_set}
-
-
 def _find_qnode_connected_to_sub_qg(qnode_keys_to_connect_to: Set[str], qnode_keys_to_choose_from: Set[str], qg: QueryGraph) -> Tuple[str, Set[str]]:
     """
     This function selects a qnode ID from the qnode_keys_to_choose_from that connects to one or more of the qnode IDs
@@ -793,153 +728,219 @@ def _get_qg_adj_map_undirected(qg) -> Dict[str, Set[str]]:
     return qg_adj_map
 
 
-def _extract_sub_qg_adj_map(qg_adj_map: Dict[str, Set[str]], allowed_qnode_keys: Set[str]) -> Dict[str, Set[str]]:
+def _get_qnode_join_order(qg_adj_map: Dict[str, Set[str]], qg: QueryGraph,
+                          kg_node_keys_by_qg_key: Dict[str, Set[str]]) -> List[Tuple[str, Set[str]]]:
     """
-    This function extracts the node adjacency info for a "subgraph" of the query graph (represented by
-    allowed_qnode_keys). Example of qg_adj_map: {"n0": {"n1"}, "n1": {"n0"}}
+    This function decides the order in which qnodes are bound during result construction. It starts with the qnode
+    that yields the fewest partial results and then repeatedly picks, from the qnodes connected to those already
+    bound, the one with the smallest estimated fan-out (an is_set=True qnode never fans out), preferring qnodes that
+    connect to more of the already bound qnodes when tied. Returns a list of (qnode_key, prior_qnode_connections).
     """
-    return {qnode_key: neighbor_qnode_keys.intersection(allowed_qnode_keys)
-            for qnode_key, neighbor_qnode_keys in qg_adj_map.items() if qnode_key in allowed_qnode_keys}
+    def _get_estimated_fan_out(qnode_key: str) -> int:
+        return 1 if qg.nodes[qnode_key].is_set else len(kg_node_keys_by_qg_key[qnode_key])
+
+    start_qnode_key = min(qg.nodes, key=lambda qnode_key: (_get_estimated_fan_out(qnode_key),
+                                                            len(kg_node_keys_by_qg_key[qnode_key]), qnode_key))
+    join_order = [(start_qnode_key, set())]
+    qnode_keys_already_handled = {start_qnode_key}
+    qnode_keys_remaining = set(qg.nodes).difference(qnode_keys_already_handled)
+    while qnode_keys_remaining:
+        connections = {qnode_key: qg_adj_map[qnode_key].intersection(qnode_keys_already_handled)
+                       for qnode_key in qnode_keys_remaining}
+        current_qnode_key = min((qnode_key for qnode_key in qnode_keys_remaining if connections[qnode_key]),
+                                key=lambda qnode_key: (_get_estimated_fan_out(qnode_key), -len(connections[qnode_key]),
+                                                       len(kg_node_keys_by_qg_key[qnode_key]), qnode_key))
+        join_order.append((current_qnode_key, connections[current_qnode_key]))
+        qnode_keys_remaining.remove(current_qnode_key)
+        qnode_keys_already_handled.add(current_qnode_key)
+    return join_order
+
+
+def _convert_indices_to_bitset(indices: Iterable[int], num_bits: int) -> int:
+    bitset_bytes = bytearray((num_bits + 7) // 8)
+    for index in indices:
+        bitset_bytes[index >> 3] |= 1 << (index & 7)
+    return int.from_bytes(bitset_bytes, "little")
+
+
+_BIT_INDICES_BY_BYTE = [tuple(bit_index for bit_index in range(8) if byte >> bit_index & 1) for byte in range(256)]
+
+
+def _get_bitset_indices(bitset: int) -> List[int]:
+    if not bitset & (bitset - 1):
+        return [bitset.bit_length() - 1] if bitset else []  # Zero or one node is set (the common case)
+    # Otherwise walk the bitset a byte at a time, skipping empty bytes
+    bitset_bytes = bitset.to_bytes((bitset.bit_length() + 7) // 8, "little")
+    return [byte_index * 8 + bit_index for byte_index, byte in enumerate(bitset_bytes) if byte
+            for bit_index in _BIT_INDICES_BY_BYTE[byte]]
 
 
-def _clean_up_dead_ends(result_graph: Dict[str, Dict[str, Set[str]]],
-                        sub_qg_adj_map: Dict[str, Set[str]],
-                        kg_node_adj_map_by_qg_key: Dict[str, Dict[str, Dict[str, Set[str]]]]) -> Dict[str, Dict[str, Set[str]]]:
+def _get_kg_node_adj_bitsets(kg_index: KGAdjacencyIndex,
+                             qg: QueryGraph,
+                             qg_adj_map: Dict[str, Set[str]],
+                             qnode_keys: List[str],
+                             node_keys_by_qnode_index: List[List[str]]) -> List[Dict[int, List[int]]]:
     """
-    This function iteratively removes "dead ends" from a result graph until no more dead ends can be found. Dead ends
-    can be thought of as intermediate nodes (typically for is_set=True qnodes) that connect to only a subset of the
-    nodes they should be connected to according to the query graph. Only the part of the result graph that has been
-    "fulfilled" so far during the result construction process is evaluated here: the sub_qg_adj_map must contain only
-    info for qnodes fulfilled thus far.
+    This function records which KG nodes are connected to which as bitsets over the integer indices of the KG nodes
+    fulfilling each qnode. The returned list looks like [{1: [0b0110, 0b0001]}, ...], meaning that the first KG node
+    fulfilling qnode 0 is connected to the second and third KG nodes fulfilling qnode 1, and so on. Two KG nodes only
+    count as connected if they are linked by edges fulfilling ALL of the (parallel) qedges between their qnodes.
     """
-    fulfilled_qnode_keys = set(sub_qg_adj_map)
-    found_dead_ends = True
-    while found_dead_ends:
-        found_dead_ends = False
-        nodes_to_remove = dict()
-        # Go through each qnode "role" in our result graph, and check the nodes corresponding to that qnode
-        for qnode_key in fulfilled_qnode_keys:
-            corresponding_node_keys = result_graph["nodes"][qnode_key]
-            required_neighbor_qnode_keys = sub_qg_adj_map[qnode_key]
-            # Make sure each node for this qnode ID is connected to at LEAST one node fulfilling each neighbor qnode ID
-            for corresponding_node_key in corresponding_node_keys:
-                for neighbor_qnode_key in required_neighbor_qnode_keys:
-                    # Look for at least one node in the result graph in this neighbor spot that this node is linked to
-                    neighbors_in_kg = kg_node_adj_map_by_qg_key[qnode_key][corresponding_node_key][neighbor_qnode_key]
-                    if not neighbors_in_kg.intersection(result_graph["nodes"][neighbor_qnode_key]):
-                        # Mark this node for removal from this result graph since it's lacking a neighbor here
-                        found_dead_ends = True
-                        if qnode_key not in nodes_to_remove:
-                            nodes_to_remove[qnode_key] = set()
-                        nodes_to_remove[qnode_key].add(corresponding_node_key)
-        # Actually go through and remove our nodes marked for removal
-        for qnode_key, node_keys in nodes_to_remove.items():
-            result_graph["nodes"][qnode_key] = result_graph["nodes"][qnode_key].difference(node_keys)
-    return result_graph
+    qnode_indices = {qnode_key: qnode_index for qnode_index, qnode_key in enumerate(qnode_keys)}
+    kg_node_indices_by_qnode_index = [kg_index.get_node_indices(node_keys) for node_keys in node_keys_by_qnode_index]
+    adj_bitsets = []
+    for qnode_index, qnode_key in enumerate(qnode_keys):
+        num_nodes = len(node_keys_by_qnode_index[qnode_index])
+        adj_bitsets_for_qnode = dict()
+        for neighbor_qnode_key in qg_adj_map[qnode_key]:
+            neighbor_qnode_index = qnode_indices[neighbor_qnode_key]
+            parallel_qedge_keys = {qedge_key for qedge_key, qedge in qg.edges.items()
+                                   if {qedge.subject, qedge.object} == {qnode_key, neighbor_qnode_key}}
+            node_positions, neighbor_node_positions = kg_index.get_connected_pairs(parallel_qedge_keys,
+                                                                                   kg_node_indices_by_qnode_index[qnode_index],
+                                                                                   kg_node_indices_by_qnode_index[neighbor_qnode_index])
+            # Pairs come back sorted by node, so each node's neighbors form one contiguous run
+            run_boundaries = np.searchsorted(node_positions, np.arange(num_nodes + 1))
+            num_neighbor_nodes = len(node_keys_by_qnode_index[neighbor_qnode_index])
+            adj_bitsets_for_qnode[neighbor_qnode_index] = [
+                _convert_indices_to_bitset(neighbor_node_positions[run_boundaries[node_index]:run_boundaries[node_index + 1]].tolist(),
+                                           num_neighbor_nodes)
+                for node_index in range(num_nodes)]
+        adj_bitsets.append(adj_bitsets_for_qnode)
+    return adj_bitsets
+
+
+def _get_adjacent_bitset(bitset: int, adj_bitsets_to_neighbor: List[int]) -> int:
+    """
+    This function returns the bitset of all neighbor nodes connected to ANY of the nodes in the input bitset.
+    """
+    adjacent_bitset = 0
+    for node_index in _get_bitset_indices(bitset):
+        adjacent_bitset |= adj_bitsets_to_neighbor[node_index]
+    return adjacent_bitset
+
+
+def _prune_dead_ends(binding: List[int],
+                     qnode_indices_to_check: Set[int],
+                     sub_qg_adj_map: Dict[int, List[int]],
+                     adj_bitsets: List[Dict[int, List[int]]]) -> Optional[Tuple[int, ...]]:
+    """
+    This function iteratively removes "dead ends" from a partial result (a list holding one bitset of KG nodes per
+    qnode) until no more dead ends can be found. Dead ends can be thought of as intermediate nodes (typically for
+    is_set=True qnodes) that connect to only a subset of the nodes they should be connected to according to the query
+    graph. Only the qnodes bound so far are evaluated (sub_qg_adj_map must contain only those), and only qnodes in
+    qnode_indices_to_check (plus the neighbors of any qnode that loses nodes along the way) are re-examined. Returns
+    None if any qnode is left with no nodes, since such a partial result can never fulfill the query graph.
+    """
+    qnode_indices_to_check = set(qnode_indices_to_check)
+    while qnode_indices_to_check:
+        qnode_index = qnode_indices_to_check.pop()
+        bitset = binding[qnode_index]
+        pruned_bitset = bitset
+        for node_index in _get_bitset_indices(bitset):
+            # Make sure this node is connected to at LEAST one node fulfilling each neighbor qnode in this result
+            for neighbor_qnode_index in sub_qg_adj_map[qnode_index]:
+                if not adj_bitsets[qnode_index][neighbor_qnode_index][node_index] & binding[neighbor_qnode_index]:
+                    pruned_bitset ^= 1 << node_index
+                    break
+        if not pruned_bitset:
+            return None
+        if pruned_bitset != bitset:
+            binding[qnode_index] = pruned_bitset
+            qnode_indices_to_check.update(sub_qg_adj_map[qnode_index])
+    return tuple(binding)
 
 
 def _create_result_graphs(kg: KnowledgeGraph,
                           qg: QueryGraph,
-                          ignore_edge_direction: bool = True) -> List[Result]:
-    result_graphs = []
+                          kg_index: KGAdjacencyIndex,
+                          ignore_edge_direction: bool = True) -> List[Dict[str, Dict[str, Set[str]]]]:
     kg_node_keys_by_qg_key = _get_kg_node_keys_by_qg_key(kg)
-    kg_node_adj_map_by_qg_key = _get_kg_node_adj_map_by_qg_key(kg_node_keys_by_qg_key, kg, qg)
     qg_adj_map = _get_qg_adj_map_undirected(qg)
 
-    # Iteratively construct "result graphs" (initially containing only nodes, not edges) by walking through all qnodes
-    qnode_keys_remaining = set(qg.nodes)
-    qnode_keys_already_handled = set()
-    while qnode_keys_remaining:
-        # Start with a random qnode if this is our first iteration
-        if not qnode_keys_already_handled:
-            current_qnode_key = list(qnode_keys_remaining)[0]
-            prior_qnode_connections = set()
-        # Otherwise find a yet unhandled qnode ID that connects somehow to the part of the QG we've already handled
-        else:
-            current_qnode_key, prior_qnode_connections = _find_qnode_connected_to_sub_qg(qnode_keys_already_handled, qnode_keys_remaining, qg)
-        current_qnode = qg.nodes[current_qnode_key]
-
-        # Initialize our result graphs if this is our first iteration
-        if not result_graphs:
-            all_node_keys_in_kg_for_this_qnode_key = kg_node_keys_by_qg_key.get(current_qnode_key)
-            # We'll start with one result graph with ALL corresponding nodes in the KG in this spot if is_set=True
-            if current_qnode.is_set:
-                new_result_graph = _create_new_empty_result_graph(qg)
-                new_result_graph["nodes"][current_qnode_key] = all_node_keys_in_kg_for_this_qnode_key
-                result_graphs.append(new_result_graph)
-            # Otherwise, we'll start with a result graph for EACH corresponding node in the KG
+    # Intern the KG nodes fulfilling each qnode as integers; partial results are then tuples holding one bitset (int)
+    # of KG nodes per qnode (in qnode_keys order), and adjacency checks become bitwise ANDs
+    qnode_keys = sorted(qg.nodes)
+    qnode_indices = {qnode_key: qnode_index for qnode_index, qnode_key in enumerate(qnode_keys)}
+    node_keys_by_qnode_index = [sorted(kg_node_keys_by_qg_key[qnode_key]) for qnode_key in qnode_keys]
+    adj_bitsets = _get_kg_node_adj_bitsets(kg_index, qg, qg_adj_map, qnode_keys, node_keys_by_qnode_index)
+
+    # Iteratively construct partial results by binding qnodes in order of their estimated selectivity
+    bindings = []
+    qnode_indices_already_handled = set()
+    for current_qnode_key, prior_qnode_connections in _get_qnode_join_order(qg_adj_map, qg, kg_node_keys_by_qg_key):
+        current_qnode_index = qnode_indices[current_qnode_key]
+        all_nodes_bitset = (1 << len(node_keys_by_qnode_index[current_qnode_index])) - 1
+        # Initialize our partial results if this is our first iteration
+        if not qnode_indices_already_handled:
+            empty_binding = [0] * len(qnode_keys)
+            # We'll start with one result with ALL corresponding nodes in the KG in this spot if is_set=True
+            if qg.nodes[current_qnode_key].is_set:
+                empty_binding[current_qnode_index] = all_nodes_bitset
+                bindings.append(tuple(empty_binding))
+            # Otherwise, we'll start with a result for EACH corresponding node in the KG
             else:
-                for node_key in all_node_keys_in_kg_for_this_qnode_key:
-                    new_result_graph = _create_new_empty_result_graph(qg)
-                    new_result_graph["nodes"][current_qnode_key] = {node_key}
-                    result_graphs.append(new_result_graph)
-        # Otherwise fan out our existing result graphs, filling out this qnode spot in them based on prior contents
+                for node_index in range(len(node_keys_by_qnode_index[current_qnode_index])):
+                    empty_binding[current_qnode_index] = 1 << node_index
+                    bindings.append(tuple(empty_binding))
+        # Otherwise fan out our existing partial results, filling out this qnode spot in them based on prior contents
         else:
-            new_result_graphs = []
-            sub_qg_adj_map = _extract_sub_qg_adj_map(qg_adj_map, qnode_keys_already_handled.union({current_qnode_key}))
-            for result_graph in result_graphs:
-                # Figure out which KG nodes could fulfill the current qnode in this result
-                prior_qnodes_kg_nodes = {prior_qnode_key: result_graph["nodes"][prior_qnode_key] for prior_qnode_key in prior_qnode_connections}
-                current_kg_node_possibilities = [_get_all_adjacent_nodes(corresponding_kg_nodes, prior_qnode_key, current_qnode_key, kg_node_adj_map_by_qg_key)
-                                                 for prior_qnode_key, corresponding_kg_nodes in prior_qnodes_kg_nodes.items()]
-                # Only keep connections that have links to KG nodes in ALL prior connected qnode roles
-                final_connected_kg_nodes = set.intersection(*current_kg_node_possibilities)
-                if current_qnode.is_set:
-                    # Replace this result graph with a new one with all valid connections listed under this qnode
-                    new_result_graph = _copy_result_graph(result_graph)
-                    new_result_graph["nodes"][current_qnode_key] = final_connected_kg_nodes
-                    pruned_result_graph = _clean_up_dead_ends(result_graph=new_result_graph,
-                                                              sub_qg_adj_map=sub_qg_adj_map,
-                                                              kg_node_adj_map_by_qg_key=kg_node_adj_map_by_qg_key)
-                    new_result_graphs.append(pruned_result_graph)
+            prior_qnode_indices = [qnode_indices[prior_qnode_key] for prior_qnode_key in prior_qnode_connections]
+            sub_qg_adj_map = {qnode_index: [qnode_indices[neighbor_qnode_key] for neighbor_qnode_key in qg_adj_map[qnode_key]
+                                            if qnode_indices[neighbor_qnode_key] in qnode_indices_already_handled or
+                                            neighbor_qnode_key == current_qnode_key]
+                              for qnode_index, qnode_key in enumerate(qnode_keys)
+                              if qnode_index in qnode_indices_already_handled or qnode_key == current_qnode_key}
+            qnode_indices_to_check = set(prior_qnode_indices).union({current_qnode_index})
+            new_bindings = []
+            for binding in bindings:
+                # Only keep KG nodes that have links to KG nodes in ALL prior connected qnode roles
+                connected_nodes_bitset = all_nodes_bitset
+                for prior_qnode_index in prior_qnode_indices:
+                    connected_nodes_bitset &= _get_adjacent_bitset(binding[prior_qnode_index],
+                                                                   adj_bitsets[prior_qnode_index][current_qnode_index])
+                if qg.nodes[current_qnode_key].is_set:
+                    new_binding = list(binding)
+                    new_binding[current_qnode_index] = connected_nodes_bitset
+                    new_bindings.append(_prune_dead_ends(new_binding, qnode_indices_to_check, sub_qg_adj_map, adj_bitsets))
                 else:
-                    # Create a new result graph for each new valid connected node
-                    for connected_node_key in final_connected_kg_nodes:
-                        new_result_graph = _copy_result_graph(result_graph)
-                        new_result_graph["nodes"][current_qnode_key] = {connected_node_key}
-                        pruned_result_graph = _clean_up_dead_ends(result_graph=new_result_graph,
-                                                                  sub_qg_adj_map=sub_qg_adj_map,
-                                                                  kg_node_adj_map_by_qg_key=kg_node_adj_map_by_qg_key)
-                        new_result_graphs.append(pruned_result_graph)
-            result_graphs = new_result_graphs
-
-        # Update our records about which qnodes we've already processed
-        qnode_keys_remaining.remove(current_qnode_key)
-        qnode_keys_already_handled.add(current_qnode_key)
+                    # Create a new partial result for each new valid connected node
+                    for node_index in _get_bitset_indices(connected_nodes_bitset):
+                        new_binding = list(binding)
+                        new_binding[current_qnode_index] = 1 << node_index
+                        new_bindings.append(_prune_dead_ends(new_binding, qnode_indices_to_check, sub_qg_adj_map, adj_bitsets))
+            # Drop partial results that turned out to be dead ends entirely
+            bindings = [binding for binding in new_bindings if binding]
+        qnode_indices_already_handled.add(current_qnode_index)
+
+    # Convert our partial results back into (string-keyed) result graphs
+    result_graphs = []
+    for binding in bindings:
+        result_graph = _create_new_empty_result_graph(qg)
+        for qnode_index, bitset in enumerate(binding):
+            node_keys = node_keys_by_qnode_index[qnode_index]
+            result_graph["nodes"][qnode_keys[qnode_index]] = {node_keys[node_index] for node_index in _get_bitset_indices(bitset)}
+        result_graphs.append(result_graph)
 
     # Then add edges to our result graphs as appropriate
-    edges_by_node_pairs = {qedge_key: dict() for qedge_key in qg.edges}
+    edge_keys_by_node_by_qg_key = {qedge_key: dict() for qedge_key in qg.edges}
     for edge_key, edge in kg.edges.items():
         if edge.qedge_keys:
             for qedge_key in edge.qedge_keys:
                 # Note: KG may contain some qedges not in this version of the QG due to option group handling
-                if qedge_key in set(qg.edges):
-                    edge_node_pair = f"{edge.subject}--{edge.object}"
-                    if edge_node_pair not in edges_by_node_pairs[qedge_key]:
-                        edges_by_node_pairs[qedge_key][edge_node_pair] = set()
-                    edges_by_node_pairs[qedge_key][edge_node_pair].add(edge_key)
+                if qedge_key in edge_keys_by_node_by_qg_key:
+                    edge_keys_by_node = edge_keys_by_node_by_qg_key[qedge_key]
+                    edge_keys_by_node.setdefault(edge.subject, dict()).setdefault(edge.object, set()).add(edge_key)
                     if ignore_edge_direction:
-                        node_pair_in_other_direction = f"{edge.object}--{edge.subject}"
-                        if node_pair_in_other_direction not in edges_by_node_pairs[qedge_key]:
-                            edges_by_node_pairs[qedge_key][node_pair_in_other_direction] = set()
-                        edges_by_node_pairs[qedge_key][node_pair_in_other_direction].add(edge_key)
+                        edge_keys_by_node.setdefault(edge.object, dict()).setdefault(edge.subject, set()).add(edge_key)
     for result_graph in result_graphs:
         for qedge_key in result_graph['edges']:
             qedge = qg.edges[qedge_key]
-            potential_nodes_1 = result_graph['nodes'][qedge.subject]
             potential_nodes_2 = result_graph['nodes'][qedge.object]
-            possible_node_pairs = set()
-            for node_1 in potential_nodes_1:
-                for node_2 in potential_nodes_2:
-                    node_pair_key = f"{node_1}--{node_2}"
-                    possible_node_pairs.add(node_pair_key)
-            for node_pair in possible_node_pairs:
-                ids_of_matching_edges = edges_by_node_pairs[qedge_key].get(node_pair, set())
-                result_graph['edges'][qedge_key] = result_graph['edges'][qedge_key].union(ids_of_matching_edges)
+            for node_1 in result_graph['nodes'][qedge.subject]:
+                for node_2, edge_keys in edge_keys_by_node_by_qg_key[qedge_key].get(node_1, dict()).items():
+                    if node_2 in potential_nodes_2:
+                        result_graph['edges'][qedge_key].update(edge_keys)
 
     final_result_graphs = [result_graph for result_graph in result_graphs if _result_graph_is_fulfilled(result_graph, qg)]
     return final_result_graphs
-
-
-
-
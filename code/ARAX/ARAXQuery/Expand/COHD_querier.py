@@ -5,7 +5,7 @@ import traceback
 import ast
 import itertools
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Set
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import expand_utilities as eu
@@ -22,16 +22,39 @@ from openapi_server.models.query_graph import QueryGraph
 from openapi_server.models.q_node import QNode
 from openapi_server.models.q_edge import QEdge
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../../ARAX/KnowledgeSources/COHD_local/scripts/")
-from COHDIndex import COHDIndex
+from COHDIndex import COHDIndex, ASSOCIATION_DTYPE
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../../ARAX/NodeSynonymizer/")
 from node_synonymizer import NodeSynonymizer
 
+COHD_DATASET_ID = 3  # the hierarchical dataset
+
+# How each COHD_method scores an edge: the association value used (and the one it is sorted by when choosing between
+# several values for a pair), the value left out when computing percentile thresholds, whether higher values are
+# better, and the value a pair without any association gets
+COHD_METHODS = {
+    'paired_concept_freq': {'name': 'paired_concept_frequency', 'description': 'paired concept frequency',
+                            'value': 'concept_frequency', 'sort_by': 'concept_frequency', 'excluded_value': 0,
+                            'higher_is_better': True, 'default_value': 0},
+    'observed_expected_ratio': {'name': 'ln_observed_expected_ratio', 'description': 'natural logarithm of observed expected ratio',
+                                'value': 'ln_ratio', 'sort_by': 'ln_ratio', 'excluded_value': float("-inf"),
+                                'higher_is_better': True, 'default_value': float("-inf")},
+    'chi_square': {'name': 'chi_square_pvalue', 'description': 'chi square pvalue',
+                   'value': 'p_value', 'sort_by': 'chi_square', 'excluded_value': 0,
+                   'higher_is_better': False, 'default_value': float("inf")},
+}
+
+
 class COHDQuerier:
 
     def __init__(self, response_object: ARAXResponse) -> Tuple[QGOrganizedKnowledgeGraph, Dict[str, Dict[str, str]]]:
         self.response = response_object
         self.cohdindex = COHDIndex()
         self.synonymizer = NodeSynonymizer()
+        # What has been looked up so far for this query, so that each lookup is only done once
+        self.canonical_info = dict()
+        self.associations = np.empty(0, dtype=ASSOCIATION_DTYPE)
+        self.loaded_omop_ids = set()
+        self.curies_by_concept_id = dict()
 
     def answer_one_hop_query(self, query_graph: QueryGraph) -> Tuple[QGOrganizedKnowledgeGraph, Dict[str, Dict[str, str]]]:
         """
@@ -77,12 +100,8 @@ class COHDQuerier:
             return final_kg, edge_to_nodes_map
 
         # Run the actual query and process results
-        if COHD_method.lower() == 'paired_concept_freq':
-            final_kg, edge_to_nodes_map = self._answer_query_using_COHD_paired_concept_freq(query_graph, COHD_method_percentile, log)
-        elif COHD_method.lower() == 'observed_expected_ratio':
-            final_kg, edge_to_nodes_map = self._answer_query_using_COHD_observed_expected_ratio(query_graph, COHD_method_percentile, log)
-        elif COHD_method.lower() == 'chi_square':
-            final_kg, edge_to_nodes_map = self._answer_query_using_COHD_chi_square(query_graph, COHD_method_percentile, log)
+        if COHD_method.lower() in COHD_METHODS:
+            final_kg, edge_to_nodes_map = self._answer_query_using_COHD(query_graph, COHD_method.lower(), COHD_method_percentile, log)
         else:
             log.error(f"The parameter 'COHD_method' was passed an invalid option. The current allowed options are `paired_concept_freq`, `observed_expected_ratio`, `chi_square`.", error_code="InvalidParameterOption")
 
@@ -91,16 +110,12 @@ class COHDQuerier:
 
         return final_kg, edge_to_nodes_map
 
-    def _answer_query_using_COHD_paired_concept_freq(self, query_graph: QueryGraph, COHD_method_percentile: float, log: ARAXResponse) -> Tuple[QGOrganizedKnowledgeGraph, Dict[str, Dict[str, str]]]:
+    def _answer_query_using_COHD(self, query_graph: QueryGraph, COHD_method: str, COHD_method_percentile: float, log: ARAXResponse) -> Tuple[QGOrganizedKnowledgeGraph, Dict[str, Dict[str, str]]]:
+        method = COHD_METHODS[COHD_method]
         qedge_key = next(qedge_key for qedge_key in query_graph.edges)
-        log.debug(f"Processing query results for edge {qedge_key} by using paired concept frequency")
+        log.debug(f"Processing query results for edge {qedge_key} by using {method['description']}")
         final_kg = QGOrganizedKnowledgeGraph()
         edge_to_nodes_map = dict()
-        # if COHD_method_threshold == float("inf"):
-        #     threshold = pow(10, -3.365)  # default threshold based on the distribution of 0.99 quantile
-        # else:
-        #     threshold = COHD_method_threshold
-        # log.info(f"The threshod used to filter paired concept frequency is {threshold}")
 
         # extract information from the QueryGraph
         qedge = query_graph.edges[qedge_key]
@@ -132,775 +147,175 @@ class COHDQuerier:
         if (source_qnode_omop_ids is None) and (target_qnode_omop_ids is None):
             return final_kg, edge_to_nodes_map
 
-        elif (source_qnode_omop_ids is not None) and (target_qnode_omop_ids is not None):
-            source_dict = dict()
-            target_dict = dict()
-            average_threshold = 0
-            count = 0
+        # Look up the types of the given curies and all of the associations of their OMOP ids up front, in one batch each
+        given_omop_ids = [omop_ids for qnode_omop_ids in (source_qnode_omop_ids, target_qnode_omop_ids) if qnode_omop_ids is not None
+                          for omop_ids in qnode_omop_ids.values()]
+        self._get_canonical_info([curie for qnode_omop_ids in (source_qnode_omop_ids, target_qnode_omop_ids) if qnode_omop_ids is not None
+                                  for curie in qnode_omop_ids])
+        self._load_associations({omop_id for omop_ids in given_omop_ids for omop_id in omop_ids})
+
+        source_dict = dict()
+        target_dict = dict()
+        average_threshold = 0
+        count = 0
+        if (source_qnode_omop_ids is not None) and (target_qnode_omop_ids is not None):
             for (source_preferred_key, target_preferred_key) in itertools.product(list(source_qnode_omop_ids.keys()), list(target_qnode_omop_ids.keys())):
-
-                if source_qnode.category is None and target_qnode.category is None:
-                    pass
-                else:
-                    if self.synonymizer.get_canonical_curies(source_preferred_key)[source_preferred_key]['preferred_type'] == source_qnode.category:
-                        pass
-                    else:
-                        continue
-                    if self.synonymizer.get_canonical_curies(target_preferred_key)[target_preferred_key]['preferred_type'] == target_qnode.category:
-                        pass
-                    else:
-                        continue
-
-                if len(source_qnode_omop_ids[source_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
-                    continue
-                elif len(self.cohdindex.get_paired_concept_freq(concept_id_1=source_qnode_omop_ids[source_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept ids was found from COHD database for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
-                    continue
-                else:
-                    pass
-
-                if len(target_qnode_omop_ids[target_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
-                    continue
-                elif len(self.cohdindex.get_paired_concept_freq(concept_id_1=target_qnode_omop_ids[target_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept ids was found from COHD database for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
-                    continue
-                else:
-                    pass
-
-                frequency = 0
-                threshold1 = np.percentile([row['concept_frequency'] for row in self.cohdindex.get_paired_concept_freq(concept_id_1=source_qnode_omop_ids[source_preferred_key], dataset_id=3) if row['concept_frequency'] != 0], COHD_method_percentile)  # calculate the percentile after removing the extreme value e.g. 0
-                threshold2 = np.percentile([row['concept_frequency'] for row in self.cohdindex.get_paired_concept_freq(concept_id_1=target_qnode_omop_ids[target_preferred_key], dataset_id=3) if row['concept_frequency'] != 0], COHD_method_percentile)  # calculate the percentile after removing the extreme value e.g. 0
-                threshold = min(threshold1, threshold2)  # pick the minimum one for threshold
-                average_threshold = average_threshold + threshold
-                count = count + 1
-                omop_pairs = [f"{omop1}_{omop2}" for (omop1, omop2) in itertools.product(source_qnode_omop_ids[source_preferred_key], target_qnode_omop_ids[target_preferred_key])]
-                if len(omop_pairs) != 0:
-                    res = self.cohdindex.get_paired_concept_freq(concept_id_pair=omop_pairs, dataset_id=3)  # use the hierarchical dataset
-                    if len(res) != 0:
-                        maximum_concept_frequency = res[0]['concept_frequency']  # the result returned from get_paired_concept_freq was sorted by decreasing order
-                        frequency = maximum_concept_frequency
-                value = frequency
-                if value >= threshold:
-                    swagger_edge_key, swagger_edge = self._convert_to_swagger_edge(source_preferred_key, target_preferred_key, "paired_concept_frequency", value)
-                else:
+                if not self._has_category(source_preferred_key, source_qnode.category) or not self._has_category(target_preferred_key, target_qnode.category):
                     continue
-
-                source_dict[source_preferred_key] = source_qnode_key
-                target_dict[target_preferred_key] = target_qnode_key
-
-                # Record which of this edge's nodes correspond to which qnode_key
-                if swagger_edge_key not in edge_to_nodes_map:
-                    edge_to_nodes_map[swagger_edge_key] = dict()
-                edge_to_nodes_map[swagger_edge_key][source_qnode_key] = source_preferred_key
-                edge_to_nodes_map[swagger_edge_key][target_qnode_key] = target_preferred_key
-
-                # Finally add the current edge to our answer knowledge graph
-                final_kg.add_edge(swagger_edge_key, swagger_edge, qedge_key)
-
-            # Add the nodes to our answer knowledge graph
-            if len(source_dict) != 0:
-                for source_preferred_key in source_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(source_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, source_dict[source_preferred_key])
-            if len(target_dict) != 0:
-                for target_preferred_key in target_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(target_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, target_dict[target_preferred_key])
-
-            if count != 0:
-                log.info(f"The average threshold based on {COHD_method_percentile}th percentile of paired concept frequency is {threshold/count}")
-
-            return final_kg, edge_to_nodes_map
-
-        elif source_qnode_omop_ids is not None:
-            source_dict = dict()
-            target_dict = dict()
-            new_edge = dict()
-            average_threshold = 0
-            count = 0
-            for source_preferred_key in source_qnode_omop_ids:
-
-                if source_qnode.category is None:
-                    pass
-                else:
-                    if self.synonymizer.get_canonical_curies(source_preferred_key)[source_preferred_key]['preferred_type'] == source_qnode.category:
-                        pass
-                    else:
-                        log.warning(f"The preferred type of source preferred id '{source_preferred_key}' can't match to the given source type '{source_qnode.category}''")
-                        continue
-
-                if len(source_qnode_omop_ids[source_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
+                source_rows = self._get_associations_for_curie(source_preferred_key, source_qnode_omop_ids[source_preferred_key], qedge.subject, method, log)
+                if source_rows is None:
                     continue
-                elif len(self.cohdindex.get_paired_concept_freq(concept_id_1=source_qnode_omop_ids[source_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept frequency was found from COHD database for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
+                target_rows = self._get_associations_for_curie(target_preferred_key, target_qnode_omop_ids[target_preferred_key], qedge.object, method, log)
+                if target_rows is None:
                     continue
-                else:
-                    pass
 
-                new_edge[source_preferred_key] = dict()
-                threshold = np.percentile([row['concept_frequency'] for row in self.cohdindex.get_paired_concept_freq(concept_id_1=source_qnode_omop_ids[source_preferred_key], dataset_id=3) if row['concept_frequency'] != 0], COHD_method_percentile)
+                # Use the least strict of the two curies' thresholds
+                threshold1 = self._get_threshold(source_rows, method, COHD_method_percentile)
+                threshold2 = self._get_threshold(target_rows, method, COHD_method_percentile)
+                threshold = min(threshold1, threshold2) if method['higher_is_better'] else max(threshold1, threshold2)
                 average_threshold = average_threshold + threshold
                 count = count + 1
-                freq_data_list = [row for row in self.cohdindex.get_paired_concept_freq(concept_id_1=source_qnode_omop_ids[source_preferred_key], dataset_id=3) if row['concept_frequency'] >= threshold]
-                for freq_data in freq_data_list:
-                    if target_qnode.category is None:
-                        preferred_target_list = self.cohdindex.get_curies_from_concept_id(freq_data['concept_id_2'])
-                    else:
-                        preferred_target_list = [preferred_target_curie for preferred_target_curie in self.cohdindex.get_curies_from_concept_id(freq_data['concept_id_2']) if self.synonymizer.get_canonical_curies(preferred_target_curie)[preferred_target_curie]['preferred_type'] == target_qnode.category]
-
-                    for target_preferred_key in preferred_target_list:
-                        if target_preferred_key not in new_edge[source_preferred_key]:
-                            new_edge[source_preferred_key][target_preferred_key] = freq_data['concept_frequency']
-                        else:
-                            if freq_data['concept_frequency'] > new_edge[source_preferred_key][target_preferred_key]:
-                                new_edge[source_preferred_key][target_preferred_key] = freq_data['concept_frequency']
-
-                if len(new_edge[source_preferred_key]) != 0:
-                    for target_preferred_key in new_edge[source_preferred_key]:
-                        swagger_edge_key, swagger_edge = self._convert_to_swagger_edge(source_preferred_key, target_preferred_key, "paired_concept_frequency", new_edge[source_preferred_key][target_preferred_key])
-
-                        source_dict[source_preferred_key] = source_qnode_key
-                        target_dict[target_preferred_key] = target_qnode_key
-
-                        # Record which of this edge's nodes correspond to which qnode_key
-                        if swagger_edge_key not in edge_to_nodes_map:
-                            edge_to_nodes_map[swagger_edge_key] = dict()
-                            edge_to_nodes_map[swagger_edge_key][source_qnode_key] = source_preferred_key
-                            edge_to_nodes_map[swagger_edge_key][target_qnode_key] = target_preferred_key
-
-                        # Finally add the current edge to our answer knowledge graph
-                        final_kg.add_edge(swagger_edge_key, swagger_edge, qedge_key)
-
-            # Add the nodes to our answer knowledge graph
-            if len(source_dict) != 0:
-                for source_preferred_key in source_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(source_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, source_dict[source_preferred_key])
-            if len(target_dict) != 0:
-                for target_preferred_key in target_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(target_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, target_dict[target_preferred_key])
-
-            if count != 0:
-                log.info(f"The average threshold based on {COHD_method_percentile}th percentile of paired concept frequency is {threshold/count}")
-
-            return final_kg, edge_to_nodes_map
 
-        else:
-            source_dict = dict()
-            target_dict = dict()
-            new_edge = dict()
-            average_threshold = 0
-            count = 0
-            for target_preferred_key in target_qnode_omop_ids:
-
-                if target_qnode.category is None:
-                    pass
-                else:
-                    if self.synonymizer.get_canonical_curies(target_preferred_key)[target_preferred_key]['preferred_type'] == target_qnode.category:
-                        pass
-                    else:
-                        continue
-
-                if len(target_qnode_omop_ids[target_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
+                # The value for the pair is that of its top association (in the order COHD sorts them) between their OMOP ids
+                value = method['default_value']
+                pair_rows = source_rows[np.isin(source_rows['concept_id_2'], target_qnode_omop_ids[target_preferred_key])]
+                if len(pair_rows) != 0:
+                    value = float(pair_rows[method['value']][np.argmax(pair_rows[method['sort_by']])])
+                if not self._passes_threshold(value, threshold, method):
                     continue
-                elif len(self.cohdindex.get_paired_concept_freq(concept_id_1=target_qnode_omop_ids[target_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept frequency was found from COHD database for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
-                    continue
-                else:
-                    pass
-
-                new_edge[target_preferred_key] = dict()
-                threshold = np.percentile([row['concept_frequency'] for row in self.cohdindex.get_paired_concept_freq(concept_id_1=target_qnode_omop_ids[target_preferred_key], dataset_id=3) if row['concept_frequency'] != 0], COHD_method_percentile)
-                average_threshold = average_threshold + threshold
-                count = count + 1
-                freq_data_list = [row for row in self.cohdindex.get_paired_concept_freq(concept_id_1=target_qnode_omop_ids[target_preferred_key], dataset_id=3) if row['concept_frequency'] >= threshold]
-                for freq_data in freq_data_list:
-                    if source_qnode.category is None:
-                        preferred_source_list = self.cohdindex.get_curies_from_concept_id(freq_data['concept_id_2'])
-                    else:
-                        preferred_source_list = [preferred_source_curie for preferred_source_curie in self.cohdindex.get_curies_from_concept_id(freq_data['concept_id_2']) if self.synonymizer.get_canonical_curies(preferred_source_curie)[preferred_source_curie]['preferred_type'] == source_qnode.category]
-
-                    for source_preferred_key in preferred_source_list:
-                        if source_preferred_key not in new_edge[target_preferred_key]:
-                            new_edge[target_preferred_key][source_preferred_key] = freq_data['concept_frequency']
-                        else:
-                            if freq_data['concept_frequency'] > new_edge[target_preferred_key][source_preferred_key]:
-                                new_edge[target_preferred_key][source_preferred_key] = freq_data['concept_frequency']
-
-                if len(new_edge[target_preferred_key]) != 0:
-                    for source_preferred_key in new_edge[target_preferred_key]:
-                        swagger_edge_key, swagger_edge = self._convert_to_swagger_edge(source_preferred_key, target_preferred_key, "paired_concept_frequency", new_edge[target_preferred_key][source_preferred_key])
-
-                        source_dict[source_preferred_key] = source_qnode_key
-                        target_dict[target_preferred_key] = target_qnode_key
-
-                        # Record which of this edge's nodes correspond to which qnode_key
-                        if swagger_edge_key not in edge_to_nodes_map:
-                            edge_to_nodes_map[swagger_edge_key] = dict()
-                            edge_to_nodes_map[swagger_edge_key][source_qnode_key] = source_preferred_key
-                            edge_to_nodes_map[swagger_edge_key][target_qnode_key] = target_preferred_key
-
-                        # Finally add the current edge to our answer knowledge graph
-                        final_kg.add_edge(swagger_edge_key, swagger_edge, qedge_key)
-
-            # Add the nodes to our answer knowledge graph
-            if len(source_dict) != 0:
-                for source_preferred_key in source_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(source_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, source_dict[source_preferred_key])
-            if len(target_dict) != 0:
-                for target_preferred_key in target_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(target_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, target_dict[target_preferred_key])
-
-            if count != 0:
-                log.info(f"The average threshold based on {COHD_method_percentile}th percentile of paired concept frequency is {threshold/count}")
-
-            return final_kg, edge_to_nodes_map
-
-    def _answer_query_using_COHD_observed_expected_ratio(self, query_graph: QueryGraph, COHD_method_percentile: float, log: ARAXResponse) -> Tuple[QGOrganizedKnowledgeGraph, Dict[str, Dict[str, str]]]:
-        qedge_key = next(qedge_key for qedge_key in query_graph.edges)
-        log.debug(f"Processing query results for edge {qedge_key} by using natural logarithm of observed expected ratio")
-        final_kg = QGOrganizedKnowledgeGraph()
-        edge_to_nodes_map = dict()
-        # if COHD_method_threshold == float("inf"):
-        #     threshold = 4.44  # default threshold based on the distribution of 0.99 quantile
-        # else:
-        #     threshold = COHD_method_threshold
-        # log.info(f"The threshod used to filter natural logarithm of observed expected ratio is {threshold}")
-
-        # extract information from the QueryGraph
-        qedge = query_graph.edges[qedge_key]
-        source_qnode_key = qedge.subject
-        target_qnode_key = qedge.object
-        source_qnode = query_graph.nodes[source_qnode_key]
-        target_qnode = query_graph.nodes[target_qnode_key]
-
-        # check if both ends of edge have no curie
-        if (source_qnode.id is None) and (target_qnode.id is None):
-            log.error(f"Both ends of edge {qedge_key} are None", error_code="BadEdge")
-            return final_kg, edge_to_nodes_map
-
-        # Convert curie ids to OMOP ids
-        if source_qnode.id is not None:
-            source_qnode_omop_ids = self._get_omop_id_from_curies(source_qnode_key, query_graph, log)
-        else:
-            source_qnode_omop_ids = None
-        if log.status != 'OK':
-            return final_kg, edge_to_nodes_map
-        if target_qnode.id is not None:
-            target_qnode_omop_ids = self._get_omop_id_from_curies(target_qnode_key, query_graph, log)
-        else:
-            target_qnode_omop_ids = None
-        if log.status != 'OK':
-            return final_kg, edge_to_nodes_map
-
-        # expand edges according to the OMOP id pairs
-        if (source_qnode_omop_ids is None) and (target_qnode_omop_ids is None):
-            return final_kg, edge_to_nodes_map
-
-        elif (source_qnode_omop_ids is not None) and (target_qnode_omop_ids is not None):
-            source_dict = dict()
-            target_dict = dict()
-            average_threshold = 0
-            count = 0
-            for (source_preferred_key, target_preferred_key) in itertools.product(list(source_qnode_omop_ids.keys()), list(target_qnode_omop_ids.keys())):
-
-                if source_qnode.category is None and target_qnode.category is None:
-                    pass
-                else:
-                    if self.synonymizer.get_canonical_curies(source_preferred_key)[source_preferred_key]['preferred_type'] == source_qnode.category:
-                        pass
-                    else:
-                        continue
-                    if self.synonymizer.get_canonical_curies(target_preferred_key)[target_preferred_key]['preferred_type'] == target_qnode.category:
-                        pass
-                    else:
-                        continue
-
-                if len(source_qnode_omop_ids[source_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
-                    continue
-                elif len(self.cohdindex.get_obs_exp_ratio(concept_id_1=source_qnode_omop_ids[source_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept ids was found from COHD database for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
-                    continue
-                else:
-                    pass
-
-                if len(target_qnode_omop_ids[target_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
-                    continue
-                elif len(self.cohdindex.get_obs_exp_ratio(concept_id_1=target_qnode_omop_ids[target_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept ids was found from COHD database for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
-                    continue
-                else:
-                    pass
-
-                value = float("-inf")
-                threshold1 = np.percentile([row['ln_ratio'] for row in self.cohdindex.get_obs_exp_ratio(concept_id_1=source_qnode_omop_ids[source_preferred_key], domain="", dataset_id=3) if row['ln_ratio'] != float("-inf")], COHD_method_percentile)  # calculate the percentile after removing the extreme value e.g. -inf
-                threshold2 = np.percentile([row['ln_ratio'] for row in self.cohdindex.get_obs_exp_ratio(concept_id_1=target_qnode_omop_ids[target_preferred_key], domain="", dataset_id=3) if row['ln_ratio'] != float("-inf")], COHD_method_percentile)  # calculate the percentile after removing the extreme value e.g. -inf
-                threshold = min(threshold1, threshold2)  # pick the minimum one for threshold
-                average_threshold = average_threshold + threshold
-                count = count + 1
-                omop_pairs = [f"{omop1}_{omop2}" for (omop1, omop2) in itertools.product(source_qnode_omop_ids[source_preferred_key], target_qnode_omop_ids[target_preferred_key])]
-                if len(omop_pairs) != 0:
-                    res = self.cohdindex.get_obs_exp_ratio(concept_id_pair=omop_pairs, domain="", dataset_id=3)  # use the hierarchical dataset
-                    if len(res) != 0:
-                        maximum_ln_ratio = res[0]['ln_ratio']  # the result returned from get_paired_concept_freq was sorted by decreasing order
-                        value = maximum_ln_ratio
-                if value >= threshold:
-                    swagger_edge_key, swagger_edge = self._convert_to_swagger_edge(source_preferred_key, target_preferred_key, "ln_observed_expected_ratio", value)
-                else:
-                    continue
-
+                self._add_edge(final_kg, edge_to_nodes_map, qedge_key, source_qnode_key, source_preferred_key, target_qnode_key, target_preferred_key, method, value)
                 source_dict[source_preferred_key] = source_qnode_key
                 target_dict[target_preferred_key] = target_qnode_key
 
-                # Record which of this edge's nodes correspond to which qnode_key
-                if swagger_edge_key not in edge_to_nodes_map:
-                    edge_to_nodes_map[swagger_edge_key] = dict()
-                edge_to_nodes_map[swagger_edge_key][source_qnode_key] = source_preferred_key
-                edge_to_nodes_map[swagger_edge_key][target_qnode_key] = target_preferred_key
-
-                # Finally add the current edge to our answer knowledge graph
-                final_kg.add_edge(swagger_edge_key, swagger_edge, qedge_key)
-
-            # Add the nodes to our answer knowledge graph
-            if len(source_dict) != 0:
-                for source_preferred_key in source_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(source_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, source_dict[source_preferred_key])
-            if len(target_dict) != 0:
-                for target_preferred_key in target_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(target_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, target_dict[target_preferred_key])
-
-            if count != 0:
-                log.info(f"The average threshold based on {COHD_method_percentile}th percentile of natural logarithm of observed expected ratio is {threshold/count}")
-
-            return final_kg, edge_to_nodes_map
-
-        elif source_qnode_omop_ids is not None:
-            source_dict = dict()
-            target_dict = dict()
-            new_edge = dict()
-            average_threshold = 0
-            count = 0
-            for source_preferred_key in source_qnode_omop_ids:
-
-                if source_qnode.category is None:
-                    pass
-                else:
-                    if self.synonymizer.get_canonical_curies(source_preferred_key)[source_preferred_key]['preferred_type'] == source_qnode.category:
-                        pass
-                    else:
-                        continue
-
-                if len(source_qnode_omop_ids[source_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
-                    continue
-                elif len(self.cohdindex.get_obs_exp_ratio(concept_id_1=source_qnode_omop_ids[source_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept frequency was found from COHD database for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
-                    continue
-                else:
-                    pass
-
-                new_edge[source_preferred_key] = dict()
-                threshold = np.percentile([row['ln_ratio'] for row in self.cohdindex.get_obs_exp_ratio(concept_id_1=source_qnode_omop_ids[source_preferred_key], domain="", dataset_id=3) if row['ln_ratio'] != float("-inf")], COHD_method_percentile)
-                average_threshold = average_threshold + threshold
-                count = count + 1
-                ln_ratio_data_list = [row for row in self.cohdindex.get_obs_exp_ratio(concept_id_1=source_qnode_omop_ids[source_preferred_key], domain="", dataset_id=3) if row['ln_ratio'] >= threshold]
-                for ln_ratio_data in ln_ratio_data_list:
-                    if target_qnode.category is None:
-                        preferred_target_list = self.cohdindex.get_curies_from_concept_id(ln_ratio_data['concept_id_2'])
-                    else:
-                        preferred_target_list = [preferred_target_curie for preferred_target_curie in self.cohdindex.get_curies_from_concept_id(ln_ratio_data['concept_id_2']) if self.synonymizer.get_canonical_curies(preferred_target_curie)[preferred_target_curie]['preferred_type'] == target_qnode.category]
-
-                    for target_preferred_key in preferred_target_list:
-                        if target_preferred_key not in new_edge[source_preferred_key]:
-                            new_edge[source_preferred_key][target_preferred_key] = ln_ratio_data['ln_ratio']
-                        else:
-                            if ln_ratio_data['ln_ratio'] > new_edge[source_preferred_key][target_preferred_key]:
-                                new_edge[source_preferred_key][target_preferred_key] = ln_ratio_data['ln_ratio']
-
-                if len(new_edge[source_preferred_key]) != 0:
-                    for target_preferred_key in new_edge[source_preferred_key]:
-                        swagger_edge_key, swagger_edge = self._convert_to_swagger_edge(source_preferred_key, target_preferred_key, "ln_observed_expected_ratio", new_edge[source_preferred_key][target_preferred_key])
-
-                        source_dict[source_preferred_key] = source_qnode_key
-                        target_dict[target_preferred_key] = target_qnode_key
-
-                        # Record which of this edge's nodes correspond to which qnode_key
-                        if swagger_edge_key not in edge_to_nodes_map:
-                            edge_to_nodes_map[swagger_edge_key] = dict()
-                            edge_to_nodes_map[swagger_edge_key][source_qnode_key] = source_preferred_key
-                            edge_to_nodes_map[swagger_edge_key][target_qnode_key] = target_preferred_key
-
-                        # Finally add the current edge to our answer knowledge graph
-                        final_kg.add_edge(swagger_edge_key, swagger_edge, qedge_key)
-
-            # Add the nodes to our answer knowledge graph
-            if len(source_dict) != 0:
-                for source_preferred_key in source_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(source_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, source_dict[source_preferred_key])
-            if len(target_dict) != 0:
-                for target_preferred_key in target_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(target_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, target_dict[target_preferred_key])
-
-            if count != 0:
-                log.info(f"The average threshold based on {COHD_method_percentile}th percentile of natural logarithm of observed expected ratio is {threshold/count}")
-            return final_kg, edge_to_nodes_map
-
         else:
-            source_dict = dict()
-            target_dict = dict()
-            new_edge = dict()
-            average_threshold = 0
-            count = 0
-            for target_preferred_key in target_qnode_omop_ids:
-
-                if target_qnode.category is None:
-                    pass
-                else:
-                    if self.synonymizer.get_canonical_curies(target_preferred_key)[target_preferred_key]['preferred_type'] == target_qnode.category:
-                        pass
-                    else:
-                        continue
-
-                if len(target_qnode_omop_ids[target_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
+            # Only one end has curies: find the concepts associated with each of them at or beyond the threshold
+            if source_qnode_omop_ids is not None:
+                given_qnode_key, given_qnode, given_qnode_omop_ids, given_id_of_qedge = source_qnode_key, source_qnode, source_qnode_omop_ids, qedge.subject
+                other_qnode_key, other_qnode = target_qnode_key, target_qnode
+            else:
+                given_qnode_key, given_qnode, given_qnode_omop_ids, given_id_of_qedge = target_qnode_key, target_qnode, target_qnode_omop_ids, qedge.object
+                other_qnode_key, other_qnode = source_qnode_key, source_qnode
+            # (As before, chi-square p-values around a subject curie are filtered at the (100 - percentile)th percentile)
+            if COHD_method == 'chi_square' and source_qnode_omop_ids is not None:
+                percentile = 100 - COHD_method_percentile
+            else:
+                percentile = COHD_method_percentile
+
+            kept_rows = dict()
+            for given_preferred_key in given_qnode_omop_ids:
+                if not self._has_category(given_preferred_key, given_qnode.category):
+                    log.warning(f"The preferred type of preferred id '{given_preferred_key}' can't match to the given type '{given_qnode.category}''")
                     continue
-                elif len(self.cohdindex.get_paired_concept_freq(concept_id_1=target_qnode_omop_ids[target_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept frequency was found from COHD database for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
+                rows = self._get_associations_for_curie(given_preferred_key, given_qnode_omop_ids[given_preferred_key], given_id_of_qedge, method, log)
+                if rows is None:
                     continue
-                else:
-                    pass
-
-                new_edge[target_preferred_key] = dict()
-                threshold = np.percentile([row['ln_ratio'] for row in self.cohdindex.get_obs_exp_ratio(concept_id_1=target_qnode_omop_ids[target_preferred_key], domain="", dataset_id=3) if row['ln_ratio'] != float("-inf")], COHD_method_percentile)
+                threshold = self._get_threshold(rows, method, percentile)
                 average_threshold = average_threshold + threshold
                 count = count + 1
-                ln_ratio_data_list = [row for row in self.cohdindex.get_obs_exp_ratio(concept_id_1=target_qnode_omop_ids[target_preferred_key], domain="", dataset_id=3) if row['ln_ratio'] >= threshold]
-                for ln_ratio_data in ln_ratio_data_list:
-                    if source_qnode.category is None:
-                        preferred_source_list = self.cohdindex.get_curies_from_concept_id(ln_ratio_data['concept_id_2'])
+                kept_rows[given_preferred_key] = rows[self._passes_threshold(rows[method['value']], threshold, method)]
+
+            # Map all of the associated concepts to curies, and look up those curies' types, in one batch each
+            curies_by_concept_id = self._get_curies_from_concept_ids({int(concept_id) for rows in kept_rows.values() for concept_id in rows['concept_id_2']})
+            if other_qnode.category is not None:
+                self._get_canonical_info([curie for curies in curies_by_concept_id.values() for curie in curies])
+
+            for given_preferred_key, rows in kept_rows.items():
+                best_values = dict()
+                for concept_id, value in zip(rows['concept_id_2'].tolist(), rows[method['value']].tolist()):
+                    for other_preferred_key in curies_by_concept_id[concept_id]:
+                        if not self._has_category(other_preferred_key, other_qnode.category):
+                            continue
+                        if other_preferred_key not in best_values or self._is_better(value, best_values[other_preferred_key], method):
+                            best_values[other_preferred_key] = value
+
+                for other_preferred_key, value in best_values.items():
+                    if source_qnode_omop_ids is not None:
+                        source_preferred_key, target_preferred_key = given_preferred_key, other_preferred_key
                     else:
-                        preferred_source_list = [preferred_source_curie for preferred_source_curie in self.cohdindex.get_curies_from_concept_id(ln_ratio_data['concept_id_2']) if self.synonymizer.get_canonical_curies(preferred_source_curie)[preferred_source_curie]['preferred_type'] == source_qnode.category]
-
-                    for source_preferred_key in preferred_source_list:
-                        if source_preferred_key not in new_edge[target_preferred_key]:
-                            new_edge[target_preferred_key][source_preferred_key] = ln_ratio_data['ln_ratio']
-                        else:
-                            if ln_ratio_data['ln_ratio'] > new_edge[target_preferred_key][source_preferred_key]:
-                                new_edge[target_preferred_key][source_preferred_key] = ln_ratio_data['ln_ratio']
-
-                if len(new_edge[target_preferred_key]) != 0:
-                    for source_preferred_key in new_edge[target_preferred_key]:
-                        swagger_edge_key, swagger_edge = self._convert_to_swagger_edge(source_preferred_key, target_preferred_key, "ln_observed_expected_ratio", new_edge[target_preferred_key][source_preferred_key])
-
-                        source_dict[source_preferred_key] = source_qnode_key
-                        target_dict[target_preferred_key] = target_qnode_key
-
-                        # Record which of this edge's nodes correspond to which qnode_key
-                        if swagger_edge_key not in edge_to_nodes_map:
-                            edge_to_nodes_map[swagger_edge_key] = dict()
-                            edge_to_nodes_map[swagger_edge_key][source_qnode_key] = source_preferred_key
-                            edge_to_nodes_map[swagger_edge_key][target_qnode_key] = target_preferred_key
-
-                        # Finally add the current edge to our answer knowledge graph
-                        final_kg.add_edge(swagger_edge_key, swagger_edge, qedge_key)
-
-            # Add the nodes to our answer knowledge graph
-            if len(source_dict) != 0:
-                for source_preferred_key in source_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(source_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, source_dict[source_preferred_key])
-            if len(target_dict) != 0:
-                for target_preferred_key in target_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(target_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, target_dict[target_preferred_key])
-
-            if count != 0:
-                log.info(f"The average threshold based on {COHD_method_percentile}th percentile of natural logarithm of observed expected ratio is {threshold/count}")
-            return final_kg, edge_to_nodes_map
-
-    def _answer_query_using_COHD_chi_square(self, query_graph: QueryGraph, COHD_method_percentile: float, log: ARAXResponse) -> Tuple[QGOrganizedKnowledgeGraph, Dict[str, Dict[str, str]]]:
-        qedge_key = next(qedge_key for qedge_key in query_graph.edges)
-        log.debug(f"Processing query results for edge {qedge_key} by using chi square pvalue")
-        final_kg = QGOrganizedKnowledgeGraph()
-        edge_to_nodes_map = dict()
-        # if COHD_method_threshold == float("inf"):
-        #     threshold = pow(10, -270.7875)  # default threshold based on the distribution of 0.99 quantile
-        # else:
-        #     threshold = COHD_method_threshold
-        # log.info(f"The threshod used to filter chi square pvalue is {threshold}")
-
-        # extract information from the QueryGraph
-        qedge = query_graph.edges[qedge_key]
-        source_qnode_key = qedge.subject
-        target_qnode_key = qedge.object
-        source_qnode = query_graph.nodes[source_qnode_key]
-        target_qnode = query_graph.nodes[target_qnode_key]
-
-        # check if both ends of edge have no curie
-        if (source_qnode.id is None) and (target_qnode.id is None):
-            log.error(f"Both ends of edge {qedge_key} are None", error_code="BadEdge")
-            return final_kg, edge_to_nodes_map
+                        source_preferred_key, target_preferred_key = other_preferred_key, given_preferred_key
+                    self._add_edge(final_kg, edge_to_nodes_map, qedge_key, source_qnode_key, source_preferred_key, target_qnode_key, target_preferred_key, method, value)
+                    source_dict[source_preferred_key] = source_qnode_key
+                    target_dict[target_preferred_key] = target_qnode_key
 
-        # Convert curie ids to OMOP ids
-        if source_qnode.id is not None:
-            source_qnode_omop_ids = self._get_omop_id_from_curies(source_qnode_key, query_graph, log)
-        else:
-            source_qnode_omop_ids = None
-        if log.status != 'OK':
-            return final_kg, edge_to_nodes_map
-        if target_qnode.id is not None:
-            target_qnode_omop_ids = self._get_omop_id_from_curies(target_qnode_key, query_graph, log)
-        else:
-            target_qnode_omop_ids = None
-        if log.status != 'OK':
-            return final_kg, edge_to_nodes_map
+        # Add the nodes to our answer knowledge graph
+        self._get_canonical_info(list(source_dict) + list(target_dict))
+        for node_dict in (source_dict, target_dict):
+            for preferred_key, qnode_key in node_dict.items():
+                swagger_node_key, swagger_node = self._convert_to_swagger_node(preferred_key)
+                final_kg.add_node(swagger_node_key, swagger_node, qnode_key)
 
-        # expand edges according to the OMOP id pairs
-        if (source_qnode_omop_ids is None) and (target_qnode_omop_ids is None):
-            return final_kg, edge_to_nodes_map
+        if count != 0:
+            log.info(f"The average threshold based on {COHD_method_percentile}th percentile of {method['description']} is {average_threshold/count}")
 
-        elif (source_qnode_omop_ids is not None) and (target_qnode_omop_ids is not None):
-            source_dict = dict()
-            target_dict = dict()
-            average_threshold = 0
-            count = 0
-            for (source_preferred_key, target_preferred_key) in itertools.product(list(source_qnode_omop_ids.keys()), list(target_qnode_omop_ids.keys())):
-
-                if source_qnode.category is None and target_qnode.category is None:
-                    pass
-                else:
-                    if self.synonymizer.get_canonical_curies(source_preferred_key)[source_preferred_key]['preferred_type'] == source_qnode.category:
-                        pass
-                    else:
-                        continue
-                    if self.synonymizer.get_canonical_curies(target_preferred_key)[target_preferred_key]['preferred_type'] == target_qnode.category:
-                        pass
-                    else:
-                        continue
-
-                if len(source_qnode_omop_ids[source_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
-                    continue
-                elif len(self.cohdindex.get_obs_exp_ratio(concept_id_1=source_qnode_omop_ids[source_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept ids was found from COHD database for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
-                    continue
-                else:
-                    pass
-
-                if len(target_qnode_omop_ids[target_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
-                    continue
-                elif len(self.cohdindex.get_obs_exp_ratio(concept_id_1=target_qnode_omop_ids[target_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept ids was found from COHD database for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
-                    continue
-                else:
-                    pass
-
-                value = float("inf")
-                threshold1 = np.percentile([row['p-value'] for row in self.cohdindex.get_chi_square(concept_id_1=source_qnode_omop_ids[source_preferred_key], domain="", dataset_id=3) if row['p-value'] != 0], COHD_method_percentile)  # calculate the percentile after removing the extreme value e.g. 0
-                threshold2 = np.percentile([row['p-value'] for row in self.cohdindex.get_chi_square(concept_id_1=target_qnode_omop_ids[target_preferred_key], domain="", dataset_id=3) if row['p-value'] != 0], COHD_method_percentile)  # calculate the percentile after removing the extreme value e.g. 0
-                threshold = max(threshold1, threshold2)  # pick the maximum one for threshold
-                average_threshold = average_threshold + threshold
-                count = count + 1
-                omop_pairs = [f"{omop1}_{omop2}" for (omop1, omop2) in itertools.product(source_qnode_omop_ids[source_preferred_key], target_qnode_omop_ids[target_preferred_key])]
-
-                if len(omop_pairs) != 0:
-                    res = self.cohdIndex.get_chi_square(concept_id_pair=omop_pairs, domain="", dataset_id=3)  # use the hierarchical dataset
-                    if len(res) != 0:
-                        minimum_pvalue = res[0]['p-value']  # the result returned from get_paired_concept_freq was sorted by decreasing order
-                        value = minimum_pvalue
-
-                if value <= threshold:
-                    swagger_edge_key, swagger_edge = self._convert_to_swagger_edge(source_preferred_key, target_preferred_key, "chi_square_pvalue", value)
-                else:
-                    continue
-
-                source_dict[source_preferred_key] = source_qnode_key
-                target_dict[target_preferred_key] = target_qnode_key
-
-                # Record which of this edge's nodes correspond to which qnode_key
-                if swagger_edge_key not in edge_to_nodes_map:
-                    edge_to_nodes_map[swagger_edge_key] = dict()
-                edge_to_nodes_map[swagger_edge_key][source_qnode_key] = source_preferred_key
-                edge_to_nodes_map[swagger_edge_key][target_qnode_key] = target_preferred_key
-
-                # Finally add the current edge to our answer knowledge graph
-                final_kg.add_edge(swagger_edge_key, swagger_edge, qedge_key)
-
-            # Add the nodes to our answer knowledge graph
-            if len(source_dict) != 0:
-                for source_preferred_key in source_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(source_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, source_dict[source_preferred_key])
-            if len(target_dict) != 0:
-                for target_preferred_key in target_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(target_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, target_dict[target_preferred_key])
-
-            if count != 0:
-                log.info(f"The average threshold based on {COHD_method_percentile}th percentile of chi square pvalue is {threshold/count}")
-            return final_kg, edge_to_nodes_map
-
-        elif source_qnode_omop_ids is not None:
-            source_dict = dict()
-            target_dict = dict()
-            new_edge = dict()
-            average_threshold = 0
-            count = 0
-            for source_preferred_key in source_qnode_omop_ids:
-
-                if source_qnode.category is None:
-                    pass
-                else:
-                    if self.synonymizer.get_canonical_curies(source_preferred_key)[source_preferred_key]['preferred_type'] == source_qnode.category:
-                        pass
-                    else:
-                        continue
-
-                if len(source_qnode_omop_ids[source_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
-                    continue
-                elif len(self.cohdindex.get_obs_exp_ratio(concept_id_1=source_qnode_omop_ids[source_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept frequency was found from COHD database for source preferred id '{source_preferred_key}'' with qnode id '{qedge.subject}'")
-                    continue
-                else:
-                    pass
-
-                new_edge[source_preferred_key] = dict()
-                threshold = np.percentile([row['p-value'] for row in self.cohdindex.get_chi_square(concept_id_1=source_qnode_omop_ids[source_preferred_key], domain="", dataset_id=3) if row['p-value'] != 0], (100 - COHD_method_percentile))
-                average_threshold = average_threshold + threshold
-                count = count + 1
-                pvalue_data_list = [row for row in self.cohdindex.get_chi_square(concept_id_1=source_qnode_omop_ids[source_preferred_key], domain="", dataset_id=3) if row['p-value'] <= threshold]
-                for pvalue_data in pvalue_data_list:
-                    if target_qnode.category is None:
-                        preferred_target_list = self.cohdindex.get_curies_from_concept_id(pvalue_data['concept_id_2'])
-                    else:
-                        preferred_target_list = [preferred_target_curie for preferred_target_curie in self.cohdindex.get_curies_from_concept_id(pvalue_data['concept_id_2']) if self.synonymizer.get_canonical_curies(preferred_target_curie)[preferred_target_curie]['preferred_type'] == target_qnode.category]
-
-                    for target_preferred_key in preferred_target_list:
-                        if target_preferred_key not in new_edge[source_preferred_key]:
-                            new_edge[source_preferred_key][target_preferred_key] = pvalue_data['p-value']
-                        else:
-                            if pvalue_data['p-value'] < new_edge[source_preferred_key][target_preferred_key]:
-                                new_edge[source_preferred_key][target_preferred_key] = pvalue_data['p-value']
-
-                if len(new_edge[source_preferred_key]) != 0:
-                    for target_preferred_key in new_edge[source_preferred_key]:
-                        swagger_edge_key, swagger_edge = self._convert_to_swagger_edge(source_preferred_key, target_preferred_key, "chi_square_pvalue", new_edge[source_preferred_key][target_preferred_key])
-
-                        source_dict[source_preferred_key] = source_qnode_key
-                        target_dict[target_preferred_key] = target_qnode_key
-
-                        # Record which of this edge's nodes correspond to which qnode_key
-                        if swagger_edge_key not in edge_to_nodes_map:
-                            edge_to_nodes_map[swagger_edge_key] = dict()
-                            edge_to_nodes_map[swagger_edge_key][source_qnode_key] = source_preferred_key
-                            edge_to_nodes_map[swagger_edge_key][target_qnode_key] = target_preferred_key
-
-                        # Finally add the current edge to our answer knowledge graph
-                        final_kg.add_edge(swagger_edge_key, swagger_edge, qedge_key)
-
-            # Add the nodes to our answer knowledge graph
-            if len(source_dict) != 0:
-                for source_preferred_key in source_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(source_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, source_dict[source_preferred_key])
-            if len(target_dict) != 0:
-                for target_preferred_key in target_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(target_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, target_dict[target_preferred_key])
-
-            if count != 0:
-                log.info(f"The average threshold based on {COHD_method_percentile}th percentile of chi square pvalue is {threshold/count}")
-
-            return final_kg, edge_to_nodes_map
-
-        else:
-            source_dict = dict()
-            target_dict = dict()
-            new_edge = dict()
-            average_threshold = 0
-            count = 0
-            for target_preferred_key in target_qnode_omop_ids:
-
-                if target_qnode.category is None:
-                    pass
-                else:
-                    if self.synonymizer.get_canonical_curies(target_preferred_key)[target_preferred_key]['preferred_type'] == target_qnode.category:
-                        pass
-                    else:
-                        continue
-
-                if len(target_qnode_omop_ids[target_preferred_key]) == 0:
-                    log.warning(f"No OMOP concept id was found for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
-                    continue
-                elif len(self.cohdindex.get_paired_concept_freq(concept_id_1=target_qnode_omop_ids[target_preferred_key], dataset_id=3)) == 0:
-                    log.warning(f"No paired concept frequency was found from COHD database for target preferred id '{target_preferred_key}'' with qnode id '{qedge.object}'")
-                    continue
-                else:
-                    pass
+        return final_kg, edge_to_nodes_map
 
-                new_edge[target_preferred_key] = dict()
-                threshold = np.percentile([row['p-value'] for row in self.cohdindex.get_chi_square(concept_id_1=target_qnode_omop_ids[target_preferred_key], domain="", dataset_id=3) if row['p-value'] != 0], COHD_method_percentile)
-                average_threshold = average_threshold + threshold
-                count = count + 1
-                pvalue_data_list = [row for row in self.cohdindex.get_chi_square(concept_id_1=target_qnode_omop_ids[target_preferred_key], domain="", dataset_id=3) if row['p-value'] <= threshold]
-                for pvalue_data in pvalue_data_list:
-                    if source_qnode.category is None:
-                        preferred_source_list = self.cohdindex.get_curies_from_concept_id(pvalue_data['concept_id_2'])
-                    else:
-                        preferred_source_list = [preferred_source_curie for preferred_source_curie in self.cohdindex.get_curies_from_concept_id(pvalue_data['concept_id_2']) if self.synonymizer.get_canonical_curies(preferred_source_curie)[preferred_source_curie]['preferred_type'] == source_qnode.category]
-
-                    for source_preferred_key in preferred_source_list:
-                        if source_preferred_key not in new_edge[target_preferred_key]:
-                            new_edge[target_preferred_key][source_preferred_key] = pvalue_data['p-value']
-                        else:
-                            if pvalue_data['p-value'] < new_edge[target_preferred_key][source_preferred_key]:
-                                new_edge[target_preferred_key][source_preferred_key] = pvalue_data['p-value']
-
-                if len(new_edge[target_preferred_key]) != 0:
-                    for source_preferred_key in new_edge[target_preferred_key]:
-                        swagger_edge_key, swagger_edge = self._convert_to_swagger_edge(source_preferred_key, target_preferred_key, "chi_square_pvalue", new_edge[target_preferred_key][source_preferred_key])
-
-                        source_dict[source_preferred_key] = source_qnode_key
-                        target_dict[target_preferred_key] = target_qnode_key
-
-                        # Record which of this edge's nodes correspond to which qnode_key
-                        if swagger_edge_key not in edge_to_nodes_map:
-                            edge_to_nodes_map[swagger_edge_key] = dict()
-                            edge_to_nodes_map[swagger_edge_key][source_qnode_key] = source_preferred_key
-                            edge_to_nodes_map[swagger_edge_key][target_qnode_key] = target_preferred_key
-
-                        # Finally add the current edge to our answer knowledge graph
-                        final_kg.add_edge(swagger_edge_key, swagger_edge, qedge_key)
-
-            # Add the nodes to our answer knowledge graph
-            if len(source_dict) != 0:
-                for source_preferred_key in source_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(source_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, source_dict[source_preferred_key])
-            if len(target_dict) != 0:
-                for target_preferred_key in target_dict:
-                    swagger_node_key, swagger_node = self._convert_to_swagger_node(target_preferred_key)
-                    final_kg.add_node(swagger_node_key, swagger_node, target_dict[target_preferred_key])
-
-            if count != 0:
-                log.info(f"The average threshold based on {COHD_method_percentile}th percentile of chi square pvalue is {threshold/count}")
-
-            return final_kg, edge_to_nodes_map
+    def _add_edge(self, final_kg: QGOrganizedKnowledgeGraph, edge_to_nodes_map: Dict[str, Dict[str, str]], qedge_key: str, source_qnode_key: str,
+                  source_preferred_key: str, target_qnode_key: str, target_preferred_key: str, method: dict, value: float):
+        swagger_edge_key, swagger_edge = self._convert_to_swagger_edge(source_preferred_key, target_preferred_key, method['name'], value)
+
+        # Record which of this edge's nodes correspond to which qnode_key
+        if swagger_edge_key not in edge_to_nodes_map:
+            edge_to_nodes_map[swagger_edge_key] = dict()
+        edge_to_nodes_map[swagger_edge_key][source_qnode_key] = source_preferred_key
+        edge_to_nodes_map[swagger_edge_key][target_qnode_key] = target_preferred_key
+
+        # Finally add the current edge to our answer knowledge graph
+        final_kg.add_edge(swagger_edge_key, swagger_edge, qedge_key)
+
+    def _get_associations_for_curie(self, preferred_key: str, omop_ids: List[int], qnode_key: str, method: dict, log: ARAXResponse) -> Optional[np.ndarray]:
+        """Returns the (already loaded) COHD associations of a curie's OMOP ids that its threshold can be computed from, or None"""
+        if len(omop_ids) == 0:
+            log.warning(f"No OMOP concept id was found for preferred id '{preferred_key}'' with qnode id '{qnode_key}'")
+            return None
+        rows = self.associations[np.isin(self.associations['concept_id_1'], omop_ids)]
+        if len(rows) == 0 or not np.any(rows[method['value']] != method['excluded_value']):
+            log.warning(f"No paired concept ids was found from COHD database for preferred id '{preferred_key}'' with qnode id '{qnode_key}'")
+            return None
+        return rows
+
+    @staticmethod
+    def _get_threshold(rows: np.ndarray, method: dict, percentile: float) -> float:
+        # calculate the percentile after removing the extreme value (e.g. 0 or -inf)
+        values = rows[method['value']]
+        return float(np.percentile(values[values != method['excluded_value']], percentile))
+
+    @staticmethod
+    def _passes_threshold(value, threshold: float, method: dict):
+        return value >= threshold if method['higher_is_better'] else value <= threshold
+
+    @staticmethod
+    def _is_better(value: float, other_value: float, method: dict) -> bool:
+        return value > other_value if method['higher_is_better'] else value < other_value
+
+    def _has_category(self, curie: str, category) -> bool:
+        if category is None:
+            return True
+        canonical_info = self._get_canonical_info([curie]).get(curie)
+        if canonical_info is None:
+            return False
+        return canonical_info['preferred_type'] in category if isinstance(category, list) else canonical_info['preferred_type'] == category
+
+    def _get_canonical_info(self, curies: List[str]) -> Dict[str, Optional[Dict[str, str]]]:
+        """Returns the NodeSynonymizer's canonical info for each curie, looking up all those not seen before in one call"""
+        unknown_curies = [curie for curie in dict.fromkeys(curies) if curie not in self.canonical_info]
+        if unknown_curies:
+            canonical_info = self.synonymizer.get_canonical_curies(curies=unknown_curies)
+            for curie in unknown_curies:
+                self.canonical_info[curie] = canonical_info.get(curie)
+        return {curie: self.canonical_info[curie] for curie in curies}
+
+    def _load_associations(self, omop_ids: Set[int]):
+        """Fetches the COHD associations of all of these OMOP ids that haven't been fetched yet, in one batch"""
+        unloaded_omop_ids = {int(omop_id) for omop_id in omop_ids} - self.loaded_omop_ids
+        if unloaded_omop_ids:
+            self.associations = np.concatenate([self.associations, self.cohdindex.get_associations(list(unloaded_omop_ids), dataset_id=COHD_DATASET_ID)])
+            self.loaded_omop_ids |= unloaded_omop_ids
+
+    def _get_curies_from_concept_ids(self, concept_ids: Set[int]) -> Dict[int, List[str]]:
+        unknown_concept_ids = [concept_id for concept_id in concept_ids if concept_id not in self.curies_by_concept_id]
+        if unknown_concept_ids:
+            self.curies_by_concept_id.update(self.cohdindex.get_curies_from_concept_ids(unknown_concept_ids))
+        return {concept_id: self.curies_by_concept_id[concept_id] for concept_id in concept_ids}
 
     def _get_omop_id_from_curies(self, qnode_key: str, qg: QueryGraph, log: ARAXResponse) -> Dict[str, list]:
         log.info(f"Getting the OMOP id for {qnode_key}")
@@ -911,41 +326,12 @@ class COHDQuerier:
             log.error(f"{qnode_key} has no curie id", error_code="NoCurie")
             return {}
 
-        res_dict = {}
-        if isinstance(qnode.id, str):
-            # res = self.synonymizer.get_canonical_curies(curies=qnode.id)
-            # if res[qnode.id] is None:
-            #     log.error("Can't find the preferred curie for {qnode.id}", error_code="NoPreferredCurie")
-            #     return {}
-            # else:
-            #     preferred_curie = res[qnode.id]['preferred_curie']
-            try:
-                omop_ids = self.cohdindex.get_concept_ids(qnode.id)
-            except:
-                log.error(f"Internal error accessing local COHD database.", error_code="DatabaseError")
-                return {}
-            res_dict[qnode.id] = omop_ids
-
-        else:
-            # classify the curies based on the preferred curie
-            # res = self.synonymizer.get_canonical_curies(curies=qnode.id)
-            # for curie in res:
-            #     if res[curie] is None:
-            #         log.error("Can't find the preferred curie for {curie}", error_code="NoPreferredCurie")
-            #         return {}
-            #     else:
-            #         if res[curie]['preferred_curie'] not in res_dict:
-            #             res_dict[res[curie]['preferred_curie']] = []
-
-            for curie in qnode.id:
-                try:
-                    omop_ids = self.cohdindex.get_concept_ids(curie)
-                except:
-                    log.error(f"Internal error accessing local COHD database.", error_code="DatabaseError")
-                    return {}
-                res_dict[curie] = omop_ids
-
-        return res_dict
+        curies = [qnode.id] if isinstance(qnode.id, str) else qnode.id
+        try:
+            return self.cohdindex.get_concept_ids_for_curies(curies)
+        except:
+            log.error(f"Internal error accessing local COHD database.", error_code="DatabaseError")
+            return {}
 
     def _convert_to_swagger_edge(self, subject: str, object: str, name: str, value: float) -> Tuple[str, Edge]:
         swagger_edge = Edge()
@@ -968,8 +354,9 @@ class COHDQuerier:
     def _convert_to_swagger_node(self, node_key: str) -> Tuple[str, Node]:
         swagger_node = Node()
         swagger_node_key = node_key
-        swagger_node.name = self.synonymizer.get_canonical_curies(node_key)[node_key]['preferred_name']
+        canonical_info = self._get_canonical_info([node_key])[node_key] or dict()
+        swagger_node.name = canonical_info.get('preferred_name')
         swagger_node.description = None
-        swagger_node.category = self.synonymizer.get_canonical_curies(node_key)[node_key]['preferred_type']
+        swagger_node.category = canonical_info.get('preferred_type')
 
         return swagger_node_key, swagger_node
@@ -6,15 +6,13 @@ import ast
 import itertools
 import numpy as np
 from typing import List, Dict, Tuple
-from neo4j import GraphDatabase
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import expand_utilities as eu
 from expand_utilities import QGOrganizedKnowledgeGraph
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
 from ARAX_response import ARAXResponse
-sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../../")  # code directory
-from RTXConfiguration import RTXConfiguration
+from neo4j_connection_manager import get_neo4j_connection_manager
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.node import Node
 from openapi_server.models.edge import Edge
@@ -895,14 +893,8 @@ class DTDQuerier:
 
     @staticmethod
     def _run_cypher_query(cypher_query: str, kg_name: str, log: ARAXResponse) -> List[Dict[str, any]]:
-        rtxc = RTXConfiguration()
-        if "KG2" in kg_name:  # Flip into KG2 mode if that's our KP (rtx config is set to KG1 info by default)
-            rtxc.live = kg_name.upper()  # TODO: Eventually change config file to "KG2c" vs. "KG2C" (then won't need to convert case here)
         try:
-            driver = GraphDatabase.driver(rtxc.neo4j_bolt, auth=(rtxc.neo4j_username, rtxc.neo4j_password))
-            with driver.session() as session:
-                query_results = session.run(cypher_query).data()
-            driver.close()
+            query_results = get_neo4j_connection_manager().run_query(cypher_query, kg_name)
         except Exception:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -0,0 +1,65 @@
+#!/bin/env python3
+""" Compares wall-clock time for BTEQuerier answering a multi-curie one-hop query with its single-curie queries sent
+concurrently vs. one at a time (equivalent to the old curie-by-curie loop). Reports the number of answer edges for each
+so that the two modes can be checked for agreement.
+Usage: python benchmark_bte_querier.py [--curies NCBIGene:1017 NCBIGene:7157 ...] [--output-category ChemicalSubstance]
+       [--max-concurrent-queries 4] [--runs 3]
+"""
+import argparse
+import copy
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bte_querier import BTEQuerier
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
+from ARAX_response import ARAXResponse
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../UI/OpenAPI/python-flask-server/")
+from openapi_server.models.query_graph import QueryGraph
+from openapi_server.models.q_node import QNode
+from openapi_server.models.q_edge import QEdge
+
+DEFAULT_CURIES = ["NCBIGene:1017", "NCBIGene:7157", "NCBIGene:672", "NCBIGene:3845", "NCBIGene:1956",
+                  "NCBIGene:5290", "NCBIGene:207", "NCBIGene:4609", "NCBIGene:2064", "NCBIGene:7422"]
+
+
+def _run_query(qg: QueryGraph, max_concurrent_queries: int):
+    response = ARAXResponse()
+    response.data['parameters'] = {'enforce_directionality': True, 'use_synonyms': False}
+    querier = BTEQuerier(response)
+    querier.max_concurrent_queries = max_concurrent_queries
+    start = time.time()
+    answer_kg, _ = querier.answer_one_hop_query(copy.deepcopy(qg))
+    elapsed = time.time() - start
+    if response.status != 'OK':
+        print(response.show(level=ARAXResponse.ERROR))
+    return elapsed, sum(len(edges) for edges in answer_kg.edges_by_qg_id.values())
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmarks concurrent vs. curie-by-curie BTE querying")
+    arg_parser.add_argument("--curies", dest="curies", nargs="+", default=DEFAULT_CURIES)
+    arg_parser.add_argument("--input-category", dest="input_category", type=str, default="Gene")
+    arg_parser.add_argument("--output-category", dest="output_category", type=str, default="ChemicalSubstance")
+    arg_parser.add_argument("--max-concurrent-queries", dest="max_concurrent_queries", type=int, default=4)
+    arg_parser.add_argument("--runs", dest="num_runs", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    qg = QueryGraph(nodes={"n00": QNode(id=args.curies, category=[args.input_category]),
+                           "n01": QNode(category=[args.output_category])},
+                    edges={"e00": QEdge(subject="n00", object="n01")})
+    modes = [("curie-by-curie", 1), ("concurrent", args.max_concurrent_queries)]
+    for label, max_concurrent_queries in modes:
+        times = []
+        num_edges = None
+        for run in range(args.num_runs):
+            elapsed, num_edges = _run_query(qg, max_concurrent_queries)
+            times.append(elapsed)
+        print(f"{label}: median {round(statistics.median(times), 2)} s, max {round(max(times), 2)} s over "
+              f"{len(times)} runs ({len(args.curies)} curies, {num_edges} edges)")
+
+
+if __name__ == "__main__":
+    main()
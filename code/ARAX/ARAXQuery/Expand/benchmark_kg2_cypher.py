@@ -0,0 +1,74 @@
+#!/bin/env python3
+""" Compares neo4j planning time for KG2Querier's parameterized cypher vs. cypher with curies inlined into the text.
+Each run expands the same query graph shape with a different random set of input curies; neo4j's
+'result_available_after' (time to plan the query and produce the first record) is recorded for each.
+Usage: python benchmark_kg2_cypher.py [--kg KG2c] [--runs 20] [--curies 100]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+from typing import List, Dict
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from kg2_querier import KG2Querier
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
+from neo4j_connection_manager import get_neo4j_connection_manager
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../UI/OpenAPI/python-flask-server/")
+from openapi_server.models.query_graph import QueryGraph
+from openapi_server.models.q_node import QNode
+from openapi_server.models.q_edge import QEdge
+
+
+def _get_random_curies(kg_name: str, category: str, num_curies: int) -> List[str]:
+    category_property = "types" if kg_name == "KG2c" else "category_label"
+    cypher_query = f"MATCH (n) WHERE $category IN n.{category_property} " \
+                   f"RETURN n.id AS id, rand() AS r ORDER BY r LIMIT {num_curies}"
+    results = get_neo4j_connection_manager().run_query(cypher_query, kg_name, {"category": category})
+    return [result["id"] for result in results]
+
+
+def _inline_parameters(cypher_template: str, parameters: Dict[str, any]) -> str:
+    # Recreates the old (pre-parameterization) style of query, where values are baked into the query text
+    cypher_query = cypher_template
+    for parameter_name in sorted(parameters, key=len, reverse=True):
+        cypher_query = cypher_query.replace(f"${parameter_name}", json.dumps(parameters[parameter_name]))
+    return cypher_query
+
+
+def _get_planning_time_ms(cypher_query: str, parameters: Dict[str, any], kg_name: str) -> int:
+    with get_neo4j_connection_manager().session(kg_name) as session:
+        result = session.run(cypher_query, parameters)
+        result.consume()
+        return result.summary().result_available_after
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmarks planning time of KG2Querier's cypher queries")
+    arg_parser.add_argument("--kg", dest="kg_name", type=str, default="KG2c")
+    arg_parser.add_argument("--runs", dest="num_runs", type=int, default=20)
+    arg_parser.add_argument("--curies", dest="num_curies", type=int, default=100)
+    args = arg_parser.parse_args()
+
+    querier = KG2Querier.__new__(KG2Querier)  # The cypher builders don't need a response object
+    inlined_times = []
+    parameterized_times = []
+    for run in range(args.num_runs):
+        curies = _get_random_curies(args.kg_name, "disease", args.num_curies)
+        qg = QueryGraph(nodes={"n00": QNode(id=curies, category=["disease"]), "n01": QNode(category=["protein"])},
+                        edges={"e00": QEdge(subject="n00", object="n01", predicate=[])})
+        shape = querier._get_query_graph_shape(qg, False, args.kg_name)
+        cypher_template = querier._get_one_hop_cypher_template(shape)
+        parameters = querier._get_cypher_parameters(qg, args.kg_name)
+        inlined_times.append(_get_planning_time_ms(_inline_parameters(cypher_template, parameters), dict(), args.kg_name))
+        parameterized_times.append(_get_planning_time_ms(cypher_template, parameters, args.kg_name))
+
+    for label, times in [("inlined", inlined_times), ("parameterized", parameterized_times)]:
+        print(f"{label}: median {statistics.median(times)} ms, mean {round(statistics.mean(times), 1)} ms, "
+              f"max {max(times)} ms over {len(times)} runs")
+    print(f"Template cache: {querier._get_one_hop_cypher_template.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
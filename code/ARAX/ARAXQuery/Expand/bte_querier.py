@@ -4,6 +4,8 @@ import sys
 import os
 import traceback
 import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Tuple, Set
 
 from biothings_explorer.user_query_dispatcher import SingleEdgeQueryDispatcher
@@ -24,6 +26,7 @@ class BTEQuerier:
 
     def __init__(self, response_object: ARAXResponse):
         self.response = response_object
+        self.max_concurrent_queries = 4  # Max number of single-curie queries to have in flight to BTE at once
 
     def answer_one_hop_query(self, query_graph: QueryGraph) -> Tuple[QGOrganizedKnowledgeGraph, Dict[str, Dict[str, str]]]:
         """
@@ -85,33 +88,67 @@ class BTEQuerier:
         qedge = qg.edges[qedge_key]
         input_qnode = qg.nodes[input_qnode_key]
         output_qnode = qg.nodes[output_qnode_key]
-        # Send this single-edge query to BTE, input curie by input curie (adding findings to our answer KG as we go)
+        # BTE takes a single input curie per query, so send one query per curie (and combination of qnode types,
+        # which can be multiple if gene/protein)
+        queries = []
         for curie in input_qnode.id:
-            # Consider all different combinations of qnode types (can be multiple if gene/protein)
-            for input_qnode_category, output_qnode_category in itertools.product(input_qnode.category, output_qnode.category):
-                if eu.get_curie_prefix(curie) in valid_bte_inputs_dict['curie_prefixes']:
-                    accepted_curies.add(curie)
-                    try:
-                        loop = asyncio.new_event_loop()
-                        seqd = SingleEdgeQueryDispatcher(input_cls=input_qnode_category,
-                                                         output_cls=output_qnode_category,
-                                                         pred=qedge.predicate,
-                                                         input_id=eu.get_curie_prefix(curie),
-                                                         values=eu.get_curie_local_id(curie),
-                                                         loop=loop)
-                        log.debug(f"Sending query to BTE: {curie}-{qedge.predicate if qedge.predicate else ''}->{output_qnode_category}")
-                        seqd.query()
-                        reasoner_std_response = seqd.to_reasoner_std()
-                    except Exception:
-                        trace_back = traceback.format_exc()
-                        error_type, error, _ = sys.exc_info()
-                        log.error(f"Encountered a problem while using BioThings Explorer. {trace_back}",
-                                  error_code=error_type.__name__)
-                        return answer_kg, accepted_curies
-                    else:
-                        answer_kg = self._add_answers_to_kg(answer_kg, reasoner_std_response, input_qnode_key, output_qnode_key, qedge_key, log)
+            if eu.get_curie_prefix(curie) in valid_bte_inputs_dict['curie_prefixes']:
+                accepted_curies.add(curie)
+                queries += [(curie, input_qnode_category, output_qnode_category) for input_qnode_category, output_qnode_category
+                            in itertools.product(input_qnode.category, output_qnode.category)]
+        if not queries:
+            return answer_kg, accepted_curies
+        log.debug(f"Sending {len(queries)} queries for {len(accepted_curies)} curies to BTE "
+                  f"(up to {self.max_concurrent_queries} at a time)")
+
+        # Send the queries to BTE concurrently, adding answers to our KG as each one comes back
+        event_loops = []
+        thread_state = threading.local()
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrent_queries)
+        try:
+            futures = {executor.submit(self._query_bte_for_curie, query, qedge.predicate, thread_state, event_loops): query
+                       for query in queries}
+            for future in as_completed(futures):
+                curie, _, output_qnode_category = futures[future]
+                try:
+                    reasoner_std_response = future.result()
+                except Exception:
+                    trace_back = traceback.format_exc()
+                    error_type, error, _ = sys.exc_info()
+                    log.error(f"Encountered a problem while using BioThings Explorer. {trace_back}",
+                              error_code=error_type.__name__)
+                    for other_future in futures:
+                        other_future.cancel()
+                    return answer_kg, accepted_curies
+                log.debug(f"Got response from BTE for {curie}-{qedge.predicate if qedge.predicate else ''}->{output_qnode_category}")
+                answer_kg = self._add_answers_to_kg(answer_kg, reasoner_std_response, input_qnode_key, output_qnode_key, qedge_key, log)
+                if log.status != 'OK':
+                    for other_future in futures:
+                        other_future.cancel()
+                    return answer_kg, accepted_curies
+        finally:
+            executor.shutdown(wait=True)
+            for loop in event_loops:
+                loop.close()
         return answer_kg, accepted_curies
 
+    @staticmethod
+    def _query_bte_for_curie(query: Tuple[str, str, str], predicate: List[str], thread_state: threading.local,
+                             event_loops: List[asyncio.AbstractEventLoop]) -> Dict[str, any]:
+        # Each worker thread creates one event loop and reuses it for every query it sends to BTE
+        if not hasattr(thread_state, "loop"):
+            thread_state.loop = asyncio.new_event_loop()
+            event_loops.append(thread_state.loop)
+        curie, input_qnode_category, output_qnode_category = query
+        seqd = SingleEdgeQueryDispatcher(input_cls=input_qnode_category,
+                                         output_cls=output_qnode_category,
+                                         pred=predicate,
+                                         input_id=eu.get_curie_prefix(curie),
+                                         values=eu.get_curie_local_id(curie),
+                                         loop=thread_state.loop)
+        seqd.query()
+        return seqd.to_reasoner_std()
+
     def _add_answers_to_kg(self, answer_kg: QGOrganizedKnowledgeGraph, reasoner_std_response: Dict[str, any],
                            input_qnode_key: str, output_qnode_key: str, qedge_key: str, log: ARAXResponse) -> QGOrganizedKnowledgeGraph:
         kg_to_qg_ids_dict = self._build_kg_to_qg_id_dict(reasoner_std_response['results'])
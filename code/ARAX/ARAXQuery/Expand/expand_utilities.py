@@ -247,6 +247,30 @@ def get_curie_synonyms(curie: Union[str, List[str]], log: ARAXResponse) -> List[
             return []
 
 
+def get_curie_synonyms_dict(curie: Union[str, List[str]], log: ARAXResponse) -> Dict[str, List[str]]:
+    curies = convert_string_or_list_to_list(curie)
+    try:
+        synonymizer = NodeSynonymizer()
+        log.debug(f"Sending NodeSynonymizer.get_equivalent_nodes() a list of {len(curies)} curies")
+        equivalent_curies_dict = synonymizer.get_equivalent_nodes(curies, kg_name="KG2")
+        log.debug(f"Got response back from NodeSynonymizer")
+    except Exception:
+        tb = traceback.format_exc()
+        error_type, error, _ = sys.exc_info()
+        log.error(f"Encountered a problem using NodeSynonymizer: {tb}", error_code=error_type.__name__)
+        return {}
+    else:
+        if equivalent_curies_dict is not None:
+            curies_missing_info = {curie for curie in curies if not equivalent_curies_dict.get(curie)}
+            if curies_missing_info:
+                log.warning(f"NodeSynonymizer did not find any equivalent curies for: {curies_missing_info}")
+            # Make sure even curies without synonyms are included
+            return {curie: sorted(set(equivalent_curies_dict.get(curie) or []).union({curie})) for curie in curies}
+        else:
+            log.error(f"NodeSynonymizer returned None", error_code="NodeNormalizationIssue")
+            return {}
+
+
 def get_canonical_curies_dict(curie: Union[str, List[str]], log: ARAXResponse) -> Dict[str, Dict[str, str]]:
     curies = convert_string_or_list_to_list(curie)
     try:
@@ -407,13 +431,19 @@ def switch_back_to_str_or_list_types(qg: QueryGraph) -> QueryGraph:
     return qg
 
 
-def make_qg_use_old_types(qg: QueryGraph) -> QueryGraph:
+def convert_predicate_to_old_format(predicate: str) -> str:
     # This is a temporary patch until we switch to KG2.5+
     predicates_with_commas = {"positively_regulates_entity_to_entity": "positively_regulates,_entity_to_entity",
                               "negatively_regulates_entity_to_entity": "negatively_regulates,_entity_to_entity",
                               "positively_regulates_process_to_process": "positively_regulates,_process_to_process",
                               "regulates_process_to_process": "regulates,_process_to_process",
                               "negatively_regulates_process_to_process": "negatively_regulates,_process_to_process"}
+    prefixless_predicate = predicate.split(":")[-1]
+    return predicates_with_commas.get(prefixless_predicate, prefixless_predicate)
+
+
+def make_qg_use_old_types(qg: QueryGraph) -> QueryGraph:
+    # This is a temporary patch until we switch to KG2.5+
     qg_copy = QueryGraph(nodes={qnode_key: copy_qnode(qnode) for qnode_key, qnode in qg.nodes.items()},
                          edges={qedge_key: copy_qedge(qedge) for qedge_key, qedge in qg.edges.items()})
     for qnode in qg_copy.nodes.values():
@@ -424,8 +454,7 @@ def make_qg_use_old_types(qg: QueryGraph) -> QueryGraph:
     for qedge in qg_copy.edges.values():
         if qedge.predicate:
             predicates = convert_string_or_list_to_list(qedge.predicate)
-            prefixless_predicates = [predicate.split(":")[-1] for predicate in predicates]
-            qedge.predicate = [predicates_with_commas.get(predicate, predicate) for predicate in prefixless_predicates]
+            qedge.predicate = [convert_predicate_to_old_format(predicate) for predicate in predicates]
     return qg_copy
 
 
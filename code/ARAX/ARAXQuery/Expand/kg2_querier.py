@@ -3,17 +3,15 @@ import sys
 import os
 import traceback
 import ast
+from functools import lru_cache
 from typing import List, Dict, Tuple
 
-from neo4j import GraphDatabase
-
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import expand_utilities as eu
 from expand_utilities import QGOrganizedKnowledgeGraph
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
 from ARAX_response import ARAXResponse
-sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")  # code directory
-from RTXConfiguration import RTXConfiguration
+from neo4j_connection_manager import get_neo4j_connection_manager
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.node import Node
 from openapi_server.models.edge import Edge
@@ -27,6 +25,9 @@ class KG2Querier:
         self.response = response_object
         self.enforce_directionality = self.response.data['parameters'].get('enforce_directionality')
         self.use_synonyms = self.response.data['parameters'].get('use_synonyms')
+        max_edges = self.response.data['parameters'].get('max_edges')
+        self.max_edges = int(max_edges) if max_edges is not None else None
+        self.stream_batch_size = 5000
         if input_kp == "ARAX/KG2":
             if self.use_synonyms:
                 self.kg_name = "KG2c"
@@ -76,14 +77,12 @@ class KG2Querier:
                 qnode.id = canonical_curies
             qnode.category = []  # Important to clear this, otherwise results are limited (#889)
 
-        # Run the actual query and process results
-        cypher_query = self._convert_one_hop_query_graph_to_cypher_query(query_graph, enforce_directionality, kg_name, log)
-        if log.status != 'OK':
-            return final_kg, edge_to_nodes_map
-        neo4j_results = self._answer_query_using_neo4j(cypher_query, qedge_key, kg_name, log)
+        # Run the actual query and process results (as they stream in)
+        cypher_query, parameters = self._convert_one_hop_query_graph_to_cypher_query(query_graph, enforce_directionality,
+                                                                                     kg_name, log)
         if log.status != 'OK':
             return final_kg, edge_to_nodes_map
-        final_kg, edge_to_nodes_map = self._load_answers_into_kg(neo4j_results, kg_name, query_graph, log)
+        final_kg, edge_to_nodes_map = self._stream_answers_into_kg(cypher_query, parameters, kg_name, query_graph, log)
         if log.status != 'OK':
             return final_kg, edge_to_nodes_map
 
@@ -111,10 +110,12 @@ class KG2Querier:
                 qnode.category = []  # Important to clear this to avoid discrepancies in types for particular concepts
 
         # Build and run a cypher query to get this node/nodes
-        where_clause = f"{qnode_key}.id='{qnode.id}'" if type(qnode.id) is str else f"{qnode_key}.id in {qnode.id}"
-        cypher_query = f"MATCH {self._get_cypher_for_query_node(qnode_key, single_node_qg, kg_name)} WHERE {where_clause} RETURN {qnode_key}"
+        curies = [qnode.id] if type(qnode.id) is str else qnode.id
+        _, _, category_label, _ = self._get_query_node_shape(qnode_key, single_node_qg, kg_name)
+        qnode_cypher = self._get_cypher_for_query_node_shape(qnode_key, "none", category_label)
+        cypher_query = f"MATCH {qnode_cypher} WHERE {qnode_key}.id IN ${qnode_key}_curies RETURN {qnode_key}"
         log.info(f"Sending cypher query for node {qnode_key} to {kg_name} neo4j")
-        results = self._run_cypher_query(cypher_query, kg_name, log)
+        results = self._run_cypher_query(cypher_query, kg_name, log, {f"{qnode_key}_curies": curies})
 
         # Load the results into swagger object model and add to our answer knowledge graph
         for result in results:
@@ -128,106 +129,139 @@ class KG2Querier:
         return final_kg
 
     def _convert_one_hop_query_graph_to_cypher_query(self, qg: QueryGraph, enforce_directionality: bool,
-                                                     kg_name: str, log: ARAXResponse) -> str:
+                                                     kg_name: str, log: ARAXResponse) -> Tuple[str, Dict[str, any]]:
         qedge_key = next(qedge_key for qedge_key in qg.edges)
-        qedge = qg.edges[qedge_key]
         log.debug(f"Generating cypher for edge {qedge_key} query graph")
         try:
-            # Build the match clause
-            subject_qnode_key = qedge.subject
-            object_qnode_key = qedge.object
-            qedge_cypher = self._get_cypher_for_query_edge(qedge_key, qg, enforce_directionality)
-            source_qnode_cypher = self._get_cypher_for_query_node(subject_qnode_key, qg, kg_name)
-            target_qnode_cypher = self._get_cypher_for_query_node(object_qnode_key, qg, kg_name)
-            match_clause = f"MATCH {source_qnode_cypher}{qedge_cypher}{target_qnode_cypher}"
-
-            # Build the where clause
-            where_fragments = []
-            for qnode_key in [subject_qnode_key, object_qnode_key]:
-                qnode = qg.nodes[qnode_key]
-                if qnode.id and isinstance(qnode.id, list) and len(qnode.id) > 1:
-                    where_fragments.append(f"{qnode_key}.id in {qnode.id}")
-                if qnode.category:
-                    # Only inspect the 'all_categories' field if we're using KG2c
-                    if kg_name == "KG2c":
-                        category_fragments = [f"'{category}' in {qnode_key}.types" for category in qnode.category]
-                        joined_category_fragments = " OR ".join(category_fragments)
-                        category_where_clause = joined_category_fragments if len(category_fragments) < 2 else f"({joined_category_fragments})"
-                        where_fragments.append(category_where_clause)
-                    # Otherwise add a simple where condition if we have multiple categories
-                    elif len(qnode.category) > 1:
-                        if kg_name == "KG2":
-                            node_category_property = "category_label"
-                        else:
-                            node_category_property = "category"
-                        where_fragments.append(f"{qnode_key}.{node_category_property} in {qnode.category}")
-
-            if where_fragments:
-                where_clause = f"WHERE {' AND '.join(where_fragments)}"
-            else:
-                where_clause = ""
-
-            # Build the with clause
-            source_qnode_col_name = f"nodes_{subject_qnode_key}"
-            target_qnode_col_name = f"nodes_{object_qnode_key}"
-            qedge_col_name = f"edges_{qedge_key}"
-            # This line grabs the edge's ID and a record of which of its nodes correspond to which qnode ID
-            extra_edge_properties = "{.*, " + f"id:ID({qedge_key}), {subject_qnode_key}:{subject_qnode_key}.id, {object_qnode_key}:{object_qnode_key}.id" + "}"
-            with_clause = f"WITH collect(distinct {subject_qnode_key}) as {source_qnode_col_name}, " \
-                          f"collect(distinct {object_qnode_key}) as {target_qnode_col_name}, " \
-                          f"collect(distinct {qedge_key}{extra_edge_properties}) as {qedge_col_name}"
-
-            # Build the return clause
-            return_clause = f"RETURN {source_qnode_col_name}, {target_qnode_col_name}, {qedge_col_name}"
-
-            cypher_query = f"{match_clause} {where_clause} {with_clause} {return_clause}"
-            return cypher_query
+            # Curies and categories are passed as parameters, so the query text only depends on the QG's 'shape';
+            # this lets neo4j reuse its query plan across requests (and keeps the query text small)
+            qg_shape = self._get_query_graph_shape(qg, enforce_directionality, kg_name, self.max_edges is not None)
+            cypher_template = self._get_one_hop_cypher_template(qg_shape)
+            parameters = self._get_cypher_parameters(qg, kg_name)
+            if self.max_edges is not None:
+                parameters["max_edges"] = self.max_edges
+            return cypher_template, parameters
         except Exception:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
             log.error(f"Problem generating cypher for query. {tb}", error_code=error_type.__name__)
-            return ""
+            return "", dict()
+
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def _get_one_hop_cypher_template(qg_shape: tuple) -> str:
+        qedge_key, predicates, enforce_directionality, kg_name, qnode_shapes, has_edge_limit = qg_shape
+        subject_qnode_key, object_qnode_key = [qnode_shape[0] for qnode_shape in qnode_shapes]
+        # Build the match clause
+        qedge_cypher = KG2Querier._get_cypher_for_query_edge_shape(qedge_key, predicates, enforce_directionality)
+        source_qnode_cypher = KG2Querier._get_cypher_for_query_node_shape(*qnode_shapes[0])
+        target_qnode_cypher = KG2Querier._get_cypher_for_query_node_shape(*qnode_shapes[1])
+        match_clause = f"MATCH {source_qnode_cypher}{qedge_cypher}{target_qnode_cypher}"
+
+        # Build the where clause
+        where_fragments = []
+        for qnode_key, curie_mode, _, has_category_parameter in qnode_shapes:
+            if curie_mode == "multiple":
+                where_fragments.append(f"{qnode_key}.id IN ${qnode_key}_curies")
+            if has_category_parameter:
+                # Only inspect the 'types' field if we're using KG2c
+                if kg_name == "KG2c":
+                    where_fragments.append(f"any(category IN ${qnode_key}_categories WHERE category IN {qnode_key}.types)")
+                # Otherwise add a simple where condition (we have multiple categories)
+                else:
+                    node_category_property = "category_label" if kg_name == "KG2" else "category"
+                    where_fragments.append(f"{qnode_key}.{node_category_property} IN ${qnode_key}_categories")
+        where_clause = f"WHERE {' AND '.join(where_fragments)}" if where_fragments else ""
+
+        # Build the return clause (one row per matching edge, so results can be streamed back)
+        # This grabs the edge's ID and a record of which of its nodes correspond to which qnode ID
+        extra_edge_properties = "{.*, " + f"id:ID({qedge_key}), {subject_qnode_key}:{subject_qnode_key}.id, {object_qnode_key}:{object_qnode_key}.id" + "}"
+        return_clause = f"RETURN {subject_qnode_key}, {object_qnode_key}, {qedge_key}{extra_edge_properties} AS {qedge_key}"
+        limit_clause = "LIMIT $max_edges" if has_edge_limit else ""
+
+        return f"{match_clause} {where_clause} {return_clause} {limit_clause}".strip()
 
-    def _answer_query_using_neo4j(self, cypher_query: str, qedge_key: str, kg_name: str, log: ARAXResponse) -> List[Dict[str, List[Dict[str, any]]]]:
+    @staticmethod
+    def _get_query_graph_shape(qg: QueryGraph, enforce_directionality: bool, kg_name: str,
+                               has_edge_limit: bool = False) -> tuple:
+        # Captures everything about a one-hop QG that ends up in the cypher text (i.e., everything but curie values)
+        qedge_key = next(qedge_key for qedge_key in qg.edges)
+        qedge = qg.edges[qedge_key]
+        qnode_shapes = tuple(KG2Querier._get_query_node_shape(qnode_key, qg, kg_name)
+                             for qnode_key in [qedge.subject, qedge.object])
+        predicates = tuple(qedge.predicate) if qedge.predicate else tuple()
+        return qedge_key, predicates, bool(enforce_directionality), kg_name, qnode_shapes, has_edge_limit
+
+    @staticmethod
+    def _get_query_node_shape(qnode_key: str, qg: QueryGraph, kg_name: str) -> Tuple[str, str, str, bool]:
+        qnode = qg.nodes[qnode_key]
+        if not qnode.id:
+            curie_mode = "none"
+        elif isinstance(qnode.id, str) or len(qnode.id) == 1:
+            curie_mode = "single"
+        else:
+            curie_mode = "multiple"
+        categories = qnode.category if qnode.category else []
+        # Add in node label if there's only one category (and we're not using KG2c - KG2c only ever uses all_categories)
+        category_label = categories[0] if len(categories) == 1 and kg_name != "KG2c" else ""
+        has_category_parameter = KG2Querier._uses_category_parameter(categories, kg_name)
+        return qnode_key, curie_mode, category_label, has_category_parameter
+
+    @staticmethod
+    def _uses_category_parameter(categories: List[str], kg_name: str) -> bool:
+        return bool(categories) and (kg_name == "KG2c" or len(categories) > 1)
+
+    @staticmethod
+    def _get_cypher_parameters(qg: QueryGraph, kg_name: str) -> Dict[str, any]:
+        parameters = dict()
+        for qnode_key, qnode in qg.nodes.items():
+            if qnode.id:
+                if isinstance(qnode.id, str) or len(qnode.id) == 1:
+                    parameters[f"{qnode_key}_curie"] = qnode.id if isinstance(qnode.id, str) else qnode.id[0]
+                else:
+                    parameters[f"{qnode_key}_curies"] = list(qnode.id)
+            if KG2Querier._uses_category_parameter(qnode.category, kg_name):
+                parameters[f"{qnode_key}_categories"] = list(qnode.category)
+        return parameters
+
+    def _stream_answers_into_kg(self, cypher_query: str, parameters: Dict[str, any], kg_name: str, qg: QueryGraph,
+                                log: ARAXResponse) -> Tuple[QGOrganizedKnowledgeGraph, Dict[str, Dict[str, str]]]:
+        qedge_key = next(qedge_key for qedge_key in qg.edges)
         log.info(f"Sending cypher query for edge {qedge_key} to {kg_name} neo4j")
-        results_from_neo4j = self._run_cypher_query(cypher_query, kg_name, log)
-        if log.status == 'OK':
-            columns_with_lengths = dict()
-            for column in results_from_neo4j[0]:
-                columns_with_lengths[column] = len(results_from_neo4j[0].get(column))
-        return results_from_neo4j
-
-    def _load_answers_into_kg(self, neo4j_results: List[Dict[str, List[Dict[str, any]]]], kg_name: str,
-                              qg: QueryGraph, log: ARAXResponse) -> Tuple[QGOrganizedKnowledgeGraph, Dict[str, Dict[str, str]]]:
-        log.debug(f"Processing query results for edge {next(qedge_key for qedge_key in qg.edges)}")
         final_kg = QGOrganizedKnowledgeGraph()
         edge_to_nodes_map = dict()
-        node_uuid_to_curie_dict = self._build_node_uuid_to_curie_dict(neo4j_results[0]) if kg_name == "KG1" else dict()
-
-        results_table = neo4j_results[0]
-        column_names = [column_name for column_name in results_table]
-        for column_name in column_names:
-            # Load answer nodes into our knowledge graph
-            if column_name.startswith('nodes'):  # Example column name: 'nodes_n00'
-                column_qnode_key = column_name.replace("nodes_", "", 1)
-                for neo4j_node in results_table.get(column_name):
-                    swagger_node_key, swagger_node = self._convert_neo4j_node_to_swagger_node(neo4j_node, kg_name)
-                    final_kg.add_node(swagger_node_key, swagger_node, column_qnode_key)
-            # Load answer edges into our knowledge graph
-            elif column_name.startswith('edges'):  # Example column name: 'edges_e01'
-                column_qedge_key = column_name.replace("edges_", "", 1)
-                for neo4j_edge in results_table.get(column_name):
+        qnode_keys = list(qg.nodes)
+        try:
+            for batch in get_neo4j_connection_manager().stream_query(cypher_query, kg_name, parameters,
+                                                                     batch_size=self.stream_batch_size):
+                log.debug(f"Processing batch of {len(batch)} results for edge {qedge_key}")
+                for row in batch:
+                    # Load this row's answer nodes into our knowledge graph (skipping those we've already converted)
+                    for qnode_key in qnode_keys:
+                        neo4j_node = row.get(qnode_key)
+                        if neo4j_node.get('id') not in final_kg.nodes_by_qg_id.get(qnode_key, dict()):
+                            swagger_node_key, swagger_node = self._convert_neo4j_node_to_swagger_node(neo4j_node, kg_name)
+                            final_kg.add_node(swagger_node_key, swagger_node, qnode_key)
+
+                    # Load this row's answer edge into our knowledge graph
+                    neo4j_edge = row.get(qedge_key)
+                    node_uuid_to_curie_dict = {row.get(qnode_key).get('UUID'): row.get(qnode_key).get('id')
+                                               for qnode_key in qnode_keys} if kg_name == "KG1" else dict()
                     swagger_edge_key, swagger_edge = self._convert_neo4j_edge_to_swagger_edge(neo4j_edge, node_uuid_to_curie_dict, kg_name)
-
                     # Record which of this edge's nodes correspond to which qnode_key
-                    if swagger_edge_key not in edge_to_nodes_map:
-                        edge_to_nodes_map[swagger_edge_key] = dict()
-                    for qnode_key in qg.nodes:
-                        edge_to_nodes_map[swagger_edge_key][qnode_key] = neo4j_edge.get(qnode_key)
-
-                    # Finally add the current edge to our answer knowledge graph
-                    final_kg.add_edge(swagger_edge_key, swagger_edge, column_qedge_key)
-
+                    edge_to_nodes_map[swagger_edge_key] = {qnode_key: neo4j_edge.get(qnode_key) for qnode_key in qnode_keys}
+                    final_kg.add_edge(swagger_edge_key, swagger_edge, qedge_key)
+                    if self.max_edges is not None and len(edge_to_nodes_map) >= self.max_edges:
+                        break
+
+                if self.max_edges is not None and len(edge_to_nodes_map) >= self.max_edges:
+                    log.warning(f"Reached the maximum number of edges (max_edges={self.max_edges}) for qedge {qedge_key};"
+                                f" answers from {kg_name} may be incomplete")
+                    break
+        except Exception:
+            tb = traceback.format_exc()
+            error_type, error, _ = sys.exc_info()
+            log.error(f"Encountered an error interacting with {kg_name} neo4j. {tb}", error_code=error_type.__name__)
         return final_kg, edge_to_nodes_map
 
     def _convert_neo4j_node_to_swagger_node(self, neo4j_node: Dict[str, any], kp: str) -> Tuple[str, Node]:
@@ -347,15 +381,10 @@ class KG2Querier:
         return new_attributes
 
     @staticmethod
-    def _run_cypher_query(cypher_query: str, kg_name: str, log: ARAXResponse) -> List[Dict[str, any]]:
-        rtxc = RTXConfiguration()
-        if "KG2" in kg_name:  # Flip into KG2 mode if that's our KP (rtx config is set to KG1 info by default)
-            rtxc.live = kg_name.upper()  # TODO: Eventually change config file to "KG2c" vs. "KG2C" (then won't need to convert case here)
+    def _run_cypher_query(cypher_query: str, kg_name: str, log: ARAXResponse,
+                          parameters: Dict[str, any] = None) -> List[Dict[str, any]]:
         try:
-            driver = GraphDatabase.driver(rtxc.neo4j_bolt, auth=(rtxc.neo4j_username, rtxc.neo4j_password))
-            with driver.session() as session:
-                query_results = session.run(cypher_query).data()
-            driver.close()
+            query_results = get_neo4j_connection_manager().run_query(cypher_query, kg_name, parameters)
         except Exception:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
@@ -364,15 +393,6 @@ class KG2Querier:
         else:
             return query_results
 
-    @staticmethod
-    def _build_node_uuid_to_curie_dict(results_table: Dict[str, List[Dict[str, any]]]) -> Dict[str, str]:
-        node_uuid_to_curie_dict = dict()
-        nodes_columns = [column_name for column_name in results_table if column_name.startswith('nodes')]
-        for column in nodes_columns:
-            for node in results_table.get(column):
-                node_uuid_to_curie_dict[node.get('UUID')] = node.get('id')
-        return node_uuid_to_curie_dict
-
     @staticmethod
     def _remap_edge(edge: Edge, new_curie: str, old_curie: str) -> Edge:
         if edge.subject == new_curie:
@@ -382,22 +402,14 @@ class KG2Querier:
         return edge
 
     @staticmethod
-    def _get_cypher_for_query_node(qnode_key: str, qg: QueryGraph, kg_name: str) -> str:
-        qnode = qg.nodes[qnode_key]
-        # Add in node label if there's only one category (and we're not using KG2c - KG2c only ever uses all_categories)
-        category_cypher = f":{qnode.category[0]}" if len(qnode.category) == 1 and kg_name != "KG2c" else ""
-        if qnode.id and (isinstance(qnode.id, str) or len(qnode.id) == 1):
-            curie = qnode.id if isinstance(qnode.id, str) else qnode.id[0]
-            curie_cypher = f" {{id:'{curie}'}}"
-        else:
-            curie_cypher = ""
-        qnode_cypher = f"({qnode_key}{category_cypher}{curie_cypher})"
-        return qnode_cypher
+    def _get_cypher_for_query_node_shape(qnode_key: str, curie_mode: str, category_label: str, *_) -> str:
+        category_cypher = f":{category_label}" if category_label else ""
+        curie_cypher = f" {{id:${qnode_key}_curie}}" if curie_mode == "single" else ""
+        return f"({qnode_key}{category_cypher}{curie_cypher})"
 
     @staticmethod
-    def _get_cypher_for_query_edge(qedge_key: str, qg: QueryGraph, enforce_directionality: bool) -> str:
-        qedge = qg.edges[qedge_key]
-        predicate_cypher = "|".join([f":`{predicate}`" for predicate in qedge.predicate])
+    def _get_cypher_for_query_edge_shape(qedge_key: str, predicates: tuple, enforce_directionality: bool) -> str:
+        predicate_cypher = "|".join([f":`{predicate}`" for predicate in predicates])
         full_qedge_cypher = f"-[{qedge_key}{predicate_cypher}]-"
         if enforce_directionality:
             full_qedge_cypher += ">"
@@ -86,6 +86,7 @@ class NGDQuerier:
         cngd = ComputeNGD(log, kg2_message, None)
         cngd.load_curie_to_pmids_data(kg2_answer_kg.nodes)
         kg2_edge_ngd_map = dict()
+        ngd_pairs = []
         for kg2_edge_key, kg2_edge in kg2_answer_kg.edges.items():
             kg2_node_1_key = kg2_edge.subject
             kg2_node_2_key = kg2_edge.object
@@ -98,8 +99,11 @@ class NGDQuerier:
             else:
                 ngd_subject = kg2_node_2_key
                 ngd_object = kg2_node_1_key
-            ngd_value = cngd.calculate_ngd_fast(ngd_subject, ngd_object)
-            kg2_edge_ngd_map[kg2_edge_key] = {"ngd_value": ngd_value, "subject": ngd_subject, "object": ngd_object}
+            ngd_pairs.append((ngd_subject, ngd_object))
+            kg2_edge_ngd_map[kg2_edge_key] = {"subject": ngd_subject, "object": ngd_object}
+        ngd_values = cngd.calculate_ngd_for_pairs(ngd_pairs)
+        for ngd_info_dict, ngd_value in zip(kg2_edge_ngd_map.values(), ngd_values):
+            ngd_info_dict["ngd_value"] = float(ngd_value)
 
         # Create edges for those from KG2 found to have a low enough ngd value
         threshold = 0.5
@@ -5,6 +5,9 @@ import os
 import traceback
 import numpy as np
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
+from kg_adjacency_index import KGAdjacencyIndex
+
 
 class RemoveNodes:
 
@@ -104,24 +107,13 @@ class RemoveNodes:
         """
         self.response.debug(f"Removing orphaned nodes")
         self.response.info(f"Removing orphaned nodes")
-        node_parameters = self.node_parameters
-
         try:
-            # iterate over edges in KG to find all id's that connect the edges
-            connected_node_keys = set()
-            for edge in self.message.knowledge_graph.edges.values():
-                connected_node_keys.add(edge.subject)
-                connected_node_keys.add(edge.object)
+            # index the KG to find how many edge ends touch each node
+            kg_index = KGAdjacencyIndex.from_knowledge_graph(self.message.knowledge_graph)
+            node_degrees = kg_index.get_node_degrees()
 
-            # iterate over all nodes in KG
-            nodes_to_remove = set()
-            for key, node in self.message.knowledge_graph.nodes.items():
-                if 'node_category' in node_parameters and node_parameters['node_category'] in node.category:
-                    if key not in connected_node_keys:
-                        nodes_to_remove.add(key)
-                else:
-                    if key not in connected_node_keys:
-                        nodes_to_remove.add(key)
+            # every node that no edge touches is an orphan
+            nodes_to_remove = {kg_index.node_keys[node_index] for node_index in np.flatnonzero(node_degrees == 0)}
 
             # remove the orphaned nodes
             #self.message.knowledge_graph.nodes = [val for idx, val in enumerate(self.message.knowledge_graph.nodes) if idx not in node_indexes_to_remove]
@@ -0,0 +1,96 @@
+## This script compares the random walk throughput (walks per second) of generate_random_walk.py and generate_random_walk_csr.py
+# on a synthetic G.json file (a random graph with a skewed degree distribution, like the KG2 one), running both scripts the way
+# 1_graphsage_make_data.sh does, and checks that the pairs written by generate_random_walk_csr.py come from valid walks.
+# Usage: python benchmark_random_walk.py [--nodes 20000] [--edges 200000] [--walk_length 100] [--number_of_walks 10] [--process 4]
+
+import itertools
+import json
+import numpy as np
+import os
+import subprocess
+import sys
+import argparse
+import tempfile
+import timeit
+
+from generate_random_walk_csr import load_csr_graph, random_walk_pairs
+
+
+def create_graph_json(Gjson, num_nodes, num_edges, validation_percent, seed):
+    rng = np.random.default_rng(seed)
+    # preferential-attachment-like degrees: a few hubs and many nodes with a handful of edges
+    weights = 1.0 / np.arange(1, num_nodes + 1) ** 0.8
+    sources = rng.choice(num_nodes, size=num_edges, p=weights / weights.sum())
+    targets = rng.integers(0, num_nodes, size=num_edges)
+    links = [{'source': int(source), 'target': int(target)} for source, target in zip(sources, targets)]
+    valid = set(rng.permutation(num_nodes)[:int(num_nodes * validation_percent)].tolist())
+    nodes = [{'test': False, 'id': node, 'feature': [0.0], 'label': [1], 'val': node in valid} for node in range(num_nodes)]
+    # 'links' is read by older NetworkX versions and generate_random_walk_csr.py, 'edges' by NetworkX >= 3.4
+    with open(Gjson, 'w') as f:
+        f.write(json.dumps({'directed': False, 'graph': {'name': 'disjoint_union(,)'}, 'nodes': nodes, 'links': links,
+                            'edges': links, 'multigraph': False}))
+
+
+def run_script(script, Gjson, outpath, args, extra_args=()):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), script), '--Gjson', Gjson,
+               '--walk_length', str(args.walk_length), '--number_of_walks', str(args.number_of_walks),
+               '--process', str(args.process), '--output', outpath, *extra_args]
+    t0 = timeit.default_timer()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return timeit.default_timer() - t0
+
+
+def check_pairs(walks_file, ids, indptr, indices, walk_length):
+    # every visited node (in the first million pairs) must be within walk_length - 1 steps of its start node
+    id_to_index = {node_id: index for index, node_id in enumerate(ids.tolist())}
+    with open(walks_file) as f:
+        pairs = np.array([line.split('\t') for line in itertools.islice(f, 1000000)], dtype=np.int64).reshape(-1, 2)
+    pairs = np.vectorize(id_to_index.__getitem__)(pairs) if len(pairs) > 0 else pairs
+    for start in np.unique(pairs[:, 0])[:200]:
+        reachable = {start}
+        frontier = {start}
+        for _ in range(walk_length - 1):
+            frontier = {int(neighbor) for node in frontier for neighbor in indices[indptr[node]:indptr[node + 1]]} - reachable
+            reachable |= frontier
+        assert set(pairs[pairs[:, 0] == start, 1].tolist()) <= reachable
+    return len(pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks generate_random_walk.py against generate_random_walk_csr.py")
+    parser.add_argument("--nodes", type=int, default=20000)
+    parser.add_argument("--edges", type=int, default=200000)
+    parser.add_argument("-l", "--walk_length", type=int, default=100)
+    parser.add_argument("-r", "--number_of_walks", type=int, default=10)
+    parser.add_argument("-p", "--process", type=int, default=4)
+    parser.add_argument("--skip_original", action="store_true", default=False, help="Only run generate_random_walk_csr.py")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        Gjson = os.path.join(temp_dir, 'data-G.json')
+        create_graph_json(Gjson, args.nodes, args.edges, 0.3, args.seed)
+        ids, indptr, indices = load_csr_graph(Gjson)
+        num_walks = int((np.diff(indptr) > 0).sum()) * args.number_of_walks
+        print(f"{len(ids)} training nodes, {len(indices) // 2} edges, {num_walks} walks of length {args.walk_length}")
+
+        # the walk engine alone, in this process
+        t0 = timeit.default_timer()
+        random_walk_pairs(indptr, indices, np.arange(len(ids)), args.number_of_walks, args.walk_length, np.random.default_rng(args.seed))
+        engine_time = timeit.default_timer() - t0
+        print(f"random_walk_pairs (1 process): {engine_time:.2f} s, {num_walks / engine_time:.0f} walks/s")
+
+        for script, extra_args in (('generate_random_walk_csr.py', ('--seed', str(args.seed))),
+                                   ('generate_random_walk.py', ('--batch_size', '100000'))):
+            if script == 'generate_random_walk.py' and args.skip_original:
+                continue
+            outpath = os.path.join(temp_dir, script.replace('.py', ''))
+            script_time = run_script(script, Gjson, outpath, args, extra_args)
+            num_pairs = sum(1 for line in open(os.path.join(outpath, 'data-walks.txt')) if line.strip())
+            print(f"{script} ({args.process} processes): {script_time:.2f} s, {num_walks / script_time:.0f} walks/s, {num_pairs} pairs")
+            if script == 'generate_random_walk_csr.py':
+                check_pairs(os.path.join(outpath, 'data-walks.txt'), ids, indptr, indices, args.walk_length)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import itertools
 import pandas as pd
 import sqlite3
 import argparse
@@ -26,29 +27,21 @@ insert_command1 = insert_command1 + ")"
 conn.execute(insert_command1)
 conn.commit()
 
+insert_command = f"INSERT INTO GRAPH values ({','.join('?' * graph.shape[1])})"
+rows = graph.itertuples(index=False, name=None)
+
 count = 0
 
 print(f"Insert data into database", flush=True)
-for row in range(graph.shape[0]):
-    count = count + 1
-    insert_command1 = f"INSERT INTO GRAPH"
-    insert_command2 = f" values ("
-
-    for col in range(graph.shape[1]):
-        insert_command2 = insert_command2 + f"?,"
-
-    insert_command = insert_command1 + insert_command2 + ")"
-    insert_command = insert_command.replace(',)', ')')
-    line = tuple(graph.loc[row, :])
-    conn.execute(insert_command, line)
-    if count%5000==0:
-        conn.commit()
-        percentage = int(count*100.0/graph.shape[0])
-        print(str(percentage) + "%..", end='', flush=True)
-
-conn.commit()
-percentage = int(count*100.0/graph.shape[0])
-print(str(percentage) + "%..", end='', flush=True)
+while True:
+    batch = list(itertools.islice(rows, 5000))
+    if len(batch) == 0:
+        break
+    conn.executemany(insert_command, batch)
+    conn.commit()
+    count = count + len(batch)
+    percentage = int(count*100.0/graph.shape[0])
+    print(str(percentage) + "%..", end='', flush=True)
 
 conn.execute(f"CREATE INDEX idx_GRAPH_curie ON GRAPH(curie)")
 conn.commit()
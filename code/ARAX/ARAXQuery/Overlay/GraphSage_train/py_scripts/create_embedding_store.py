@@ -0,0 +1,23 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import argparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../../predictor')
+from predictor import EmbeddingStore
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-e", "--embfile", type=str, help="The path of .emb file")
+parser.add_argument("-m", "--mapfile", type=str, help="The path of map.txt file")
+parser.add_argument("-o", "--output", type=str, help="The path of output folder")
+args = parser.parse_args()
+
+print(f"Read the embedding vectors", flush=True)
+graph = pd.read_csv(args.embfile, sep=' ', skiprows=1, header=None, index_col=None)
+graph = graph.sort_values(0).reset_index(drop=True)
+map_df = pd.read_csv(args.mapfile, sep='\t', index_col=None)
+
+## GRAPH_embeddings.npy and GRAPH_curies.npy are found by predictor.import_file() next to GRAPH.sqlite, and used instead of it
+EmbeddingStore.save(args.output + '/GRAPH', list(map_df.loc[:, 'curie']), graph.loc[:, 1:].to_numpy(dtype=np.float32))
+print(f"INFO: Embedding store created successfully", flush=True)
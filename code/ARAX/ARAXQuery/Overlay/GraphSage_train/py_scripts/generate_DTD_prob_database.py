@@ -50,5 +50,7 @@ print(f"INFO: Populating tables is completed", flush=True)
 print(f"INFO: Creating INDEXes on DTD_PROBABILITY", flush=True)
 connection.execute(f"CREATE INDEX idx_DTD_PROBABILITY_disease ON DTD_PROBABILITY(disease)")
 connection.execute(f"CREATE INDEX idx_DTD_PROBABILITY_drug ON DTD_PROBABILITY(drug)")
+# covers the (drug, disease) pair lookups, so the probability is read from the index alone
+connection.execute(f"CREATE INDEX idx_DTD_PROBABILITY_drug_disease ON DTD_PROBABILITY(drug, disease, probability)")
 
 print(f"INFO: Creating INDEXes is completed", flush=True)
@@ -0,0 +1,178 @@
+## This script generates the same random walk co-occurrence file as generate_random_walk.py (eg. data-walks.txt, please see
+# https://github.com/williamleif/GraphSAGE for more details), but much faster: the training graph is converted from G.json to
+# CSR arrays once (saved as .npy files next to the output), the worker processes memory-map those arrays instead of each
+# getting a pickled copy of a NetworkX graph, and the walks of a whole batch of start nodes advance one step at a time with
+# NumPy random indexing.
+
+import json
+import numpy as np
+import os
+import sys
+import argparse
+import multiprocessing
+from datetime import datetime
+
+CSR_FILE_SUFFIXES = ('ids', 'indptr', 'indices')
+
+
+def load_csr_graph(Gjson):
+    """
+    Reads a G.json file and builds the CSR adjacency arrays of its training subgraph (the nodes that are neither 'val' nor
+    'test', and the edges between them)
+    :return: a tuple (ids, indptr, indices): the G.json id of each node, and the neighbors of node i are
+    indices[indptr[i]:indptr[i+1]] (each one once, as in an undirected NetworkX graph)
+    """
+    with open(Gjson, 'r') as input_file:
+        G_data = json.load(input_file)
+    ids = np.array([node['id'] for node in G_data['nodes'] if not node['val'] and not node['test']], dtype=np.int64)
+    id_to_index = {node_id: index for index, node_id in enumerate(ids.tolist())}
+    links = G_data['links'] if 'links' in G_data else G_data['edges']
+    edges = [(id_to_index[link['source']], id_to_index[link['target']]) for link in links
+             if link['source'] in id_to_index and link['target'] in id_to_index]
+    del G_data, links  ## delete variables to release ram
+
+    edges = np.array(edges, dtype=np.int64).reshape(-1, 2)
+    num_nodes = len(ids)
+    # both directions of every edge, without duplicates (a self-loop is a single neighbor)
+    keys = np.unique(np.concatenate([edges[:, 0] * num_nodes + edges[:, 1], edges[:, 1] * num_nodes + edges[:, 0]]))
+    sources = keys // num_nodes if num_nodes > 0 else keys
+    index_dtype = np.int32 if num_nodes < np.iinfo(np.int32).max else np.int64
+    indices = (keys % num_nodes if num_nodes > 0 else keys).astype(index_dtype)
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+    return ids, indptr, indices
+
+
+def save_csr_graph(csr_prefix, ids, indptr, indices):
+    for suffix, array in zip(CSR_FILE_SUFFIXES, (ids, indptr, indices)):
+        np.save(f"{csr_prefix}-{suffix}.npy", array)
+
+
+def open_csr_graph(csr_prefix):
+    return tuple(np.load(f"{csr_prefix}-{suffix}.npy", mmap_mode='r') for suffix in CSR_FILE_SUFFIXES)
+
+
+def random_walk_pairs(indptr, indices, start_nodes, num_walks, walk_len, rng):
+    """
+    Does num_walks random walks of walk_len steps from each start node, like generate_random_walk.run_random_walks, with all of
+    the walks advancing together
+    :return: an array with a (start node, visited node) row for each node visited by a walk (apart from its start node), in
+    the same order as run_random_walks: by start node, then walk, then step
+    """
+    degrees = np.diff(indptr)
+    start_nodes = np.asarray(start_nodes)
+    # nodes without neighbors have no walks
+    walk_starts = np.repeat(start_nodes[degrees[start_nodes] > 0], num_walks).astype(indices.dtype)
+    walks = np.empty((len(walk_starts), walk_len), dtype=indices.dtype)
+    current_nodes = walk_starts
+    for step in range(walk_len):
+        walks[:, step] = current_nodes
+        if step + 1 < walk_len:
+            # the graph is undirected, so every node a walk reaches has at least one neighbor
+            offsets = (rng.random(len(current_nodes)) * degrees[current_nodes]).astype(np.int64)
+            current_nodes = indices[indptr[current_nodes] + offsets]
+    pairs = np.empty((walks.size, 2), dtype=indices.dtype)
+    pairs[:, 0] = np.repeat(walk_starts, walk_len)
+    pairs[:, 1] = walks.ravel()
+    # self co-occurrences are useless
+    return pairs[pairs[:, 0] != pairs[:, 1]]
+
+
+def format_pairs(ids, pairs, id_strings=None):
+    """
+    Encodes (start node, visited node) pairs of node indices as lines of tab-separated G.json ids; id_strings can be the result
+    of make_id_strings(ids), to avoid recomputing it for every batch
+    """
+    if id_strings is None:
+        id_strings = make_id_strings(ids)
+    source_strings, target_strings = id_strings
+    return b''.join(np.char.add(source_strings[pairs[:, 0]], target_strings[pairs[:, 1]]).tolist())
+
+
+def make_id_strings(ids):
+    id_strings = np.asarray(ids).astype(str).astype(bytes)
+    return np.char.add(id_strings, b'\t'), np.char.add(id_strings, b'\n')
+
+
+## each worker process memory-maps the CSR arrays once
+_graph = None
+_id_strings = None
+
+
+def _init_worker(csr_prefix):
+    global _graph
+    _graph = open_csr_graph(csr_prefix)
+
+
+def _run_batch(this):
+    global _id_strings
+    start, end, seed, num_walks, walk_len = this
+    ids, indptr, indices = _graph
+    pairs = random_walk_pairs(indptr, indices, np.arange(start, end), num_walks, walk_len, np.random.default_rng(seed))
+    if _id_strings is None:
+        _id_strings = make_id_strings(ids)
+    return format_pairs(ids, pairs, _id_strings)
+
+
+def generate_walks(csr_prefix, output_file_name, num_walks, walk_len, batch_size, processes=None, seed=None):
+    """
+    Writes the co-occurrence pairs of the random walks from every node of the CSR graph saved at csr_prefix, a batch of start
+    nodes per task. Each batch gets its own random stream spawned from the seed, so the output is the same for a given seed and
+    batch_size whatever the number of processes, but changes with batch_size
+    :return: the number of pairs written
+    """
+    num_nodes = len(np.load(f"{csr_prefix}-ids.npy", mmap_mode='r'))
+    batches = list(range(0, num_nodes, batch_size)) + [num_nodes]
+    seeds = np.random.SeedSequence(seed).spawn(len(batches) - 1)
+    tasks = [(batches[i], batches[i + 1], seeds[i], num_walks, walk_len) for i in range(len(batches) - 1)]
+    num_pairs = 0
+    with multiprocessing.Pool(processes=processes, initializer=_init_worker, initargs=(csr_prefix,)) as executor:
+        with open(output_file_name, 'wb') as output_file:
+            for i, out_res in enumerate(executor.imap(_run_batch, tasks)):
+                output_file.write(out_res)
+                num_pairs += out_res.count(b'\n')
+                print(f'{datetime.now().strftime("%H:%M:%S")} batch {i + 1}/{len(tasks)} done', flush=True)
+    return num_pairs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--Gjson", type=str, help="The path of G.json file")
+    parser.add_argument("-l", "--walk_length", type=int, help="Random walk length", default=200)
+    parser.add_argument("-r", "--number_of_walks", type=int, help="Number of random walks per node", default=10)
+    parser.add_argument("-b", "--batch_size", type=int, help="Number of start nodes for each task", default=5000)
+    parser.add_argument("-p", "--process", type=int, help="Number of processes to be used", default=-1)
+    parser.add_argument("-s", "--seed", type=int, help="Random seed (the walks are different on every run if not given, and depend on the batch size)", default=None)
+    parser.add_argument("-o", "--output", type=str, help="The path of output folder", default="/graphsage_input")
+    args = parser.parse_args()
+
+    current_path = os.path.split(os.path.realpath(__file__))[0]
+
+    # check the input arguments
+    if args.Gjson == None or not os.path.exists(os.path.realpath(args.Gjson)):
+        sys.exit('Error Occurred! Please provide the correct path of your G.json file.')
+    else:
+        Gjson = os.path.realpath(args.Gjson)
+
+    # setting the path of output directory
+    if args.output == "/graphsage_input":
+        outpath = current_path + '/graphsage_input'
+    else:
+        outpath = os.path.realpath(args.output)
+    os.makedirs(outpath, exist_ok=True)
+
+    # convert the graph to CSR arrays, unless that was already done for this G.json
+    csr_prefix = outpath + '/' + os.path.splitext(os.path.basename(Gjson))[0] + '-csr'
+    if all(os.path.getmtime(f"{csr_prefix}-{suffix}.npy") >= os.path.getmtime(Gjson) if os.path.exists(f"{csr_prefix}-{suffix}.npy") else False
+           for suffix in CSR_FILE_SUFFIXES):
+        print(f'Using the CSR graph in {csr_prefix}-*.npy')
+    else:
+        ids, indptr, indices = load_csr_graph(Gjson)
+        save_csr_graph(csr_prefix, ids, indptr, indices)
+        del ids, indptr, indices
+    print(f'The number of nodes in training graph: {len(np.load(csr_prefix + "-ids.npy", mmap_mode="r"))}')
+
+    output_file_name = outpath + '/data-walks.txt'
+    num_pairs = generate_walks(csr_prefix, output_file_name, args.number_of_walks, args.walk_length, args.batch_size,
+                               processes=None if args.process == -1 else args.process, seed=args.seed)
+    print(f'{num_pairs} co-occurrence pairs written to {output_file_name}')
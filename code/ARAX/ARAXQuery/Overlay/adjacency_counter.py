@@ -0,0 +1,103 @@
+#!/bin/env python3
+# This class counts, for a batch of nodes, how many edges connect each of them to nodes of a given category in one of
+# our neo4j KGs, using a single grouped cypher query (rather than expanding each node and counting its edges). Each node
+# is first widened to the curies expand(kp=...) would query for it (its canonical curie in KG2c, or all of its synonyms
+# in KG1), so the counts are the same as those of the edges expand returns for it
+import re
+import sys
+import os
+import traceback
+from typing import List, Dict, Optional, Union
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")  # ARAXQuery directory
+from ARAX_response import ARAXResponse
+from neo4j_connection_manager import get_neo4j_connection_manager
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../Expand/")
+import expand_utilities as eu
+
+
+class AdjacencyCounter:
+
+    # Maps KPs to the neo4j KG that expand(kp=...) uses for them by default
+    KP_TO_KG_NAME = {"ARAX/KG1": "KG1", "ARAX/KG2": "KG2c", "ARAX/KG2c": "KG2c"}
+
+    def __init__(self, response: ARAXResponse):
+        self.response = response
+
+    @staticmethod
+    def supports_kp(kp: str) -> bool:
+        return kp in AdjacencyCounter.KP_TO_KG_NAME
+
+    def get_adjacent_edge_counts(self, curies: List[str], adjacent_category: Union[str, List[str]], kp: str,
+                                 predicate: Optional[str] = None) -> Optional[Dict[str, int]]:
+        """
+        Counts the distinct edges between each of the given nodes and any node of the adjacent category(s) (optionally
+        only edges with the given predicate), ignoring edge direction. As in expand, a node's synonyms count as the node
+        itself, and edges between two of them (self-edges) are not counted. Nodes with no such edges get a count of 0.
+        :return: A dict mapping each input curie to its count, or None if something went wrong (error is logged).
+        """
+        kg_name = self.KP_TO_KG_NAME.get(kp)
+        if not kg_name:
+            self.response.error(f"AdjacencyCounter only supports these KPs: {list(self.KP_TO_KG_NAME)}",
+                                error_code="UnsupportedKP")
+            return None
+        # Use the same (old-style) category and predicate formats that KG2Querier uses to query these KGs
+        adjacent_categories = [eu.convert_string_to_snake_case(category.split(":")[-1])
+                               for category in eu.convert_string_or_list_to_list(adjacent_category)]
+        predicate = eu.convert_predicate_to_old_format(predicate) if predicate else None
+        curie_groups = self._get_curie_groups(curies, kg_name)
+        if curie_groups is None:
+            return None
+        cypher_query, parameters = self._get_adjacent_edge_count_cypher(curie_groups, adjacent_categories, kg_name, predicate)
+        if not cypher_query:
+            return None
+
+        self.response.debug(f"Counting edges to {', '.join(adjacent_categories)} nodes for {len(curies)} nodes in "
+                            f"{kg_name} neo4j")
+        try:
+            results = get_neo4j_connection_manager().run_query(cypher_query, kg_name, parameters)
+        except Exception:
+            tb = traceback.format_exc()
+            error_type, error, _ = sys.exc_info()
+            self.response.error(f"Encountered an error interacting with {kg_name} neo4j. {tb}",
+                                error_code=error_type.__name__)
+            return None
+        counts = {curie: 0 for curie in curies}
+        for result in results:
+            counts[result["curie"]] = result["count"]
+        return counts
+
+    def _get_curie_groups(self, curies: List[str], kg_name: str) -> Optional[Dict[str, List[str]]]:
+        # Find the curies that KG2Querier would send to neo4j for each node (it uses canonical curies for KG2c and all
+        # synonyms for KG1, since expand uses synonyms by default)
+        if kg_name == "KG2c":
+            canonical_curies_dict = eu.get_canonical_curies_dict(curies, self.response)
+            curie_groups = {curie: [canonical_curies_dict[curie].get('preferred_curie', curie)]
+                            if canonical_curies_dict.get(curie) else [curie] for curie in curies}
+        else:
+            synonyms_dict = eu.get_curie_synonyms_dict(curies, self.response)
+            curie_groups = {curie: synonyms_dict.get(curie, [curie]) for curie in curies}
+        if self.response.status != 'OK':
+            return None
+        return curie_groups
+
+    def _get_adjacent_edge_count_cypher(self, curie_groups: Dict[str, List[str]], adjacent_categories: List[str],
+                                        kg_name: str, predicate: Optional[str]):
+        parameters = {"curie_groups": [{"curie": curie, "curies": group_curies} for curie, group_curies in curie_groups.items()]}
+        where_fragments = ["n00.id IN curie_group.curies", "NOT n01.id IN curie_group.curies"]
+        if kg_name == "KG2c":
+            where_fragments.append("any(category IN $adjacent_categories WHERE category IN n01.types)")
+            parameters["adjacent_categories"] = adjacent_categories
+        else:
+            # Labels can't be passed as parameters, so make sure these are safe to put in the query
+            invalid_categories = [category for category in adjacent_categories if not re.fullmatch(r"\w+", category)]
+            if invalid_categories:
+                self.response.error(f"Invalid node category(s) for {kg_name}: {invalid_categories}", error_code="InvalidInput")
+                return None, None
+            where_fragments.append(f"({' OR '.join(f'n01:{category}' for category in adjacent_categories)})")
+        if predicate:
+            where_fragments.append("type(e) = $predicate")
+            parameters["predicate"] = predicate
+        cypher_query = f"UNWIND $curie_groups AS curie_group MATCH (n00)-[e]-(n01) WHERE {' AND '.join(where_fragments)} " \
+                       f"RETURN curie_group.curie AS curie, count(DISTINCT e) AS count"
+        return cypher_query, parameters
@@ -1,6 +1,5 @@
 # This class will overlay the normalized google distance on a message (all edges)
 #!/bin/env python3
-import functools
 import json
 import math
 import subprocess
@@ -10,7 +9,7 @@ import sqlite3
 import traceback
 import numpy as np
 from datetime import datetime
-from typing import List
+from typing import List, Tuple
 
 import random
 import time
@@ -56,7 +55,6 @@ class ComputeNGD:
                            f"co-occurrence frequency in PubMed abstracts")
         name = "normalized_google_distance"
         type = "EDAM:data_2526"
-        value = self.parameters['default_value']
         url = "https://arax.ncats.io/api/rtx/v1/ui/#/PubmedMeshNgd"
         qg = self.message.query_graph
         kg = self.message.knowledge_graph
@@ -72,15 +70,15 @@ class ComputeNGD:
             canonicalized_curie_lookup = self._get_canonical_curies_map(list(involved_curies))
             self.load_curie_to_pmids_data(canonicalized_curie_lookup.values())
             added_flag = False  # check to see if any edges where added
-            self.response.debug(f"Looping through {len(node_pairs_to_evaluate)} node pairs and calculating NGD values")
+            self.response.debug(f"Calculating NGD values for {len(node_pairs_to_evaluate)} node pairs")
+            node_pairs_to_evaluate = list(node_pairs_to_evaluate)
+            ngd_values = self.calculate_ngd_for_pairs([(canonicalized_curie_lookup.get(subject_curie, subject_curie),
+                                                        canonicalized_curie_lookup.get(object_curie, object_curie))
+                                                       for subject_curie, object_curie in node_pairs_to_evaluate])
             # iterate over all pairs of these nodes, add the virtual edge, decorate with the correct attribute
-            for (subject_curie, object_curie) in node_pairs_to_evaluate:
+            for (subject_curie, object_curie), ngd_value in zip(node_pairs_to_evaluate, ngd_values):
                 # create the edge attribute if it can be
-                canonical_subject_curie = canonicalized_curie_lookup.get(subject_curie, subject_curie)
-                canonical_object_curie = canonicalized_curie_lookup.get(object_curie, object_curie)
-                ngd_value = self.calculate_ngd_fast(canonical_subject_curie, canonical_object_curie)
-                if np.isfinite(ngd_value):  # if ngd is finite, that's ok, otherwise, stay with default
-                    value = ngd_value
+                value = ngd_value if np.isfinite(ngd_value) else self.parameters['default_value']  # if ngd isn't finite, use the default
                 edge_attribute = EdgeAttribute(type=type, name=name, value=str(value), url=url)  # populate the NGD edge attribute
                 if edge_attribute:
                     added_flag = True
@@ -145,19 +143,16 @@ class ComputeNGD:
                 # Map all nodes to their canonicalized curies in one batch (need canonical IDs for the local NGD system)
                 canonicalized_curie_map = self._get_canonical_curies_map([key for key in self.message.knowledge_graph.nodes.keys()])
                 self.load_curie_to_pmids_data(canonicalized_curie_map.values())
-                self.response.debug(f"Looping through edges and calculating NGD values")
-                for edge in self.message.knowledge_graph.edges.values():
+                self.response.debug(f"Calculating NGD values for all edges")
+                edges = list(self.message.knowledge_graph.edges.values())
+                ngd_values = self.calculate_ngd_for_pairs([(canonicalized_curie_map.get(edge.subject, edge.subject),
+                                                            canonicalized_curie_map.get(edge.object, edge.object))
+                                                           for edge in edges])
+                for edge, ngd_value in zip(edges, ngd_values):
                     # Make sure the attributes are not None
                     if not edge.attributes:
                         edge.attributes = []  # should be an array, but why not a list?
-                    # now go and actually get the NGD
-                    subject_curie = edge.subject
-                    object_curie = edge.object
-                    canonical_subject_curie = canonicalized_curie_map.get(subject_curie, subject_curie)
-                    canonical_object_curie = canonicalized_curie_map.get(object_curie, object_curie)
-                    ngd_value = self.calculate_ngd_fast(canonical_subject_curie, canonical_object_curie)
-                    if np.isfinite(ngd_value):  # if ngd is finite, that's ok, otherwise, stay with default
-                        value = ngd_value
+                    value = ngd_value if np.isfinite(ngd_value) else self.parameters['default_value']  # if ngd isn't finite, use the default
                     ngd_edge_attribute = EdgeAttribute(type=type, name=name, value=str(value), url=url)  # populate the NGD edge attribute
                     edge.attributes.append(ngd_edge_attribute)  # append it to the list of attributes
             except:
@@ -172,53 +167,61 @@ class ComputeNGD:
 
     def load_curie_to_pmids_data(self, canonicalized_curies):
         self.response.debug(f"Extracting PMID lists from sqlite database for relevant nodes")
-        curies = list(set(canonicalized_curies))
+        curies = list(set(canonicalized_curies).difference(self.curie_to_pmids_map))
+        # Newer databases store each PMID list as a sorted array of uint32s; older ones only have JSON lists
+        self.cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='curie_to_pmid_arrays'")
+        has_pmid_arrays = bool(self.cursor.fetchall())
+        table_name = "curie_to_pmid_arrays" if has_pmid_arrays else "curie_to_pmids"
         chunk_size = 20000
-        num_chunks = len(curies) // chunk_size if len(curies) % chunk_size == 0 else (len(curies) // chunk_size) + 1
-        start_index = 0
-        stop_index = chunk_size
-        for num in range(num_chunks):
-            chunk = curies[start_index:stop_index] if stop_index <= len(curies) else curies[start_index:]
-            curie_list_str = ", ".join([f"'{curie}'" for curie in chunk])
-            self.cursor.execute(f"SELECT * FROM curie_to_pmids WHERE curie in ({curie_list_str})")
-            rows = self.cursor.fetchall()
-            for row in rows:
-                self.curie_to_pmids_map[row[0]] = json.loads(row[1])  # PMID list is stored as JSON string in sqlite db
-            start_index += chunk_size
-            stop_index += chunk_size
+        for start_index in range(0, len(curies), chunk_size):
+            chunk = curies[start_index:start_index + chunk_size]
+            self.cursor.execute(f"SELECT curie, pmids FROM {table_name} WHERE curie IN (SELECT value FROM json_each(?))",
+                                (json.dumps(chunk),))
+            for curie, pmids in self.cursor.fetchall():
+                if has_pmid_arrays:
+                    self.curie_to_pmids_map[curie] = np.frombuffer(pmids, dtype=np.uint32)
+                else:
+                    self.curie_to_pmids_map[curie] = np.unique(np.array(json.loads(pmids), dtype=np.uint32))
 
     def calculate_ngd_fast(self, subject_curie, object_curie):
-        if subject_curie in self.curie_to_pmids_map and object_curie in self.curie_to_pmids_map:
-            pubmed_ids_for_curies = [self.curie_to_pmids_map.get(subject_curie),
-                                     self.curie_to_pmids_map.get(object_curie)]
-            counts_res = self._compute_marginal_and_joint_counts(pubmed_ids_for_curies)
-            return self._compute_multiway_ngd_from_counts(*counts_res)
-        else:
-            return math.nan
+        return float(self.calculate_ngd_for_pairs([(subject_curie, object_curie)])[0])
+
+    def calculate_ngd_for_pairs(self, curie_pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """
+        Computes NGD for a batch of (canonical) curie pairs using the PMID arrays loaded by load_curie_to_pmids_data().
+        Each curie's array is shared by all the pairs it appears in; NaN is returned for pairs lacking PMID data.
+        """
+        marginal_counts = np.zeros((len(curie_pairs), 2), dtype=np.float64)
+        joint_counts = np.zeros(len(curie_pairs), dtype=np.float64)
+        joint_counts_by_pair = dict()  # Many edges can connect the same two nodes
+        for index, (subject_curie, object_curie) in enumerate(curie_pairs):
+            subject_pmids = self.curie_to_pmids_map.get(subject_curie)
+            object_pmids = self.curie_to_pmids_map.get(object_curie)
+            if subject_pmids is not None and object_pmids is not None:
+                marginal_counts[index] = (subject_pmids.size, object_pmids.size)
+                if (subject_curie, object_curie) not in joint_counts_by_pair:
+                    joint_counts_by_pair[(subject_curie, object_curie)] = self._count_common_pmids(subject_pmids, object_pmids)
+                joint_counts[index] = joint_counts_by_pair[(subject_curie, object_curie)]
+        return self._compute_ngd_from_count_arrays(marginal_counts, joint_counts)
 
     @staticmethod
-    def _compute_marginal_and_joint_counts(concept_pubmed_ids: List[List[int]]) -> list:
-        return [list(map(lambda pmid_list: len(set(pmid_list)), concept_pubmed_ids)),
-                len(functools.reduce(lambda pmids_intersec_cumul, pmids_next:
-                                     set(pmids_next).intersection(pmids_intersec_cumul),
-                                     concept_pubmed_ids))]
+    def _count_common_pmids(pmids_a: np.ndarray, pmids_b: np.ndarray) -> int:
+        # Both arrays are sorted and unique; look up each PMID of the smaller one in the larger one
+        smaller, larger = (pmids_a, pmids_b) if pmids_a.size <= pmids_b.size else (pmids_b, pmids_a)
+        if not smaller.size:
+            return 0
+        positions = np.searchsorted(larger, smaller)
+        positions[positions == larger.size] = 0
+        return int(np.count_nonzero(larger[positions] == smaller))
 
-    def _compute_multiway_ngd_from_counts(self, marginal_counts: List[int],
-                                          joint_count: int) -> float:
-        # Make sure that things are within the right domain for the logs
-        # Should also make sure things are not negative, but I'll just do this with a ValueError
-        if None in marginal_counts:
-            return math.nan
-        elif 0 in marginal_counts or 0. in marginal_counts:
-            return math.nan
-        elif joint_count == 0 or joint_count == 0.:
-            return math.nan
-        else:
-            try:
-                return (max([math.log(count) for count in marginal_counts]) - math.log(joint_count)) / \
-                   (math.log(self.ngd_normalizer) - min([math.log(count) for count in marginal_counts]))
-            except ValueError:
-                return math.nan
+    def _compute_ngd_from_count_arrays(self, marginal_counts: np.ndarray, joint_counts: np.ndarray) -> np.ndarray:
+        # NGD for each pair from its marginal and joint PMID counts (NaN wherever any count is 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_marginal_counts = np.log(marginal_counts)
+            ngd_values = (log_marginal_counts.max(axis=1) - np.log(joint_counts)) / \
+                         (math.log(self.ngd_normalizer) - log_marginal_counts.min(axis=1))
+        ngd_values[(joint_counts == 0) | (marginal_counts == 0).any(axis=1)] = math.nan
+        return ngd_values
 
     def _get_canonical_curies_map(self, curies):
         self.response.debug(f"Canonicalizing curies of relevant nodes using NodeSynonymizer")
@@ -8,13 +8,10 @@ import traceback
 import sys
 import os
 import multiprocessing
-import pandas as pd
 from datetime import datetime
-from neo4j import GraphDatabase, basic_auth
-sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../")
-from RTXConfiguration import RTXConfiguration
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../")
 from ARAX_query import ARAXQuery
+from neo4j_connection_manager import get_neo4j_connection_manager
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.attribute import Attribute as EdgeAttribute
 from openapi_server.models.edge import Edge
@@ -23,6 +20,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../NodeSynonymiz
 from node_synonymizer import NodeSynonymizer
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import overlay_utilities as ou
+from adjacency_counter import AdjacencyCounter
 import collections
 
 
@@ -272,72 +270,33 @@ class ComputeFTEST:
 
 
         # find all nodes with the same type of 'subject_qnode_key' nodes in specified KP ('ARAX/KG1','ARAX/KG2','BTE') that are adjacent to target nodes
-        use_parallel = False
-
-        if not use_parallel:
-            # query adjacent node in one DSL command by providing a list of query nodes to add_qnode()
-            if rel_edge_key:
-                if len(rel_edge_type) == 1:  # if the edge with rel_edge_key has only type, we use this rel_edge_predicate to find all subject nodes in KP
-                    self.response.debug(f"{kp} and edge relation type {list(rel_edge_type)[0]} were used to calculate total object nodes in Fisher's Exact Test")
-                    result = self.query_size_of_adjacent_nodes(node_curie=list(object_node_dict.keys()), source_type=object_node_category, adjacent_type=subject_node_category, kp = kp, rel_type=list(rel_edge_type)[0], use_cypher_command=False)
-                else:  # if the edge with rel_edge_key has more than one type, we ignore the edge predicate and use all categories to find all subject nodes in KP
-                    self.response.warning(f"The edges with specified qedge key {rel_edge_key} have more than one category, we ignore the edge predicate and use all categories to calculate Fisher's Exact Test")
-                    self.response.debug(f"{kp} was used to calculate total object nodes in Fisher's Exact Test")
-                    result = self.query_size_of_adjacent_nodes(node_curie=list(object_node_dict.keys()), source_type=object_node_category, adjacent_type=subject_node_category, kp=kp, rel_type=None, use_cypher_command=False)
-            else:  # if no rel_edge_key is specified, we ignore the edge predicate and use all categories to find all subject nodes in KP
+        # (counted for all object nodes in one batch)
+        if rel_edge_key:
+            if len(rel_edge_type) == 1:  # if the edge with rel_edge_key has only type, we use this rel_edge_predicate to find all subject nodes in KP
+                self.response.debug(f"{kp} and edge relation type {list(rel_edge_type)[0]} were used to calculate total object nodes in Fisher's Exact Test")
+                result = self.query_size_of_adjacent_nodes(node_curie=list(object_node_dict.keys()), source_type=object_node_category, adjacent_type=subject_node_category, kp = kp, rel_type=list(rel_edge_type)[0])
+            else:  # if the edge with rel_edge_key has more than one type, we ignore the edge predicate and use all categories to find all subject nodes in KP
+                self.response.warning(f"The edges with specified qedge key {rel_edge_key} have more than one category, we ignore the edge predicate and use all categories to calculate Fisher's Exact Test")
                 self.response.debug(f"{kp} was used to calculate total object nodes in Fisher's Exact Test")
-                result = self.query_size_of_adjacent_nodes(node_curie=list(object_node_dict.keys()), source_type=object_node_category, adjacent_type=subject_node_category, kp=kp, rel_type=None, use_cypher_command=False)
+                result = self.query_size_of_adjacent_nodes(node_curie=list(object_node_dict.keys()), source_type=object_node_category, adjacent_type=subject_node_category, kp=kp, rel_type=None)
+        else:  # if no rel_edge_key is specified, we ignore the edge predicate and use all categories to find all subject nodes in KP
+            self.response.debug(f"{kp} was used to calculate total object nodes in Fisher's Exact Test")
+            result = self.query_size_of_adjacent_nodes(node_curie=list(object_node_dict.keys()), source_type=object_node_category, adjacent_type=subject_node_category, kp=kp, rel_type=None)
 
-            if result is None:
-                return self.response ## Something wrong happened for querying the adjacent nodes
-            else:
-                res, removed_nodes = result
-                if len(removed_nodes)==0:
-                    size_of_object = res
-                else:
-                    if len(removed_nodes) == 1:
-                        self.response.warning(f"One object node which is {removed_nodes[0]} can't find its neighbors. This node will be ignored for FET calculation.")
-                    else:
-                        self.response.warning(f"{len(removed_nodes)} object nodes which are {removed_nodes} can't find its neighbors. These nodes will be ignored for FET calculation.")
-                    for node in removed_nodes:
-                        del object_node_dict[node]
-                    size_of_object = res
+        if result is None:
+            return self.response ## Something wrong happened for querying the adjacent nodes
         else:
-            # query adjacent node for query nodes one by one in parallel
-            if rel_edge_key:
-                if len(rel_edge_type) == 1:  # if the edge with rel_edge_key has only type, we use this rel_edge_predicate to find all subject nodes in KP
-                    self.response.debug(f"{kp} and edge relation type {list(rel_edge_type)[0]} were used to calculate total adjacent nodes in Fisher's Exact Test")
-                    parameter_list = [(node, object_node_category, subject_node_category, kp, list(rel_edge_type)[0]) for node in list(object_node_dict.keys())]
-                else:  # if the edge with rel_edge_key has more than one type, we ignore the edge type and use all types to find all source nodes in KP
-                    self.response.warning(f"The edges with specified qedge key {rel_edge_key} have more than one type, we ignore the edge type and use all types to calculate Fisher's Exact Test")
-                    self.response.debug(f"{kp} was used to calculate total adjacent nodes in Fisher's Exact Test")
-                    parameter_list = [(node, object_node_category, subject_node_category, kp, None) for node in list(object_node_dict.keys())]
-            else:  # if no rel_edge_key is specified, we ignore the edge type and use all types to find all source nodes in KP
-                self.response.debug(f"{kp} was used to calculate total adjacent nodes in Fisher's Exact Test")
-                parameter_list = [(node, object_node_category, subject_node_category, kp, None) for node in list(object_node_dict.keys())]
-
-            ## get the count of all nodes with the type of 'subject_qnode_key' nodes in KP for each target node in parallel
-            try:
-                with multiprocessing.Pool() as executor:
-                    object_count_res = [elem for elem in executor.map(self._query_size_of_adjacent_nodes_parallel, parameter_list)]
-            except:
-                tb = traceback.format_exc()
-                error_type, error, _ = sys.exc_info()
-                self.response.error(tb, error_code=error_type.__name__)
-                self.response.error(f"Something went wrong with querying adjacent nodes in parallel")
-                return self.response
-
-            if any([type(elem) is list for elem in object_count_res]):
-                for msg in [elem2 for elem1 in object_count_res if type(elem1) is list for elem2 in elem1]:
-                    if type(msg) is tuple:
-                        self.response.error(msg[0], error_code=msg[1])
-                    else:
-                        self.response.error(msg)
-                return self.response  ## Something wrong happened for querying the adjacent nodes
+            res, removed_nodes = result
+            if len(removed_nodes)==0:
+                size_of_object = res
             else:
-                for index in range(len(object_node_dict)):
-                    node = list(object_node_dict.keys())[index]
-                    size_of_object[node] = object_count_res[index]
+                if len(removed_nodes) == 1:
+                    self.response.warning(f"One object node which is {removed_nodes[0]} can't find its neighbors. This node will be ignored for FET calculation.")
+                else:
+                    self.response.warning(f"{len(removed_nodes)} object nodes which are {removed_nodes} can't find its neighbors. These nodes will be ignored for FET calculation.")
+                for node in removed_nodes:
+                    del object_node_dict[node]
+                size_of_object = res
 
         if len(object_node_dict) != 0:
             ## Based on KP detected in message KG, find the total number of node with the same type of source node
@@ -454,7 +413,7 @@ class ComputeFTEST:
         return self.response
 
 
-    def query_size_of_adjacent_nodes(self, node_curie, source_type, adjacent_type, kp="ARAX/KG1", rel_type=None, use_cypher_command=False):
+    def query_size_of_adjacent_nodes(self, node_curie, source_type, adjacent_type, kp="ARAX/KG1", rel_type=None):
         """
         Query adjacent nodes of a given source node based on adjacent node type.
         :param node_curie: (required) the curie id of query node. It accepts both single curie id or curie id list eg. "UniProtKB:P14136" or ['UniProtKB:P02675', 'UniProtKB:P01903', 'UniProtKB:P09601', 'UniProtKB:Q02878']
@@ -462,247 +421,77 @@ class ComputeFTEST:
         :param adjacent_type: (required) the type of adjacent node, eg. "biological_process"
         :param kp: (optional) the knowledge provider to use, eg. "ARAX/KG1"(default)
         :param rel_type: (optional) edge type to consider, eg. "involved_in"
-        :param use_cypher_command: Boolean (True or False). If True, it used cypher command to the size of query adjacent nodes(default:True)
         :return a tuple with a dict containing the number of adjacent nodes for the query node and a list of removed nodes
         """
 
         res = None
 
-        if kp=='ARAX/KG2' or kp == 'ARAX/KG2c':
-            kp="ARAX/KG2"
-
-        if use_cypher_command is True:
-
-            #create the RTXConfiguration object
-            rtxConfig = RTXConfiguration()
-            # Connection information for the neo4j server, populated with orangeboard
-            if kp=="ARAX/KG1":
-                driver = GraphDatabase.driver(rtxConfig.neo4j_bolt, auth=basic_auth(rtxConfig.neo4j_username, rtxConfig.neo4j_password))
-            elif kp=="ARAX/KG2":
-                rtxConfig.live = "KG2"
-                driver = GraphDatabase.driver(rtxConfig.neo4j_bolt, auth=basic_auth(rtxConfig.neo4j_username, rtxConfig.neo4j_password))
-            else:
-                self.response.error(f"The 'kp' argument of 'query_size_of_adjacent_nodes' method within FET only accepts 'ARAX/KG1' or 'ARAX/KG2' for cypher query right now")
-                return res
-
-            session = driver.session()
-
-            # check if node_curie is a str or a list
-            if type(node_curie) is str:
-                if not rel_type:
-                    query = f"match (n00:{adjacent_type})-[]-(n01) where n01.id='{node_curie}' with collect(distinct n00.id) as nodes_n00, n01 as node_n01 return node_n01.id as curie, size(nodes_n00) as count"
-                else:
-                    query = f"match (n00:{adjacent_type})-[:{rel_type}]-(n01) where n01.id='{node_curie}' with collect(distinct n00.id) as nodes_n00, n01 as node_n01 return node_n01.id as curie, size(nodes_n00) as count"
-            elif type(node_curie) is list:
-                if not rel_type:
-                    query = f"match (n00:{adjacent_type})-[]-(n01) where n01.id in {node_curie} with collect(distinct n00.id) as nodes_n00, n01 as node_n01 return node_n01.id as curie, size(nodes_n00) as count"
-                else:
-                    query = f"match (n00:{adjacent_type})-[:{rel_type}]-(n01) where n01.id in {node_curie} with collect(distinct n00.id) as nodes_n00, n01 as node_n01 return node_n01.id as curie, size(nodes_n00) as count"
-            else:
-                self.response.error("The 'node_curie' argument of 'query_size_of_adjacent_nodes' method within FET only accepts str or list")
-                return res
-
-            try:
-                cypher_res = session.run(query)
-                result = pd.DataFrame(cypher_res.data())
-                if result.shape[0] == 0:
-                    self.response.error(f"Fail to query adjacent nodes from {kp} for {node_curie}")
-                    return res
-                else:
-                    res_dict = dict()
-                    has_error = False
-                    if type(node_curie) is str:
-                        res_dict[node_curie] = result['count'][0]
-                        return res_dict
-                    else:
-                        for node in node_curie:
-                            if node in list(result['curie']):
-                                row_ind = list(result['curie']).index(node)
-                                res_dict[node] = result.iloc[row_ind, 1]
-                            else:
-                                self.response.error(f"Fail to query adjacent nodes from {kp} for {node}")
-                                has_error = True
-
-                        if len(res_dict)==0:
-                            return res
-                        elif has_error is True:
-                            return res
-                        else:
-                            return res_dict
-            except:
-                tb = traceback.format_exc()
-                error_type, error, _ = sys.exc_info()
-                self.response.error(tb, error_code=error_type.__name__)
-                self.response.error(f"Something went wrong with querying adjacent nodes from {kp} for {node_curie}")
+        # check if node_curie is a str or a list
+        if type(node_curie) is str:
+            node_curies = [node_curie]
+        elif type(node_curie) is list:
+            node_curies = node_curie
+        else:
+            self.response.error("The 'node_curie' argument of 'query_size_of_adjacent_nodes' method within FET only accepts str or list")
+            return res
+
+        if AdjacencyCounter.supports_kp(kp):
+            # count the edges for all query nodes with one grouped cypher query
+            counts = AdjacencyCounter(self.response).get_adjacent_edge_counts(node_curies, adjacent_type, kp, rel_type)
+            if counts is None:
+                self.response.error(f"Fail to query adjacent nodes from {kp} for {node_curie}")
                 return res
-
         else:
-
-            # construct the instance of ARAXQuery class
-            araxq = ARAXQuery()
-
-            # check if node_curie is a str or a list
-            if type(node_curie) is str:
-                query_node_curie = node_curie
-            elif type(node_curie) is list:
-                node_id_list_str = "["
-                for index in range(len(node_curie)):
-                    node = node_curie[index]
-                    if index + 1 == len(node_curie):
-                        node_id_list_str = node_id_list_str + str(node) + "]"
-                    else:
-                        node_id_list_str = node_id_list_str + str(node) + ","
-
-                query_node_curie = node_id_list_str
-            else:
-                self.response.error(
-                    "The 'node_curie' argument of 'query_size_of_adjacent_nodes' method within FET only accepts str or list")
+            # otherwise expand all query nodes in one DSL command and count their edges in the resulting KG
+            counts = self._count_adjacent_edges_using_expand(node_curies, source_type, adjacent_type, kp, rel_type)
+            if counts is None:
                 return res
 
-            # call the method of ARAXQuery class to query adjacent node
-            if rel_type:
-                query = {"operations": {"actions": [
-                    "create_message",
-                    f"add_qnode(id={query_node_curie}, category={source_type}, key=FET_n00)",
-                    f"add_qnode(category={adjacent_type}, key=FET_n01)",
-                    f"add_qedge(subject=FET_n00, object=FET_n01, key=FET_e00, predicate={rel_type})",
-                    f"expand(edge_key=FET_e00,kp={kp})",
-                    #"resultify()",
-                    "return(message=true, store=false)"
-                ]}}
+        res_dict = dict()
+        failure_node = list()
+        for node in node_curies:
+            if counts.get(node, 0) == 0:
+                self.response.warning(f"Fail to query adjacent nodes from {kp} for {node} in FET probably because expander ignores node type. For more details, please see issue897.")
+                failure_node.append(node)
             else:
-                query = {"operations": {"actions": [
-                    "create_message",
-                    f"add_qnode(id={query_node_curie}, category={source_type}, key=FET_n00)",
-                    f"add_qnode(category={adjacent_type}, key=FET_n01)",
-                    f"add_qedge(subject=FET_n00, object=FET_n01, key=FET_e00)",
-                    f"expand(edge_key=FET_e00,kp={kp})",
-                    #"resultify()",
-                    "return(message=true, store=false)"
-                ]}}
-
-            try:
-                result = araxq.query(query)
-                if result.status != 'OK':
-                    self.response.error(f"Fail to query adjacent nodes from {kp} for {node_curie}")
-                    return res
-                else:
-                    res_dict = dict()
-                    message = araxq.response.envelope.message
-                    if type(node_curie) is str:
-                        tmplist = set([edge_key for edge_key in message.knowledge_graph.edges if message.knowledge_graph.edges[edge_key].subject == node_curie or message.knowledge_graph.edges[edge_key].object == node_curie])  ## edge has no direction
-                        if len(tmplist) == 0:
-                            self.response.warning(f"Fail to query adjacent nodes from {kp} for {node_curie} in FET probably because expander ignores node type. For more details, please see issue897.")
-                            return (res_dict,[node_curie])
-                        res_dict[node_curie] = len(tmplist)
-                        return (res_dict,[])
-                    else:
-                        check_empty = False
-                        failure_node = list()
-                        for node in node_curie:
-                            tmplist = set([edge_key for edge_key in message.knowledge_graph.edges if message.knowledge_graph.edges[edge_key].subject == node or message.knowledge_graph.edges[edge_key].object == node])  ## edge has no direction
-                            if len(tmplist) == 0:
-                                self.response.warning(f"Fail to query adjacent nodes from {kp} for {node} in FET probably because expander ignores node type. For more details, please see issue897.")
-                                failure_node.append(node)
-                                check_empty = True
-                                continue
-                            res_dict[node] = len(tmplist)
-
-                        if check_empty is True:
-                            return (res_dict,failure_node)
-                        else:
-                            return (res_dict,failure_node)
-            except:
-                tb = traceback.format_exc()
-                error_type, error, _ = sys.exc_info()
-                self.response.error(tb, error_code=error_type.__name__)
-                self.response.error(f"Something went wrong with querying adjacent nodes from {kp} for {node_curie}")
-                return res
-
-
-    def _query_size_of_adjacent_nodes_parallel(self, this):
-        # This method is expected to be run within this class
-        """
-        Query the size of adjacent nodes of a given source node based on adjacent node type in parallel.
-        :param this is a list containing five sub-arguments below since this function is exectued in parallel.
-        :return the number of adjacent nodes for the query node
-        """
-        #:sub-argument node_curie: (required) the curie id of query node, eg. "UniProtKB:P14136"
-        #:sub-argument source_type: (required) the type of source node, eg. "gene"
-        #:sub-argument adjacent_type: (required) the type of adjacent node, eg. "biological_process"
-        #:sub-argument kp: (optional) the knowledge provider to use, eg. "ARAX/KG1"(default)
-        #:sub-argument rel_type: (optional) edge type to consider, eg. "involved_in"
-
-        error_message = []
-        if len(this) == 5:
-            # this contains four arguments and assign them to different variables
-            node_curie, source_type, adjacent_type, kp, rel_type = this
-        elif len(this) == 4:
-            node_curie, source_type, adjacent_type, kp = this
-            rel_type = None
-        elif len(this) == 3:
-            node_curie, source_type, adjacent_type = this
-            kp = "ARAX/KG1"
-            rel_type = None
-        else:
-            error_message.append("The '_query_size_of_adjacent_nodes_parallel' method within FET only accepts four arguments: node_curie, adjacent_type, kp, rel_type")
-            return error_message
-
-        if kp=='ARAX/KG2' or kp == 'ARAX/KG2c':
-            kp="ARAX/KG2"
+                res_dict[node] = counts[node]
+        return (res_dict, failure_node)
 
+    def _count_adjacent_edges_using_expand(self, node_curies, source_type, adjacent_type, kp, rel_type):
         # construct the instance of ARAXQuery class
         araxq = ARAXQuery()
-
-        # check if node_curie is a str
-        if type(node_curie) is str:
-            pass
-        else:
-            error_message.append("The 'node_curie' argument of '_query_size_of_adjacent_nodes_parallel' method within FET only accepts str")
-            return error_message
+        query_node_curie = "[" + ",".join(str(node) for node in node_curies) + "]"
 
         # call the method of ARAXQuery class to query adjacent node
-
-        if rel_type:
-            query = {"operations": {"actions": [
-                "create_message",
-                f"add_qnode(id={node_curie}, category={source_type}, key=FET_n00)",
-                f"add_qnode(category={adjacent_type}, key=FET_n01)",
-                f"add_qedge(subject=FET_n00, object=FET_n01, key=FET_e00, predicate={rel_type})",
-                f"expand(edge_key=FET_e00,kp={kp})",
-                #"resultify()",
-                "return(message=true, store=false)"
-            ]}}
-        else:
-            query = {"operations": {"actions": [
-                "create_message",
-                f"add_qnode(id={node_curie}, category={source_type}, key=FET_n00)",
-                f"add_qnode(category={adjacent_type}, key=FET_n01)",
-                f"add_qedge(subject=FET_n00, object=FET_n01, key=FET_e00)",
-                f"expand(edge_key=FET_e00,kp={kp})",
-                #"resultify()",
-                "return(message=true, store=false)"
-            ]}}
+        predicate_str = f", predicate={rel_type}" if rel_type else ""
+        query = {"operations": {"actions": [
+            "create_message",
+            f"add_qnode(id={query_node_curie}, category={source_type}, key=FET_n00)",
+            f"add_qnode(category={adjacent_type}, key=FET_n01)",
+            f"add_qedge(subject=FET_n00, object=FET_n01, key=FET_e00{predicate_str})",
+            f"expand(edge_key=FET_e00,kp={kp})",
+            "return(message=true, store=false)"
+        ]}}
 
         try:
             result = araxq.query(query)
             if result.status != 'OK':
-                error_message.append(f"Fail to query adjacent nodes from {kp} for {node_curie}")
-                return error_message
-            else:
-                message = araxq.response.envelope.message
-                tmplist = set([edge_key for edge_key in message.knowledge_graph.edges if message.knowledge_graph[edge_key].subject == node_curie or message.knowledge_graph[edge_key].object == node_curie]) ## edge has no direction
-                if len(tmplist) == 0:
-                    error_message.append(f"Fail to query adjacent nodes from {kp} for {node_curie}")
-                    return error_message
-                res = len(tmplist)
-                return res
+                self.response.error(f"Fail to query adjacent nodes from {kp} for {node_curies}")
+                return None
+            # count each node's edges in a single pass over the KG (edges have no direction here)
+            message = araxq.response.envelope.message
+            edge_keys_by_node = {node: set() for node in node_curies}
+            for edge_key, edge in message.knowledge_graph.edges.items():
+                for node in {edge.subject, edge.object}:
+                    if node in edge_keys_by_node:
+                        edge_keys_by_node[node].add(edge_key)
+            return {node: len(edge_keys) for node, edge_keys in edge_keys_by_node.items()}
         except:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
-            error_message.append((tb, error_type.__name__))
-            error_message.append(f"Something went wrong with querying adjacent nodes from {kp} for {node_curie}")
-            return error_message
+            self.response.error(tb, error_code=error_type.__name__)
+            self.response.error(f"Something went wrong with querying adjacent nodes from {kp} for {node_curies}")
+            return None
 
     def size_of_given_type_in_KP(self, node_type, use_cypher_command=False, kg='KG1'):
         """
@@ -725,14 +514,9 @@ class ComputeFTEST:
 
         if kg == 'KG1':
             if use_cypher_command:
-                rtxConfig = RTXConfiguration()
-                # Connection information for the neo4j server, populated with orangeboard
-                driver = GraphDatabase.driver(rtxConfig.neo4j_bolt, auth=basic_auth(rtxConfig.neo4j_username, rtxConfig.neo4j_password))
-                session = driver.session()
-
                 query = "MATCH (n:%s) return count(distinct n)" % (node_type)
-                res = session.run(query)
-                size_of_total = res.single()["count(distinct n)"]
+                res = get_neo4j_connection_manager().run_query(query, kg)
+                size_of_total = res[0]["count(distinct n)"]
                 return size_of_total
             else:
                 nodesynonymizer = NodeSynonymizer()
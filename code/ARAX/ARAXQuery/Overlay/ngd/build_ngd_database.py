@@ -11,6 +11,8 @@ There are two halves to the (full) build process:
 2. Create the final file called "curie_to_pmids.sqlite"
      - Contains mappings from canonicalized curies to their list of PMIDs based on the data scraped from Pubmed AND
        from KG2 data (node.publications and edge.publications)
+     - PMID lists are stored both as JSON lists (curie_to_pmids table) and as sorted uint32 arrays in binary form
+       (curie_to_pmid_arrays table); the latter is what ComputeNGD uses
      - The NodeSynonymizer is used to link curies to concept names from step 1
 Usage: python build_ngd_database.py <path to directory containing PubMed xml files> [--test] [--full]
        By default, only step 2 above will be performed. To do a "full" build, use the --full flag.
@@ -26,14 +28,13 @@ import time
 import traceback
 from typing import List, Dict, Set, Union
 
+import numpy as np
 from lxml import etree
 import pickledb
-from neo4j import GraphDatabase
-
 sys.path.append(f"{os.path.dirname(os.path.abspath(__file__))}/../../../NodeSynonymizer/")
 from node_synonymizer import NodeSynonymizer
-sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../../")  # code directory
-from RTXConfiguration import RTXConfiguration
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")  # ARAXQuery directory
+from neo4j_connection_manager import get_neo4j_connection_manager
 
 
 class NGDDatabaseBuilder:
@@ -187,14 +188,20 @@ class NGDDatabaseBuilder:
         cursor = connection.cursor()
         cursor.execute("CREATE TABLE curie_to_pmids (curie TEXT, pmids TEXT)")
         cursor.execute("CREATE UNIQUE INDEX unique_curie ON curie_to_pmids (curie)")
+        # PMID lists are also stored as sorted uint32 arrays (raw bytes), which ComputeNGD can use without parsing
+        cursor.execute("CREATE TABLE curie_to_pmid_arrays (curie TEXT PRIMARY KEY, pmids BLOB) WITHOUT ROWID")
         print(f"  Gathering row data..")
-        rows = [[curie, json.dumps(list(filter(None, {self._get_local_id_as_int(pmid) for pmid in pmids})))]
-                for curie, pmids in curie_to_pmids_map.items()]
-        rows_in_chunks = self._divide_list_into_chunks(rows, 5000)
+        sorted_pmids_map = {curie: sorted(filter(None, {self._get_local_id_as_int(pmid) for pmid in pmids}))
+                            for curie, pmids in curie_to_pmids_map.items()}
+        rows = [[curie, json.dumps(pmids)] for curie, pmids in sorted_pmids_map.items()]
+        array_rows = [[curie, np.array(pmids, dtype=np.uint32).tobytes()] for curie, pmids in sorted_pmids_map.items()]
         print(f"  Inserting row data into database..")
-        for chunk in rows_in_chunks:
+        for chunk in self._divide_list_into_chunks(rows, 5000):
             cursor.executemany(f"INSERT INTO curie_to_pmids (curie, pmids) VALUES (?, ?)", chunk)
             connection.commit()
+        for chunk in self._divide_list_into_chunks(array_rows, 5000):
+            cursor.executemany(f"INSERT INTO curie_to_pmid_arrays (curie, pmids) VALUES (?, ?)", chunk)
+            connection.commit()
         # Log how many rows we've added in the end (for debugging purposes)
         cursor.execute(f"SELECT COUNT(*) FROM curie_to_pmids")
         count = cursor.fetchone()[0]
@@ -259,14 +266,8 @@ class NGDDatabaseBuilder:
 
     @staticmethod
     def _run_cypher_query(cypher_query: str, kg='KG2') -> List[Dict[str, any]]:
-        rtxc = RTXConfiguration()
-        if kg == 'KG2':
-            rtxc.live = "KG2"
         try:
-            driver = GraphDatabase.driver(rtxc.neo4j_bolt, auth=(rtxc.neo4j_username, rtxc.neo4j_password))
-            with driver.session() as session:
-                query_results = session.run(cypher_query).data()
-            driver.close()
+            query_results = get_neo4j_connection_manager().run_query(cypher_query, kg)
         except Exception:
             tb = traceback.format_exc()
             error_type, error, _ = sys.exc_info()
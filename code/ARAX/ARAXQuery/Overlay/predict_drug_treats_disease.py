@@ -18,6 +18,18 @@ from node_synonymizer import NodeSynonymizer
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import overlay_utilities as ou
 
+DRUG_TYPES = {"drug", "chemical_substance", "biolink:Drug", "biolink:ChemicalSubstance"}
+DISEASE_TYPES = {"disease", "phenotypic_feature", "biolink:Disease", "biolink:PhenotypicFeature"}
+
+
+def _is_drug(category):
+    return any(drug_type in category for drug_type in DRUG_TYPES)
+
+
+def _is_disease(category):
+    return any(disease_type in category for disease_type in DISEASE_TYPES)
+
+
 class PredictDrugTreatsDisease:
 
     #### Constructor
@@ -91,28 +103,36 @@ class PredictDrugTreatsDisease:
 
         self.synonymizer = NodeSynonymizer()
 
-    def convert_to_trained_curies(self, input_curie):
+    def get_treat_probabilities(self, drug_disease_pairs):
         """
-        Takes an input curie from the KG, uses the synonymizer, and then returns something that the map.csv can handle
+        Takes a list of (drug, disease) pairs of curies from the KG and returns the probability that each drug treats each
+        disease, as a dict keyed by the pairs. All of the curies are converted with a single NodeSynonymizer call and all
+        of the probabilities come from a single DTD database query (or a single call to the model). Pairs that the
+        synonymizer doesn't see as a drug and a disease, or that have no finite probability, are left out.
         """
-        normalizer_result = self.synonymizer.get_canonical_curies(input_curie)
-        curies_in_model = normalizer_result[input_curie]
-        # curies_in_model = [curie for curie in curies_in_model if curie in self.known_curies]
-        # equivalent_curies = []  # start with empty equivalent_curies
-        # try:
-        #     equivalent_curies = [x['identifier'] for x in normalizer_result[input_curie]['equivalent_identifiers']]
-        # except:
-        #     self.response.warning(f"NodeSynonmizer could not find curies for {input_curie}, skipping this one.")
-        # for curie in equivalent_curies:
-        #     curie_prefix = curie.split(':')[0]
-        #     # FIXME: fix this when re-training the ML model, as when this was originally trained, it was ChEMBL:123, not CHEMBL.COMPOUND:CHEMBL123
-        #     if curie_prefix == "CHEMBL.COMPOUND":
-        #         chembl_fix = 'ChEMBL:' + curie[22:]
-        #         if chembl_fix in self.known_curies:
-        #             curies_in_model.add(chembl_fix)
-        #     elif curie in self.known_curies:
-        #         curies_in_model.add(curie)
-        return curies_in_model
+        curies = list({curie for drug_disease_pair in drug_disease_pairs for curie in drug_disease_pair})
+        normalizer_results = self.synonymizer.get_canonical_curies(curies) if len(curies) > 0 else dict()
+        converted_pairs = dict()
+        for drug_curie, disease_curie in drug_disease_pairs:
+            converted_drug_curie = normalizer_results.get(drug_curie)
+            converted_disease_curie = normalizer_results.get(disease_curie)
+            if converted_drug_curie is None or converted_drug_curie['preferred_type'] not in DRUG_TYPES:
+                continue
+            if converted_disease_curie is None or converted_disease_curie['preferred_type'] not in DISEASE_TYPES:
+                continue
+            converted_pairs[(drug_curie, disease_curie)] = (converted_drug_curie['preferred_curie'], converted_disease_curie['preferred_curie'])
+
+        unique_converted_pairs = list(set(converted_pairs.values()))
+        if self.use_prob_db is True:
+            probabilities = self.pred.get_probs_from_DTD_db_for_pairs(unique_converted_pairs)
+        else:
+            probabilities = self.pred.prob_pairs(unique_converted_pairs)
+        treat_probabilities = dict()
+        for drug_disease_pair, converted_pair in converted_pairs.items():
+            probability = probabilities.get(converted_pair)
+            if probability is not None and np.isfinite(probability):
+                treat_probabilities[drug_disease_pair] = probability
+        return treat_probabilities
 
     def predict_drug_treats_disease(self):
         """
@@ -126,7 +146,6 @@ class PredictDrugTreatsDisease:
 
         attribute_name = "probability_treats"
         attribute_type = "EDAM:data_0951"
-        value = 0  # this will be the default value. If the model returns 0, or the default is there, don't include that edge
         url = "https://doi.org/10.1101/765305"
 
         # if you want to add virtual edges, identify the source/targets, decorate the edges, add them to the KG, and then add one to the QG corresponding to them
@@ -138,66 +157,26 @@ class PredictDrugTreatsDisease:
             for node_key, node in self.message.knowledge_graph.nodes.items():
                 if hasattr(node, 'qnode_keys'):
                     if parameters['subject_qnode_key'] in node.qnode_keys:
-                        if "drug" in node.category or "chemical_substance" in node.category or "biolink:Drug" in node.category or "biolink:ChemicalSubstance" in node.category:  # this is now NOT checked by ARAX_overlay
+                        if _is_drug(node.category):  # this is now NOT checked by ARAX_overlay
                             source_curies_to_decorate.add(node_key)
                             curie_to_name[node_key] = node.name
                     if parameters['object_qnode_key'] in node.qnode_keys:
-                        if "disease" in node.category or "phenotypic_feature" in node.category or "biolink:Disease" in node.category or "biolink:PhenotypicFeature" in node.category:  # this is now NOT checked by ARAX_overlay
+                        if _is_disease(node.category):  # this is now NOT checked by ARAX_overlay
                             target_curies_to_decorate.add(node_key)
                             curie_to_name[node_key] = node.name
 
             added_flag = False  # check to see if any edges where added
-            # iterate over all pairs of these nodes, add the virtual edge, decorate with the correct attribute
+            # compute the probabilities of all pairs of these nodes at once, then add the virtual edges, decorated with the correct attribute
+            curie_pairs = list(itertools.product(source_curies_to_decorate, target_curies_to_decorate))
+            treat_probabilities = self.get_treat_probabilities(curie_pairs)
 
-            for (source_curie, target_curie) in itertools.product(source_curies_to_decorate, target_curies_to_decorate):
+            for (source_curie, target_curie) in curie_pairs:
                 self.response.debug(f"Predicting probability that {curie_to_name[source_curie]} treats {curie_to_name[target_curie]}")
-                # create the edge attribute if it can be
-                # loop over all equivalent curies and take the highest probability
-
-                max_probability = 0
-                converted_source_curie = self.convert_to_trained_curies(source_curie)
-                if converted_source_curie is None:
-                    continue
-                else:
-                    preferred_type = converted_source_curie['preferred_type']
-                    if preferred_type == "drug" or preferred_type == "chemical_substance" or preferred_type == "biolink:Drug" or preferred_type == "biolink:ChemicalSubstance":
-                        converted_source_curie = converted_source_curie['preferred_curie']
-                    else:
-                        continue
-                converted_target_curie = self.convert_to_trained_curies(target_curie)
-                if converted_target_curie is None:
-                    continue
-                else:
-                    preferred_type = converted_target_curie['preferred_type']
-                    if preferred_type == "disease" or preferred_type == "phenotypic_feature" or preferred_type == "biolink:Disease" or preferred_type == "biolink:PhenotypicFeature":
-                        converted_target_curie = converted_target_curie['preferred_curie']
-                    else:
-                        continue
-                if self.use_prob_db is True:
-                    probability = self.pred.get_prob_from_DTD_db(converted_source_curie, converted_target_curie)
-                    if probability is not None:
-                        if np.isfinite(probability):
-                            max_probability = probability
-                else:
-                    probability = self.pred.prob_single(converted_source_curie, converted_target_curie)
-                    if probability is not None:
-                        probability = probability[0]
-                        if np.isfinite(probability):
-                            max_probability = probability
-                # if len(res) != 0:
-                #     all_probabilities = self.pred.prob_all(res)
-                #     if isinstance(all_probabilities, list):
-                #         max_probability = max([value for value in all_probabilities if np.isfinite(value)])
-
-                value = max_probability
-
-                #probability = self.pred.prob_single('ChEMBL:' + source_curie[22:], target_curie)  # FIXME: when this was trained, it was ChEMBL:123, not CHEMBL.COMPOUND:CHEMBL123
-                #if probability and np.isfinite(probability):  # finite, that's ok, otherwise, stay with default
-                #    value = probability[0]
-                edge_attribute = EdgeAttribute(type=attribute_type, name=attribute_name, value=str(value), url=url)  # populate the edge attribute
-                if edge_attribute and value != 0:
+                value = treat_probabilities.get((source_curie, target_curie), 0)  # if the model returns 0, or there is no probability, don't include that edge
+                if value != 0:
                     added_flag = True
                     # make the edge, add the attribute
+                    edge_attribute = EdgeAttribute(type=attribute_type, name=attribute_name, value=str(value), url=url)  # populate the edge attribute
 
                     # edge properties
                     now = datetime.now()
@@ -248,106 +227,28 @@ class PredictDrugTreatsDisease:
                 for node_key, node in self.message.knowledge_graph.nodes.items():
                     curie_to_type[node_key] = node.category
                     curie_to_name[node_key] = node.name
-                # then iterate over the edges and decorate if appropriate
+                # first find the edges between a drug and a disease (in either direction), then get all of their probabilities at once
+                edges_to_decorate = []
                 for edge_key, edge in self.message.knowledge_graph.edges.items():
                     # Make sure the edge_attributes are not None
                     if not edge.attributes:
                         edge.attributes = []  # should be an array, but why not a list?
-                    # now go and actually get the probability
                     source_curie = edge.subject
                     target_curie = edge.object
                     source_types = curie_to_type[source_curie]
                     target_types = curie_to_type[target_curie]
-                    if (("drug" in source_types) or ("chemical_substance" in source_types) or ("biolink:Drug" in source_types) or ("biolink:ChemicalSubstance" in source_types)) and (("disease" in target_types) or ("phenotypic_feature" in target_types) or ("biolink:Disease" in target_types) or ("biolink:PhenotypicFeature" in target_types)):
-                        # loop over all pairs of equivalent curies and take the highest probability
-                        self.response.debug(f"Predicting treatment probability between {curie_to_name[source_curie]} and {curie_to_name[target_curie]}")
-                        max_probability = 0
-                        converted_source_curie = self.convert_to_trained_curies(source_curie)
-                        if converted_source_curie is None:
-                            continue
-                        else:
-                            preferred_type = converted_source_curie['preferred_type']
-                            if preferred_type == "drug" or preferred_type == "chemical_substance" or preferred_type == "biolink:Drug" or preferred_type == "biolink:ChemicalSubstance":
-                                converted_source_curie = converted_source_curie['preferred_curie']
-                            else:
-                                continue
-                        converted_target_curie = self.convert_to_trained_curies(target_curie)
-                        if converted_target_curie is None:
-                            continue
-                        else:
-                            preferred_type = converted_target_curie['preferred_type']
-                            if preferred_type == "disease" or preferred_type == "phenotypic_feature" or preferred_type == "biolink:Disease" or preferred_type == "biolink:PhenotypicFeature":
-                                converted_target_curie = converted_target_curie['preferred_curie']
-                            else:
-                                continue
-                        if self.use_prob_db is True:
-                            probability = self.pred.get_prob_from_DTD_db(converted_source_curie, converted_target_curie)
-                            if probability is not None:
-                                if np.isfinite(probability):
-                                    max_probability = probability
-                        else:
-                            probability = self.pred.prob_single(converted_source_curie, converted_target_curie)
-                            if probability is not None:
-                                probability = probability[0]
-                                if np.isfinite(probability):
-                                    max_probability = probability
-                        # res = list(itertools.product(converted_source_curie, converted_target_curie))
-                        # if len(res) != 0:
-                        #     all_probabilities = self.pred.prob_all(res)
-                        #     if isinstance(all_probabilities, list):
-                        #         max_probability = max([value for value in all_probabilities if np.isfinite(value)])
-
-                        value = max_probability
-
-                        #probability = self.pred.prob_single('ChEMBL:' + source_curie[22:], target_curie)  # FIXME: when this was trained, it was ChEMBL:123, not CHEMBL.COMPOUND:CHEMBL123
-                        #if probability and np.isfinite(probability):  # finite, that's ok, otherwise, stay with default
-                        #    value = probability[0]
-                    elif (("drug" in target_types) or ("chemical_substance" in target_types) or ("biolink:Drug" in target_types) or ("biolink:ChemicalSubstance" in target_types)) and (("disease" in source_types) or ("phenotypic_feature" in source_types) or ("biolink:Disease" in source_types) or ("biolink:PhenotypicFeature" in source_types)):
-                        #probability = self.pred.prob_single('ChEMBL:' + target_curie[22:], source_curie)  # FIXME: when this was trained, it was ChEMBL:123, not CHEMBL.COMPOUND:CHEMBL123
-                        #if probability and np.isfinite(probability):  # finite, that's ok, otherwise, stay with default
-                        #    value = probability[0]
-                        self.response.debug(f"Predicting treatment probability between {curie_to_name[source_curie]} and {curie_to_name[target_curie]}")
-                        max_probability = 0
-                        converted_source_curie = self.convert_to_trained_curies(source_curie)
-                        if converted_source_curie is None:
-                            continue
-                        else:
-                            preferred_type = converted_source_curie['preferred_type']
-                            if preferred_type == "disease" or preferred_type == "phenotypic_feature" or preferred_type == "biolink:Disease" or preferred_type == "biolink:PhenotypicFeature":
-                                converted_source_curie = converted_source_curie['preferred_curie']
-                            else:
-                                continue
-                        converted_target_curie = self.convert_to_trained_curies(target_curie)
-                        if converted_target_curie is None:
-                            continue
-                        else:
-                            preferred_type = converted_target_curie['preferred_type']
-                            if preferred_type == "drug" or preferred_type == "chemical_substance" or preferred_type == "biolink:Drug" or preferred_type == "biolink:ChemicalSubstance":
-                                converted_target_curie = converted_target_curie['preferred_curie']
-                            else:
-                                continue
-
-                        if self.use_prob_db is True:
-                            probability = self.pred.get_prob_from_DTD_db(converted_target_curie, converted_source_curie)
-                            if probability is not None:
-                                if np.isfinite(probability):
-                                    max_probability = probability
-                        else:
-                            probability = self.pred.prob_single(converted_target_curie, converted_source_curie)
-                            if probability is not None:
-                                probability = probability[0]
-                                if np.isfinite(probability):
-                                    max_probability = probability
-                        # res = list(itertools.product(converted_target_curie, converted_source_curie))
-                        # if len(res) != 0:
-                        #     all_probabilities = self.pred.prob_all(res)
-                        #     if isinstance(all_probabilities, list):
-                        #         max_probability = max([value for value in all_probabilities if np.isfinite(value)])
-
-                        value = max_probability
-
+                    if _is_drug(source_types) and _is_disease(target_types):
+                        drug_disease_pair = (source_curie, target_curie)
+                    elif _is_drug(target_types) and _is_disease(source_types):
+                        drug_disease_pair = (target_curie, source_curie)
                     else:
                         continue
+                    self.response.debug(f"Predicting treatment probability between {curie_to_name[source_curie]} and {curie_to_name[target_curie]}")
+                    edges_to_decorate.append((edge, drug_disease_pair))
+                treat_probabilities = self.get_treat_probabilities([drug_disease_pair for _, drug_disease_pair in edges_to_decorate])
+                # then decorate the edges that got a probability
+                for edge, drug_disease_pair in edges_to_decorate:
+                    value = treat_probabilities.get(drug_disease_pair, 0)  # if the model returns 0, or there is no probability, don't include that edge
                     if value != 0:
                         edge_attribute = EdgeAttribute(type=attribute_type, name=attribute_name, value=str(value), url=url)  # populate the attribute
                         edge.attributes.append(edge_attribute)  # append it to the list of attributes
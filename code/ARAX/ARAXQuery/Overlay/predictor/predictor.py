@@ -11,6 +11,51 @@ except:
         import joblib
 
 
+class EmbeddingStore():
+    """
+    The embedding vectors of the graph nodes: a float32 matrix saved as '<prefix>_embeddings.npy', whose rows belong to the
+    curies saved (sorted, as bytes) in '<prefix>_curies.npy'. Both files are memory-mapped, so a curie is found with a binary
+    search and only the rows actually used are read from disk.
+    """
+
+    def __init__(self, path_prefix):
+        self.embeddings = np.load(path_prefix + '_embeddings.npy', mmap_mode='r')
+        self.curies = np.load(path_prefix + '_curies.npy', mmap_mode='r')
+
+    @staticmethod
+    def exists(path_prefix):
+        return os.path.exists(path_prefix + '_embeddings.npy') and os.path.exists(path_prefix + '_curies.npy')
+
+    @staticmethod
+    def save(path_prefix, curies, embeddings):
+        """
+        Saves an embedding store
+
+        :param curies: the curie of each row of embeddings
+        :param embeddings: a matrix with the embedding vector of each curie
+        """
+        curies = np.array([curie.encode('utf-8') for curie in curies], dtype=bytes)
+        order = np.argsort(curies, kind='stable')
+        np.save(path_prefix + '_curies.npy', curies[order])
+        np.save(path_prefix + '_embeddings.npy', np.asarray(embeddings, dtype=np.float32)[order])
+
+    def get_rows(self, curie_names):
+        """
+        Finds the rows of the embedding matrix that belong to the given curies
+
+        :param curie_names: a list of curie names
+        return an array with the row of each curie, or -1 for the curies that aren't in the store
+        """
+        if len(curie_names) == 0 or len(self.curies) == 0:
+            return np.full(len(curie_names), -1, dtype=np.int64)
+        keys = [curie.encode('utf-8') for curie in curie_names]
+        # a curie longer than any stored one can't be in the store (and would be truncated by the cast below)
+        fits = np.array([len(key) <= self.curies.itemsize for key in keys], dtype=bool)
+        keys = np.array(keys, dtype=self.curies.dtype)
+        rows = np.minimum(np.searchsorted(self.curies, keys), len(self.curies) - 1)
+        return np.where(fits & (self.curies[rows] == keys), rows, -1)
+
+
 class predictor():
 
     def __init__(self, DTD_prob_file=os.path.dirname(os.path.abspath(__file__))+'/DTD_probability_database.db', model_file=os.path.dirname(os.path.abspath(__file__))+'/LogModel.pkl', use_prob_db=True):
@@ -21,6 +66,7 @@ class predictor():
         else:
             self.model = joblib.load(model_file)
             self.graph_cur = None
+            self.embedding_store = None
             self.X = None
 
     def prob(self, X):
@@ -50,6 +96,13 @@ class predictor():
             print(f"ERROR: The 'curie_name' has to be a str")
             return None
 
+        if self.embedding_store is not None:
+            row = self.embedding_store.get_rows([curie_name])[0]
+            if row < 0:
+                print(f"No curie named '{curie_name}' was found from database")
+                return None
+            return self.embedding_store.embeddings[row].tolist()
+
         row = self.graph_cur.execute(f"select * from GRAPH where curie='{curie_name}'")
         res = row.fetchone()
         if res is None:
@@ -59,18 +112,51 @@ class predictor():
         res.pop(0)
         return res
 
-    def import_file(self, file, graph_database=os.path.dirname(os.path.abspath(__file__))+'/retrain_data/GRAPH.sqlite'):
+    def get_features(self, curie_names):
+        """
+        Retrieve the features of many curie ids at once, as a matrix
+
+        :param curie_names: a list of curie names
+        return a tuple of the feature matrix and a dict mapping each curie found in the database to its row of the matrix
+        """
+        curie_names = list(set(curie_names))
+        if self.embedding_store is not None:
+            rows = self.embedding_store.get_rows(curie_names)
+            found = rows >= 0
+            curie_rows = {curie: index for index, curie in enumerate(curie_name for curie_name, is_found in zip(curie_names, found) if is_found)}
+            return self.embedding_store.embeddings[rows[found]].astype(float), curie_rows
+
+        # one query per batch of curies, from the SQLite database
+        feature_list = []
+        curie_rows = dict()
+        for start in range(0, len(curie_names), 500):
+            batch = curie_names[start:start + 500]
+            for row in self.graph_cur.execute(f"select * from GRAPH where curie in ({','.join('?' * len(batch))})", batch):
+                if row[0] not in curie_rows:
+                    curie_rows[row[0]] = len(feature_list)
+                    feature_list.append(row[1:])
+        return np.array(feature_list, dtype=float), curie_rows
+
+    def import_file(self, file, graph_database=os.path.dirname(os.path.abspath(__file__))+'/retrain_data/GRAPH.sqlite', embedding_store=None):
         """
         Imports all necisary files to take curie ids and extract their feature vectors.
 
         :param file: A string containing the filename or path of a csv containing the source and target curie ids to make predictions on (If set to None will just import the graph and map files)
         :param graph_database: A string containing the filename or path of the sqlite file containing the feature vectors for each node
+        :param embedding_store: The path prefix of an EmbeddingStore with the feature vectors (by default, the graph_database path without its extension); it is used instead of the sqlite file if it exists
         """
         #graph = pd.read_csv(graph_file, sep=' ', skiprows=1, header=None, index_col=None)
         #self.graph = graph.sort_values(0).reset_index(drop=True)
         if self.use_prob_db is not True:
-            conn = sqlite3.connect(graph_database)
-            self.graph_cur = conn.cursor()
+            if embedding_store is None:
+                embedding_store = os.path.splitext(graph_database)[0]
+            if EmbeddingStore.exists(embedding_store):
+                self.embedding_store = EmbeddingStore(embedding_store)
+                self.graph_cur = None
+            else:
+                self.embedding_store = None
+                conn = sqlite3.connect(graph_database)
+                self.graph_cur = conn.cursor()
 
             if file is not None:
                 data = pd.read_csv(file, index_col=None)
@@ -146,7 +232,7 @@ class predictor():
         :param target_curie: A string containg the curie id of the target node
         """
         if self.use_prob_db is not True:
-            if self.graph_cur is None:
+            if self.graph_cur is None and self.embedding_store is None:
                 self.import_file(None)
 
             source_feature = self.get_feature(source_curie)
@@ -173,7 +259,7 @@ class predictor():
         :source_target_curie_list: A list containing a bunch of tuples which contain the curie ids of the source and target nodes
         """
         if self.use_prob_db is not True:
-            if self.graph_cur is None:
+            if self.graph_cur is None and self.embedding_store is None:
                 self.import_file(None)
 
             if isinstance(source_target_curie_list, list):
@@ -206,7 +292,7 @@ class predictor():
         :param target_curie: A string containg the curie id of the target node
         """
         if self.use_prob_db is not True:
-            if self.graph_cur is None:
+            if self.graph_cur is None and self.embedding_store is None:
                 self.import_file(None)
 
             source_feature = self.get_feature(source_curie)
@@ -233,7 +319,7 @@ class predictor():
         :source_target_curie_list: A list containing a bunch of tuples which contain the curie ids of the source and target nodes
         """
         if self.use_prob_db is not True:
-            if self.graph_cur is None:
+            if self.graph_cur is None and self.embedding_store is None:
                 self.import_file(None)
 
             if isinstance(source_target_curie_list, list):
@@ -258,6 +344,29 @@ class predictor():
             else:
                 return None
 
+    def prob_pairs(self, source_target_curie_list):
+        """
+        Generates the probabilities of multiple pairs of source and target curie ids being classified as the positive class, like
+        prob_all(), but fetching the feature vectors of all curies at once (a single fancy-indexing operation with an
+        EmbeddingStore) and scoring all pairs with a single call to the model
+
+        :source_target_curie_list: A list containing a bunch of tuples which contain the curie ids of the source and target nodes
+        return a dict mapping each pair whose source and target both have feature vectors to its probability
+        """
+        if self.use_prob_db is not True:
+            if self.graph_cur is None and self.embedding_store is None:
+                self.import_file(None)
+
+            features, curie_rows = self.get_features([curie for pair in source_target_curie_list for curie in pair])
+            scored_pairs = [(source_curie, target_curie) for source_curie, target_curie in source_target_curie_list
+                            if source_curie in curie_rows and target_curie in curie_rows]
+            if len(scored_pairs) == 0:
+                return dict()
+            source_rows = [curie_rows[source_curie] for source_curie, _ in scored_pairs]
+            target_rows = [curie_rows[target_curie] for _, target_curie in scored_pairs]
+            X = features[source_rows] * features[target_rows]  # use 'Hadamard product' method instead of 'Concatenate' method
+            return dict(zip(scored_pairs, self.prob(X)[:, 1]))
+
     def get_prob_from_DTD_db(self, source_curie, target_curie):
         """
         Get the probability of a single pair of source and target curie ids from DTD probability database
@@ -278,6 +387,27 @@ class predictor():
             else:
                 return res[2]
 
+    def get_probs_from_DTD_db_for_pairs(self, drug_disease_pairs):
+        """
+        Get the probabilities of many pairs of drug and disease curie ids from DTD probability database at once, by joining a
+        temporary table of the pairs with the DTD_PROBABILITY table (instead of making one query per pair)
+
+        :param drug_disease_pairs: A list containing a bunch of tuples which contain the curie ids of the drug and disease nodes
+        return a dict mapping each pair found in the database to its probability
+        """
+
+        if self.use_prob_db is True:
+            cursor = self.connection.cursor()
+            cursor.execute("create temp table if not exists DTD_PAIRS( drug VARCHAR(255), disease VARCHAR(255), PRIMARY KEY (drug, disease) ) WITHOUT ROWID")
+            cursor.execute("delete from temp.DTD_PAIRS")
+            cursor.executemany("insert or ignore into temp.DTD_PAIRS values (?, ?)", drug_disease_pairs)
+            probabilities = dict()
+            for drug, disease, probability in cursor.execute("select p.drug, p.disease, p.probability from temp.DTD_PAIRS t inner join DTD_PROBABILITY p on p.disease = t.disease and p.drug = t.drug"):
+                probabilities.setdefault((drug, disease), probability)
+            cursor.execute("delete from temp.DTD_PAIRS")
+            self.connection.commit()
+            return probabilities
+
     def get_probs_from_DTD_db_based_on_disease(self, disease_id_list):
         """
         Get the probabilities of all pairs of source and target curie ids from DTD probability database based on given disease ids
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+""" Compares answering legacy canned queries with ARAXLegacyQueryPool (pre-warmed worker processes) against starting a new
+python3 process per question (the pool with --workers 0, as ARAXQuery did before). Reports the startup time of the pool
+(until every worker has loaded the solution scripts) and the latency of the first and the following questions.
+By default the questions are answered by a synthetic QuestionAnswering area whose solution script imports numpy, pandas
+and networkx and loads a small data file, as the real scripts do, since those need a running Neo4j; --question-answering-dir
+and --query-type-id/--term run the real ones instead.
+Usage: python benchmark_legacy_query_pool.py [--questions 20] [--workers 2] [--question-answering-dir DIR --query-type-id Q3 --term protein=UniProtKB:P12345 ...]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import textwrap
+import timeit
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from ARAX_response import ARAXResponse
+from ARAX_legacy_query_pool import ARAXLegacyQueryPool
+
+SYNTHETIC_FILES = {
+    "Questions.tsv": "#known query type ID\trestated question\tcorpus\ttypes\tsolution script\tadditional parameters\n"
+                     "Q3\tWhat proteins are the target of $chemical_substance\t['what proteins does target']\t['chemical_substance']\t"
+                     "SyntheticSolution.py -s '$chemical_substance' -t '$target_label' -j\t{'target_label': 'protein'}\n",
+    "ParseQuestion.py": """
+        import ast
+        import os
+        import string
+        class ParseQuestion:
+            def __init__(self):
+                self.scripts = dict()
+                for line in open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Questions.tsv')):
+                    if not line.startswith('#'):
+                        columns = line.rstrip('\\n').split('\\t')
+                        self.scripts[columns[0]] = (string.Template(columns[4]), ast.literal_eval(columns[5]))
+            def get_execution_string(self, query_type_id, parameters):
+                template, other_parameters = self.scripts[query_type_id]
+                return template.safe_substitute({**other_parameters, **parameters})
+        """,
+    "SyntheticSolution.py": """
+        import argparse
+        import json
+        import os
+        import numpy as np
+        import pandas as pd
+        import networkx as nx
+        targets = pd.read_csv(os.path.abspath('targets.tsv'), sep='\\t')
+        def main():
+            parser = argparse.ArgumentParser()
+            parser.add_argument('-s', type=str)
+            parser.add_argument('-t', type=str)
+            parser.add_argument('-j', action='store_true')
+            args = parser.parse_args()
+            graph = nx.from_pandas_edgelist(targets, 'drug', 'protein')
+            proteins = sorted(graph.neighbors(args.s)) if args.s in graph else []
+            print(json.dumps({'results': [], 'query_graph': {'nodes': {'n00': {'id': [args.s]}, 'n01': {'category': [args.t]}}, 'edges': {}},
+                              'knowledge_graph': {'nodes': {protein: {'name': protein} for protein in proteins}, 'edges': {}}}))
+        if __name__ == "__main__":
+            main()
+        """,
+}
+
+
+def create_synthetic_question_answering_dir(directory):
+    for file_name, content in SYNTHETIC_FILES.items():
+        with open(os.path.join(directory, file_name), 'w') as output_file:
+            output_file.write(textwrap.dedent(content))
+    with open(os.path.join(directory, 'targets.tsv'), 'w') as output_file:
+        output_file.write("drug\tprotein\n")
+        for index in range(20000):
+            output_file.write(f"CHEMBL.COMPOUND:CHEMBL{index % 500}\tUniProtKB:P{index:05}\n")
+
+
+def time_questions(pool, query_type_id, terms, num_questions):
+    latencies = []
+    for _ in range(num_questions):
+        response = ARAXResponse()
+        t0 = timeit.default_timer()
+        message = pool.answer(query_type_id, terms, response)
+        latencies.append(timeit.default_timer() - t0)
+        if message is None:
+            raise RuntimeError(response.show())
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks ARAXLegacyQueryPool against a new process per canned question")
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--question-answering-dir", type=str, default=None)
+    parser.add_argument("--query-type-id", type=str, default="Q3")
+    parser.add_argument("--term", type=str, action="append", default=None, help="A term of the question, as name=value")
+    args = parser.parse_args()
+    terms = dict(term.split("=", 1) for term in args.term) if args.term else {'chemical_substance': 'CHEMBL.COMPOUND:CHEMBL7'}
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        question_answering_dir = args.question_answering_dir
+        if question_answering_dir is None:
+            question_answering_dir = temp_dir
+            create_synthetic_question_answering_dir(question_answering_dir)
+
+        t0 = timeit.default_timer()
+        pool = ARAXLegacyQueryPool(num_workers=args.workers, question_answering_dir=question_answering_dir)
+        pool.wait_until_ready()
+        startup_time = timeit.default_timer() - t0
+        print(f"pool startup ({args.workers} workers): {startup_time:.2f} s")
+        try:
+            for name, this_pool in (("pool", pool), ("new process per question", ARAXLegacyQueryPool(num_workers=0, question_answering_dir=question_answering_dir))):
+                latencies = time_questions(this_pool, args.query_type_id, terms, args.questions)
+                print(f"{name}: first question {latencies[0] * 1000:.1f} ms, median {statistics.median(latencies) * 1000:.1f} ms, "
+                      f"max {max(latencies) * 1000:.1f} ms over {args.questions} questions")
+        finally:
+            pool.close()
+
+
+if __name__ == "__main__":
+    main()
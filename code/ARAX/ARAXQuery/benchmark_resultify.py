@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+""" Times result enumeration (ARAX_resultify._get_results_for_kg_by_qg) on synthetic linear query graphs with 2, 3 and
+4 hops. The first qnode is pinned to a few curies and every other qnode is fulfilled by a random pool of KG nodes, with
+each KG node linked to a fixed number of random nodes in the next qnode's pool. Reports wall-clock time, peak Python
+memory (via tracemalloc) and the number of results for each query graph.
+Usage: python benchmark_resultify.py [--hops 2 3 4] [--nodes-per-qnode 300] [--degree 4] [--pinned 3] [--is-set] [--runs 3]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import timeit
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import ARAX_resultify
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from openapi_server.models.edge import Edge
+from openapi_server.models.node import Node
+from openapi_server.models.q_edge import QEdge
+from openapi_server.models.q_node import QNode
+from openapi_server.models.query_graph import QueryGraph
+from openapi_server.models.knowledge_graph import KnowledgeGraph
+
+
+def _create_synthetic_kg_and_qg(num_hops: int, nodes_per_qnode: int, degree: int, num_pinned: int, is_set: bool):
+    qnode_keys = [f"n{index:02}" for index in range(num_hops + 1)]
+    qg = QueryGraph(nodes={qnode_key: QNode(is_set=(is_set and 0 < index < num_hops))
+                           for index, qnode_key in enumerate(qnode_keys)},
+                    edges={f"e{index:02}": QEdge(subject=qnode_keys[index], object=qnode_keys[index + 1])
+                           for index in range(num_hops)})
+    kg = KnowledgeGraph(nodes=dict(), edges=dict())
+    node_keys_by_qnode_key = dict()
+    for index, qnode_key in enumerate(qnode_keys):
+        num_nodes = num_pinned if index == 0 else nodes_per_qnode
+        node_keys_by_qnode_key[qnode_key] = [f"{qnode_key}:{node_index}" for node_index in range(num_nodes)]
+        for node_key in node_keys_by_qnode_key[qnode_key]:
+            node = Node(name=node_key)
+            node.qnode_keys = [qnode_key]
+            kg.nodes[node_key] = node
+    for qedge_key, qedge in qg.edges.items():
+        for subject_key in node_keys_by_qnode_key[qedge.subject]:
+            for object_key in random.sample(node_keys_by_qnode_key[qedge.object], degree):
+                edge = Edge(subject=subject_key, object=object_key, predicate="biolink:related_to")
+                edge.qedge_keys = [qedge_key]
+                kg.edges[f"{qedge_key}:{subject_key}--{object_key}"] = edge
+    return kg, qg
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmarks resultify on synthetic multi-hop query graphs")
+    arg_parser.add_argument("--hops", dest="hops", type=int, nargs="+", default=[2, 3, 4])
+    arg_parser.add_argument("--nodes-per-qnode", dest="nodes_per_qnode", type=int, default=300)
+    arg_parser.add_argument("--degree", dest="degree", type=int, default=4)
+    arg_parser.add_argument("--pinned", dest="num_pinned", type=int, default=3)
+    arg_parser.add_argument("--is-set", dest="is_set", action="store_true", help="Make intermediate qnodes is_set=True")
+    arg_parser.add_argument("--runs", dest="num_runs", type=int, default=3)
+    arg_parser.add_argument("--seed", dest="seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    random.seed(args.seed)
+    for num_hops in args.hops:
+        kg, qg = _create_synthetic_kg_and_qg(num_hops, args.nodes_per_qnode, args.degree, args.num_pinned, args.is_set)
+        times = []
+        num_results = 0
+        for run in range(args.num_runs):
+            t0 = timeit.default_timer()
+            num_results = len(ARAX_resultify._get_results_for_kg_by_qg(kg, qg))
+            times.append(timeit.default_timer() - t0)
+        tracemalloc.start()
+        ARAX_resultify._get_results_for_kg_by_qg(kg, qg)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{num_hops}-hop ({len(kg.nodes)} nodes, {len(kg.edges)} edges): median {round(statistics.median(times), 3)} s "
+              f"over {len(times)} runs, peak memory {round(peak_memory / 1024 / 1024, 1)} MB, {num_results} results")
+
+
+if __name__ == "__main__":
+    main()
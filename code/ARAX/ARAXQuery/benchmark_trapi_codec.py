@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+""" Times converting a large synthetic TRAPI response (shaped like an ARAX answer: KG2 nodes and edges with attributes,
+and results binding them) between dicts, model objects and JSON, using the reflection-based functions in
+openapi_server.util / the old JSONEncoder logic and the per-class codec in openapi_server.codec. Reports wall-clock
+time and peak Python memory (via tracemalloc) for each step, and checks that both give the same output.
+Usage: python benchmark_trapi_codec.py [--nodes 10000] [--edges 50000] [--results 5000] [--runs 3]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import timeit
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from openapi_server import codec
+from openapi_server import util
+from openapi_server.models.base_model_ import Model
+from openapi_server.models.response import Response
+
+
+def _create_response_dict(num_nodes: int, num_edges: int, num_results: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    node_keys = [f"CHEMBL.COMPOUND:CHEMBL{index}" for index in range(num_nodes)]
+    nodes = {node_key: {"name": f"compound {index}", "category": ["biolink:ChemicalSubstance"],
+                        "attributes": [{"name": "iri", "type": "biolink:IriType", "value": f"http://identifiers.org/{node_key}"},
+                                       {"name": "synonym", "type": "biolink:synonym", "value": [f"synonym {index}-{i}" for i in range(3)]},
+                                       {"name": "description", "type": "biolink:description", "value": "A compound. " * 5}]}
+             for index, node_key in enumerate(node_keys)}
+    edges = {f"KG2:{index}": {"subject": rng.choice(node_keys), "object": rng.choice(node_keys), "predicate": "biolink:related_to",
+                              "relation": "CHEMBL.MECHANISM:inhibitor",
+                              "attributes": [{"name": "provided_by", "type": "biolink:provided_by", "value": "ARAX/KG2"},
+                                             {"name": "publications", "type": "biolink:publications",
+                                              "value": [f"PMID:{rng.randrange(10 ** 7)}" for _ in range(3)]},
+                                             {"name": "probability", "type": "EDAM:data_0006", "value": rng.random()}]}
+             for index in range(num_edges)}
+    edge_keys = list(edges)
+    results = [{"node_bindings": {"n00": [{"id": edges[edge_key]["subject"]}], "n01": [{"id": edges[edge_key]["object"]}]},
+                "edge_bindings": {"e00": [{"id": edge_key}]}, "confidence": rng.random(), "reasoner_id": "ARAX",
+                "essence": edges[edge_key]["object"]}
+               for edge_key in rng.sample(edge_keys, min(num_results, num_edges))]
+    return {"type": "translator_reasoner_response", "reasoner_id": "ARAX", "tool_version": "ARAX 0.7.0", "schema_version": "1.0.0",
+            "status": "OK", "description": "synthetic",
+            "logs": [{"timestamp": "2021-03-01T00:00:00", "level": "INFO", "code": "", "message": f"log line {index}"} for index in range(200)],
+            "message": {"query_graph": {"nodes": {"n00": {"id": ["MONDO:0005148"], "category": ["biolink:Disease"]},
+                                                  "n01": {"category": ["biolink:ChemicalSubstance"]}},
+                                        "edges": {"e00": {"subject": "n01", "object": "n00"}}},
+                        "knowledge_graph": {"nodes": nodes, "edges": edges},
+                        "results": results}}
+
+
+def _default_by_reflection(o):
+    # What encoder.JSONEncoder.default() used to do (it is called back for every nested model object)
+    if isinstance(o, Model):
+        return {o.attribute_map[attr]: getattr(o, attr) for attr in o.openapi_types if getattr(o, attr) is not None}
+    return codec._default(o)
+
+
+def _time_and_measure(function, num_runs: int):
+    times = []
+    result = None
+    for run in range(num_runs):
+        t0 = timeit.default_timer()
+        result = function()
+        times.append(timeit.default_timer() - t0)
+    tracemalloc.start()
+    function()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, statistics.median(times), peak_memory
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmarks TRAPI model (de)serialization on a large synthetic response")
+    arg_parser.add_argument("--nodes", dest="num_nodes", type=int, default=10000)
+    arg_parser.add_argument("--edges", dest="num_edges", type=int, default=50000)
+    arg_parser.add_argument("--results", dest="num_results", type=int, default=5000)
+    arg_parser.add_argument("--runs", dest="num_runs", type=int, default=3)
+    arg_parser.add_argument("--seed", dest="seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    response_dict = _create_response_dict(args.num_nodes, args.num_edges, args.num_results, args.seed)
+    envelope = codec.model_from_dict(response_dict, Response)
+    print(f"Response with {args.num_nodes} nodes, {args.num_edges} edges and {args.num_results} results "
+          f"({'orjson' if codec.orjson is not None else 'json'} for encoding)")
+
+    steps = [("dict -> model", lambda: util.deserialize_model(response_dict, Response), lambda: codec.model_from_dict(response_dict, Response)),
+             ("model -> dict", lambda: util.serialize_model(envelope), lambda: codec.model_to_dict(envelope)),
+             ("model -> JSON", lambda: json.dumps(envelope, default=_default_by_reflection).encode('utf-8'), lambda: codec.dumps(envelope))]
+    for step_name, reflective_function, codec_function in steps:
+        reflective_result, reflective_time, reflective_memory = _time_and_measure(reflective_function, args.num_runs)
+        codec_result, codec_time, codec_memory = _time_and_measure(codec_function, args.num_runs)
+        if isinstance(reflective_result, bytes):
+            is_same = json.loads(reflective_result) == json.loads(codec_result)
+        else:
+            is_same = reflective_result == codec_result
+        print(f"{step_name}: reflection {round(reflective_time, 3)} s / {round(reflective_memory / 1024 / 1024, 1)} MB peak, "
+              f"codec {round(codec_time, 3)} s / {round(codec_memory / 1024 / 1024, 1)} MB peak"
+              f"{'' if is_same else '  ERROR: outputs differ'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/bin/env python3
+# This file contains a compact, integer-indexed adjacency index over a knowledge graph, shared by the passes that need
+# to check which KG nodes are connected to which (resultify, Expand's dead-end pruning, filter_kg's orphan removal)
+import sys
+import os
+from typing import List, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from openapi_server.models.knowledge_graph import KnowledgeGraph
+
+
+class KGAdjacencyIndex:
+    """
+    Interns KG node keys to integers and stores the edges fulfilling each qedge as NumPy arrays of node indices, from
+    which an (undirected) CSR adjacency structure is built per qedge on first use. Edges that don't fulfill any qedge
+    are stored under the qedge key None. Build it once per pass over a KG (e.g., with from_knowledge_graph()) and then
+    query it, rather than building nested dicts of node key sets.
+    """
+
+    def __init__(self):
+        self.node_keys: List[str] = []
+        self.node_indices: Dict[str, int] = dict()
+        self._node_pairs_by_qedge_key: Dict[Optional[str], Tuple[List[int], List[int]]] = dict()
+        self._edge_arrays_by_qedge_key: Dict[Optional[str], Tuple[np.ndarray, np.ndarray]] = dict()
+        self._csr_by_qedge_key: Dict[Optional[str], Tuple[np.ndarray, np.ndarray]] = dict()
+
+    @classmethod
+    def from_knowledge_graph(cls, knowledge_graph: KnowledgeGraph) -> 'KGAdjacencyIndex':
+        kg_index = cls()
+        for node_key in knowledge_graph.nodes:
+            kg_index.intern(node_key)
+        for edge in knowledge_graph.edges.values():
+            qedge_keys = edge.qedge_keys if hasattr(edge, 'qedge_keys') and edge.qedge_keys else [None]
+            for qedge_key in qedge_keys:
+                kg_index.add_edge(qedge_key, edge.subject, edge.object)
+        return kg_index
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_keys)
+
+    def intern(self, node_key: str) -> int:
+        node_index = self.node_indices.get(node_key)
+        if node_index is None:
+            node_index = len(self.node_keys)
+            self.node_indices[node_key] = node_index
+            self.node_keys.append(node_key)
+            self._csr_by_qedge_key.clear()  # Any CSR arrays built so far are now one node too short
+        return node_index
+
+    def add_edge(self, qedge_key: Optional[str], subject_key: str, object_key: str):
+        subject_indices, object_indices = self._node_pairs_by_qedge_key.setdefault(qedge_key, ([], []))
+        subject_indices.append(self.intern(subject_key))
+        object_indices.append(self.intern(object_key))
+        self._edge_arrays_by_qedge_key.pop(qedge_key, None)
+        self._csr_by_qedge_key.pop(qedge_key, None)
+
+    def get_qedge_keys(self) -> List[Optional[str]]:
+        return list(self._node_pairs_by_qedge_key)
+
+    def get_node_indices(self, node_keys: Iterable[str]) -> np.ndarray:
+        """
+        Returns the indices of the given node keys (in the same order). All of the node keys must be in the index.
+        """
+        return np.fromiter((self.node_indices[node_key] for node_key in node_keys), dtype=np.int64)
+
+    def get_node_mask(self, node_keys: Iterable[str]) -> np.ndarray:
+        """
+        Returns a boolean array over all indexed nodes that is True for the given node keys. Node keys that aren't in
+        the index (i.e., nodes not used by any indexed edge) are ignored.
+        """
+        node_mask = np.zeros(self.num_nodes, dtype=bool)
+        node_indices = [self.node_indices[node_key] for node_key in node_keys if node_key in self.node_indices]
+        node_mask[node_indices] = True
+        return node_mask
+
+    def get_edge_node_indices(self, qedge_key: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns two parallel arrays holding the subject and object node indices of every edge for the given qedge.
+        """
+        edge_arrays = self._edge_arrays_by_qedge_key.get(qedge_key)
+        if edge_arrays is None:
+            subject_indices, object_indices = self._node_pairs_by_qedge_key.get(qedge_key, ([], []))
+            edge_arrays = (np.array(subject_indices, dtype=np.int64), np.array(object_indices, dtype=np.int64))
+            self._edge_arrays_by_qedge_key[qedge_key] = edge_arrays
+        return edge_arrays
+
+    def get_neighbors(self, qedge_key: Optional[str], node_index: int) -> np.ndarray:
+        """
+        Returns the indices of the nodes connected to the given node by edges for the given qedge (either direction).
+        """
+        indptr, indices = self._get_csr(qedge_key)
+        return indices[indptr[node_index]:indptr[node_index + 1]]
+
+    def get_node_degrees(self) -> np.ndarray:
+        """
+        Returns the number of edge endpoints at each node, across all qedges (an edge fulfilling multiple qedges is
+        counted once per qedge).
+        """
+        node_degrees = np.zeros(self.num_nodes, dtype=np.int64)
+        for qedge_key in self._node_pairs_by_qedge_key:
+            subject_indices, object_indices = self.get_edge_node_indices(qedge_key)
+            node_degrees += np.bincount(subject_indices, minlength=self.num_nodes)
+            node_degrees += np.bincount(object_indices, minlength=self.num_nodes)
+        return node_degrees
+
+    def get_connected_pairs(self, qedge_keys: Iterable[Optional[str]], from_node_indices: np.ndarray,
+                            to_node_indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds which of the 'from' nodes are connected to which of the 'to' nodes by edges for EVERY one of the given
+        qedges (in either direction). Returns two parallel arrays of positions into from_node_indices and
+        to_node_indices, sorted by 'from' position and then 'to' position.
+        """
+        from_node_indices = np.asarray(from_node_indices, dtype=np.int64)
+        to_node_indices = np.asarray(to_node_indices, dtype=np.int64)
+        num_to_nodes = len(to_node_indices)
+        if not len(from_node_indices) or not num_to_nodes:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        to_positions = np.full(self.num_nodes, -1, dtype=np.int64)
+        to_positions[to_node_indices] = np.arange(num_to_nodes)
+        pair_codes = None
+        for qedge_key in qedge_keys:
+            indptr, indices = self._get_csr(qedge_key)
+            # Gather every CSR row for our 'from' nodes at once
+            row_starts = indptr[from_node_indices]
+            row_lengths = indptr[from_node_indices + 1] - row_starts
+            from_positions = np.repeat(np.arange(len(from_node_indices)), row_lengths)
+            offsets_within_rows = np.arange(row_lengths.sum()) - np.repeat(np.cumsum(row_lengths) - row_lengths, row_lengths)
+            neighbor_to_positions = to_positions[indices[np.repeat(row_starts, row_lengths) + offsets_within_rows]]
+            is_to_node = neighbor_to_positions >= 0
+            qedge_pair_codes = np.unique(from_positions[is_to_node] * num_to_nodes + neighbor_to_positions[is_to_node])
+            pair_codes = qedge_pair_codes if pair_codes is None else np.intersect1d(pair_codes, qedge_pair_codes,
+                                                                                     assume_unique=True)
+        if pair_codes is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return pair_codes // num_to_nodes, pair_codes % num_to_nodes
+
+    def _get_csr(self, qedge_key: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+        csr = self._csr_by_qedge_key.get(qedge_key)
+        if csr is None:
+            subject_indices, object_indices = self.get_edge_node_indices(qedge_key)
+            # Record each edge in both directions, since connections are looked up regardless of edge direction
+            row_indices = np.concatenate([subject_indices, object_indices])
+            column_indices = np.concatenate([object_indices, subject_indices])
+            indices = column_indices[np.argsort(row_indices, kind="stable")]
+            indptr = np.zeros(self.num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(row_indices, minlength=self.num_nodes), out=indptr[1:])
+            csr = (indptr, indices)
+            self._csr_by_qedge_key[qedge_key] = csr
+        return csr
@@ -0,0 +1,224 @@
+#!/bin/env python3
+# This file contains a process-wide manager of neo4j drivers, shared by every module in ARAX that runs cypher queries
+import sys
+import os
+import threading
+import time
+from typing import List, Dict, Iterator, Optional
+
+from neo4j import GraphDatabase, unit_of_work
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")  # code directory
+from RTXConfiguration import RTXConfiguration
+
+
+class Neo4jConnectionManager:
+    """
+    Keeps one pooled neo4j driver per KG endpoint (KG1, KG2, KG2c) for the life of the process, so that callers don't
+    pay the Bolt handshake and authentication cost on every query. Use get_neo4j_connection_manager() to access it.
+    """
+
+    # Maps our KG names to the RTXConfiguration 'live' settings that hold their neo4j connection info
+    KG_NAME_TO_RTX_LIVE = {"KG1": "Production", "KG2": "KG2", "KG2c": "KG2C"}
+
+    def __init__(self, max_sessions_per_kg: int = 20, session_acquisition_timeout: float = 60,
+                 default_query_timeout: Optional[float] = None, liveness_check_interval: float = 300,
+                 max_connection_lifetime: float = 3600):
+        self.max_sessions_per_kg = max_sessions_per_kg
+        self.session_acquisition_timeout = session_acquisition_timeout
+        self.default_query_timeout = default_query_timeout
+        self.liveness_check_interval = liveness_check_interval
+        self.max_connection_lifetime = max_connection_lifetime
+        self._lock = threading.Lock()
+        self._drivers = dict()
+        self._session_semaphores = dict()
+        self._last_liveness_check = dict()
+        self._metrics = dict()
+
+    def run_query(self, cypher_query: str, kg_name: str, parameters: Optional[Dict[str, any]] = None,
+                  timeout: Optional[float] = None) -> List[Dict[str, any]]:
+        """
+        Runs a (read-only) cypher query against the given KG's neo4j and returns its results as a list of dicts.
+        Exceptions are propagated to the caller, who is expected to log them in its own way.
+        """
+        kg_name = self._normalize_kg_name(kg_name)
+        timeout = timeout if timeout is not None else self.default_query_timeout
+
+        @unit_of_work(timeout=timeout)
+        def _run_transaction(tx):
+            return tx.run(cypher_query, parameters if parameters else dict()).data()
+
+        with self.session(kg_name) as session:
+            start = time.time()
+            try:
+                query_results = session.read_transaction(_run_transaction)
+            except Exception:
+                self._record(kg_name, "queries_failed", 1)
+                raise
+            self._record(kg_name, "queries_run", 1)
+            self._record(kg_name, "query_seconds", time.time() - start)
+        return query_results
+
+    def stream_query(self, cypher_query: str, kg_name: str, parameters: Optional[Dict[str, any]] = None,
+                     batch_size: int = 5000, timeout: Optional[float] = None) -> Iterator[List[Dict[str, any]]]:
+        """
+        Runs a (read-only) cypher query and yields its result rows in batches (lists of dicts) as they arrive from
+        neo4j, rather than materializing the whole answer first. Closing the generator early rolls back the query;
+        note that neo4j still sends any remaining rows, so callers wanting to stop early should also use a LIMIT.
+        """
+        kg_name = self._normalize_kg_name(kg_name)
+        timeout = timeout if timeout is not None else self.default_query_timeout
+        with self.session(kg_name) as session:
+            start = time.time()
+            try:
+                with session.begin_transaction(timeout=timeout) as tx:
+                    batch = []
+                    for record in tx.run(cypher_query, parameters if parameters else dict()):
+                        batch.append(record.data())
+                        if len(batch) >= batch_size:
+                            yield batch
+                            batch = []
+                    if batch:
+                        yield batch
+            except GeneratorExit:
+                raise
+            except Exception:
+                self._record(kg_name, "queries_failed", 1)
+                raise
+            self._record(kg_name, "queries_run", 1)
+            self._record(kg_name, "query_seconds", time.time() - start)
+
+    def session(self, kg_name: str) -> '_PooledSession':
+        """
+        Returns a context manager wrapping a neo4j session for the given KG. The number of sessions open against a
+        single KG at once is bounded by max_sessions_per_kg.
+        """
+        kg_name = self._normalize_kg_name(kg_name)
+        driver = self._get_driver(kg_name)
+        return _PooledSession(self, kg_name, driver)
+
+    def is_alive(self, kg_name: str) -> bool:
+        kg_name = self._normalize_kg_name(kg_name)
+        with self._lock:
+            driver = self._drivers.get(kg_name)
+        return self._check_liveness(kg_name, driver) if driver else False
+
+    def get_metrics(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {kg_name: dict(kg_metrics) for kg_name, kg_metrics in self._metrics.items()}
+
+    def close(self, kg_name: Optional[str] = None):
+        with self._lock:
+            kg_names = [self._normalize_kg_name(kg_name)] if kg_name else list(self._drivers)
+            for name in kg_names:
+                driver = self._drivers.pop(name, None)
+                self._last_liveness_check.pop(name, None)
+                if driver:
+                    driver.close()
+
+    def _get_driver(self, kg_name: str):
+        with self._lock:
+            driver = self._drivers.get(kg_name)
+            if driver is None:
+                driver = self._create_driver(kg_name)
+                self._drivers[kg_name] = driver
+                self._last_liveness_check[kg_name] = time.time()
+            needs_liveness_check = time.time() - self._last_liveness_check[kg_name] > self.liveness_check_interval
+        # Periodically make sure our pooled connections haven't gone stale (e.g., after a neo4j restart)
+        if needs_liveness_check and not self._check_liveness(kg_name, driver):
+            with self._lock:
+                if self._drivers.get(kg_name) is driver:
+                    driver.close()
+                    driver = self._create_driver(kg_name)
+                    self._drivers[kg_name] = driver
+                    self._last_liveness_check[kg_name] = time.time()
+                else:
+                    driver = self._drivers[kg_name]
+        return driver
+
+    def _create_driver(self, kg_name: str):
+        # Note: Caller must hold self._lock
+        rtxc = RTXConfiguration()
+        rtxc.live = self.KG_NAME_TO_RTX_LIVE[kg_name]
+        driver = GraphDatabase.driver(rtxc.neo4j_bolt,
+                                      auth=(rtxc.neo4j_username, rtxc.neo4j_password),
+                                      max_connection_pool_size=self.max_sessions_per_kg,
+                                      connection_acquisition_timeout=self.session_acquisition_timeout,
+                                      max_connection_lifetime=self.max_connection_lifetime)
+        if kg_name not in self._session_semaphores:
+            self._session_semaphores[kg_name] = threading.BoundedSemaphore(self.max_sessions_per_kg)
+        self._metrics.setdefault(kg_name, {"drivers_created": 0, "queries_run": 0, "queries_failed": 0,
+                                           "query_seconds": 0.0, "sessions_in_use": 0, "max_sessions_in_use": 0,
+                                           "session_acquisition_timeouts": 0, "liveness_check_failures": 0})
+        self._metrics[kg_name]["drivers_created"] += 1
+        return driver
+
+    def _check_liveness(self, kg_name: str, driver) -> bool:
+        try:
+            with driver.session() as session:
+                session.run("RETURN 1").consume()
+        except Exception:
+            self._record(kg_name, "liveness_check_failures", 1)
+            return False
+        with self._lock:
+            self._last_liveness_check[kg_name] = time.time()
+        return True
+
+    def _record(self, kg_name: str, metric_name: str, amount: float):
+        with self._lock:
+            kg_metrics = self._metrics[kg_name]
+            kg_metrics[metric_name] += amount
+            if metric_name == "sessions_in_use":
+                kg_metrics["max_sessions_in_use"] = max(kg_metrics["max_sessions_in_use"], kg_metrics["sessions_in_use"])
+
+    def _normalize_kg_name(self, kg_name: str) -> str:
+        # Accept KP names like 'ARAX/KG2' and case variants like 'KG2C'
+        kg_name = kg_name.split("/")[-1]
+        for known_kg_name in self.KG_NAME_TO_RTX_LIVE:
+            if kg_name.upper() == known_kg_name.upper():
+                return known_kg_name
+        raise ValueError(f"Unrecognized KG name for neo4j: {kg_name}. Options are: {list(self.KG_NAME_TO_RTX_LIVE)}")
+
+
+class _PooledSession:
+    def __init__(self, manager: Neo4jConnectionManager, kg_name: str, driver):
+        self.manager = manager
+        self.kg_name = kg_name
+        self.driver = driver
+        self.session = None
+
+    def __enter__(self):
+        semaphore = self.manager._session_semaphores[self.kg_name]
+        if not semaphore.acquire(timeout=self.manager.session_acquisition_timeout):
+            self.manager._record(self.kg_name, "session_acquisition_timeouts", 1)
+            raise TimeoutError(f"Timed out after {self.manager.session_acquisition_timeout}s waiting for a "
+                               f"{self.kg_name} neo4j session")
+        self.manager._record(self.kg_name, "sessions_in_use", 1)
+        try:
+            self.session = self.driver.session()
+        except Exception:
+            self._release()
+            raise
+        return self.session
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        try:
+            self.session.close()
+        finally:
+            self._release()
+
+    def _release(self):
+        self.manager._record(self.kg_name, "sessions_in_use", -1)
+        self.manager._session_semaphores[self.kg_name].release()
+
+
+_connection_manager = None
+_connection_manager_lock = threading.Lock()
+
+
+def get_neo4j_connection_manager() -> Neo4jConnectionManager:
+    global _connection_manager
+    with _connection_manager_lock:
+        if _connection_manager is None:
+            _connection_manager = Neo4jConnectionManager()
+        return _connection_manager
@@ -11,6 +11,7 @@ import argparse
 import sqlite3
 import pickle
 import itertools
+import numpy as np
 
 # import internal modules
 pathlist = os.path.realpath(__file__).split(os.path.sep)
@@ -21,6 +22,24 @@ from node_synonymizer import NodeSynonymizer
 
 DEBUG = True
 
+# Fields of the structured arrays returned by COHDIndex.get_associations()
+ASSOCIATION_DTYPE = np.dtype([('concept_id_1', np.int64), ('concept_id_2', np.int64), ('concept_count', np.int64),
+                              ('concept_frequency', np.float64), ('expected_count', np.float64), ('ln_ratio', np.float64),
+                              ('chi_square', np.float64), ('p_value', np.float64)])
+MAX_SQL_PARAMETERS = 900  # stay under SQLite's default limit on the number of bound parameters per statement
+# Fields of the structured arrays returned by the pair methods when as_array=True (named like the keys of their dicts)
+PAIRED_CONCEPT_FREQ_DTYPE = np.dtype([('dataset_id', np.int64), ('concept_id_1', np.int64), ('concept_id_2', np.int64),
+                                      ('concept_count', np.int64), ('concept_frequency', np.float64)])
+OBS_EXP_RATIO_DTYPE = np.dtype([('concept_id_1', np.int64), ('concept_id_2', np.int64), ('dataset_id', np.int64),
+                                ('expected_count', np.float64), ('ln_ratio', np.float64), ('observed_count', np.int64)])
+CHI_SQUARE_DTYPE = np.dtype([('chi_square', np.float64), ('concept_id_1', np.int64), ('concept_id_2', np.int64),
+                             ('dataset_id', np.int64), ('p-value', np.float64)])
+RELATIVE_FREQUENCY_DTYPE = np.dtype([('concept_2_count', np.int64), ('concept_id_1', np.int64), ('concept_id_2', np.int64),
+                                     ('concept_pair_count', np.int64), ('dataset_id_row', np.int64), ('relative_frequency', np.float64)])
+# Id lists longer than this are loaded into a temporary table rather than bound one parameter each
+MAX_BOUND_IDS = MAX_SQL_PARAMETERS // 4
+_temp_table_ids = itertools.count()
+
 
 class COHDIndex:
 
@@ -232,6 +251,22 @@ class COHDIndex:
 
         #     print(f"INFO: Creating INDEXes is completed", flush=True)
 
+    def create_association_indexes(self):
+        """Create covering indexes on PAIRED_CONCEPT_COUNTS_ASSOCIATIONS for looking pairs up by either of their concepts
+        and a dataset, so that the pair methods (which query both orientations of each pair) are answered from the
+        indexes alone. They can be added to an existing database with 'python COHDIndex.py --index'."""
+        if self.success_con is True:
+            columns = "concept_count,concept_prevalence,chi_square_t,chi_square_p,expected_count,ln_ratio"
+            print(f"INFO: Creating covering INDEXes on PAIRED_CONCEPT_COUNTS_ASSOCIATIONS", flush=True)
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS idx_PAIRED_CONCEPT_COUNTS_ASSOCIATIONS_concept_id_1_dataset_id ON PAIRED_CONCEPT_COUNTS_ASSOCIATIONS(concept_id_1,dataset_id,concept_id_2,{columns})")
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS idx_PAIRED_CONCEPT_COUNTS_ASSOCIATIONS_concept_id_2_dataset_id ON PAIRED_CONCEPT_COUNTS_ASSOCIATIONS(concept_id_2,dataset_id,concept_id_1,{columns})")
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS idx_PAIRED_CONCEPT_COUNTS_ASSOCIATIONS_concept_pair_id_dataset_id ON PAIRED_CONCEPT_COUNTS_ASSOCIATIONS(concept_pair_id,dataset_id)")
+            print(f"INFO: Creating covering INDEX on SINGLE_CONCEPT_COUNTS", flush=True)
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS idx_SINGLE_CONCEPT_COUNTS_concept_id_dataset_id ON SINGLE_CONCEPT_COUNTS(concept_id,dataset_id,concept_count)")
+            self.connection.execute("ANALYZE")
+            self.connection.commit()
+            print(f"INFO: Creating covering INDEXes is completed", flush=True)
+
     def get_concept_ids(self, curie):
         """Search for OMOP concept ids by curie id.
 
@@ -292,7 +327,156 @@ class COHDIndex:
 
         return results_list
 
-    def get_paired_concept_freq(self, concept_id_1=[], concept_id_2=[], concept_id_pair=None, dataset_id=1):
+    def get_concept_ids_for_curies(self, curies):
+        """Search for the OMOP concept ids of many curies at once (like get_concept_ids(), with one synonymizer
+        lookup and one query per batch of curies).
+
+        Args:
+            curies (required, list): Compacy URIs (CURIEs) of the concepts to map, e.g., ["DOID:8398", "DOID:9352"]
+
+        Returns:
+            dict: a dict mapping each given curie to the list of OMOP concepts for it (empty if there are none)
+            example:
+                {"DOID:8398": [75617, 80180, 1570333], "DOID:9352": [201826, 4193704]}
+        """
+        curies = [curie for curie in dict.fromkeys(curies) if isinstance(curie, str)]
+        canonical_curies = self.synonymizer.get_canonical_curies(curies) if curies else dict()
+        preferred_curies = {curie: canonical_curies[curie]['preferred_curie'] for curie in curies if canonical_curies.get(curie) is not None}
+        concept_ids_by_preferred_curie = dict()
+        unique_preferred_curies = list(set(preferred_curies.values()))
+        cursor = self.connection.cursor()
+        for start in range(0, len(unique_preferred_curies), MAX_SQL_PARAMETERS):
+            batch = unique_preferred_curies[start:start + MAX_SQL_PARAMETERS]
+            cursor.execute(f"select distinct t1.preferred_curie, t1.concept_id from CURIE_TO_OMOP_MAPPING t1 inner join CONCEPTS t2 on t1.concept_id = t2.concept_id "
+                           f"where t1.preferred_curie in ({','.join('?' * len(batch))});", batch)
+            for preferred_curie, concept_id in cursor.fetchall():
+                concept_ids_by_preferred_curie.setdefault(preferred_curie, []).append(concept_id)
+        return {curie: list(concept_ids_by_preferred_curie.get(preferred_curies.get(curie), [])) for curie in curies}
+
+    def get_curies_from_concept_ids(self, concept_ids):
+        """Search for the curie ids of many OMOP concept ids at once (like get_curies_from_concept_id(), with one
+        query per batch of ids).
+
+        Args:
+            concept_ids (required, list): OMOP concept ids, e.g., [192855, 8507]
+
+        Returns:
+            dict: a dict mapping each given concept id to the list of curies for it (empty if there are none)
+        """
+        concept_ids = list({int(concept_id) for concept_id in concept_ids})
+        curies_by_concept_id = {concept_id: [] for concept_id in concept_ids}
+        cursor = self.connection.cursor()
+        for start in range(0, len(concept_ids), MAX_SQL_PARAMETERS):
+            batch = concept_ids[start:start + MAX_SQL_PARAMETERS]
+            cursor.execute(f"select distinct preferred_curie, concept_id from CURIE_TO_OMOP_MAPPING where concept_id in ({','.join('?' * len(batch))});", batch)
+            for preferred_curie, concept_id in cursor.fetchall():
+                curies_by_concept_id[concept_id].append(preferred_curie)
+        return curies_by_concept_id
+
+    def get_associations(self, concept_ids, dataset_id=1):
+        """Retrieve all paired concept frequencies, observed/expected ratios and chi-square results involving any of
+        the given concepts, in one query per batch of ids.
+
+        Args:
+            concept_ids (required, list): OMOP concept ids, e.g., [192855, 8507]
+            dataset_id (optional, int): The dataset_id of the dataset to query, e.g. 1,2,3
+
+        Returns:
+            numpy.ndarray: a structured array with ASSOCIATION_DTYPE fields. Like get_paired_concept_freq(concept_id_1=...),
+                pairs are oriented so that concept_id_1 is one of the given concepts, whichever way round they are stored.
+        """
+        concept_ids = list({int(concept_id) for concept_id in concept_ids})
+        rows = []
+        cursor = self.connection.cursor()
+        columns = "concept_count,concept_prevalence,expected_count,ln_ratio,chi_square_t,chi_square_p"
+        for start in range(0, len(concept_ids), MAX_SQL_PARAMETERS // 2):
+            batch = concept_ids[start:start + MAX_SQL_PARAMETERS // 2]
+            placeholders = ','.join('?' * len(batch))
+            cursor.execute(f"select distinct concept_id_1,concept_id_2,{columns} from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where dataset_id=? and concept_id_1 in ({placeholders}) "
+                           f"union all "
+                           f"select distinct concept_id_2,concept_id_1,{columns} from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where dataset_id=? and concept_id_2 in ({placeholders});",
+                           [dataset_id, *batch, dataset_id, *batch])
+            rows.extend((row[0], row[1], row[2] if row[2] is not None else 0) +
+                        tuple(float(value) if value is not None else np.nan for value in row[3:]) for row in cursor.fetchall())
+        return np.array(rows, dtype=ASSOCIATION_DTYPE)
+
+    def _get_id_list(self, cursor, ids, temp_tables):
+        """Returns the SQL to put after 'in' to match any of the given ids, and the parameters to bind for it. Long lists
+        are loaded into a temporary table (whose name is added to temp_tables) instead of making huge statements."""
+        ids = list(dict.fromkeys(ids))
+        if len(ids) <= MAX_BOUND_IDS:
+            return f"({','.join('?' * len(ids))})", ids
+        table_name = f"cohd_ids_{next(_temp_table_ids)}"
+        cursor.execute(f"create temp table {table_name}(id primary key)")
+        cursor.executemany(f"insert into temp.{table_name} values (?)", ((concept_id,) for concept_id in ids))
+        temp_tables.append(table_name)
+        return f"(select id from temp.{table_name})", []
+
+    def _get_pair_rows(self, columns, dataset_id, concept_id_1=None, concept_id_2=None, concept_id_pair=None, reversed_concept_id_pair=None, domain=''):
+        """Retrieve the given PAIRED_CONCEPT_COUNTS_ASSOCIATIONS columns for the pairs with concept_id_1 (and
+        concept_id_2) or concept_id_pair in the given dataset, whichever way round they are stored, as the pair methods do.
+
+        Each pair is stored once, so this makes one query for the pairs stored with the given concept first and one for
+        those stored the other way round, whose rows are returned oriented like the first ones (concept_id_1 is always
+        a concept from concept_id_1). The column 'concept_2_count' is the single concept count of concept_id_2, and
+        the domain, if given, also applies to concept_id_2.
+
+        Returns:
+            list: a list of tuples with the requested columns
+        """
+        cursor = self.connection.cursor()
+        temp_tables = []
+        rows = []
+        try:
+            if concept_id_pair is not None:
+                pairs = [concept_id_pair] if isinstance(concept_id_pair, str) else concept_id_pair
+                reversed_pairs = [reversed_concept_id_pair] if isinstance(reversed_concept_id_pair, str) else reversed_concept_id_pair
+                pair_list, pair_params = self._get_id_list(cursor, pairs, temp_tables)
+                reversed_pair_list, reversed_pair_params = self._get_id_list(cursor, reversed_pairs, temp_tables)
+                conditions = [(f"p.concept_pair_id in {pair_list}", pair_params), (f"p.concept_pair_id in {reversed_pair_list}", reversed_pair_params)]
+            else:
+                id_list_1, params_1 = self._get_id_list(cursor, concept_id_1, temp_tables)
+                conditions = [(f"p.concept_id_1 in {id_list_1}", params_1), (f"p.concept_id_2 in {id_list_1}", params_1)]
+                if len(concept_id_2) != 0:
+                    id_list_2, params_2 = self._get_id_list(cursor, concept_id_2, temp_tables)
+                    conditions = [(f"{conditions[0][0]} and p.concept_id_2 in {id_list_2}", params_1 + params_2),
+                                  (f"{conditions[1][0]} and p.concept_id_1 in {id_list_2}", params_1 + params_2)]
+
+            for (condition, params), (this_concept, other_concept) in zip(conditions, [("p.concept_id_1", "p.concept_id_2"), ("p.concept_id_2", "p.concept_id_1")]):
+                select_list = ','.join({'concept_id_1': this_concept, 'concept_id_2': other_concept, 'concept_2_count': 's.concept_count'}.get(column, f"p.{column}")
+                                       for column in columns)
+                joins = ""
+                if 'concept_2_count' in columns:
+                    joins += f" inner join SINGLE_CONCEPT_COUNTS s on {other_concept} = s.concept_id and p.dataset_id = s.dataset_id"
+                if domain != "":
+                    joins += f" inner join CONCEPTS c on {other_concept} = c.concept_id"
+                    condition += " and c.domain_id=?"
+                    params = params + [domain]
+                # The unary + keeps SQLite from looking rows up by dataset_id (which matches a third of the table)
+                # rather than by concept, when the database hasn't been analyzed
+                cursor.execute(f"select distinct {select_list} from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p{joins} where {condition} and +p.dataset_id=?;",
+                               params + [dataset_id])
+                rows.extend(cursor.fetchall())
+        finally:
+            for table_name in temp_tables:
+                cursor.execute(f"drop table temp.{table_name}")
+            if temp_tables:
+                self.connection.commit()
+        return rows
+
+    @staticmethod
+    def _format_pair_results(rows, dtype, sort_by, as_array):
+        """Sort the rows of a pair method in decreasing order of the sort_by field and return them as a list of
+        dictionaries or, with as_array, as a NumPy structured array (where missing values become 0 or NaN)"""
+        sort_index = dtype.names.index(sort_by)
+        if len(rows) != 0:
+            rows = sorted(rows, key=lambda row: row[sort_index], reverse=True)
+        if as_array:
+            missing_values = [np.nan if dtype[index].kind == 'f' else 0 for index in range(len(dtype))]
+            return np.array([tuple(missing_value if value is None else value for value, missing_value in zip(row, missing_values)) for row in rows], dtype=dtype)
+        return [dict(zip(dtype.names, row)) for row in rows]
+
+    def get_paired_concept_freq(self, concept_id_1=[], concept_id_2=[], concept_id_pair=None, dataset_id=1, as_array=False):
         """Retrieve observed clinical frequencies of a pair of concepts.
 
         Args:
@@ -301,6 +485,8 @@ class COHDIndex:
                 will return all pairs of concepts with concept_id_1.
             concept_id_pair (optional, str or list): the concatenation of two concept ids, e.g. "192855_2008271" or ["192855_2008271","8507_939259"]
             dataset_id (optional, int): The dataset_id of the dataset to query. Default dataset is the 5-year dataset e.g. 1,2,3
+            as_array (optional, bool): If set, return the results as a NumPy structured array with PAIRED_CONCEPT_FREQ_DTYPE fields
+                (in the same order) instead of a list of dictionaries
 
         Returns:
             array: an sorted(decreasing concept_frequency) array of dictionaries which contains a numeric frequency and a numeric concept count
@@ -352,202 +538,13 @@ class COHDIndex:
                 print("The 'dataset_id' in get_paired_concept_freq should be 1, 2 or 3", flush=True)
                 return []
 
-        results_array = []
-        cursor = self.connection.cursor()
+        columns = ['dataset_id', 'concept_id_1', 'concept_id_2', 'concept_count', 'concept_prevalence']
         if concept_id_pair is None:
-            if len(concept_id_2) == 0:
-                if len(concept_id_1) == 1:
-                    cursor.execute(f"select distinct dataset_id,concept_id_1,concept_id_2,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_1[0]};")
-                else:
-                    cursor.execute(f"select distinct dataset_id,concept_id_1,concept_id_2,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_1))};")
-                res = cursor.fetchall()
-                if len(res) == 0:
-                    if len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2={concept_id_1[0]};")
-                    else:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2 in {tuple(set(concept_id_1))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        pass
-                    else:
-                        for row in res:
-                            if row[0] == dataset_id:
-                                results_array.append({'dataset_id': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_count': row[3],
-                                                        'concept_frequency': row[4]})
-                else:
-                    for row in res:
-                        if row[0] == dataset_id:
-                            results_array.append({'dataset_id': row[0],
-                                                    'concept_id_1': row[1],
-                                                    'concept_id_2': row[2],
-                                                    'concept_count': row[3],
-                                                    'concept_frequency': row[4]})
-
-                    if len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2={concept_id_1[0]};")
-                    else:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2 in {tuple(set(concept_id_1))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        pass
-                    else:
-                        for row in res:
-                            if row[0] == dataset_id:
-                                results_array.append({'dataset_id': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_count': row[3],
-                                                        'concept_frequency': row[4]})
-            else:
-                if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                    cursor.execute(f"select distinct dataset_id,concept_id_1,concept_id_2,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_1[0]} and concept_id_2={concept_id_2[0]};")
-                elif len(concept_id_1) == 1:
-                    cursor.execute(f"select distinct dataset_id,concept_id_1,concept_id_2,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_1[0]} and concept_id_2 in {tuple(set(concept_id_2))};")
-                elif len(concept_id_2) == 1:
-                    cursor.execute(f"select distinct dataset_id,concept_id_1,concept_id_2,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_1))} and concept_id_2={concept_id_2[0]};")
-                else:
-                    cursor.execute(f"select distinct dataset_id,concept_id_1,concept_id_2,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_1))} and concept_id_2 in {tuple(set(concept_id_2))};")
-                res = cursor.fetchall()
-                if len(res) == 0:
-                    if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2={concept_id_1[0]} and concept_id_1={concept_id_2[0]};")
-                    elif len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2={concept_id_1[0]} and concept_id_1 in {tuple(set(concept_id_2))};")
-                    elif len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2 in {tuple(set(concept_id_1))} and concept_id_1={concept_id_2[0]};")
-                    else:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2 in {tuple(set(concept_id_1))} and concept_id_1 in {tuple(set(concept_id_2))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        pass
-                    else:
-                        for row in res:
-                            if row[0] == dataset_id:
-                                results_array.append({'dataset_id': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_count': row[3],
-                                                        'concept_frequency': row[4]})
-                else:
-                    for row in res:
-                        if row[0] == dataset_id:
-                            results_array.append({'dataset_id': row[0],
-                                                    'concept_id_1': row[1],
-                                                    'concept_id_2': row[2],
-                                                    'concept_count': row[3],
-                                                    'concept_frequency': row[4]})
-
-                    if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2={concept_id_1[0]} and concept_id_1={concept_id_2[0]};")
-                    elif len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2={concept_id_1[0]} and concept_id_1 in {tuple(set(concept_id_2))};")
-                    elif len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2 in {tuple(set(concept_id_1))} and concept_id_1={concept_id_2[0]};")
-                    else:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2 in {tuple(set(concept_id_1))} and concept_id_1 in {tuple(set(concept_id_2))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        pass
-                    else:
-                        for row in res:
-                            if row[0] == dataset_id:
-                                results_array.append({'dataset_id': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_count': row[3],
-                                                        'concept_frequency': row[4]})
+            rows = self._get_pair_rows(columns, dataset_id, concept_id_1=concept_id_1, concept_id_2=concept_id_2)
         else:
-            if isinstance(concept_id_pair, str):
-                cursor.execute(f"select distinct dataset_id,concept_id_1,concept_id_2,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair1}';")
-                res = cursor.fetchall()
-                if len(res) == 0:
-                    cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        pass
-                    else:
-                        for row in res:
-                            if row[0] == dataset_id:
-                                results_array.append({'dataset_id': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_count': row[3],
-                                                        'concept_frequency': row[4]})
-                else:
-                    for row in res:
-                        if row[0] == dataset_id:
-                            results_array.append({'dataset_id': row[0],
-                                                    'concept_id_1': row[1],
-                                                    'concept_id_2': row[2],
-                                                    'concept_count': row[3],
-                                                    'concept_frequency': row[4]})
+            rows = self._get_pair_rows(columns, dataset_id, concept_id_pair=concept_id_pair1, reversed_concept_id_pair=concept_id_pair2)
 
-                    cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        pass
-                    else:
-                        for row in res:
-                            if row[0] == dataset_id:
-                                results_array.append({'dataset_id': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_count': row[3],
-                                                        'concept_frequency': row[4]})
-            else:
-                if len(concept_id_pair) == 1:
-                    cursor.execute(f"select distinct dataset_id,concept_id_1,concept_id_2,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair1[0]}';")
-                else:
-                    cursor.execute(f"select distinct dataset_id,concept_id_1,concept_id_2,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id in {tuple(set(concept_id_pair1))};")
-                res = cursor.fetchall()
-                if len(res) == 0:
-                    if len(concept_id_pair) == 1:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2[0]}';")
-                    else:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id in {tuple(set(concept_id_pair2))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        pass
-                    else:
-                        for row in res:
-                            if row[0] == dataset_id:
-                                results_array.append({'dataset_id': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_count': row[3],
-                                                        'concept_frequency': row[4]})
-                else:
-                    for row in res:
-                        if row[0] == dataset_id:
-                            results_array.append({'dataset_id': row[0],
-                                                    'concept_id_1': row[1],
-                                                    'concept_id_2': row[2],
-                                                    'concept_count': row[3],
-                                                    'concept_frequency': row[4]})
-
-                    if len(concept_id_pair) == 1:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2[0]}';")
-                    else:
-                        cursor.execute(f"select distinct dataset_id,concept_id_2,concept_id_1,concept_count,concept_prevalence from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id in {tuple(set(concept_id_pair2))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        pass
-                    else:
-                        for row in res:
-                            if row[0] == dataset_id:
-                                results_array.append({'dataset_id': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_count': row[3],
-                                                        'concept_frequency': row[4]})
-
-        if len(results_array) != 0:
-            results_array = sorted(results_array, key=lambda x: x['concept_frequency'], reverse=True)
-
-        return results_array
+        return self._format_pair_results(rows, PAIRED_CONCEPT_FREQ_DTYPE, 'concept_frequency', as_array)
 
     def get_individual_concept_freq(self, concept_id, dataset_id=1):
         """Retrieve observed clinical frequencies of individual concepts.
@@ -1008,7 +1005,7 @@ class COHDIndex:
 
         return results_array
 
-    def get_obs_exp_ratio(self, concept_id_1=[], concept_id_2=[], concept_id_pair=None, domain="", dataset_id=1):
+    def get_obs_exp_ratio(self, concept_id_1=[], concept_id_2=[], concept_id_pair=None, domain="", dataset_id=1, as_array=False):
         """Return the natural logarithm of the ratio between the observed count and expected count.
 
             Expected count is calculated from the single concept frequencies and assuming independence between the concepts. Results are returned in descending order of ln_ratio.
@@ -1029,6 +1026,8 @@ class COHDIndex:
             domain (optional, str): An OMOP domain id, e.g., "Condition", "Drug", "Procedure", etc., to restrict the associated
                 concept (concept_id_2) to. If this parameter is not specified, then the domain is unrestricted.
             dataset_id (optional, int): The dataset_id of the dataset to query. Default dataset is the 5-year dataset (1).
+            as_array (optional, bool): If set, return the results as a NumPy structured array with OBS_EXP_RATIO_DTYPE fields
+                (in the same order) instead of a list of dictionaries
 
         Returns:
             array: an sorted(decreasing ln_ratio) array of dictionaries which contains  the natural logarithm of the ratio between the observed
@@ -1086,420 +1085,16 @@ class COHDIndex:
                 print("The 'dataset_id' in get_obs_exp_ratio should be 1, 2 or 3", flush=True)
                 return []
 
-        results_array = []
-        cursor = self.connection.cursor()
+        columns = ['concept_id_1', 'concept_id_2', 'dataset_id', 'expected_count', 'ln_ratio', 'concept_count']
         if concept_id_pair is None:
-            if len(concept_id_2) == 0:
-                if domain == "":
-                    if len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_1[0]};")
-                    else:
-                        cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_1))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2={concept_id_1[0]};")
-                        else:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-                    else:
-                        for row in res:
-                            if row[2] == dataset_id:
-                                results_array.append({'concept_id_1': row[0],
-                                                        'concept_id_2': row[1],
-                                                        'dataset_id': row[2],
-                                                        'expected_count': row[3],
-                                                        'ln_ratio': float(row[4]),
-                                                        'observed_count': row[5]})
-
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2={concept_id_1[0]};")
-                        else:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-                else:
-                    if len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1={concept_id_1[0]} and c.domain_id='{domain}';")
-                    else:
-                        cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-                    else:
-                        for row in res:
-                            if row[2] == dataset_id:
-                                results_array.append({'concept_id_1': row[0],
-                                                        'concept_id_2': row[1],
-                                                        'dataset_id': row[2],
-                                                        'expected_count': row[3],
-                                                        'ln_ratio': float(row[4]),
-                                                        'observed_count': row[5]})
-
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-            else:
-                if domain == "":
-                    if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_1[0]} and concept_id_2={concept_id_2[0]};")
-                    elif len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_1[0]} and concept_id_2 in {tuple(set(concept_id_2))};")
-                    elif len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_1))} and concept_id_2={concept_id_2[0]};")
-                    else:
-                        cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_1))} and concept_id_2 in {tuple(set(concept_id_2))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_2[0]} and concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_2))} and concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_2[0]} and concept_id_2 in {tuple(set(concept_id_1))};")
-                        else:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_2))} and concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-                    else:
-                        for row in res:
-                            if row[2] == dataset_id:
-                                results_array.append({'concept_id_1': row[0],
-                                                        'concept_id_2': row[1],
-                                                        'dataset_id': row[2],
-                                                        'expected_count': row[3],
-                                                        'ln_ratio': float(row[4]),
-                                                        'observed_count': row[5]})
-
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_2[0]} and concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_2))} and concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_2[0]} and concept_id_2 in {tuple(set(concept_id_1))};")
-                        else:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_2))} and concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-
-                else:
-                    if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1={concept_id_1[0]} and p.concept_id_2={concept_id_2[0]} and c.domain_id='{domain}';")
-                    elif len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1={concept_id_1[0]} and p.concept_id_2 in {tuple(set(concept_id_2))} and c.domain_id='{domain}';")
-                    elif len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_1))} and p.concept_id_2={concept_id_2[0]} and c.domain_id='{domain}';")
-                    else:
-                        cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_1))} and p.concept_id_2 in {tuple(set(concept_id_2))} and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1={concept_id_2[0]} and p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1={concept_id_2[0]} and p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-                    else:
-                        for row in res:
-                            if row[2] == dataset_id:
-                                results_array.append({'concept_id_1': row[0],
-                                                        'concept_id_2': row[1],
-                                                        'dataset_id': row[2],
-                                                        'expected_count': row[3],
-                                                        'ln_ratio': float(row[4]),
-                                                        'observed_count': row[5]})
-
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1={concept_id_2[0]} and p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1={concept_id_2[0]} and p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
+            rows = self._get_pair_rows(columns, dataset_id, concept_id_1=concept_id_1, concept_id_2=concept_id_2, domain=domain)
         else:
-            if isinstance(concept_id_pair, str):
-                if domain == "":
-                    cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair1}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-                    else:
-                        for row in res:
-                            if row[2] == dataset_id:
-                                results_array.append({'concept_id_1': row[0],
-                                                        'concept_id_2': row[1],
-                                                        'dataset_id': row[2],
-                                                        'expected_count': row[3],
-                                                        'ln_ratio': float(row[4]),
-                                                        'observed_count': row[5]})
-
-                        cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-                else:
-                    cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_pair_id='{concept_id_pair1}' and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2}' and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-                    else:
-                        for row in res:
-                            if row[2] == dataset_id:
-                                results_array.append({'concept_id_1': row[0],
-                                                        'concept_id_2': row[1],
-                                                        'dataset_id': row[2],
-                                                        'expected_count': row[3],
-                                                        'ln_ratio': float(row[4]),
-                                                        'observed_count': row[5]})
-
-                        cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2}' and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-            else:
-                if domain == "":
-                    if len(concept_id_pair) == 1:
-                        cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair1[0]}';")
-                    else:
-                        cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id in {tuple(set(concept_id_pair1))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2[0]}';")
-                        else:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id in {tuple(set(concept_id_pair2))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-                    else:
-                        for row in res:
-                            if row[2] == dataset_id:
-                                results_array.append({'concept_id_1': row[0],
-                                                        'concept_id_2': row[1],
-                                                        'dataset_id': row[2],
-                                                        'expected_count': row[3],
-                                                        'ln_ratio': float(row[4]),
-                                                        'observed_count': row[5]})
-
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2[0]}';")
-                        else:
-                            cursor.execute(f"select distinct concept_id_1,concept_id_2,dataset_id,expected_count,ln_ratio,concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id in {tuple(set(concept_id_pair2))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-                else:
-                    if len(concept_id_pair) == 1:
-                        cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_pair_id='{concept_id_pair1[0]}' and c.domain_id='{domain}';")
-                    else:
-                        cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_pair_id in {tuple(set(concept_id_pair1))} and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2[0]}' and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id in {tuple(set(concept_id_pair2))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-                    else:
-                        for row in res:
-                            if row[2] == dataset_id:
-                                results_array.append({'concept_id_1': row[0],
-                                                        'concept_id_2': row[1],
-                                                        'dataset_id': row[2],
-                                                        'expected_count': row[3],
-                                                        'ln_ratio': float(row[4]),
-                                                        'observed_count': row[5]})
-
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2[0]}' and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.concept_id_1,p.concept_id_2,p.dataset_id,p.expected_count,p.ln_ratio,p.concept_count from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id in {tuple(set(concept_id_pair2))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[2] == dataset_id:
-                                    results_array.append({'concept_id_1': row[1],
-                                                            'concept_id_2': row[0],
-                                                            'dataset_id': row[2],
-                                                            'expected_count': row[3],
-                                                            'ln_ratio': float(row[4]),
-                                                            'observed_count': row[5]})
-
-        if len(results_array) != 0:
-            results_array = sorted(results_array, key=lambda x: x['ln_ratio'], reverse=True)
+            rows = self._get_pair_rows(columns, dataset_id, concept_id_pair=concept_id_pair1, reversed_concept_id_pair=concept_id_pair2, domain=domain)
+        rows = [(row[0], row[1], row[2], row[3], float(row[4]), row[5]) for row in rows]
 
-        return results_array
+        return self._format_pair_results(rows, OBS_EXP_RATIO_DTYPE, 'ln_ratio', as_array)
 
-    def get_chi_square(self, concept_id_1=[], concept_id_2=[], concept_id_pair=None, domain='', dataset_id=1):
+    def get_chi_square(self, concept_id_1=[], concept_id_2=[], concept_id_pair=None, domain='', dataset_id=1, as_array=False):
         """Return the chi-square statistic and p-value between pairs of concepts.
 
             Results are returned in descending order of the chi-square statistic.
@@ -1520,6 +1115,8 @@ class COHDIndex:
             domain (optional, str): An OMOP domain id, e.g., "Condition", "Drug", "Procedure", etc., to restrict the associated
                 concept (concept_id_2) to. If this parameter is not specified, then the domain is unrestricted.
             dataset_id (int): The dataset_id of the dataset to query. Default dataset is the 5-year dataset (1).
+            as_array (optional, bool): If set, return the results as a NumPy structured array with CHI_SQUARE_DTYPE fields
+                (in the same order) instead of a list of dictionaries
 
         Returns:
             array: an sorted(increasing pvalue) array of chi-square dictionaries.
@@ -1575,398 +1172,15 @@ class COHDIndex:
                 print("The 'dataset_id' in get_chi_square should be 1, 2 or 3", flush=True)
                 return []
 
-        results_array = []
-        cursor = self.connection.cursor()
+        columns = ['chi_square_t', 'concept_id_1', 'concept_id_2', 'dataset_id', 'chi_square_p']
         if concept_id_pair is None:
-            if len(concept_id_2) == 0:
-                if domain == "":
-                    if len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_1[0]};")
-                    else:
-                        cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_1))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2={concept_id_1[0]};")
-                        else:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-                    else:
-                        for row in res:
-                            if row[3] == dataset_id:
-                                results_array.append({'chi_square': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'dataset_id': row[3],
-                                                        'p-value': row[4]})
-
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2={concept_id_1[0]};")
-                        else:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-                else:
-                    if len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1={concept_id_1[0]} and c.domain_id='{domain}';")
-                    else:
-                        cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-                    else:
-                        for row in res:
-                            chi_square, concept_id_1, concept_id_2, dataset_id_row, pvalue = row
-                            if row[3] == dataset_id:
-                                results_array.append({'chi_square': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'dataset_id': row[3],
-                                                        'p-value': row[4]})
-
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-
-            else:
-                if domain == "":
-                    if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_1[0]} and concept_id_2={concept_id_2[0]};")
-                    elif len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_1[0]} and concept_id_2 in {tuple(set(concept_id_2))};")
-                    elif len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_1))} and concept_id_2={concept_id_2[0]};")
-                    else:
-                        cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_1))} and concept_id_2 in {tuple(set(concept_id_2))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_2[0]} and concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_2))} and concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_2[0]} and concept_id_2 in {tuple(set(concept_id_1))};")
-                        else:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_2))} and concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-                    else:
-                        for row in res:
-                            if row[3] == dataset_id:
-                                results_array.append({'chi_square': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'dataset_id': row[3],
-                                                        'p-value': row[4]})
-
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_2[0]} and concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_2))} and concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1={concept_id_2[0]} and concept_id_2 in {tuple(set(concept_id_1))};")
-                        else:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_id_1 in {tuple(set(concept_id_2))} and concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-
-                else:
-                    if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1={concept_id_1[0]} and p.concept_id_2={concept_id_2[0]} and c.domain_id='{domain}';")
-                    elif len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1={concept_id_1[0]} and p.concept_id_2 in {tuple(set(concept_id_2))} and c.domain_id='{domain}';")
-                    elif len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_1))} and p.concept_id_2={concept_id_2[0]} and c.domain_id='{domain}';")
-                    else:
-                        cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_1))} and p.concept_id_2 in {tuple(set(concept_id_2))} and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1={concept_id_2[0]} and p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1={concept_id_2[0]} and p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-                    else:
-                        for row in res:
-                            if row[3] == dataset_id:
-                                results_array.append({'chi_square': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'dataset_id': row[3],
-                                                        'p-value': row[4]})
-
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1={concept_id_2[0]} and p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1={concept_id_2[0]} and p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id  where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
+            rows = self._get_pair_rows(columns, dataset_id, concept_id_1=concept_id_1, concept_id_2=concept_id_2, domain=domain)
         else:
-            if isinstance(concept_id_pair, str):
-                if domain == "":
-                    cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair1}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-                    else:
-                        for row in res:
-                            if row[3] == dataset_id:
-                                results_array.append({'chi_square': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'dataset_id': row[3],
-                                                        'p-value': row[4]})
-
-                        cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-                else:
-                    cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_pair_id='{concept_id_pair1}' and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2}' and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-                    else:
-                        for row in res:
-                            if row[3] == dataset_id:
-                                results_array.append({'chi_square': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'dataset_id': row[3],
-                                                        'p-value': row[4]})
-
-                        cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2}' and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-            else:
-                if domain == "":
-                    if len(concept_id_pair) == 1:
-                        cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair1[0]}';")
-                    else:
-                        cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id in {tuple(set(concept_id_pair1))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2[0]}';")
-                        else:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id in {tuple(set(concept_id_pair2))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-                    else:
-                        for row in res:
-                            if row[3] == dataset_id:
-                                results_array.append({'chi_square': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'dataset_id': row[3],
-                                                        'p-value': row[4]})
-
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id='{concept_id_pair2[0]}';")
-                        else:
-                            cursor.execute(f"select distinct chi_square_t,concept_id_1,concept_id_2,dataset_id,chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS where concept_pair_id in {tuple(set(concept_id_pair2))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-                else:
-                    if len(concept_id_pair) == 1:
-                        cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_pair_id='{concept_id_pair1[0]}' and c.domain_id='{domain}';")
-                    else:
-                        cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_pair_id in {tuple(set(concept_id_pair1))} and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2[0]}' and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id in {tuple(set(concept_id_pair2))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
-                    else:
-                        for row in res:
-                            if row[3] == dataset_id:
-                                results_array.append({'chi_square': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'dataset_id': row[3],
-                                                        'p-value': row[4]})
-
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2[0]}' and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct p.chi_square_t,p.concept_id_1,p.concept_id_2,p.dataset_id,p.chi_square_p from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id in {tuple(set(concept_id_pair2))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[3] == dataset_id:
-                                    results_array.append({'chi_square': row[0],
-                                                            'concept_id_1': row[2],
-                                                            'concept_id_2': row[1],
-                                                            'dataset_id': row[3],
-                                                            'p-value': row[4]})
+            rows = self._get_pair_rows(columns, dataset_id, concept_id_pair=concept_id_pair1, reversed_concept_id_pair=concept_id_pair2, domain=domain)
 
-        if len(results_array) != 0:
-            results_array = sorted(results_array, key=lambda x: x['chi_square'], reverse=True)
-
-        return results_array
+        return self._format_pair_results(rows, CHI_SQUARE_DTYPE, 'chi_square', as_array)
 
-    def get_relative_frequency(self, concept_id_1=[], concept_id_2=[], concept_id_pair=None, domain='', dataset_id=1):
+    def get_relative_frequency(self, concept_id_1=[], concept_id_2=[], concept_id_pair=None, domain='', dataset_id=1, as_array=False):
         """Relative frequency between pairs of concepts.
 
             Calculates the relative frequency (i.e., conditional probability) between pairs of concepts. Results are
@@ -1987,6 +1201,8 @@ class COHDIndex:
             domain (optional, str): An OMOP domain id, e.g., "Condition", "Drug", "Procedure", etc., to restrict the associated
                 concept (concept_id_2) to. If this parameter is not specified, then the domain is unrestricted.
             dataset_id (optional, int): The dataset_id of the dataset to query. Default dataset is the 5-year dataset (1).
+            as_array (optional, bool): If set, return the results as a NumPy structured array with RELATIVE_FREQUENCY_DTYPE fields
+                (in the same order) instead of a list of dictionaries
 
         Returns:
             array: an sorted(decreasing relative_frequency) array of dictionaries which contains the relative frequency between pairs of concepts
@@ -2043,418 +1259,14 @@ class COHDIndex:
                 print("The 'dataset_id' in get_relative_frequency should be 1, 2 or 3", flush=True)
                 return []
 
-        results_array = []
-        cursor = self.connection.cursor()
+        columns = ['concept_2_count', 'concept_id_1', 'concept_id_2', 'concept_count', 'dataset_id']
         if concept_id_pair is None:
-            if len(concept_id_2) == 0:
-                if domain == "":
-                    if len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1={concept_id_1[0]};")
-                    else:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1 in {tuple(set(concept_id_1))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_2={concept_id_1[0]};")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-                    else:
-                        for row in res:
-                            if row[4] == dataset_id:
-                                results_array.append({'concept_2_count': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_pair_count': row[3],
-                                                        'dataset_id_row': row[4],
-                                                        'relative_frequency': row[3] / row[0]})
-
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_2={concept_id_1[0]};")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-                else:
-                    if len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_id_1={concept_id_1[0]} and c.domain_id='{domain}';")
-                    else:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_id_1 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-                    else:
-                        for row in res:
-                            if row[4] == dataset_id:
-                                results_array.append({'concept_2_count': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_pair_count': row[3],
-                                                        'dataset_id_row': row[4],
-                                                        'relative_frequency': row[3] / row[0]})
-
-                        if len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2={concept_id_1[0]} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2 in {tuple(set(concept_id_1))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-            else:
-                if domain == "":
-                    if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1={concept_id_1[0]} and p.concept_id_2={concept_id_2[0]};")
-                    elif len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1={concept_id_1[0]} and p.concept_id_2 in {tuple(set(concept_id_2))};")
-                    elif len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1 in {tuple(set(concept_id_1))} and p.concept_id_2={concept_id_2[0]};")
-                    else:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1 in {tuple(set(concept_id_1))} and p.concept_id_2 in {tuple(set(concept_id_2))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1={concept_id_2[0]} and p.concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1={concept_id_2[0]} and p.concept_id_2 in {tuple(set(concept_id_1))};")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-                    else:
-                        for row in res:
-                            if row[4] == dataset_id:
-                                results_array.append({'concept_2_count': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_pair_count': row[3],
-                                                        'dataset_id_row': row[4],
-                                                        'relative_frequency': row[3] / row[0]})
-
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1={concept_id_2[0]} and p.concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2={concept_id_1[0]};")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1={concept_id_2[0]} and p.concept_id_2 in {tuple(set(concept_id_1))};")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_id_1 in {tuple(set(concept_id_2))} and p.concept_id_2 in {tuple(set(concept_id_1))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-
-                else:
-                    if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_id_1={concept_id_1[0]} and p.concept_id_2={concept_id_2[0]} and c.domain_id='{domain}';")
-                    elif len(concept_id_1) == 1:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_id_1={concept_id_1[0]} and p.concept_id_2 in {tuple(set(concept_id_2))} and c.domain_id='{domain}';")
-                    elif len(concept_id_2) == 1:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_id_1 in {tuple(set(concept_id_1))} and p.concept_id_2={concept_id_2[0]} and c.domain_id='{domain}';")
-                    else:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_id_1 in {tuple(set(concept_id_1))} and p.concept_id_2 in {tuple(set(concept_id_2))} and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2={concept_id_1[0]} and p.concept_id_1={concept_id_2[0]} and c.domain_id='{domain}';")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2={concept_id_1[0]} and p.concept_id_1 in {tuple(set(concept_id_2))} and c.domain_id='{domain}';")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2 in {tuple(set(concept_id_1))} and p.concept_id_1={concept_id_2[0]} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2 in {tuple(set(concept_id_1))} and p.concept_id_1 in {tuple(set(concept_id_2))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-                    else:
-                        for row in res:
-                            if row[4] == dataset_id:
-                                results_array.append({'concept_2_count': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_pair_count': row[3],
-                                                        'dataset_id_row': row[4],
-                                                        'relative_frequency': row[3] / row[0]})
-
-                        if len(concept_id_1) == 1 and len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2={concept_id_1[0]} and p.concept_id_1={concept_id_2[0]} and c.domain_id='{domain}';")
-                        elif len(concept_id_1) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2={concept_id_1[0]} and p.concept_id_1 in {tuple(set(concept_id_2))} and c.domain_id='{domain}';")
-                        elif len(concept_id_2) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2 in {tuple(set(concept_id_1))} and p.concept_id_1={concept_id_2[0]} and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_id_2 in {tuple(set(concept_id_1))} and p.concept_id_1 in {tuple(set(concept_id_2))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
+            rows = self._get_pair_rows(columns, dataset_id, concept_id_1=concept_id_1, concept_id_2=concept_id_2, domain=domain)
         else:
-            if isinstance(concept_id_pair, str):
-                if domain == "":
-                    cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_pair_id='{concept_id_pair1}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_pair_id='{concept_id_pair2}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-                    else:
-                        for row in res:
-                            if row[4] == dataset_id:
-                                results_array.append({'concept_2_count': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_pair_count': row[3],
-                                                        'dataset_id_row': row[4],
-                                                        'relative_frequency': row[3] / row[0]})
-
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_pair_id='{concept_id_pair2}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-                else:
-                    cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_pair_id='{concept_id_pair1}' and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2}' and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-                    else:
-                        for row in res:
-                            if row[4] == dataset_id:
-                                results_array.append({'concept_2_count': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_pair_count': row[3],
-                                                        'dataset_id_row': row[4],
-                                                        'relative_frequency': row[3] / row[0]})
-
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2}' and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-            else:
-                if domain == "":
-                    if len(concept_id_pair) == 1:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_pair_id='{concept_id_pair1[0]}';")
-                    else:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_pair_id in {tuple(set(concept_id_pair1))};")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_pair_id='{concept_id_pair2[0]}';")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_pair_id in {tuple(set(concept_id_pair2))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-                    else:
-                        for row in res:
-                            if row[4] == dataset_id:
-                                results_array.append({'concept_2_count': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_pair_count': row[3],
-                                                        'dataset_id_row': row[4],
-                                                        'relative_frequency': row[3] / row[0]})
-
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_pair_id='{concept_id_pair2[0]}';")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id where p.concept_pair_id in {tuple(set(concept_id_pair2))};")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-                else:
-                    if len(concept_id_pair) == 1:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_pair_id='{concept_id_pair1[0]}' and c.domain_id='{domain}';")
-                    else:
-                        cursor.execute(f"select distinct s.concept_count,p.concept_id_1,p.concept_id_2,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_2 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_2 = c.concept_id where p.concept_pair_id in {tuple(set(concept_id_pair1))} and c.domain_id='{domain}';")
-                    res = cursor.fetchall()
-                    if len(res) == 0:
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2[0]}' and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id in {tuple(set(concept_id_pair2))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
-                    else:
-                        for row in res:
-                            if row[4] == dataset_id:
-                                results_array.append({'concept_2_count': row[0],
-                                                        'concept_id_1': row[1],
-                                                        'concept_id_2': row[2],
-                                                        'concept_pair_count': row[3],
-                                                        'dataset_id_row': row[4],
-                                                        'relative_frequency': row[3] / row[0]})
-
-                        if len(concept_id_pair) == 1:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id='{concept_id_pair2[0]}' and c.domain_id='{domain}';")
-                        else:
-                            cursor.execute(f"select distinct s.concept_count,p.concept_id_2,p.concept_id_1,p.concept_count,p.dataset_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS p inner join SINGLE_CONCEPT_COUNTS s on p.concept_id_1 = s.concept_id and p.dataset_id = s.dataset_id inner join CONCEPTS c on p.concept_id_1 = c.concept_id where p.concept_pair_id in {tuple(set(concept_id_pair2))} and c.domain_id='{domain}';")
-                        res = cursor.fetchall()
-                        if len(res) == 0:
-                            pass
-                        else:
-                            for row in res:
-                                if row[4] == dataset_id:
-                                    results_array.append({'concept_2_count': row[0],
-                                                            'concept_id_1': row[1],
-                                                            'concept_id_2': row[2],
-                                                            'concept_pair_count': row[3],
-                                                            'dataset_id_row': row[4],
-                                                            'relative_frequency': row[3] / row[0]})
+            rows = self._get_pair_rows(columns, dataset_id, concept_id_pair=concept_id_pair1, reversed_concept_id_pair=concept_id_pair2, domain=domain)
+        rows = [(*row, row[3] / row[0]) for row in rows]
 
-        if len(results_array) != 0:
-            results_array = sorted(results_array, key=lambda x: x['relative_frequency'], reverse=True)
-
-        return results_array
+        return self._format_pair_results(rows, RELATIVE_FREQUENCY_DTYPE, 'relative_frequency', as_array)
 
     def get_datasets(self):
         """Enumerate the datasets available in COHD.
@@ -2588,10 +1400,11 @@ def main():
 
     parser = argparse.ArgumentParser(description="Tests or rebuilds the COHD Node Index", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('-b', '--build', action="store_true", help="If set, (re)build the index from scratch", default=False)
+    parser.add_argument('-i', '--index', action="store_true", help="If set, add the covering indexes used by the pair queries to an existing database", default=False)
     parser.add_argument('-t', '--test', action="store_true", help="If set, run a test of the index by doing several lookups", default=False)
     args = parser.parse_args()
 
-    if not args.build and not args.test:
+    if not args.build and not args.index and not args.test:
         parser.print_help()
         sys.exit(2)
 
@@ -2602,6 +1415,8 @@ def main():
         cohdIndex.create_tables()
         cohdIndex.populate_table()
         cohdIndex.create_indexes()
+    if args.build or args.index:
+        cohdIndex.create_association_indexes()
 
     # Exit here if tests are not requested
     if not args.test:
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+""" Times the COHDIndex pair methods (get_paired_concept_freq, get_obs_exp_ratio, get_chi_square and
+get_relative_frequency) for one-sided, two-sided, domain-restricted and pair-id queries with small and large id lists,
+first with only the original single-column indexes and then after COHDIndex.create_association_indexes() has added
+the covering indexes, and as lists of dicts vs. NumPy structured arrays. Runs on a synthetic database shaped like the
+COHD one, or on a copy of a real COHD database (which gets the covering indexes added to it).
+Usage: python benchmark_COHDIndex.py [--database COHDdatabase_v2.0.db] [--concepts 20000] [--pairs 1000000] [--runs 5]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from COHDIndex import COHDIndex
+
+DOMAINS = ['Condition', 'Drug', 'Procedure', 'Measurement', 'Observation']
+
+
+def _create_database(database_path: str, num_concepts: int, num_pairs: int, seed: int):
+    rng = random.Random(seed)
+    connection = sqlite3.connect(database_path)
+    connection.execute("CREATE TABLE CONCEPTS( concept_id INT PRIMARY KEY, concept_name VARCHAR(255), domain_id VARCHAR(255), vocabulary_id VARCHAR(255), concept_class_id VARCHAR(255), concept_code VARCHAR(255) )")
+    connection.execute("CREATE TABLE SINGLE_CONCEPT_COUNTS( dataset_id TINYINT, concept_id INT, concept_count INT, concept_prevalence FLOAT )")
+    connection.execute("CREATE TABLE PAIRED_CONCEPT_COUNTS_ASSOCIATIONS( concept_pair_id VARCHAR(255), dataset_id TINYINT, concept_id_1 INT, concept_id_2 INT, concept_count INT, concept_prevalence FLOAT, chi_square_t FLOAT, chi_square_p FLOAT, expected_count FLOAT, ln_ratio FLOAT, rel_freq_1 FLOAT, rel_freq_2 FLOAT )")
+    connection.executemany("INSERT INTO CONCEPTS VALUES (?,?,?,'','','')",
+                           ((concept_id, f"concept {concept_id}", rng.choice(DOMAINS)) for concept_id in range(1, num_concepts + 1)))
+    connection.executemany("INSERT INTO SINGLE_CONCEPT_COUNTS VALUES (?,?,?,?)",
+                           ((dataset_id, concept_id, rng.randint(10, 100000), rng.random()) for dataset_id in (1, 2, 3) for concept_id in range(1, num_concepts + 1)))
+    # Skewed like the real data: a few concepts take part in many pairs
+    pairs = set()
+    while len(pairs) < num_pairs:
+        concept_id_1 = int(rng.paretovariate(0.8)) % num_concepts + 1
+        concept_id_2 = rng.randint(1, num_concepts)
+        if concept_id_1 != concept_id_2 and (concept_id_2, concept_id_1) not in pairs:
+            pairs.add((concept_id_1, concept_id_2))
+    connection.executemany("INSERT INTO PAIRED_CONCEPT_COUNTS_ASSOCIATIONS VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                           ((f"{concept_id_1}_{concept_id_2}", dataset_id, concept_id_1, concept_id_2, rng.randint(10, 1000), rng.random() / 100,
+                             rng.random() * 1000, rng.random() / 100, rng.random() * 100, rng.random() * 6 - 3, rng.random(), rng.random())
+                            for concept_id_1, concept_id_2 in pairs for dataset_id in (1, 2, 3) if rng.random() < 0.7))
+    # The indexes the database was originally built with (see COHDIndex.create_indexes())
+    connection.execute("CREATE INDEX idx_SINGLE_CONCEPT_COUNTS_dataset_id ON SINGLE_CONCEPT_COUNTS(dataset_id)")
+    connection.execute("CREATE INDEX idx_SINGLE_CONCEPT_COUNTS_concept_id ON SINGLE_CONCEPT_COUNTS(concept_id)")
+    connection.execute("CREATE INDEX idx_PAIRED_CONCEPT_COUNTS_ASSOCIATIONS_dataset_id ON PAIRED_CONCEPT_COUNTS_ASSOCIATIONS(dataset_id)")
+    connection.execute("CREATE INDEX idx_PAIRED_CONCEPT_COUNTS_ASSOCIATIONS_concept_pair_id ON PAIRED_CONCEPT_COUNTS_ASSOCIATIONS(concept_pair_id)")
+    connection.execute("CREATE INDEX idx_PAIRED_CONCEPT_COUNTS_ASSOCIATIONS_concept_id_1 ON PAIRED_CONCEPT_COUNTS_ASSOCIATIONS(concept_id_1)")
+    connection.execute("CREATE INDEX idx_PAIRED_CONCEPT_COUNTS_ASSOCIATIONS_concept_id_2 ON PAIRED_CONCEPT_COUNTS_ASSOCIATIONS(concept_id_2)")
+    connection.commit()
+    connection.close()
+
+
+def _open_index(database_path: str) -> COHDIndex:
+    # Skip the constructor, which connects to (or downloads) the deployed database and loads the NodeSynonymizer
+    cohd_index = COHDIndex.__new__(COHDIndex)
+    cohd_index.connection = sqlite3.connect(database_path)
+    cohd_index.success_con = True
+    return cohd_index
+
+
+def _get_queries(connection, seed: int) -> list:
+    rng = random.Random(seed)
+    concept_ids = [row[0] for row in connection.execute("select concept_id from CONCEPTS")]
+    pair_ids = [row[0] for row in connection.execute("select concept_pair_id from PAIRED_CONCEPT_COUNTS_ASSOCIATIONS limit 10000")]
+    return [("1 concept", dict(concept_id_1=rng.sample(concept_ids, 1))),
+            ("20 concepts", dict(concept_id_1=rng.sample(concept_ids, 20))),
+            ("20 concepts, domain", dict(concept_id_1=rng.sample(concept_ids, 20), domain='Drug')),
+            ("20 x 2000 concepts", dict(concept_id_1=rng.sample(concept_ids, 20), concept_id_2=rng.sample(concept_ids, 2000))),
+            ("2000 concepts", dict(concept_id_1=rng.sample(concept_ids, 2000))),
+            ("500 pair ids", dict(concept_id_pair=rng.sample(pair_ids, 500)))]
+
+
+def _time(function, num_runs: int):
+    times = []
+    result = None
+    for run in range(num_runs):
+        t0 = timeit.default_timer()
+        result = function()
+        times.append(timeit.default_timer() - t0)
+    return result, statistics.median(times)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmarks the COHDIndex pair methods with and without the covering indexes")
+    arg_parser.add_argument("--database", dest="database", type=str, default=None,
+                            help="A COHD database to benchmark on (covering indexes are added to it); a synthetic one is built if not given")
+    arg_parser.add_argument("--concepts", dest="num_concepts", type=int, default=20000)
+    arg_parser.add_argument("--pairs", dest="num_pairs", type=int, default=1000000)
+    arg_parser.add_argument("--runs", dest="num_runs", type=int, default=5)
+    arg_parser.add_argument("--seed", dest="seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    database_path = args.database
+    if database_path is None:
+        database_path = f"benchmark_COHDIndex_{args.num_concepts}_{args.num_pairs}_{args.seed}.db"
+        if not os.path.exists(database_path):
+            print(f"Building a synthetic database with {args.num_concepts} concepts and {args.num_pairs} pairs in {database_path}", flush=True)
+            _create_database(database_path, args.num_concepts, args.num_pairs, args.seed)
+    cohd_index = _open_index(database_path)
+    queries = _get_queries(cohd_index.connection, args.seed)
+    methods = [cohd_index.get_paired_concept_freq, cohd_index.get_obs_exp_ratio, cohd_index.get_chi_square, cohd_index.get_relative_frequency]
+
+    timings = dict()
+    for stage in ("original indexes", "covering indexes"):
+        if stage == "covering indexes":
+            cohd_index.create_association_indexes()
+        for method in methods:
+            for query_name, kwargs in queries:
+                if method == cohd_index.get_paired_concept_freq and 'domain' in kwargs:
+                    continue
+                results, list_time = _time(lambda: method(**kwargs), args.num_runs)
+                _, array_time = _time(lambda: method(as_array=True, **kwargs), args.num_runs)
+                timings[(stage, method.__name__, query_name)] = (len(results), list_time, array_time)
+
+    for method in methods:
+        print(f"{method.__name__}:")
+        for query_name, _ in queries:
+            if ("original indexes", method.__name__, query_name) not in timings:
+                continue
+            num_results, original_time, _ = timings[("original indexes", method.__name__, query_name)]
+            _, covering_time, array_time = timings[("covering indexes", method.__name__, query_name)]
+            print(f"  {query_name} ({num_results} results): original indexes {round(original_time * 1000, 2)} ms, "
+                  f"covering indexes {round(covering_time * 1000, 2)} ms (as array {round(array_time * 1000, 2)} ms)")
+    cohd_index.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+""" Compares SQLite throughput of NodeSynonymizer's canonical curie lookup query in its old form (curies concatenated
+into an IN ( '...' ) list on a fresh connection) vs. its current form (each batch of curies bound as a single JSON array
+parameter on the shared read-only connection). Only the SQL is timed; the in-process lookup cache is not involved.
+Usage: python benchmark_node_synonymizer.py [--sizes 1000 10000 100000] [--runs 3]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from node_synonymizer import NodeSynonymizer
+
+
+def _get_random_curies(synonymizer: NodeSynonymizer, num_curies: int):
+    cursor = synonymizer.get_lookup_connection().cursor()
+    cursor.execute("SELECT MAX(rowid) FROM kg2_curie")
+    max_rowid = cursor.fetchone()[0]
+    rowids = random.sample(range(1, max_rowid + 1), min(num_curies, max_rowid))
+    curies = []
+    for start in range(0, len(rowids), 900):
+        rowid_batch = rowids[start:start + 900]
+        cursor.execute(f"SELECT curie FROM kg2_curie WHERE rowid IN ({','.join('?' * len(rowid_batch))})", rowid_batch)
+        curies += [row[0] for row in cursor.fetchall()]
+    return curies
+
+
+def _concatenated_in_list_lookup(synonymizer: NodeSynonymizer, curies):
+    # Recreates the old lookup: a new connection and a re-parsed IN ( '...' ) statement for every batch of 5000
+    connection = sqlite3.connect(f"{synonymizer.databaseLocation}/{synonymizer.databaseName}")
+    results = {}
+    for start in range(0, len(curies), 5000):
+        batch_str = "','".join(curie.upper().replace("'", "''") for curie in curies[start:start + 5000])
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SELECT C.curie,C.unique_concept_curie,U.kg2_best_curie,U.name,U.type
+              FROM kg2_curie AS C
+             INNER JOIN kg2_unique_concept AS U ON C.unique_concept_curie == U.uc_curie
+             WHERE C.uc_curie in ( '{batch_str}' )""")
+        for row in cursor.fetchall():
+            results[row[0]] = {'preferred_curie': row[2], 'preferred_name': row[3], 'preferred_type': row[4]}
+    connection.close()
+    return results
+
+
+def _bound_json_array_lookup(synonymizer: NodeSynonymizer, curies):
+    cursor = synonymizer.get_lookup_connection().cursor()
+    results = {}
+    for start in range(0, len(curies), 5000):
+        rows = synonymizer._execute_lookup(cursor, """
+            SELECT C.curie,C.unique_concept_curie,U.kg2_best_curie,U.name,U.type
+              FROM kg2_curie AS C
+             INNER JOIN kg2_unique_concept AS U ON C.unique_concept_curie == U.uc_curie
+             WHERE C.uc_curie IN ( SELECT value FROM json_each(?) )""", [curie.upper() for curie in curies[start:start + 5000]])
+        for row in rows:
+            results[row[0]] = {'preferred_curie': row[2], 'preferred_name': row[3], 'preferred_type': row[4]}
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmarks NodeSynonymizer canonical curie lookups")
+    arg_parser.add_argument("--sizes", dest="sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    arg_parser.add_argument("--runs", dest="num_runs", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    synonymizer = NodeSynonymizer()
+    for size in args.sizes:
+        curies = _get_random_curies(synonymizer, size)
+        for label, lookup_function in [("concatenated IN list", _concatenated_in_list_lookup),
+                                       ("bound JSON array", _bound_json_array_lookup)]:
+            times = []
+            for run in range(args.num_runs):
+                t0 = timeit.default_timer()
+                lookup_function(synonymizer, curies)
+                times.append(timeit.default_timer() - t0)
+            median_time = statistics.median(times)
+            print(f"{len(curies)} curies, {label}: median {round(median_time, 3)} s "
+                  f"({round(len(curies) / median_time)} curies/s) over {len(times)} runs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+""" Compares the full node_synonymizer.sqlite database with a snapshot written by NodeSynonymizer.export_snapshot():
+cold start (a fresh process creating the synonymizer and doing its first lookup) and per-lookup latency for single
+curies. The in-process lookup cache is bypassed so that every lookup goes to SQLite.
+Usage: python benchmark_node_synonymizer_snapshot.py [--snapshot node_synonymizer_snapshot.sqlite] [--lookups 2000] [--cold-starts 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from node_synonymizer import NodeSynonymizer, NodeSynonymizerSnapshot
+
+COLD_START_SCRIPT = """
+import sys, timeit
+t0 = timeit.default_timer()
+sys.path.append({directory!r})
+from node_synonymizer import NodeSynonymizer, NodeSynonymizerSnapshot
+synonymizer = {constructor}
+synonymizer.get_canonical_curies({curie!r})
+print(timeit.default_timer() - t0)
+"""
+
+
+def _get_random_curies(synonymizer: NodeSynonymizer, num_curies: int):
+    cursor = synonymizer.get_lookup_connection().cursor()
+    cursor.execute("SELECT MAX(rowid) FROM kg2_curie")
+    max_rowid = cursor.fetchone()[0]
+    rowids = random.sample(range(1, max_rowid + 1), min(num_curies, max_rowid))
+    curies = []
+    for start in range(0, len(rowids), 900):
+        rowid_batch = rowids[start:start + 900]
+        cursor.execute(f"SELECT curie FROM kg2_curie WHERE rowid IN ({','.join('?' * len(rowid_batch))})", rowid_batch)
+        curies += [row[0] for row in cursor.fetchall()]
+    return curies
+
+
+def _get_cold_start_time(constructor: str, curie: str) -> float:
+    script = COLD_START_SCRIPT.format(directory=os.path.dirname(os.path.abspath(__file__)), constructor=constructor, curie=curie)
+    output = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmarks a NodeSynonymizer snapshot against the full database")
+    arg_parser.add_argument("--snapshot", dest="snapshot", type=str, default="node_synonymizer_snapshot.sqlite")
+    arg_parser.add_argument("--lookups", dest="num_lookups", type=int, default=2000)
+    arg_parser.add_argument("--cold-starts", dest="num_cold_starts", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    full_synonymizer = NodeSynonymizer()
+    curies = _get_random_curies(full_synonymizer, args.num_lookups)
+    synonymizers = [("full database", "NodeSynonymizer()", full_synonymizer),
+                    ("snapshot", f"NodeSynonymizerSnapshot({args.snapshot!r})", NodeSynonymizerSnapshot(args.snapshot))]
+    for label, constructor, synonymizer in synonymizers:
+        database_path = f"{synonymizer.databaseLocation}/{synonymizer.databaseName}"
+        cold_start_times = [_get_cold_start_time(constructor, curies[0]) for run in range(args.num_cold_starts)]
+        lookup_times = []
+        for curie in curies:
+            t0 = timeit.default_timer()
+            synonymizer._get_canonical_curies_from_database(curies=[curie])
+            lookup_times.append(timeit.default_timer() - t0)
+        lookup_times.sort()
+        print(f"{label} ({round(os.path.getsize(database_path) / 1024 / 1024, 1)} MB): "
+              f"cold start median {round(statistics.median(cold_start_times) * 1000, 1)} ms; "
+              f"lookup median {round(statistics.median(lookup_times) * 1000000)} us, "
+              f"p99 {round(lookup_times[int(len(lookup_times) * 0.99)] * 1000000)} us over {len(lookup_times)} curies")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,11 @@ import sqlite3
 import json
 import pickle
 import platform
+import copy
+import shutil
+import time
+import threading
+from collections import OrderedDict
 def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
 
 #sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../")
@@ -33,10 +38,99 @@ def sizeof(obj):
     return size
 
 
+# ################################################################################################
+# Process-wide LRU/TTL cache of get_canonical_curies() results, shared by all NodeSynonymizer instances
+class NodeSynonymizerCache:
+
+    # Constructor
+    def __init__(self, max_size=200000, ttl=3600):
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.database_mtime = None
+        self.lock = threading.Lock()
+        self.stats = { 'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0 }
+
+
+    # ############################################################################################
+    # Clear the cache if the database file has changed since we last saw it
+    def check_database(self, database_path):
+
+        try:
+            mtime = os.path.getmtime(database_path)
+        except OSError:
+            mtime = None
+        with self.lock:
+            if mtime == self.database_mtime:
+                return False
+            if self.database_mtime is not None:
+                self.entries.clear()
+                self.stats['invalidations'] += 1
+            self.database_mtime = mtime
+            return True
+
+
+    # ############################################################################################
+    # Return (True, value) for a hit and (False, None) for a miss. Values are copied so callers can't alter the cache
+    def get(self, key):
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self.entries[key]
+                self.stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+        return True, copy.deepcopy(entry[1])
+
+
+    # ############################################################################################
+    def put(self, key, value):
+
+        value = copy.deepcopy(value)
+        with self.lock:
+            self.entries[key] = ( time.time(), value )
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+
+    # ############################################################################################
+    def clear(self):
+
+        with self.lock:
+            self.entries.clear()
+
+
+    # ############################################################################################
+    def get_stats(self):
+
+        with self.lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self.entries)
+            stats['max_size'] = self.max_size
+            stats['ttl'] = self.ttl
+        return stats
+
+
+
 # ################################################################################################
 # Main class
 class NodeSynonymizer:
 
+    # Cache of canonical curie/equivalent node lookups, shared across instances
+    cache = NodeSynonymizerCache()
+
+    # Per-thread read-only connections used for lookups (see get_lookup_connection())
+    lookup_state = threading.local()
+    lookup_mmap_size = 4 * 1024 * 1024 * 1024
+
     # Constructor
     def __init__(self):
 
@@ -973,6 +1067,49 @@ class NodeSynonymizer:
         self.connection.execute(f"CREATE INDEX idx_{kg_prefix}_synonym{TESTSUFFIX}_unique_concept_curie ON {kg_prefix}_synonym{TESTSUFFIX}(unique_concept_curie)")
 
 
+    # ############################################################################################
+    # Write a compact, read-only copy of just the tables that get_canonical_curies() needs, with each table stored in
+    # the order it is searched by (WITHOUT ROWID), for use with NodeSynonymizerSnapshot
+    def export_snapshot(self, filename='node_synonymizer_snapshot.sqlite'):
+
+        kg_prefix = 'kg2'
+        snapshot_path = filename if os.path.isabs(filename) else f"{self.databaseLocation}/{filename}"
+        temp_snapshot_path = f"{snapshot_path}.tmp"
+        if os.path.exists(temp_snapshot_path):
+            os.remove(temp_snapshot_path)
+        print(f"INFO: Exporting NodeSynonymizer snapshot to {snapshot_path}")
+
+        snapshot_connection = sqlite3.connect(temp_snapshot_path)
+        snapshot_connection.execute("PRAGMA page_size = 8192")
+        snapshot_connection.execute("PRAGMA journal_mode = OFF")
+        snapshot_connection.execute("ATTACH DATABASE ? AS source", ( f"{self.databaseLocation}/{self.databaseName}", ))
+
+        snapshot_connection.execute(f"CREATE TABLE {kg_prefix}_curie{TESTSUFFIX}( uc_curie VARCHAR(255), curie VARCHAR(255), unique_concept_curie VARCHAR(255), type VARCHAR(255), PRIMARY KEY (uc_curie, unique_concept_curie, curie) ) WITHOUT ROWID")
+        snapshot_connection.execute(f"INSERT OR IGNORE INTO {kg_prefix}_curie{TESTSUFFIX} SELECT uc_curie,curie,unique_concept_curie,type FROM source.{kg_prefix}_curie{TESTSUFFIX} ORDER BY uc_curie")
+        snapshot_connection.execute(f"CREATE INDEX idx_{kg_prefix}_curie{TESTSUFFIX}_unique_concept_curie ON {kg_prefix}_curie{TESTSUFFIX}(unique_concept_curie,type)")
+
+        snapshot_connection.execute(f"CREATE TABLE {kg_prefix}_unique_concept{TESTSUFFIX}( uc_curie VARCHAR(255) PRIMARY KEY, kg2_best_curie VARCHAR(255), name VARCHAR(255), type VARCHAR(255) ) WITHOUT ROWID")
+        snapshot_connection.execute(f"INSERT OR IGNORE INTO {kg_prefix}_unique_concept{TESTSUFFIX} SELECT uc_curie,kg2_best_curie,name,type FROM source.{kg_prefix}_unique_concept{TESTSUFFIX} ORDER BY uc_curie")
+
+        snapshot_connection.execute(f"CREATE TABLE {kg_prefix}_node{TESTSUFFIX}( unique_concept_curie VARCHAR(255), curie VARCHAR(255), kg_presence VARCHAR(10), PRIMARY KEY (unique_concept_curie, curie) ) WITHOUT ROWID")
+        snapshot_connection.execute(f"INSERT OR IGNORE INTO {kg_prefix}_node{TESTSUFFIX} SELECT unique_concept_curie,curie,kg_presence FROM source.{kg_prefix}_node{TESTSUFFIX} ORDER BY unique_concept_curie")
+
+        snapshot_connection.execute(f"CREATE TABLE {kg_prefix}_synonym{TESTSUFFIX}( lc_name VARCHAR(255), name VARCHAR(255), unique_concept_curie VARCHAR(255), PRIMARY KEY (lc_name, name, unique_concept_curie) ) WITHOUT ROWID")
+        snapshot_connection.execute(f"INSERT OR IGNORE INTO {kg_prefix}_synonym{TESTSUFFIX} SELECT lc_name,name,unique_concept_curie FROM source.{kg_prefix}_synonym{TESTSUFFIX} ORDER BY lc_name")
+
+        snapshot_connection.commit()
+        snapshot_connection.execute("DETACH DATABASE source")
+        snapshot_connection.execute("ANALYZE")
+        snapshot_connection.commit()
+        snapshot_connection.execute("VACUUM")
+        snapshot_connection.close()
+
+        # Swap the new snapshot into place in one step, so that running workers never see a partial file
+        os.replace(temp_snapshot_path, snapshot_path)
+        print(f"INFO: Wrote snapshot of {os.path.getsize(snapshot_path)} bytes to {snapshot_path}")
+        return snapshot_path
+
+
     # ############################################################################################
     def import_equivalencies(self):
 
@@ -1272,6 +1409,53 @@ class NodeSynonymizer:
     # ############################################################################################
     def get_canonical_curies(self, curies=None, names=None, return_all_types=False, return_type='canonical_curies', kg_name='KG2'):
 
+        # If the provided curies or names is just a string, turn it into a list
+        if isinstance(curies,str):
+            curies = [ curies ]
+        if isinstance(names,str):
+            names = [ names ]
+
+        # If the database file has changed, the cache has been cleared, and our connection may point to the old file
+        if self.cache.check_database(f"{self.databaseLocation}/{self.databaseName}"):
+            self.disconnect()
+            self.connect()
+
+        # Answer what we can from the cache, and only send the misses to the database
+        results = {}
+        missed_entities = { 'curies': [], 'names': [] }
+        for entity_type, entities in [ ( 'curies', curies ), ( 'names', names ) ]:
+            if entities is None:
+                continue
+            for entity in entities:
+                if entity is None:
+                    continue
+                is_hit, value = self.cache.get( ( entity, entity_type, kg_name, return_type, return_all_types ) )
+                results[entity] = value
+                if not is_hit:
+                    missed_entities[entity_type].append(entity)
+
+        if missed_entities['curies'] or missed_entities['names']:
+            database_results = self._get_canonical_curies_from_database(curies=missed_entities['curies'], names=missed_entities['names'],
+                return_all_types=return_all_types, return_type=return_type, kg_name=kg_name)
+            for entity_type, entities in missed_entities.items():
+                for entity in entities:
+                    value = database_results.get(entity)
+                    results[entity] = value
+                    self.cache.put( ( entity, entity_type, kg_name, return_type, return_all_types ), value )
+
+        return results
+
+
+    # ############################################################################################
+    # Hit and miss counts etc. for the shared lookup cache
+    def get_cache_stats(self):
+
+        return self.cache.get_stats()
+
+
+    # ############################################################################################
+    def _get_canonical_curies_from_database(self, curies=None, names=None, return_all_types=False, return_type='canonical_curies', kg_name='KG2'):
+
         # If the provided curies or names is just a string, turn it into a list
         if isinstance(curies,str):
             curies = [ curies ]
@@ -1282,10 +1466,9 @@ class NodeSynonymizer:
         batches = []
         results = {}
 
-        # Make sets of comma-separated list strings for the curies and set up the results dict with all the input values
+        # Make batches of upper-cased curies and set up the results dict with all the input values
         uc_curies = []
         curie_map = {}
-        batch_size = 0
         if curies is not None:
             for curie in curies:
                 if curie is None:
@@ -1293,20 +1476,16 @@ class NodeSynonymizer:
                 results[curie] = None
                 uc_curie = curie.upper()
                 curie_map[uc_curie] = curie
-                uc_curie = re.sub(r"'","''",uc_curie)   # Replace embedded ' characters with ''
                 uc_curies.append(uc_curie)
-                batch_size += 1
-                if batch_size > 5000:
-                    batches.append( { 'batch_type': 'curies', 'batch_str': "','".join(uc_curies) } )
+                if len(uc_curies) > 5000:
+                    batches.append( { 'batch_type': 'curies', 'keys': uc_curies } )
                     uc_curies = []
-                    batch_size = 0
-            if batch_size > 0:
-                batches.append( { 'batch_type': 'curies', 'batch_str': "','".join(uc_curies) } )
+            if len(uc_curies) > 0:
+                batches.append( { 'batch_type': 'curies', 'keys': uc_curies } )
 
-        # Make sets of comma-separated list strings for the names
+        # Make batches of lower-cased names
         lc_names = []
         name_map = {}
-        batch_size = 0
         if names is not None:
             for name in names:
                 if name is None:
@@ -1314,46 +1493,42 @@ class NodeSynonymizer:
                 results[name] = None
                 lc_name = name.lower()
                 name_map[lc_name] = name
-                lc_name = re.sub(r"'","''",lc_name)   # Replace embedded ' characters with ''
                 lc_names.append(lc_name)
-                batch_size += 1
-                if batch_size > 5000:
-                    batches.append( { 'batch_type': 'names', 'batch_str': "','".join(lc_names) } )
+                if len(lc_names) > 5000:
+                    batches.append( { 'batch_type': 'names', 'keys': lc_names } )
                     lc_names = []
-                    batch_size = 0
-            if batch_size > 0:
-                batches.append( { 'batch_type': 'names', 'batch_str': "','".join(lc_names) } )
+            if len(lc_names) > 0:
+                batches.append( { 'batch_type': 'names', 'keys': lc_names } )
 
         # Search the curie table for the provided curie
         kg_prefix = 'kg2'
 
-        #i_batch = 0
+        # Each batch of keys is bound as a single JSON array parameter (rather than being pasted into the SQL), so the
+        # SQL text never changes and sqlite can reuse its prepared statements
+        connection = self.get_lookup_connection()
+        cursor = connection.cursor()
+
         for batch in batches:
-            #print(f"INFO: Batch {i_batch} of {batch['batch_type']}")
-            #i_batch += 1
             if batch['batch_type'] == 'curies':
                 if return_type == 'equivalent_nodes':
                     sql = f"""
                         SELECT C.curie,C.unique_concept_curie,N.curie,N.kg_presence
                           FROM {kg_prefix}_curie{TESTSUFFIX} AS C
                          INNER JOIN {kg_prefix}_node{TESTSUFFIX} AS N ON C.unique_concept_curie == N.unique_concept_curie
-                         WHERE C.uc_curie in ( '{batch['batch_str']}' )"""
+                         WHERE C.uc_curie IN ( SELECT value FROM json_each(?) )"""
                 else:
                     sql = f"""
                         SELECT C.curie,C.unique_concept_curie,U.kg2_best_curie,U.name,U.type
                           FROM {kg_prefix}_curie{TESTSUFFIX} AS C
                          INNER JOIN {kg_prefix}_unique_concept{TESTSUFFIX} AS U ON C.unique_concept_curie == U.uc_curie
-                         WHERE C.uc_curie in ( '{batch['batch_str']}' )"""
+                         WHERE C.uc_curie IN ( SELECT value FROM json_each(?) )"""
             else:
                 sql = f"""
                     SELECT S.name,S.unique_concept_curie,U.kg2_best_curie,U.name,U.type
                       FROM {kg_prefix}_synonym{TESTSUFFIX} AS S
                      INNER JOIN {kg_prefix}_unique_concept{TESTSUFFIX} AS U ON S.unique_concept_curie == U.uc_curie
-                     WHERE S.lc_name in ( '{batch['batch_str']}' )"""
-            #print(f"INFO: Processing {batch['batch_type']} batch: {batch['batch_str']}")
-            cursor = self.connection.cursor()
-            cursor.execute( sql )
-            rows = cursor.fetchall()
+                     WHERE S.lc_name IN ( SELECT value FROM json_each(?) )"""
+            rows = self._execute_lookup(cursor, sql, batch['keys'])
 
             # Loop through all rows, building the list
             batch_curie_map = {}
@@ -1398,21 +1573,12 @@ class NodeSynonymizer:
             # If all_types were requested, do another query for those
             if return_all_types:
 
-                # Create the SQL IN list
-                uc_curies_list = []
-                for uc_curie in batch_curie_map:
-                    uc_curie = re.sub(r"'","''",uc_curie)   # Replace embedded ' characters with ''
-                    uc_curies_list.append(uc_curie)
-                curies_list_str = "','".join(uc_curies_list)
-
                 # Get all the curies for these concepts and their types
                 sql = f"""
-                    SELECT curie,unique_concept_curie,type
-                      FROM {kg_prefix}_curie{TESTSUFFIX}
-                     WHERE unique_concept_curie IN ( '{curies_list_str}' )"""
-                cursor = self.connection.cursor()
-                cursor.execute( sql )
-                rows = cursor.fetchall()
+                    SELECT C.curie,C.unique_concept_curie,C.type
+                      FROM {kg_prefix}_curie{TESTSUFFIX} AS C
+                     WHERE C.unique_concept_curie IN ( SELECT value FROM json_each(?) )"""
+                rows = self._execute_lookup(cursor, sql, list(batch_curie_map))
 
                 entity_all_types = {}
                 for row in rows:
@@ -1441,6 +1607,37 @@ class NodeSynonymizer:
         return results
 
 
+    # ############################################################################################
+    # Return this thread's read-only connection for lookups, shared by all NodeSynonymizer instances.
+    # It is opened immutable and memory-mapped, and is reopened if the database file changes
+    def get_lookup_connection(self):
+
+        database_mtime = self.cache.database_mtime
+        lookup_state = self.lookup_state
+        if getattr(lookup_state, 'connection', None) is not None:
+            if lookup_state.database_mtime == database_mtime:
+                return lookup_state.connection
+            lookup_state.connection.close()
+            lookup_state.connection = None
+
+        if DEBUG is True:
+            print("INFO: Opening read-only lookup connection to database")
+        connection = sqlite3.connect(f"file:{self.databaseLocation}/{self.databaseName}?mode=ro&immutable=1", uri=True)
+        connection.execute(f"PRAGMA mmap_size = {self.lookup_mmap_size}")
+        lookup_state.connection = connection
+        lookup_state.database_mtime = database_mtime
+        return connection
+
+
+    # ############################################################################################
+    # Run the provided lookup with the list of keys bound to its json_each(?) parameter
+    @staticmethod
+    def _execute_lookup(cursor, sql, keys):
+
+        cursor.execute(sql, ( json.dumps(keys), ))
+        return cursor.fetchall()
+
+
     # ############################################################################################
     # Return results in the Node Normalizer format, either from SRI or KG1 or KG2
     def get_normalizer_results(self, entities=None, kg_name='SRI'):
@@ -1621,6 +1818,96 @@ class NodeSynonymizer:
         #    print('KG2:',row)
 
 
+# ################################################################################################
+# Read-only NodeSynonymizer that answers get_canonical_curies() and get_equivalent_nodes() from a snapshot written by
+# export_snapshot(). The snapshot is opened immutable and memory-mapped, so all worker processes on a host share one
+# copy of it in the OS page cache. The snapshot keeps only the columns those two methods need, so the other lookup
+# methods of NodeSynonymizer raise NotImplementedError
+class NodeSynonymizerSnapshot(NodeSynonymizer):
+
+    # The snapshot gets its own cache and connections, separate from those of the full database
+    cache = NodeSynonymizerCache()
+    lookup_state = threading.local()
+
+    # Constructor
+    def __init__(self, filename='node_synonymizer_snapshot.sqlite'):
+
+        self.snapshot_filename = filename
+        NodeSynonymizer.__init__(self)
+        if os.path.isabs(filename):
+            self.databaseLocation = os.path.dirname(filename)
+            self.databaseName = os.path.basename(filename)
+        else:
+            self.databaseName = filename
+
+
+    # ############################################################################################
+    # All queries go through the shared lookup connection; there is no per-instance connection to open
+    def connect(self):
+
+        return
+
+
+    # ############################################################################################
+    # A snapshot already holds only the tables a snapshot needs, so exporting one is a copy of this snapshot's file
+    def export_snapshot(self, filename='node_synonymizer_snapshot.sqlite'):
+
+        snapshot_path = filename if os.path.isabs(filename) else f"{self.databaseLocation}/{filename}"
+        source_path = f"{self.databaseLocation}/{self.databaseName}"
+        if os.path.exists(snapshot_path) and os.path.samefile(source_path, snapshot_path):
+            return snapshot_path
+        print(f"INFO: Copying NodeSynonymizer snapshot {source_path} to {snapshot_path}")
+
+        # Swap the copy into place in one step, so that running workers never see a partial file
+        temp_snapshot_path = f"{snapshot_path}.tmp"
+        shutil.copyfile(source_path, temp_snapshot_path)
+        os.replace(temp_snapshot_path, snapshot_path)
+        print(f"INFO: Wrote snapshot of {os.path.getsize(snapshot_path)} bytes to {snapshot_path}")
+        return snapshot_path
+
+
+    # ############################################################################################
+    # Lookups that need tables or columns a snapshot doesn't have
+    def _raise_unsupported(self, method_name):
+
+        raise NotImplementedError(f"NodeSynonymizerSnapshot ({self.databaseLocation}/{self.databaseName}) only supports get_canonical_curies() "
+                                  f"and get_equivalent_nodes(); use NodeSynonymizer() for {method_name}()")
+
+    def get_curies_and_types(self, name, kg_name='KG2'):
+        self._raise_unsupported('get_curies_and_types')
+
+    def get_curies_and_types_and_names(self, name, kg_name='KG2'):
+        self._raise_unsupported('get_curies_and_types_and_names')
+
+    def get_names(self, curie, kg_name='KG2'):
+        self._raise_unsupported('get_names')
+
+    def get_curies(self, name, kg_name='KG2'):
+        self._raise_unsupported('get_curies')
+
+    def is_curie_present(self, curie, kg_name='KG2'):
+        self._raise_unsupported('is_curie_present')
+
+    def get_KG1_curies(self, name):
+        self._raise_unsupported('get_KG1_curies')
+
+    def convert_curie(self, curie, namespace):
+        self._raise_unsupported('convert_curie')
+
+    def get_normalizer_results(self, entities=None, kg_name='SRI'):
+        # The SRI results come from the SRI node normalizer, not from the database
+        if kg_name == 'SRI':
+            return NodeSynonymizer.get_normalizer_results(self, entities, kg_name)
+        self._raise_unsupported('get_normalizer_results')
+
+    def get_total_entity_count(self, node_type, kg_name='KG1'):
+        self._raise_unsupported('get_total_entity_count')
+
+    def test_select(self):
+        self._raise_unsupported('test_select')
+
+
+
 # ############################################################################################
 def run_example_1():
     synonymizer = NodeSynonymizer()
@@ -1882,14 +2169,21 @@ def main():
                         help="If set perform the test query and return", default=None)
     parser.add_argument('-g', '--get', action="store",
                         help="Get nodes for the specified list in the specified kg_name", default=None)
+    parser.add_argument('-x', '--export_snapshot', action="store",
+                        help="Write a compact read-only snapshot of the lookup tables to the specified file (e.g. node_synonymizer_snapshot.sqlite)", default=None)
     args = parser.parse_args()
 
-    if not args.build and not args.test and not args.recollate and not args.lookup and not args.query and not args.get:
+    if not args.build and not args.test and not args.recollate and not args.lookup and not args.query and not args.get and not args.export_snapshot:
         parser.print_help()
         sys.exit(2)
 
     synonymizer = NodeSynonymizer()
 
+    # If the user asks to export a snapshot of the lookup tables, do it
+    if args.export_snapshot:
+        synonymizer.export_snapshot(args.export_snapshot)
+        return
+
     # If the user asks to perform the SELECT statement, do it
     if args.query:
         synonymizer.test_select()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+""" Compares the disk footprint and load time of the response store (compact, compressed envelopes with deduplicated
+knowledge graph payloads) against the plain indented JSON files responses used to be stored as. By default it uses
+synthetic responses whose knowledge graphs are drawn from a shared pool of nodes and edges (as responses to similar
+queries are); with --legacy_dir it uses copies of existing plain <response_id>.json files instead.
+Usage: python benchmark_response_store.py [--responses 20] [--nodes 5000] [--edges 20000] [--pool_fraction 0.5] [--legacy_dir DIR]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import timeit
+
+from response_store import ResponseStore, PAYLOAD_DATABASE_FILENAME
+
+
+def _create_synthetic_envelopes(num_responses: int, num_nodes: int, num_edges: int, pool_fraction: float, seed: int):
+    rng = random.Random(seed)
+    pool_size = int(num_nodes / pool_fraction)
+    node_pool = {f"CHEMBL.COMPOUND:CHEMBL{index}": {"name": f"compound {index}", "category": ["biolink:ChemicalSubstance"],
+                                                    "attributes": [{"name": "synonym", "type": "biolink:synonym",
+                                                                    "value": [f"synonym {index}-{i}" for i in range(5)]}]}
+                 for index in range(pool_size)}
+    node_keys = list(node_pool)
+    for response_index in range(num_responses):
+        response_node_keys = rng.sample(node_keys, num_nodes)
+        edges = dict()
+        for edge_index in range(num_edges):
+            subject_key, object_key = rng.sample(response_node_keys, 2)
+            edges[f"e{edge_index}"] = {"subject": subject_key, "object": object_key, "predicate": "biolink:related_to",
+                                       "attributes": [{"name": "provided_by", "type": "EDAM:data_0971", "value": "ARAX/KG2"},
+                                                      {"name": "publications", "type": "biolink:publications",
+                                                       "value": [f"PMID:{rng.randrange(99991)}" for _ in range(3)]}]}
+        results = [{"node_bindings": {"n00": [{"id": edges[f"e{result_index}"]["subject"]}],
+                                      "n01": [{"id": edges[f"e{result_index}"]["object"]}]},
+                    "edge_bindings": {"e00": [{"id": f"e{result_index}"}]}, "confidence": rng.random()}
+                   for result_index in range(min(num_edges, 500))]
+        yield str(response_index + 1), {"description": "synthetic", "status": "Success", "logs": [],
+                                        "message": {"query_graph": {"nodes": {"n00": {}, "n01": {}}, "edges": {"e00": {"subject": "n00", "object": "n01"}}},
+                                                    "knowledge_graph": {"nodes": {key: node_pool[key] for key in response_node_keys}, "edges": edges},
+                                                    "results": results}}
+
+
+def _get_directory_size(directory: str) -> int:
+    return sum(os.path.getsize(f"{directory}/{filename}") for filename in os.listdir(directory))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmarks the compressed, content-addressed response store against plain JSON files")
+    arg_parser.add_argument("--responses", dest="num_responses", type=int, default=20)
+    arg_parser.add_argument("--nodes", dest="num_nodes", type=int, default=5000, help="Number of KG nodes per synthetic response")
+    arg_parser.add_argument("--edges", dest="num_edges", type=int, default=20000, help="Number of KG edges per synthetic response")
+    arg_parser.add_argument("--pool_fraction", dest="pool_fraction", type=float, default=0.5,
+                            help="Fraction of the shared node pool each synthetic response draws its nodes from")
+    arg_parser.add_argument("--legacy_dir", dest="legacy_dir", type=str, default=None,
+                            help="Directory of existing plain <response_id>.json files to use instead of synthetic responses")
+    arg_parser.add_argument("--seed", dest="seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        legacy_dir = f"{temp_dir}/legacy"
+        store_dir = f"{temp_dir}/store"
+        os.makedirs(legacy_dir)
+        if args.legacy_dir:
+            response_ids = ResponseStore(args.legacy_dir).get_legacy_response_ids()
+            for response_id in response_ids:
+                shutil.copy(f"{args.legacy_dir}/{response_id}.json", legacy_dir)
+        else:
+            response_ids = []
+            for response_id, envelope in _create_synthetic_envelopes(args.num_responses, args.num_nodes, args.num_edges,
+                                                                     args.pool_fraction, args.seed):
+                with open(f"{legacy_dir}/{response_id}.json", 'w') as outfile:
+                    json.dump(envelope, outfile, sort_keys=True, indent=2)
+                response_ids.append(response_id)
+
+        response_store = ResponseStore(store_dir)
+        legacy_store = ResponseStore(legacy_dir)
+        write_times = []
+        for response_id in response_ids:
+            envelope = legacy_store.read_response(response_id)
+            t0 = timeit.default_timer()
+            response_store.write_response(response_id, envelope)
+            write_times.append(timeit.default_timer() - t0)
+
+        legacy_load_times, store_load_times, stream_times = [], [], []
+        for response_id in response_ids:
+            t0 = timeit.default_timer()
+            legacy_envelope = legacy_store.read_response(response_id)
+            legacy_load_times.append(timeit.default_timer() - t0)
+            t0 = timeit.default_timer()
+            stored_envelope = response_store.read_response(response_id)
+            store_load_times.append(timeit.default_timer() - t0)
+            t0 = timeit.default_timer()
+            for _ in response_store.stream_response(response_id):
+                pass
+            stream_times.append(timeit.default_timer() - t0)
+            if stored_envelope != legacy_envelope:
+                print(f"ERROR: response {response_id} does not read back identically")
+
+        legacy_size = _get_directory_size(legacy_dir)
+        store_size = _get_directory_size(store_dir)
+        payload_size = os.path.getsize(f"{store_dir}/{PAYLOAD_DATABASE_FILENAME}")
+        print(f"{len(response_ids)} responses")
+        print(f"plain JSON:     {round(legacy_size / 1024 / 1024, 1)} MB on disk, median load {round(statistics.median(legacy_load_times), 3)} s")
+        print(f"response store: {round(store_size / 1024 / 1024, 1)} MB on disk ({round(payload_size / 1024 / 1024, 1)} MB of it shared payloads), "
+              f"median load {round(statistics.median(store_load_times), 3)} s, median stream {round(statistics.median(stream_times), 3)} s, "
+              f"median write {round(statistics.median(write_times), 3)} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,14 +20,16 @@ from sqlalchemy import Column, ForeignKey, Integer, Float, String, DateTime, Tex
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy import desc
 from sqlalchemy import inspect
+from sqlalchemy import func
 
 from reasoner_validator import validate_Response, ValidationError
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../..")
 from RTXConfiguration import RTXConfiguration
+from response_store import ResponseStore
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
 from openapi_server.models.response import Response as Envelope
@@ -46,6 +48,15 @@ class Response(Base):
     message = Column(Text, nullable=False)
     n_results = Column(Integer, nullable=False)
 
+class CachedQuery(Base):
+    __tablename__ = 'cached_query'
+    query_hash = Column(String(64), primary_key=True)
+    response_id = Column(Integer, nullable=False)
+    tool_version = Column(String(50), nullable=False)
+    cached_datetime = Column(DateTime, nullable=False)
+    last_hit_datetime = Column(DateTime, nullable=True)
+    n_hits = Column(Integer, nullable=False)
+
 
 #### The main ResponseCache class
 class ResponseCache:
@@ -57,6 +68,7 @@ class ResponseCache:
         self.engine_type = 'sqlite'
         if self.rtxConfig.is_production_server:
             self.engine_type = 'mysql'
+        self.response_store = ResponseStore()
         self.connect()
 
     #### Destructor
@@ -130,8 +142,9 @@ class ResponseCache:
             database_path = os.path.dirname(os.path.abspath(__file__)) + '/' + self.databaseName + '.sqlite'
             engine = create_engine("sqlite:///"+database_path)
 
+        # Each thread gets its own session, so one ResponseCache can be shared by all the threads of a server process
         DBSession = sessionmaker(bind=engine)
-        session = DBSession()
+        session = scoped_session(DBSession)
         self.session = session
         self.engine = engine
 
@@ -140,6 +153,10 @@ class ResponseCache:
             print(f"WARNING: {self.engine_type} tables do not exist; creating them")
             Base.metadata.create_all(engine)
 
+        #### The cached query table was added later, so it may be missing from an existing database
+        elif not engine.dialect.has_table(engine, CachedQuery.__tablename__):
+            CachedQuery.__table__.create(engine)
+
 
     ##################################################################################################
     #### Create and store a database connection
@@ -180,22 +197,11 @@ class ResponseCache:
         envelope.id = f"https://{servername}/api/arax/v1.0/response/{stored_response.response_id}"
 
         #### Instead of storing the large response object in the MySQL database as a blob
-        #### now store it as a JSON file on the filesystem
-        response_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'
-        if not os.path.exists(response_dir):
-            try:
-                os.mkdir(response_dir)
-            except:
-                eprint(f"ERROR: Unable to create dir {response_dir}")
-
-        if os.path.exists(response_dir):
-            response_filename = f"{stored_response.response_id}.json"
-            response_path = f"{response_dir}/{response_filename}"
-            try:
-                with open(response_path, 'w') as outfile:
-                    json.dump(envelope.to_dict(), outfile, sort_keys=True, indent=2)
-            except:
-                eprint(f"ERROR: Unable to write response to file {response_path}")
+        #### now store it on the filesystem, compressed and with knowledge graph payloads deduplicated across responses
+        try:
+            self.response_store.write_response(stored_response.response_id, envelope.to_dict())
+        except:
+            eprint(f"ERROR: Unable to write response {stored_response.response_id} to {self.response_store.response_dir}")
 
         return stored_response.response_id
 
@@ -216,15 +222,11 @@ class ResponseCache:
             #### Find the response
             stored_response = session.query(Response).filter(Response.response_id==int(response_id)).first()
             if stored_response is not None:
-                response_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'
-                response_filename = f"{stored_response.response_id}.json"
-                response_path = f"{response_dir}/{response_filename}"
                 try:
-                    with open(response_path) as infile:
-                        return json.load(infile)
+                    return self.response_store.read_response(stored_response.response_id)
                 except:
-                    eprint(f"ERROR: Unable to read response from file '{response_path}'")
-                    return
+                    eprint(f"ERROR: Unable to read response {stored_response.response_id} from {self.response_store.response_dir}")
+                    return( { "status": 500, "title": "Response unreadable", "detail": "Unable to read the stored response for response_id="+str(response_id), "type": "about:blank" }, 500)
 
             else:
                 return( { "status": 404, "title": "Response not found", "detail": "There is no response corresponding to response_id="+str(response_id), "type": "about:blank" }, 404)
@@ -323,6 +325,60 @@ class ResponseCache:
         return( { "status": 404, "title": "UnrecognizedResponse_idFormat", "detail": "Unrecognized response_id format", "type": "about:blank" }, 404)
 
 
+    ##################################################################################################
+    #### Return the response_id stored for a query hash, or None if there isn't one younger than max_age_seconds.
+    #### Expired entries are removed
+    def get_cached_query_response_id(self, query_hash, max_age_seconds):
+        session = self.session
+        cached_query = session.query(CachedQuery).filter(CachedQuery.query_hash==query_hash).first()
+        if cached_query is None:
+            return
+        now = datetime.now()
+        if (now - cached_query.cached_datetime).total_seconds() > max_age_seconds:
+            session.delete(cached_query)
+            session.commit()
+            return
+        cached_query.last_hit_datetime = now
+        cached_query.n_hits += 1
+        session.commit()
+        return cached_query.response_id
+
+
+    ##################################################################################################
+    #### Remember which stored response answers a query hash, then drop the least recently used entries beyond max_entries
+    def add_cached_query(self, query_hash, response_id, max_entries):
+        session = self.session
+        now = datetime.now()
+        session.merge(CachedQuery(query_hash=query_hash, response_id=response_id, tool_version=self.rtxConfig.version,
+            cached_datetime=now, last_hit_datetime=None, n_hits=0))
+        session.commit()
+
+        n_cached_queries = session.query(CachedQuery).count()
+        if n_cached_queries > max_entries:
+            last_used = func.coalesce(CachedQuery.last_hit_datetime, CachedQuery.cached_datetime)
+            least_recently_used = session.query(CachedQuery.query_hash).order_by(last_used).limit(n_cached_queries - max_entries).all()
+            session.query(CachedQuery).filter(CachedQuery.query_hash.in_([row[0] for row in least_recently_used])).delete(synchronize_session=False)
+            session.commit()
+
+
+    ##################################################################################################
+    #### Fetch a locally cached response as a generator of JSON text chunks (or None if it isn't available that way),
+    #### so that large responses can be sent without being loaded and re-serialized as a whole. A response that can't be
+    #### read in full is never streamed, since that would only show once the response has started with a 200 status
+    def get_response_stream(self, response_id):
+        response_id = str(response_id)
+        if not re.match(r'\d+\s*$',response_id):
+            return
+        stored_response = self.session.query(Response).filter(Response.response_id==int(response_id)).first()
+        if stored_response is None:
+            return
+        try:
+            return self.response_store.stream_response(stored_response.response_id)
+        except:
+            eprint(f"ERROR: Unable to stream response {stored_response.response_id} from {self.response_store.response_dir}")
+            return
+
+
 ############################################ Main ############################################################
 
 #### If this class is run from the command line, perform a short little test to see if it is working correctly
@@ -0,0 +1,490 @@
+#!/usr/bin/python3
+# On-disk storage of cached TRAPI responses: compact, compressed JSON envelopes whose knowledge graph node and edge
+# payloads are stored once, by content hash, in a shared payload table
+import sys
+def eprint(*args, **kwargs): print(*args, file=sys.stderr, **kwargs)
+
+import os
+import json
+import gzip
+import zlib
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+RESPONSE_STORE_FORMAT_VERSION = 1
+DEFAULT_RESPONSE_DIR = os.path.dirname(os.path.abspath(__file__)) + '/../../../data/responses_1_0'
+PAYLOAD_DATABASE_FILENAME = 'payloads.sqlite'
+COMPRESSION_DICTIONARY_SIZE = 4096  # Larger dictionaries barely compress better but are much slower to decompress with
+SQLITE_BATCH_SIZE = 500
+STREAM_CHUNK_SIZE = 65536
+
+# Stand-ins for the knowledge graph's nodes and edges when serializing the rest of an envelope for streaming
+NODES_PLACEHOLDER = '__response_store_kg_nodes__'
+EDGES_PLACEHOLDER = '__response_store_kg_edges__'
+
+
+class ResponseStore:
+    """
+    Stores each response envelope as <response_id>.json.zst (or .json.gz when the zstandard package isn't installed)
+    under the response directory. The stored envelope is compact JSON without its knowledge graph nodes and edges;
+    instead it lists the content hash of each node/edge payload, and the payloads themselves live (zlib-compressed
+    against a shared preset dictionary) in a SQLite table keyed by that hash, so an identical node or edge shared by
+    many responses is only stored once. A reference table records which payloads each response uses, so that payloads
+    no response uses any more are removed when responses are deleted (see delete_response() and collect_garbage()).
+    Responses written by older code as plain <response_id>.json files can still be read (see migrate_response()).
+    """
+
+    def __init__(self, response_dir: str = DEFAULT_RESPONSE_DIR):
+        self.response_dir = response_dir
+        self._thread_state = threading.local()  # Each thread uses its own connection to the payload database
+        self._dictionaries: Dict[int, bytes] = dict()
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        return getattr(self._thread_state, 'connection', None)
+
+    @_connection.setter
+    def _connection(self, connection: Optional[sqlite3.Connection]):
+        self._thread_state.connection = connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    ##################################################################################################
+    #### Store an envelope (as a dict) under the given response_id, returning the path of the written file
+    def write_response(self, response_id, envelope: dict) -> str:
+        os.makedirs(self.response_dir, exist_ok=True)
+        skeleton, node_refs, edge_refs, payloads = self._split_envelope(envelope)
+        self._store_payloads(response_id, payloads)
+        stored_envelope = {'response_store_format': RESPONSE_STORE_FORMAT_VERSION,
+                           'knowledge_graph_node_refs': node_refs,
+                           'knowledge_graph_edge_refs': edge_refs,
+                           'envelope': skeleton}
+        response_path = self._get_compressed_response_path(response_id, self._get_default_codec())
+        temporary_path = response_path + '.tmp'
+        with self._open_for_writing(temporary_path) as outfile:
+            outfile.write(_dump_compact_json(stored_envelope).encode('utf-8'))
+        os.replace(temporary_path, response_path)
+        return response_path
+
+    ##################################################################################################
+    #### Return whether there is a stored envelope (in any format) for the given response_id
+    def has_response(self, response_id) -> bool:
+        return self._find_response_path(response_id) is not None
+
+    ##################################################################################################
+    #### Read back the envelope for the given response_id as a dict, or None if there isn't one
+    def read_response(self, response_id) -> Optional[dict]:
+        response_path = self._find_response_path(response_id)
+        if response_path is None:
+            return None
+        if response_path.endswith('.json'):
+            with open(response_path) as infile:
+                return json.load(infile)
+        # Parsing the reassembled text in one go is much faster than parsing each payload and building the dict up
+        return _loads(''.join(self._generate_stored_envelope_json(self._read_stored_envelope(response_path))))
+
+    ##################################################################################################
+    #### Generate the envelope for the given response_id as chunks of JSON text, without ever holding the whole
+    #### serialized envelope in memory; returns None if there isn't one. Raises a KeyError right away (rather than
+    #### partway through the stream) if any of its knowledge graph payloads is missing
+    def stream_response(self, response_id, chunk_size: int = STREAM_CHUNK_SIZE) -> Optional[Iterator[str]]:
+        response_path = self._find_response_path(response_id)
+        if response_path is None:
+            return None
+        if response_path.endswith('.json'):
+            return _generate_file_chunks(response_path, chunk_size)
+        stored_envelope = self._read_stored_envelope(response_path)
+        self._check_payloads_exist(_get_payload_hashes(stored_envelope))
+        return _generate_buffered_chunks(self._generate_stored_envelope_json(stored_envelope), chunk_size)
+
+    ##################################################################################################
+    #### Rewrite a response stored as plain <response_id>.json in the current format. Returns the new path, or None
+    #### if there was no legacy file to migrate. Raises a ValueError (keeping the legacy file) if the new copy does not
+    #### read back identically
+    def migrate_response(self, response_id, remove_legacy_file: bool = False) -> Optional[str]:
+        legacy_path = self._get_legacy_response_path(response_id)
+        if not os.path.exists(legacy_path):
+            return None
+        with open(legacy_path) as infile:
+            envelope = json.load(infile)
+        response_path = self.write_response(response_id, envelope)
+        if self.read_response(response_id) != envelope:
+            self.delete_response(response_id, remove_legacy_file=False)
+            raise ValueError(f"Migrated response_id {response_id} does not read back identically; keeping {legacy_path}")
+        if remove_legacy_file:
+            os.remove(legacy_path)
+        return response_path
+
+    ##################################################################################################
+    #### Delete the stored envelope(s) for the given response_id, and the payloads no other response uses. Returns
+    #### whether there was anything to delete
+    def delete_response(self, response_id, remove_legacy_file: bool = True) -> bool:
+        response_paths = [self._get_compressed_response_path(response_id, codec) for codec in ('zst', 'gz')]
+        if remove_legacy_file:
+            response_paths.append(self._get_legacy_response_path(response_id))
+        was_deleted = False
+        for response_path in response_paths:
+            if os.path.exists(response_path):
+                os.remove(response_path)
+                was_deleted = True
+        if os.path.exists(f"{self.response_dir}/{PAYLOAD_DATABASE_FILENAME}"):
+            self._remove_payload_refs([str(response_id)])
+        return was_deleted
+
+    ##################################################################################################
+    #### Remove the payload references of responses whose files have been deleted (e.g. by hand), and the payloads
+    #### no stored response uses any more. Returns the number of payloads removed
+    def collect_garbage(self) -> int:
+        connection = self._get_connection()
+        referencing_response_ids = [row[0] for row in connection.execute("SELECT DISTINCT response_id FROM payload_ref")]
+        deleted_response_ids = [response_id for response_id in referencing_response_ids
+                                if not any(os.path.exists(self._get_compressed_response_path(response_id, codec)) for codec in ('zst', 'gz'))]
+        num_removed = self._remove_payload_refs(deleted_response_ids)
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            num_removed += connection.execute("DELETE FROM payload WHERE NOT EXISTS "
+                                              "(SELECT 1 FROM payload_ref WHERE payload_ref.hash = payload.hash)").rowcount
+        return num_removed
+
+    ##################################################################################################
+    #### List the response_ids that are still stored as plain <response_id>.json files
+    def get_legacy_response_ids(self) -> List[str]:
+        if not os.path.isdir(self.response_dir):
+            return []
+        return sorted((filename[:-len('.json')] for filename in os.listdir(self.response_dir)
+                       if filename.endswith('.json')), key=lambda response_id: (len(response_id), response_id))
+
+    @staticmethod
+    def _split_envelope(envelope: dict) -> Tuple[dict, Optional[Dict[str, str]], Optional[Dict[str, str]], Dict[str, str]]:
+        skeleton = dict(envelope)
+        refs_by_component = {'nodes': None, 'edges': None}
+        payloads = dict()
+        knowledge_graph = _get_knowledge_graph(skeleton)
+        if knowledge_graph is not None:
+            knowledge_graph = dict(knowledge_graph)
+            for component in refs_by_component:
+                component_payloads = knowledge_graph.pop(component, None)
+                if component_payloads is None:
+                    continue
+                refs = dict()
+                for key, payload in component_payloads.items():
+                    payload_json = _dump_compact_json(payload)
+                    payload_hash = hashlib.blake2b(payload_json.encode('utf-8'), digest_size=16).hexdigest()
+                    refs[key] = payload_hash
+                    payloads[payload_hash] = payload_json
+                refs_by_component[component] = refs
+            skeleton['message'] = dict(skeleton['message'], knowledge_graph=knowledge_graph)
+        return skeleton, refs_by_component['nodes'], refs_by_component['edges'], payloads
+
+    def _read_stored_envelope(self, response_path: str) -> dict:
+        with self._open_for_reading(response_path) as infile:
+            return json.load(infile)
+
+    def _generate_stored_envelope_json(self, stored_envelope: dict) -> Iterator[str]:
+        skeleton = stored_envelope['envelope']
+        node_refs = stored_envelope['knowledge_graph_node_refs']
+        edge_refs = stored_envelope['knowledge_graph_edge_refs']
+        knowledge_graph = _get_knowledge_graph(skeleton)
+        if knowledge_graph is None:
+            yield _dump_compact_json(skeleton)
+            return
+
+        # Serialize everything except the nodes and edges, then splice those in (payloads are stored as JSON text)
+        knowledge_graph['nodes'] = NODES_PLACEHOLDER
+        knowledge_graph['edges'] = EDGES_PLACEHOLDER
+        skeleton_json = _dump_compact_json(skeleton)
+        before_nodes, after_nodes = skeleton_json.split(json.dumps(NODES_PLACEHOLDER), 1)
+        if json.dumps(EDGES_PLACEHOLDER) in before_nodes:
+            before_edges, between = before_nodes.split(json.dumps(EDGES_PLACEHOLDER), 1)
+            yield before_edges
+            yield from self._generate_kg_component_json(edge_refs)
+            yield between
+            yield from self._generate_kg_component_json(node_refs)
+            yield after_nodes
+        else:
+            between, after_edges = after_nodes.split(json.dumps(EDGES_PLACEHOLDER), 1)
+            yield before_nodes
+            yield from self._generate_kg_component_json(node_refs)
+            yield between
+            yield from self._generate_kg_component_json(edge_refs)
+            yield after_edges
+
+    def _generate_kg_component_json(self, refs: Optional[Dict[str, str]]) -> Iterator[str]:
+        if refs is None:
+            yield 'null'
+            return
+        yield '{'
+        is_first = True
+        keys = sorted(refs)
+        for batch_start in range(0, len(keys), SQLITE_BATCH_SIZE):
+            batch_keys = keys[batch_start:batch_start + SQLITE_BATCH_SIZE]
+            payloads = self._fetch_payloads({refs[key] for key in batch_keys})
+            for key in batch_keys:
+                yield ('' if is_first else ',') + json.dumps(key) + ':' + payloads[refs[key]]
+                is_first = False
+        yield '}'
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(self.response_dir, exist_ok=True)
+            self._connection = sqlite3.connect(f"{self.response_dir}/{PAYLOAD_DATABASE_FILENAME}", timeout=60)
+            with self._connection:
+                self._connection.execute("BEGIN IMMEDIATE")
+                self._connection.execute("CREATE TABLE IF NOT EXISTS payload (hash TEXT PRIMARY KEY, dictionary_id INTEGER, "
+                                         "data BLOB NOT NULL) WITHOUT ROWID")
+                self._connection.execute("CREATE TABLE IF NOT EXISTS compression_dictionary (dictionary_id INTEGER PRIMARY KEY, "
+                                         "data BLOB NOT NULL)")
+                has_payload_refs = self._connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'payload_ref'").fetchone()
+                if not has_payload_refs:
+                    self._connection.execute("CREATE TABLE payload_ref (response_id TEXT, hash TEXT, PRIMARY KEY (response_id, hash)) WITHOUT ROWID")
+                    self._connection.execute("CREATE INDEX idx_payload_ref_hash ON payload_ref(hash)")
+                    self._add_refs_of_stored_responses()
+        return self._connection
+
+    def _add_refs_of_stored_responses(self):
+        # Stores written before the payload_ref table existed have payloads but no references to them, so record the
+        # references of every response already stored before anything relies on them
+        for filename in os.listdir(self.response_dir):
+            for codec in ('zst', 'gz'):
+                if filename.endswith(f".json.{codec}"):
+                    response_id = filename[:-len(f".json.{codec}")]
+                    try:
+                        payload_hashes = _get_payload_hashes(self._read_stored_envelope(f"{self.response_dir}/{filename}"))
+                    except Exception as error:
+                        eprint(f"WARNING: Unable to read the payload references of {filename}: {error}")
+                        continue
+                    self._connection.executemany("INSERT OR IGNORE INTO payload_ref (response_id, hash) VALUES (?,?)",
+                                                 [(response_id, payload_hash) for payload_hash in payload_hashes])
+
+    def _remove_payload_refs(self, response_ids: List[str]) -> int:
+        # Drop the references of these responses, and any payload they used that no other response uses
+        connection = self._get_connection()
+        num_removed = 0
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            for response_id in response_ids:
+                payload_hashes = [row[0] for row in connection.execute("SELECT hash FROM payload_ref WHERE response_id = ?", (response_id,))]
+                connection.execute("DELETE FROM payload_ref WHERE response_id = ?", (response_id,))
+                for batch_start in range(0, len(payload_hashes), SQLITE_BATCH_SIZE):
+                    batch_hashes = payload_hashes[batch_start:batch_start + SQLITE_BATCH_SIZE]
+                    num_removed += connection.execute(
+                        f"DELETE FROM payload WHERE hash IN ({','.join('?' * len(batch_hashes))}) AND NOT EXISTS "
+                        f"(SELECT 1 FROM payload_ref WHERE payload_ref.hash = payload.hash)", batch_hashes).rowcount
+        return num_removed
+
+    def _get_compression_dictionary(self, dictionary_id: int) -> bytes:
+        dictionary = self._dictionaries.get(dictionary_id)
+        if dictionary is None:
+            dictionary = self._get_connection().execute("SELECT data FROM compression_dictionary WHERE dictionary_id = ?",
+                                                        (dictionary_id,)).fetchone()[0]
+            self._dictionaries[dictionary_id] = dictionary
+        return dictionary
+
+    def _get_or_create_compression_dictionary(self, payloads: Dict[str, str]) -> Tuple[int, bytes]:
+        # Individual node/edge payloads are too small to compress well on their own, but they share most of their
+        # structure (keys, attribute names and types, ...), so they're compressed against a preset dictionary made of
+        # sample payloads, built from the first response written to the store
+        connection = self._get_connection()
+        row = connection.execute("SELECT dictionary_id, data FROM compression_dictionary ORDER BY dictionary_id DESC LIMIT 1").fetchone()
+        if row is None:
+            samples = list(payloads.values())
+            sample_step = max(1, sum(len(sample) for sample in samples) // COMPRESSION_DICTIONARY_SIZE)
+            dictionary = ''.join(samples[::sample_step]).encode('utf-8')[-COMPRESSION_DICTIONARY_SIZE:]
+            with connection:
+                dictionary_id = connection.execute("INSERT INTO compression_dictionary (data) VALUES (?)", (dictionary,)).lastrowid
+            row = (dictionary_id, dictionary)
+        self._dictionaries[row[0]] = row[1]
+        return row
+
+    def _store_payloads(self, response_id, payloads: Dict[str, str]):
+        if not payloads:
+            return
+        connection = self._get_connection()
+        dictionary_id, dictionary = self._get_or_create_compression_dictionary(payloads)
+        payload_hashes = list(payloads)
+        with connection:
+            # Take the write lock before looking for existing payloads, so none can be removed before our references to
+            # them are recorded
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany("INSERT OR IGNORE INTO payload_ref (response_id, hash) VALUES (?,?)",
+                                   [(str(response_id), payload_hash) for payload_hash in payload_hashes])
+            for batch_start in range(0, len(payload_hashes), SQLITE_BATCH_SIZE):
+                batch_hashes = payload_hashes[batch_start:batch_start + SQLITE_BATCH_SIZE]
+                existing_hashes = {row[0] for row in connection.execute(
+                    f"SELECT hash FROM payload WHERE hash IN ({','.join('?' * len(batch_hashes))})", batch_hashes)}
+                rows = []
+                for payload_hash in batch_hashes:
+                    if payload_hash not in existing_hashes:
+                        data = payloads[payload_hash].encode('utf-8')
+                        compressor = zlib.compressobj(level=6, zdict=dictionary)
+                        compressed_data = compressor.compress(data) + compressor.flush()
+                        if len(compressed_data) < len(data):
+                            rows.append((payload_hash, dictionary_id, compressed_data))
+                        else:
+                            rows.append((payload_hash, None, data))
+                connection.executemany("INSERT OR IGNORE INTO payload (hash, dictionary_id, data) VALUES (?,?,?)", rows)
+
+    def _check_payloads_exist(self, payload_hashes: Iterable[str]):
+        payload_hashes = list(payload_hashes)
+        connection = self._get_connection()
+        num_missing = 0
+        for batch_start in range(0, len(payload_hashes), SQLITE_BATCH_SIZE):
+            batch_hashes = payload_hashes[batch_start:batch_start + SQLITE_BATCH_SIZE]
+            existing_hashes = {row[0] for row in connection.execute(
+                f"SELECT hash FROM payload WHERE hash IN ({','.join('?' * len(batch_hashes))})", batch_hashes)}
+            num_missing += len(set(batch_hashes) - existing_hashes)
+        if num_missing:
+            raise KeyError(f"Response store is missing {num_missing} knowledge graph payloads")
+
+    def _fetch_payloads(self, payload_hashes: Iterable[str]) -> Dict[str, str]:
+        payload_hashes = list(payload_hashes)
+        rows = self._get_connection().execute(
+            f"SELECT hash, dictionary_id, data FROM payload WHERE hash IN ({','.join('?' * len(payload_hashes))})", payload_hashes)
+        payloads = dict()
+        for payload_hash, dictionary_id, data in rows:
+            if dictionary_id is not None:
+                data = zlib.decompressobj(zdict=self._get_compression_dictionary(dictionary_id)).decompress(data)
+            payloads[payload_hash] = data.decode('utf-8')
+        missing_hashes = set(payload_hashes) - set(payloads)
+        if missing_hashes:
+            raise KeyError(f"Response store is missing {len(missing_hashes)} knowledge graph payloads, e.g. {sorted(missing_hashes)[0]}")
+        return payloads
+
+    @staticmethod
+    def _get_default_codec() -> str:
+        return 'zst' if zstandard is not None else 'gz'
+
+    def _get_compressed_response_path(self, response_id, codec: str) -> str:
+        return f"{self.response_dir}/{response_id}.json.{codec}"
+
+    def _get_legacy_response_path(self, response_id) -> str:
+        return f"{self.response_dir}/{response_id}.json"
+
+    def _find_response_path(self, response_id) -> Optional[str]:
+        for response_path in [self._get_compressed_response_path(response_id, 'zst'),
+                              self._get_compressed_response_path(response_id, 'gz'),
+                              self._get_legacy_response_path(response_id)]:
+            if os.path.exists(response_path):
+                return response_path
+        return None
+
+    @staticmethod
+    def _open_for_writing(response_path: str):
+        if response_path.endswith('.zst.tmp'):
+            return zstandard.ZstdCompressor(level=6).stream_writer(open(response_path, 'wb'), closefd=True)
+        return gzip.open(response_path, 'wb', compresslevel=6)
+
+    @staticmethod
+    def _open_for_reading(response_path: str):
+        if response_path.endswith('.zst'):
+            if zstandard is None:
+                raise ImportError(f"The zstandard package is needed to read {response_path}")
+            return zstandard.ZstdDecompressor().stream_reader(open(response_path, 'rb'), closefd=True)
+        return gzip.open(response_path, 'rb')
+
+
+def _get_knowledge_graph(envelope: dict) -> Optional[dict]:
+    message = envelope.get('message')
+    knowledge_graph = message.get('knowledge_graph') if isinstance(message, dict) else None
+    return knowledge_graph if isinstance(knowledge_graph, dict) else None
+
+
+def _get_payload_hashes(stored_envelope: dict) -> List[str]:
+    payload_hashes = set()
+    for refs in (stored_envelope['knowledge_graph_node_refs'], stored_envelope['knowledge_graph_edge_refs']):
+        if refs is not None:
+            payload_hashes.update(refs.values())
+    return sorted(payload_hashes)
+
+
+def _loads(text: str):
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def _dump_compact_json(obj) -> str:
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'))
+
+
+def _generate_file_chunks(path: str, chunk_size: int) -> Iterator[str]:
+    with open(path) as infile:
+        while True:
+            chunk = infile.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _generate_buffered_chunks(pieces: Iterator[str], chunk_size: int) -> Iterator[str]:
+    buffer = []
+    buffer_size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffer_size += len(piece)
+        if buffer_size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            buffer_size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+############################################ Main ############################################################
+
+#### Migrate responses stored as plain <response_id>.json files to the compressed, deduplicated format
+def main():
+    import argparse
+    argparser = argparse.ArgumentParser(description='Migrates cached responses stored as plain JSON files to the compressed, '
+                                                    'content-addressed response store')
+    argparser.add_argument('--response_dir', type=str, default=DEFAULT_RESPONSE_DIR, help='Directory holding the stored responses')
+    argparser.add_argument('--remove_legacy_files', action='store_true', help='Delete each plain JSON file once it has been migrated and verified')
+    argparser.add_argument('--collect_garbage', action='store_true', help='Instead of migrating, remove the knowledge graph payloads that no stored response uses any more')
+    argparser.add_argument('response_id', type=str, nargs='*', help='Response ids to migrate (default: all plain JSON responses)')
+    params = argparser.parse_args()
+
+    response_store = ResponseStore(params.response_dir)
+    if params.collect_garbage:
+        print(f"Removed {response_store.collect_garbage()} unused knowledge graph payloads from {PAYLOAD_DATABASE_FILENAME}")
+        return
+    response_ids = params.response_id if params.response_id else response_store.get_legacy_response_ids()
+    legacy_bytes = 0
+    migrated_bytes = 0
+    n_migrated = 0
+    for response_id in response_ids:
+        legacy_path = response_store._get_legacy_response_path(response_id)
+        if not os.path.exists(legacy_path):
+            eprint(f"WARNING: There is no plain JSON file for response_id {response_id}")
+            continue
+        legacy_size = os.path.getsize(legacy_path)
+        try:
+            response_path = response_store.migrate_response(response_id, remove_legacy_file=params.remove_legacy_files)
+        except Exception as error:
+            eprint(f"ERROR: Unable to migrate response_id {response_id}: {error}")
+            continue
+        legacy_bytes += legacy_size
+        migrated_bytes += os.path.getsize(response_path)
+        n_migrated += 1
+
+    print(f"Migrated {n_migrated} of {len(response_ids)} responses: {legacy_bytes} bytes of plain JSON now take {migrated_bytes} bytes "
+          f"(plus shared knowledge graph payloads in {PAYLOAD_DATABASE_FILENAME})")
+
+
+if __name__ == "__main__": main()
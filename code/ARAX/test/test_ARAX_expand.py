@@ -19,6 +19,8 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/py
 from openapi_server.models.edge import Edge
 from openapi_server.models.node import Node
 from openapi_server.models.query_graph import QueryGraph
+from openapi_server.models.q_edge import QEdge
+from openapi_server.models.q_node import QNode
 
 
 def _run_query_and_do_standard_testing(actions_list: List[str], kg_should_be_incomplete=False, debug=False,
@@ -862,5 +864,92 @@ def test_issue_1212():
     nodes_by_qg_id, edges_by_qg_id = _run_query_and_do_standard_testing(actions_list, kg_should_be_incomplete=True)
 
 
+@pytest.mark.slow
+def test_multiple_kps_in_one_expand():
+    # KPs listed together are queried concurrently and their answers merged
+    actions_list = [
+        "add_qnode(id=CHEMBL.COMPOUND:CHEMBL112, key=n00)",
+        "add_qnode(category=biolink:Protein, key=n01)",
+        "add_qedge(subject=n00, object=n01, key=e00)",
+        "expand(kp=[ARAX/KG2, BTE], kp_timeout=300)",
+        "return(message=true, store=false)"
+    ]
+    nodes_by_qg_id, edges_by_qg_id = _run_query_and_do_standard_testing(actions_list)
+    assert any(edge_key.startswith("KG2") for edge_key in edges_by_qg_id['e00'])
+    assert any(not edge_key.startswith("KG2") for edge_key in edges_by_qg_id['e00'])
+
+
+def test_concurrent_kps_with_timeout_and_failure(monkeypatch):
+    # Three stubbed KPs answer e00 at once: one answers, one fails and one hangs past the timeout; their logs must
+    # be streamed as they are written, the failed KP's log kept, and the hung KP ignored once it has timed out
+    import queue
+    import threading
+    import Expand.general_querier
+    import Expand.molepro_querier
+    import Expand.genetics_querier
+    from ARAX_expander import ARAXExpander
+    events = {name: threading.Event() for name in ["a_started", "b_started", "c_released", "c_done"]}
+
+    class AnsweringQuerier:
+        def __init__(self, log, kp_name=None):
+            self.log = log
+
+        def answer_one_hop_query(self, query_graph):
+            self.log.info("A1")
+            events["a_started"].set()
+            events["b_started"].wait(10)
+            self.log.info("A2")
+            answer_kg = eu.QGOrganizedKnowledgeGraph()
+            answer_kg.add_node("CHEMBL.COMPOUND:CHEMBL112", Node(name="acetaminophen"), "n00")
+            answer_kg.add_node("UniProtKB:P23219", Node(name="PTGS1"), "n01")
+            answer_kg.add_edge("A:1", Edge(subject="CHEMBL.COMPOUND:CHEMBL112", object="UniProtKB:P23219"), "e00")
+            return answer_kg, {"A:1": {"n00": "CHEMBL.COMPOUND:CHEMBL112", "n01": "UniProtKB:P23219"}}
+
+    class FailingQuerier(AnsweringQuerier):
+        def answer_one_hop_query(self, query_graph):
+            events["a_started"].wait(10)
+            self.log.info("B1")
+            events["b_started"].set()
+            raise ValueError("KP B is down")
+
+    class HangingQuerier(AnsweringQuerier):
+        def answer_one_hop_query(self, query_graph):
+            self.log.info("C1")
+            events["c_released"].wait(10)
+            self.log.info("C late")
+            events["c_done"].set()
+            return eu.QGOrganizedKnowledgeGraph(), dict()
+
+    monkeypatch.setattr(Expand.general_querier, "GeneralQuerier", AnsweringQuerier)
+    monkeypatch.setattr(Expand.molepro_querier, "MoleProQuerier", FailingQuerier)
+    monkeypatch.setattr(Expand.genetics_querier, "GeneticsQuerier", HangingQuerier)
+
+    query_graph = QueryGraph(nodes={"n00": QNode(id="CHEMBL.COMPOUND:CHEMBL112"), "n01": QNode(category=["biolink:Protein"])},
+                             edges={"e00": QEdge(subject="n00", object="n01")})
+    log = ARAXResponse()
+    log.message_queue = queue.Queue()
+    answers_by_qedge = ARAXExpander()._expand_edges_concurrently(["e00"], ["ARAX/KG2", "MolePro", "GeneticsKP"],
+                                                                 eu.QGOrganizedKnowledgeGraph(), False, query_graph,
+                                                                 False, "ARAX", 1, log)
+    assert log.status == 'OK'
+    assert [list(answer_kg.edges_by_qg_id["e00"]) for answer_kg, _ in answers_by_qedge["e00"]] == [["A:1"]]
+    logged = [message["message"] for message in log.messages]
+    assert any("KP B is down" in message for message in logged)
+    assert any("did not answer qedge e00 within" in message for message in logged)
+    assert sum(1 for message in logged if message.startswith("Skipping")) == 2
+
+    # Messages reached the stream as they were logged (interleaved), each one once
+    events["c_released"].set()
+    assert events["c_done"].wait(10)
+    streamed = []
+    while not log.message_queue.empty():
+        streamed.append(log.message_queue.get_nowait()["message"])
+    kp_messages = [message for message in streamed if message in {"A1", "A2", "B1", "C1", "C late"}]
+    assert kp_messages.index("A1") < kp_messages.index("B1") < kp_messages.index("A2")
+    assert sorted(kp_messages) == ["A1", "A2", "B1", "C1"]
+    assert "C late" not in logged
+    assert len(streamed) == len(log.messages)
+
+
 if __name__ == "__main__":
     pytest.main(['-v', 'test_ARAX_expand.py'])
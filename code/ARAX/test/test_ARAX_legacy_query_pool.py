@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_ARAX_legacy_query_pool.py
+
+import os
+import sys
+import textwrap
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+from ARAX_response import ARAXResponse
+from ARAX_legacy_query_pool import ARAXLegacyQueryPool, get_solution_scripts
+
+# A QuestionAnswering area with the same layout as reasoningtool/QuestionAnswering, whose solution script answers
+# without a database and reports how many times it and its dependency were run in this process
+QUESTION_ANSWERING_FILES = {
+    "Questions.tsv": "#known query type ID\trestated question\tcorpus\ttypes\tsolution script\tadditional parameters\n"
+                     "Q1\tWhat is $term\t['what is']\t['term']\tQSolution.py -i '$term' -j\t{}\n"
+                     "Q2\tWhat is not $term\t['what is not']\t['term']\tQSolution.py -i '$term' --garbage\t{}\n"
+                     "Q3\tWhat is missing\t['what is missing']\t[]\tMissingSolution.py\t{}\n"
+                     "Q4\tWhat never ends\t['what never ends']\t[]\tSleepSolution.py\t{}\n",
+    "ParseQuestion.py": """
+        import os
+        import string
+        class ParseQuestion:
+            def get_execution_string(self, query_type_id, parameters):
+                scripts = {line.split('\\t')[0]: line.split('\\t')[4] for line in open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Questions.tsv')) if not line.startswith('#')}
+                if query_type_id not in scripts:
+                    raise Exception("Unknown query type id: %s" % query_type_id)
+                return string.Template(scripts[query_type_id]).safe_substitute(parameters)
+        """,
+    "QDependency.py": """
+        import os
+        n_imports = int(os.environ.get('N_DEPENDENCY_IMPORTS', 0)) + 1
+        os.environ['N_DEPENDENCY_IMPORTS'] = str(n_imports)
+        """,
+    "QSolution.py": """
+        import argparse
+        import json
+        import QDependency
+        n_runs = 0
+        def main():
+            global n_runs
+            n_runs += 1
+            parser = argparse.ArgumentParser()
+            parser.add_argument('-i', type=str)
+            parser.add_argument('-j', action='store_true')
+            parser.add_argument('--garbage', action='store_true')
+            args = parser.parse_args()
+            if args.garbage:
+                print('not json')
+                return
+            # the key of the second qnode tells how many times main() ran in this copy of the script
+            print(json.dumps({'results': [], 'query_graph': {'nodes': {'n0': {'id': [args.i]}, 'run%d' % n_runs: {}}, 'edges': {}},
+                              'knowledge_graph': {'nodes': {}, 'edges': {}}}))
+        if __name__ == "__main__":
+            main()
+        """,
+    "SleepSolution.py": """
+        import time
+        if __name__ == "__main__":
+            time.sleep(3600)
+        """,
+}
+
+
+@pytest.fixture(scope="module")
+def question_answering_dir(tmp_path_factory):
+    question_answering_dir = tmp_path_factory.mktemp("QuestionAnswering")
+    for file_name, content in QUESTION_ANSWERING_FILES.items():
+        (question_answering_dir / file_name).write_text(textwrap.dedent(content))
+    return str(question_answering_dir)
+
+
+@pytest.fixture(scope="module")
+def pool(question_answering_dir):
+    pool = ARAXLegacyQueryPool(num_workers=1, question_answering_dir=question_answering_dir, timeout=60)
+    assert pool.wait_until_ready(timeout=60)
+    yield pool
+    pool.close()
+
+
+def test_get_solution_scripts(question_answering_dir):
+    # MissingSolution.py is not in the directory
+    assert get_solution_scripts(question_answering_dir) == ["QSolution.py", "SleepSolution.py"]
+
+
+def test_answer(pool, question_answering_dir):
+    cwd = os.getcwd()
+    answers = []
+    for term in ["metformin", "type 2 diabetes"]:
+        response = ARAXResponse()
+        message = pool.answer("Q1", {"term": term}, response)
+        assert response.status == 'OK'
+        assert message.query_graph.nodes['n0'].id == [term]
+        answers.append(message)
+    # The script runs as a new __main__ for every question, in the QuestionAnswering area, but its imports are loaded once
+    # and the server's CWD doesn't change
+    assert [sorted(message.query_graph.nodes) for message in answers] == [['n0', 'run1'], ['n0', 'run1']]
+    assert os.getcwd() == cwd
+    assert os.path.realpath(pool.workers.apply(os.getcwd)) == os.path.realpath(question_answering_dir)
+    assert pool.workers.apply(os.getenv, ('N_DEPENDENCY_IMPORTS',)) == '1'
+    assert 'N_DEPENDENCY_IMPORTS' not in os.environ
+
+
+def test_answer_errors(pool):
+    response = ARAXResponse()
+    assert pool.answer("Q2", {"term": "metformin"}, response) is None
+    assert response.error_code == "InternalError551"
+    assert "not json" in response.message
+
+    response = ARAXResponse()
+    assert pool.answer("Q99", {}, response) is None
+    assert response.error_code == "UnsupportedQueryTypeID"
+
+
+def test_timeout_then_recover(question_answering_dir):
+    pool = ARAXLegacyQueryPool(num_workers=1, question_answering_dir=question_answering_dir, timeout=2)
+    try:
+        assert pool.wait_until_ready(timeout=60)
+        worker_pid = pool.workers.apply(os.getpid)
+        response = ARAXResponse()
+        assert pool.answer("Q4", {}, response) is None
+        assert response.error_code == "LegacyQueryTimeout"
+
+        # The hung worker was killed and replaced, so the next question gets an answer
+        response = ARAXResponse()
+        message = pool.answer("Q1", {"term": "metformin"}, response)
+        assert response.status == 'OK'
+        assert message.query_graph.nodes['n0'].id == ["metformin"]
+        assert pool.workers.apply(os.getpid) != worker_pid
+    finally:
+        pool.close()
+
+
+def test_answer_in_subprocess(question_answering_dir):
+    pool = ARAXLegacyQueryPool(num_workers=0, question_answering_dir=question_answering_dir)
+    response = ARAXResponse()
+    message = pool.answer("Q1", {"term": "metformin"}, response)
+    assert response.status == 'OK'
+    assert message.query_graph.nodes['n0'].id == ["metformin"]
+
+    response = ARAXResponse()
+    assert pool.answer("Q2", {"term": "metformin"}, response) is None
+    assert response.error_code == "InternalError551"
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_ARAX_legacy_query_pool.py'])
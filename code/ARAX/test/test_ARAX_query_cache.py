@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_ARAX_query_cache.py
+
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+import ARAX_query_cache
+from ARAX_query_cache import ARAXQueryCache
+from ARAX_response import ARAXResponse
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ResponseCache")
+from response_cache import ResponseCache, CachedQuery, Base
+
+
+class _SynonymizerWithTwoDiabetesCuries:
+    n_instances = 0
+
+    def __init__(self):
+        _SynonymizerWithTwoDiabetesCuries.n_instances += 1
+
+    def get_canonical_curies(self, curies=None):
+        return {curie: {'preferred_curie': 'MONDO:0005148'} if curie in {'DOID:9352', 'MONDO:0005148'} else None
+                for curie in curies}
+
+
+class _InMemoryResponseCache:
+    def __init__(self):
+        self.cached_queries = dict()
+        self.envelopes = dict()
+
+    def get_cached_query_response_id(self, query_hash, max_age_seconds):
+        if query_hash not in self.cached_queries:
+            return None
+        response_id, cached_datetime = self.cached_queries[query_hash]
+        if (datetime.now() - cached_datetime).total_seconds() > max_age_seconds:
+            del self.cached_queries[query_hash]
+            return None
+        return response_id
+
+    def add_cached_query(self, query_hash, response_id, max_entries):
+        self.cached_queries[query_hash] = (response_id, datetime.now())
+
+    def get_response(self, response_id):
+        return self.envelopes.get(response_id)
+
+
+@pytest.fixture
+def query_cache(monkeypatch):
+    monkeypatch.setattr(ARAX_query_cache, 'NodeSynonymizer', _SynonymizerWithTwoDiabetesCuries)
+    monkeypatch.setattr(ARAX_query_cache, '_node_synonymizer', None)
+    rtx_config = SimpleNamespace(version='ARAX test', live='KG2', neo4j_bolt='bolt://localhost:7687', neo4j_database='kg2')
+    return ARAXQueryCache(_InMemoryResponseCache(), rtx_config)
+
+
+def _create_query(curie='DOID:9352', actions=None) -> dict:
+    query = {'message': {'query_graph': {'nodes': {'n00': {'id': curie, 'category': 'biolink:Disease'},
+                                                   'n01': {'category': ['biolink:ChemicalSubstance']}},
+                                         'edges': {'e00': {'subject': 'n01', 'object': 'n00'}}}}}
+    if actions is not None:
+        query['operations'] = {'actions': actions}
+    return query
+
+
+@pytest.fixture
+def sqlite_response_cache(tmp_path):
+    response_cache = ResponseCache.__new__(ResponseCache)
+    response_cache.rtxConfig = SimpleNamespace(version='ARAX test')
+    response_cache.engine = create_engine(f"sqlite:///{tmp_path}/ResponseCache.sqlite")
+    Base.metadata.create_all(response_cache.engine)
+    response_cache.session = scoped_session(sessionmaker(bind=response_cache.engine))
+    yield response_cache
+    response_cache.disconnect()
+
+
+def test_equivalent_queries_share_a_key(query_cache):
+    response = ARAXResponse()
+    n_instances = _SynonymizerWithTwoDiabetesCuries.n_instances
+    key = query_cache.get_query_key(_create_query(), response)
+    assert key is not None
+    assert query_cache.get_query_key(_create_query(curie='MONDO:0005148'), response) == key
+    assert query_cache.get_query_key(_create_query(curie=['DOID:9352']), response) == key
+    # One NodeSynonymizer serves every query
+    assert _SynonymizerWithTwoDiabetesCuries.n_instances == n_instances + 1
+
+    actions = ["expand(kp=ARAX/KG2, edge_key=e00)", "resultify()", "return(message=true, store=true)"]
+    messy_actions = ["# expand first", "  expand( kp=ARAX/KG2 ,edge_key=e00 )", "", "resultify()", "return(message=true,store=true)"]
+    assert query_cache.get_query_key(_create_query(actions=actions), response) == \
+        query_cache.get_query_key(_create_query(actions=messy_actions), response)
+
+
+def test_different_queries_get_different_keys(query_cache):
+    response = ARAXResponse()
+    key = query_cache.get_query_key(_create_query(), response)
+    assert query_cache.get_query_key(_create_query(curie='MONDO:0004975'), response) != key
+    assert query_cache.get_query_key(_create_query(actions=["expand()", "resultify()"]), response) != key
+    assert query_cache.get_query_key(_create_query(), response, mode='RTXKG2') != key
+    query_cache.rtx_config.version = 'ARAX next'
+    assert query_cache.get_query_key(_create_query(), response) != key
+
+
+@pytest.mark.parametrize("query", [
+    {'operations': {'message_uris': ['https://arax.ncats.io/api/arax/v1.0/response/1'], 'actions': ['resultify()']}},
+    {'operations': {'actions': ['fetch_message(uri=https://arax.ncats.io/api/arax/v1.0/response/1)', 'resultify()']}},
+    {'message': {'query_graph': {'nodes': {}, 'edges': {}}, 'knowledge_graph': {'nodes': {'X:1': {}}, 'edges': {}}}},
+    {'query_type_id': 'Q0', 'terms': {'term': 'lovastatin'}},
+])
+def test_queries_depending_on_other_inputs_are_not_cached(query_cache, query):
+    assert query_cache.get_query_key(query, ARAXResponse()) is None
+
+
+def test_lookup_store_and_stats(query_cache):
+    response = ARAXResponse()
+    stats_before = ARAXQueryCache.get_stats()
+    key = query_cache.get_query_key(_create_query(), response)
+    assert query_cache.get_cached_envelope(key, response) is None
+    envelope = {'message': {'results': []}, 'status': 'OK'}
+    query_cache.response_cache.envelopes[12] = envelope
+    query_cache.store(key, 12, response)
+    assert query_cache.get_cached_envelope(key, response) == envelope
+
+    # Entries older than the TTL are no longer served
+    query_cache.response_cache.cached_queries[key] = (12, datetime.now() - timedelta(seconds=query_cache.ttl + 1))
+    assert query_cache.get_cached_envelope(key, response) is None
+
+    stats = ARAXQueryCache.get_stats()
+    assert stats['lookups'] - stats_before['lookups'] == 3
+    assert stats['hits'] - stats_before['hits'] == 1
+    assert stats['misses'] - stats_before['misses'] == 2
+    assert stats['stores'] - stats_before['stores'] == 1
+    assert 0.0 < stats['hit_rate'] <= 1.0
+
+
+def test_sqlite_cached_query_lookup(sqlite_response_cache):
+    assert sqlite_response_cache.get_cached_query_response_id('a' * 64, 60) is None
+    sqlite_response_cache.add_cached_query('a' * 64, 5, 10)
+    assert sqlite_response_cache.get_cached_query_response_id('a' * 64, 60) == 5
+    assert sqlite_response_cache.get_cached_query_response_id('a' * 64, 60) == 5
+    cached_query = sqlite_response_cache.session.query(CachedQuery).filter(CachedQuery.query_hash == 'a' * 64).one()
+    assert cached_query.n_hits == 2
+    assert cached_query.tool_version == 'ARAX test'
+
+    # An entry older than max_age_seconds is not served, and is removed
+    cached_query.cached_datetime = datetime.now() - timedelta(seconds=120)
+    sqlite_response_cache.session.commit()
+    assert sqlite_response_cache.get_cached_query_response_id('a' * 64, 60) is None
+    assert sqlite_response_cache.session.query(CachedQuery).count() == 0
+
+
+def test_sqlite_cached_query_lru_eviction(sqlite_response_cache):
+    session = sqlite_response_cache.session
+    sqlite_response_cache.add_cached_query('1' * 64, 1, 2)
+    sqlite_response_cache.add_cached_query('2' * 64, 2, 2)
+    for query_hash, hours_ago in [('1' * 64, 3), ('2' * 64, 2)]:
+        session.query(CachedQuery).filter(CachedQuery.query_hash == query_hash).one().cached_datetime = datetime.now() - timedelta(hours=hours_ago)
+    session.commit()
+    # The older entry was used since, so it is the newer, unused one that goes when a third is added
+    assert sqlite_response_cache.get_cached_query_response_id('1' * 64, 24 * 3600) == 1
+    sqlite_response_cache.add_cached_query('3' * 64, 3, 2)
+    assert sorted(row[0][0] for row in session.query(CachedQuery.query_hash).all()) == ['1', '3']
+    assert sqlite_response_cache.get_cached_query_response_id('2' * 64, 24 * 3600) is None
+    assert sqlite_response_cache.get_cached_query_response_id('3' * 64, 24 * 3600) == 3
+
+    # Storing an answer to a query that is already cached replaces its entry
+    sqlite_response_cache.add_cached_query('3' * 64, 4, 2)
+    assert session.query(CachedQuery).count() == 2
+    assert sqlite_response_cache.get_cached_query_response_id('3' * 64, 24 * 3600) == 4
+
+
+def test_query_cache_with_sqlite_response_cache(query_cache, sqlite_response_cache, monkeypatch):
+    envelope = {'message': {'results': []}, 'status': 'OK'}
+    monkeypatch.setattr(sqlite_response_cache, 'get_response', lambda response_id: envelope if response_id == 12 else None)
+    query_cache.response_cache = sqlite_response_cache
+    response = ARAXResponse()
+    key = query_cache.get_query_key(_create_query(), response)
+    assert query_cache.get_cached_envelope(key, response) is None
+    query_cache.store(key, 12, response)
+    assert query_cache.get_cached_envelope(key, response) == envelope
+    assert query_cache.get_cached_envelope(query_cache.get_query_key(_create_query(curie='MONDO:0005148'), response), response) == envelope
+    assert response.status == 'OK'
+
+
+def test_responses_missing_a_kp_are_not_cached(query_cache, sqlite_response_cache, monkeypatch):
+    # The query succeeds when one of two KPs times out, but its answer is only partial, so it must not be served from
+    # the cache to the next identical query
+    import threading
+    import Expand.expand_utilities as eu
+    import Expand.general_querier
+    import Expand.genetics_querier
+    from ARAX_expander import ARAXExpander
+    from openapi_server.models.edge import Edge
+    from openapi_server.models.node import Node
+    from openapi_server.models.query_graph import QueryGraph
+    from openapi_server.models.q_edge import QEdge
+    from openapi_server.models.q_node import QNode
+    kp_is_down = threading.Event()
+    kp_is_down.set()
+    released = threading.Event()
+
+    class _AnsweringQuerier:
+        def __init__(self, log, kp_name=None):
+            self.log = log
+
+        def answer_one_hop_query(self, query_graph):
+            answer_kg = eu.QGOrganizedKnowledgeGraph()
+            answer_kg.add_node("MONDO:0005148", Node(name="type 2 diabetes"), "n00")
+            answer_kg.add_node("CHEBI:6801", Node(name="metformin"), "n01")
+            answer_kg.add_edge("A:1", Edge(subject="CHEBI:6801", object="MONDO:0005148"), "e00")
+            return answer_kg, {"A:1": {"n00": "MONDO:0005148", "n01": "CHEBI:6801"}}
+
+    class _SometimesHangingQuerier(_AnsweringQuerier):
+        def answer_one_hop_query(self, query_graph):
+            if kp_is_down.is_set():
+                released.wait(10)
+            return _AnsweringQuerier.answer_one_hop_query(self, query_graph)
+
+    monkeypatch.setattr(Expand.general_querier, "GeneralQuerier", _AnsweringQuerier)
+    monkeypatch.setattr(Expand.genetics_querier, "GeneticsQuerier", _SometimesHangingQuerier)
+    envelopes = {1: {'message': {'results': ['partial']}}, 2: {'message': {'results': ['complete']}}}
+    monkeypatch.setattr(sqlite_response_cache, 'get_response', envelopes.get)
+    query_cache.response_cache = sqlite_response_cache
+    stats_before = ARAXQueryCache.get_stats()
+
+    def answer_query(response_id):
+        # What ARAXQuery.query() does on a cache miss: expand, then store the response if the query succeeded
+        response = ARAXResponse()
+        key = query_cache.get_query_key(_create_query(), response)
+        cached_envelope = query_cache.get_cached_envelope(key, response)
+        if cached_envelope is not None:
+            return cached_envelope
+        query_graph = QueryGraph(nodes={"n00": QNode(id="MONDO:0005148"), "n01": QNode(category=["biolink:ChemicalSubstance"])},
+                                 edges={"e00": QEdge(subject="n01", object="n00")})
+        ARAXExpander()._expand_edges_concurrently(["e00"], ["ARAX/KG2", "GeneticsKP"], eu.QGOrganizedKnowledgeGraph(), False,
+                                                  query_graph, False, "ARAX", 0.5, response)
+        if response.status == 'OK':
+            query_cache.store(key, response_id, response)
+        return envelopes[response_id]
+
+    try:
+        assert answer_query(1) == envelopes[1]
+        # The KP is back: the same query is answered anew, and that complete answer is what gets cached
+        kp_is_down.clear()
+        assert answer_query(2) == envelopes[2]
+        assert answer_query(3) == envelopes[2]
+    finally:
+        released.set()
+    stats = ARAXQueryCache.get_stats()
+    assert stats['degraded'] - stats_before['degraded'] == 1
+    assert stats['stores'] - stats_before['stores'] == 1
+    assert stats['hits'] - stats_before['hits'] == 1
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_ARAX_query_cache.py'])
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_ARAX_ranker.py
+
+import math
+import os
+import random
+import sys
+from typing import List, Dict, Tuple
+
+import networkx as nx
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+from ARAX_response import ARAXResponse
+import ARAX_ranker
+from ARAX_ranker import ARAXRanker
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from openapi_server.models.attribute import Attribute
+from openapi_server.models.edge import Edge
+from openapi_server.models.edge_binding import EdgeBinding
+from openapi_server.models.knowledge_graph import KnowledgeGraph
+from openapi_server.models.message import Message
+from openapi_server.models.node import Node
+from openapi_server.models.node_binding import NodeBinding
+from openapi_server.models.q_edge import QEdge
+from openapi_server.models.q_node import QNode
+from openapi_server.models.query_graph import QueryGraph
+from openapi_server.models.response import Response
+from openapi_server.models.result import Result
+
+
+# The functions below reproduce the ranker's previous per-result networkx scoring (one MultiDiGraph per result), which
+# the batched scoring in ARAX_ranker is checked against
+def _reference_result_graphs(kg_edge_id_to_edge: Dict[str, Edge], qg_nx: nx.MultiDiGraph, results: List[Result]) -> List[nx.MultiDiGraph]:
+    result_graphs_nx = []
+    for result in results:
+        res_graph = qg_nx.copy()
+        qg_edge_key_to_edge_tuple = {edge_tuple[2]: edge_tuple for edge_tuple in qg_nx.edges(keys=True, data=True)}
+        for edge_binding_list in result.edge_bindings.values():
+            for edge_binding in edge_binding_list:
+                kg_edge = kg_edge_id_to_edge[edge_binding.id]
+                for qedge_key in kg_edge.qedge_keys:
+                    qedge_tuple = qg_edge_key_to_edge_tuple[qedge_key]
+                    res_graph[qedge_tuple[0]][qedge_tuple[1]][qedge_key]['weight'] = kg_edge.confidence
+        result_graphs_nx.append(res_graph)
+    return result_graphs_nx
+
+
+def _reference_pairs_with_max_path_len(result_graph_nx: nx.MultiDiGraph) -> Tuple[int, List[Tuple[str, str]]]:
+    apsp_dict = dict(nx.algorithms.shortest_paths.unweighted.all_pairs_shortest_path_length(result_graph_nx))
+    path_len_with_pairs_list = [(node_i, node_j, path_len) for node_i, node_i_dict in apsp_dict.items() for node_j, path_len in node_i_dict.items()]
+    max_path_len = max(item[2] for item in path_len_with_pairs_list)
+    return max_path_len, [item[0:2] for item in path_len_with_pairs_list if item[2] == max_path_len]
+
+
+def _reference_max_flow_scores(result_graphs_nx: List[nx.MultiDiGraph]) -> List[float]:
+    max_flow_values = []
+    for result_graph_nx in result_graphs_nx:
+        if len(result_graph_nx) > 1:
+            _, pairs_with_max_path_len = _reference_pairs_with_max_path_len(result_graph_nx)
+            result_graph_collapsed_nx = ARAX_ranker._collapse_nx_multigraph_to_weighted_graph(result_graph_nx)
+            max_flow_values_for_node_pairs = [nx.algorithms.flow.maximum_flow_value(result_graph_collapsed_nx, source, target, capacity="weight")
+                                              for source, target in pairs_with_max_path_len]
+            max_flow_values.append(sum(max_flow_values_for_node_pairs)/float(len(max_flow_values_for_node_pairs)))
+        else:
+            max_flow_values.append(1.0)
+    return max_flow_values
+
+
+def _reference_longest_path_scores(result_graphs_nx: List[nx.MultiDiGraph]) -> List[float]:
+    result_scores = []
+    for result_graph_nx in result_graphs_nx:
+        max_path_len, pairs_with_max_path_len = _reference_pairs_with_max_path_len(result_graph_nx)
+        map_node_name_to_index = {node_id: node_index for node_index, node_id in enumerate(result_graph_nx.nodes)}
+        adj_matrix = nx.to_numpy_array(result_graph_nx)
+        adj_matrix_power = np.linalg.matrix_power(adj_matrix, max_path_len)/math.factorial(max_path_len)
+        result_scores.append(np.mean([adj_matrix_power[map_node_name_to_index[node_i], map_node_name_to_index[node_j]]
+                                      for node_i, node_j in pairs_with_max_path_len]))
+    return result_scores
+
+
+def _reference_frobenius_norm_scores(result_graphs_nx: List[nx.MultiDiGraph]) -> List[float]:
+    return [np.linalg.norm(nx.to_numpy_array(result_graph_nx), ord='fro') for result_graph_nx in result_graphs_nx]
+
+
+def _create_message(qg: QueryGraph, num_kg_nodes_per_qnode: int, num_results: int, seed: int) -> Message:
+    rng = random.Random(seed)
+    nodes = dict()
+    for qnode_key in qg.nodes:
+        for node_index in range(num_kg_nodes_per_qnode):
+            node = Node(name=f"{qnode_key}-{node_index}", category=["biolink:NamedThing"])
+            node.qnode_keys = [qnode_key]
+            nodes[f"{qnode_key}:{node_index}"] = node
+    edges = dict()
+    edge_keys_by_qedge_key = {qedge_key: [] for qedge_key in qg.edges}
+    for qedge_key, qedge in qg.edges.items():
+        for edge_index in range(num_kg_nodes_per_qnode * 2):
+            attributes = [Attribute(name="probability_treats", value=rng.random()),
+                          Attribute(name="normalized_google_distance", value=rng.random())]
+            if rng.random() < 0.2:
+                attributes.append(Attribute(name="confidence", value=rng.random()))
+            edge = Edge(subject=f"{qedge.subject}:{rng.randrange(num_kg_nodes_per_qnode)}",
+                        object=f"{qedge.object}:{rng.randrange(num_kg_nodes_per_qnode)}",
+                        predicate="biolink:related_to", attributes=attributes)
+            edge.qedge_keys = [qedge_key]
+            edge_key = f"{qedge_key}-{edge_index}"
+            edges[edge_key] = edge
+            edge_keys_by_qedge_key[qedge_key].append(edge_key)
+    results = []
+    for result_index in range(num_results):
+        edge_bindings = {qedge_key: [EdgeBinding(id=edge_key) for edge_key in rng.sample(edge_keys, rng.randint(1, 3))]
+                         for qedge_key, edge_keys in edge_keys_by_qedge_key.items()}
+        node_bindings = {qnode_key: [NodeBinding(id=f"{qnode_key}:0")] for qnode_key in qg.nodes}
+        results.append(Result(node_bindings=node_bindings, edge_bindings=edge_bindings, essence=f"result {result_index}"))
+    return Message(query_graph=qg, knowledge_graph=KnowledgeGraph(nodes=nodes, edges=edges), results=results)
+
+
+QUERY_GRAPHS = {
+    "one_hop": QueryGraph(nodes={"n00": QNode(), "n01": QNode()},
+                          edges={"e00": QEdge(subject="n00", object="n01")}),
+    "two_hop": QueryGraph(nodes={"n00": QNode(), "n01": QNode(is_set=True), "n02": QNode()},
+                          edges={"e00": QEdge(subject="n00", object="n01"),
+                                 "e01": QEdge(subject="n01", object="n02")}),
+    "branched_with_parallel_qedges": QueryGraph(nodes={"n00": QNode(), "n01": QNode(), "n02": QNode(), "n03": QNode()},
+                                                edges={"e00": QEdge(subject="n00", object="n01"),
+                                                       "e01": QEdge(subject="n01", object="n02"),
+                                                       "e02": QEdge(subject="n00", object="n02"),
+                                                       "e03": QEdge(subject="n02", object="n03"),
+                                                       "e04": QEdge(subject="n02", object="n03")}),
+}
+
+
+@pytest.mark.parametrize("qg_name", list(QUERY_GRAPHS))
+def test_batched_scores_match_networkx_scores(qg_name: str):
+    message = _create_message(QUERY_GRAPHS[qg_name], num_kg_nodes_per_qnode=5, num_results=60, seed=len(qg_name))
+    response = ARAXResponse()
+    response.envelope = Response(message=message)
+    ARAXRanker().aggregate_scores_dmk(response)
+    assert response.status == 'OK'
+
+    # Recompute each score the old way, using the edge confidences the ranker just assigned
+    kg_edge_id_to_edge = message.knowledge_graph.edges
+    qg_nx = ARAX_ranker._get_query_graph_networkx_from_query_graph(message.query_graph)
+    result_graphs_nx = _reference_result_graphs(kg_edge_id_to_edge, qg_nx, message.results)
+    kg_edge_id_to_confidence = {edge_key: edge.confidence for edge_key, edge in kg_edge_id_to_edge.items()}
+    kg_edge_id_to_qedge_keys = {edge_key: edge.qedge_keys for edge_key, edge in kg_edge_id_to_edge.items()}
+    edge_weights = ARAX_ranker._get_result_edge_weights(kg_edge_id_to_confidence, kg_edge_id_to_qedge_keys, qg_nx, message.results)
+    adjacency_tensor = ARAX_ranker._get_weighted_adjacency_tensor(edge_weights, qg_nx)
+    max_path_len, pairs_with_max_path_len = ARAX_ranker._get_node_pairs_with_max_path_length(qg_nx)
+
+    assert ARAX_ranker._score_weighted_adjacency_tensor_by_max_flow(adjacency_tensor, pairs_with_max_path_len) == \
+        pytest.approx(_reference_max_flow_scores(result_graphs_nx))
+    assert ARAX_ranker._score_weighted_adjacency_tensor_by_longest_path(adjacency_tensor, max_path_len, pairs_with_max_path_len) == \
+        pytest.approx(_reference_longest_path_scores(result_graphs_nx))
+    assert ARAX_ranker._score_weighted_adjacency_tensor_by_frobenius_norm(adjacency_tensor) == \
+        pytest.approx(_reference_frobenius_norm_scores(result_graphs_nx))
+
+    # And check the final result confidences
+    ranks_list = [ARAX_ranker._quantile_rank_list(scores) for scores in [_reference_max_flow_scores(result_graphs_nx),
+                                                                        _reference_longest_path_scores(result_graphs_nx),
+                                                                        _reference_frobenius_norm_scores(result_graphs_nx)]]
+    expected_confidences = sum(ranks_list)/float(len(ranks_list))
+    for result, expected_confidence in zip(message.results, expected_confidences):
+        if expected_confidence < 0.001:
+            expected_confidence += 0.001
+        assert result.confidence == pytest.approx(expected_confidence)
+
+
+def test_max_flow_cut_enumeration_matches_networkx():
+    rng = np.random.default_rng(0)
+    num_nodes = 6
+    adjacency_tensor = rng.random((40, num_nodes, num_nodes)) * (rng.random((40, num_nodes, num_nodes)) < 0.5)
+    for source_index, target_index in [(0, 5), (2, 1), (4, 0)]:
+        assert ARAX_ranker._get_max_flow_values_using_cuts(adjacency_tensor, source_index, target_index) == \
+            pytest.approx(ARAX_ranker._get_max_flow_values_using_networkx(adjacency_tensor, source_index, target_index))
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_ARAX_ranker.py'])
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_COHD_querier.py
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from ARAX_response import ARAXResponse
+from openapi_server.models.query_graph import QueryGraph
+from Expand import COHD_querier
+from Expand.COHD_querier import COHDQuerier
+import COHDIndex as COHDIndexModule
+
+CURIE_TYPES = {'DOID:9352': 'disease', 'CHEBI:6801': 'chemical_substance', 'CHEBI:5441': 'chemical_substance', 'HP:0001250': 'phenotypic_feature'}
+
+
+class _SynonymizerWithTypes:
+    def __init__(self):
+        self.n_calls = 0
+
+    def get_canonical_curies(self, curies=None):
+        self.n_calls += 1
+        curies = [curies] if isinstance(curies, str) else curies
+        return {curie: {'preferred_curie': curie, 'preferred_type': CURIE_TYPES[curie], 'preferred_name': curie.lower()}
+                if curie in CURIE_TYPES else None for curie in curies}
+
+
+@pytest.fixture
+def cohd_querier(tmp_path, monkeypatch):
+    connection = sqlite3.connect(f"{tmp_path}/COHD.db")
+    connection.execute("CREATE TABLE CURIE_TO_OMOP_MAPPING( preferred_curie VARCHAR(255), concept_id INT )")
+    connection.execute("CREATE TABLE CONCEPTS( concept_id INT PRIMARY KEY, concept_name VARCHAR(255), domain_id VARCHAR(255), vocabulary_id VARCHAR(255), concept_class_id VARCHAR(255), concept_code VARCHAR(255) )")
+    connection.execute("CREATE TABLE PAIRED_CONCEPT_COUNTS_ASSOCIATIONS( concept_pair_id VARCHAR(255), dataset_id TINYINT, concept_id_1 INT, concept_id_2 INT, concept_count INT, concept_prevalence FLOAT, chi_square_t FLOAT, chi_square_p FLOAT, expected_count FLOAT, ln_ratio FLOAT, rel_freq_1 FLOAT, rel_freq_2 FLOAT)")
+    connection.executemany("INSERT INTO CONCEPTS VALUES (?,?,'Condition','','','')", [(concept_id, f"concept {concept_id}") for concept_id in (1, 2, 3, 4, 5)])
+    connection.executemany("INSERT INTO CURIE_TO_OMOP_MAPPING VALUES (?,?)",
+                           [('DOID:9352', 1), ('DOID:9352', 2), ('CHEBI:6801', 3), ('CHEBI:5441', 4), ('HP:0001250', 5)])
+    # The diabetes concepts are stored on either side of their pairs; the dataset 1 row must be ignored
+    connection.executemany("INSERT INTO PAIRED_CONCEPT_COUNTS_ASSOCIATIONS VALUES (?,?,?,?,?,?,?,?,?,?,0,0)",
+                           [('1_3', 3, 1, 3, 50, 0.05, 300.0, 1e-10, 5.0, 2.3),
+                            ('4_2', 3, 4, 2, 2, 0.002, 10.0, 1e-3, 1.0, 0.7),
+                            ('1_5', 3, 1, 5, 9, 0.009, 80.0, 1e-6, 2.0, '-inf'),
+                            ('1_4', 1, 1, 4, 99, 0.9, 900.0, 0.0, 9.0, 4.0)])
+    connection.commit()
+
+    synonymizer = _SynonymizerWithTypes()
+    monkeypatch.setattr(COHDIndexModule.COHDIndex, '__init__', lambda self: None)
+    monkeypatch.setattr(COHDIndexModule.COHDIndex, '__del__', lambda self: None)
+    monkeypatch.setattr(COHD_querier, 'NodeSynonymizer', lambda: synonymizer)
+    response = ARAXResponse()
+    response.data['parameters'] = {'COHD_method': 'paired_concept_freq', 'COHD_method_percentile': '0'}
+    querier = COHDQuerier(response)
+    querier.cohdindex.connection = connection
+    querier.cohdindex.synonymizer = synonymizer
+    querier.cohdindex.success_con = False
+    return querier
+
+
+def _create_query_graph(source_curies, target_curies, target_category=None) -> QueryGraph:
+    return QueryGraph.from_dict({'nodes': {'n00': {'id': source_curies, 'category': ['biolink:Disease']},
+                                           'n01': {'id': target_curies, 'category': target_category}},
+                                 'edges': {'e00': {'subject': 'n00', 'object': 'n01'}}})
+
+
+def test_batched_lookups(cohd_querier):
+    cohd_index = cohd_querier.cohdindex
+    assert {curie: sorted(concept_ids) for curie, concept_ids in cohd_index.get_concept_ids_for_curies(['DOID:9352', 'CHEBI:6801', 'UMLS:C1']).items()} == \
+        {'DOID:9352': [1, 2], 'CHEBI:6801': [3], 'UMLS:C1': []}
+    assert cohd_index.get_curies_from_concept_ids([3, 5, 6]) == {3: ['CHEBI:6801'], 5: ['HP:0001250'], 6: []}
+    associations = cohd_index.get_associations([1, 2], dataset_id=3)
+    assert sorted(zip(associations['concept_id_1'].tolist(), associations['concept_id_2'].tolist())) == [(1, 3), (1, 5), (2, 4)]
+    assert associations[associations['concept_id_2'] == 5]['ln_ratio'][0] == float('-inf')
+
+
+def test_pair_methods(cohd_querier, monkeypatch):
+    cohd_index = cohd_querier.cohdindex
+    cohd_index.connection.execute("UPDATE CONCEPTS SET domain_id='Drug' WHERE concept_id=5")
+    cohd_index.connection.execute("CREATE TABLE SINGLE_CONCEPT_COUNTS( dataset_id TINYINT, concept_id INT, concept_count INT, concept_prevalence FLOAT )")
+    cohd_index.connection.executemany("INSERT INTO SINGLE_CONCEPT_COUNTS VALUES (3,?,?,0)", [(3, 100), (5, 30)])
+    # Pairs are found whichever way round they are stored, oriented with the given concepts first
+    assert cohd_index.get_paired_concept_freq(concept_id_1=[2], dataset_id=3) == \
+        [{'dataset_id': 3, 'concept_id_1': 2, 'concept_id_2': 4, 'concept_count': 2, 'concept_frequency': 0.002}]
+    assert [(row['concept_id_1'], row['concept_id_2']) for row in cohd_index.get_chi_square(concept_id_1=[1, 2], concept_id_2=[3, 4], dataset_id=3)] == [(1, 3), (2, 4)]
+    assert [(row['concept_id_1'], row['ln_ratio']) for row in cohd_index.get_obs_exp_ratio(concept_id_pair='3_1', dataset_id=3)] == [(3, 2.3)]
+    assert [row['concept_id_2'] for row in cohd_index.get_obs_exp_ratio(concept_id_1=[1], domain='Drug', dataset_id=3)] == [5]
+    relative_frequencies = cohd_index.get_relative_frequency(concept_id_1=[1], dataset_id=3, as_array=True)
+    assert relative_frequencies.dtype == COHDIndexModule.RELATIVE_FREQUENCY_DTYPE
+    assert relative_frequencies['concept_id_2'].tolist() == [3, 5]
+    assert relative_frequencies['relative_frequency'].tolist() == [0.5, 0.3]
+    # Long id lists go through temporary tables and give the same results
+    expected = cohd_index.get_chi_square(concept_id_1=[1, 2, 5], concept_id_2=[3, 4, 1], dataset_id=3)
+    monkeypatch.setattr(COHDIndexModule, 'MAX_BOUND_IDS', 1)
+    assert cohd_index.get_chi_square(concept_id_1=[1, 2, 5], concept_id_2=[3, 4, 1], dataset_id=3) == expected
+    assert cohd_index.connection.execute("SELECT count(*) FROM temp.sqlite_master").fetchone()[0] == 0
+
+
+def test_one_sided_query_with_category(cohd_querier):
+    answer_kg, edge_to_nodes_map = cohd_querier.answer_one_hop_query(_create_query_graph(['DOID:9352'], None, ['biolink:ChemicalSubstance']))
+    assert cohd_querier.response.status == 'OK'
+    assert set(answer_kg.edges_by_qg_id['e00']) == {'COHD:DOID:9352-has_paired_concept_frequency_with-CHEBI:6801',
+                                                    'COHD:DOID:9352-has_paired_concept_frequency_with-CHEBI:5441'}
+    assert set(answer_kg.nodes_by_qg_id['n01']) == {'CHEBI:6801', 'CHEBI:5441'}
+    assert edge_to_nodes_map['COHD:DOID:9352-has_paired_concept_frequency_with-CHEBI:6801'] == {'n00': 'DOID:9352', 'n01': 'CHEBI:6801'}
+    # The synonymizer is asked about the given curies, the associated curies and the answer nodes, once each
+    assert cohd_querier.synonymizer.n_calls <= 3
+
+
+@pytest.mark.parametrize("COHD_method,expected_value", [('paired_concept_freq', '0.05'), ('observed_expected_ratio', '2.3'), ('chi_square', '1e-10')])
+def test_two_sided_query(cohd_querier, COHD_method, expected_value):
+    cohd_querier.response.data['parameters'] = {'COHD_method': COHD_method, 'COHD_method_percentile': '50'}
+    answer_kg, _ = cohd_querier.answer_one_hop_query(_create_query_graph(['DOID:9352'], ['CHEBI:6801', 'CHEBI:5441']))
+    edges = answer_kg.edges_by_qg_id['e00']
+    edge_key = f"COHD:DOID:9352-has_{COHD_querier.COHD_METHODS[COHD_method]['name']}_with-CHEBI:6801"
+    assert edge_key in edges
+    assert edges[edge_key].attributes[0].value == expected_value
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_COHD_querier.py'])
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_adjacency_counter.py
+
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Expand")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Overlay")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from ARAX_response import ARAXResponse
+from openapi_server.models.query_graph import QueryGraph
+from openapi_server.models.q_node import QNode
+from openapi_server.models.q_edge import QEdge
+import expand_utilities as eu
+import kg2_querier
+from kg2_querier import KG2Querier
+import adjacency_counter
+from adjacency_counter import AdjacencyCounter
+
+# A small canonicalized KG: CHEMBL:2 is (oddly) also a protein and has a self-edge, and G:1 is not a protein
+NODES = {"CHEMBL:1": ["chemical_substance"], "CHEMBL:2": ["chemical_substance", "protein"], "CHEMBL:3": ["chemical_substance"],
+         "P:1": ["protein"], "P:2": ["protein", "gene"], "P:3": ["protein"], "G:1": ["gene"]}
+EDGES = [("e1", "CHEMBL:1", "physically_interacts_with", "P:1"),
+         ("e2", "P:2", "physically_interacts_with", "CHEMBL:1"),
+         ("e3", "CHEMBL:1", "affects", "P:1"),
+         ("e4", "CHEMBL:1", "affects", "G:1"),
+         ("e5", "CHEMBL:2", "affects", "CHEMBL:2"),
+         ("e6", "CHEMBL:2", "physically_interacts_with", "P:3")]
+SYNONYMS = {"CHEMBL:1": ["CHEMBL:1", "DRUGBANK:DB1"], "DRUGBANK:DB1": ["CHEMBL:1", "DRUGBANK:DB1"]}
+
+
+class _FakeNeo4jConnectionManager:
+    """
+    Answers the grouped count query of AdjacencyCounter and the one-hop queries of KG2Querier from NODES and EDGES
+    """
+    def __init__(self):
+        self.queries = []
+
+    @staticmethod
+    def _matches(node_curie, cypher_query, parameters):
+        if "$adjacent_categories" in cypher_query:
+            categories = parameters["adjacent_categories"]
+        elif "n01_categories" in parameters:
+            categories = parameters["n01_categories"]
+        else:
+            categories = re.findall(r"n01:(\w+)", cypher_query)
+        return not categories or any(category in NODES[node_curie] for category in categories)
+
+    @staticmethod
+    def _orientations(subject, obj):
+        return [(subject, obj)] if subject == obj else [(subject, obj), (obj, subject)]
+
+    def run_query(self, cypher_query, kg_name, parameters=None):
+        self.queries.append((cypher_query, kg_name, parameters))
+        assert cypher_query.startswith("UNWIND $curie_groups AS curie_group MATCH (n00)-[e]-(n01)")
+        results = []
+        for curie_group in parameters["curie_groups"]:
+            edge_keys = {edge_key for edge_key, subject, predicate, obj in EDGES
+                         for n00, n01 in self._orientations(subject, obj)
+                         if n00 in curie_group["curies"] and n01 not in curie_group["curies"]
+                         and self._matches(n01, cypher_query, parameters)
+                         and predicate == parameters.get("predicate", predicate)}
+            if edge_keys:
+                results.append({"curie": curie_group["curie"], "count": len(edge_keys)})
+        return results
+
+    def stream_query(self, cypher_query, kg_name, parameters=None, batch_size=5000):
+        self.queries.append((cypher_query, kg_name, parameters))
+        curies = parameters["n00_curies"] if "n00_curies" in parameters else [parameters["n00_curie"]]
+        predicates = re.findall(r"`(\w+)`", cypher_query)
+        rows = []
+        for edge_key, subject, predicate, obj in EDGES:
+            for n00, n01 in self._orientations(subject, obj):
+                if n00 in curies and self._matches(n01, cypher_query, parameters) and (not predicates or predicate in predicates):
+                    rows.append({"n00": {"id": n00, "types": NODES[n00]}, "n01": {"id": n01, "types": NODES[n01]},
+                                 "e00": {"id": edge_key, "simplified_edge_label": predicate, "subject": subject,
+                                         "object": obj, "n00": n00, "n01": n01}})
+        yield rows
+
+
+class _FakeSynonymizer:
+    def get_canonical_curies(self, curies=None):
+        return {curie: {'preferred_curie': SYNONYMS.get(curie, [curie])[0], 'preferred_type': NODES.get(SYNONYMS.get(curie, [curie])[0], ["named_thing"])[0],
+                        'preferred_name': curie} for curie in curies}
+
+    def get_equivalent_nodes(self, curies, kg_name=None):
+        return {curie: SYNONYMS.get(curie) for curie in curies}
+
+
+@pytest.fixture
+def neo4j(monkeypatch):
+    connection_manager = _FakeNeo4jConnectionManager()
+    monkeypatch.setattr(adjacency_counter, "get_neo4j_connection_manager", lambda: connection_manager)
+    monkeypatch.setattr(kg2_querier, "get_neo4j_connection_manager", lambda: connection_manager)
+    monkeypatch.setattr(eu, "NodeSynonymizer", _FakeSynonymizer)
+    return connection_manager
+
+
+def _count_adjacent_edges_using_expand(curies, adjacent_category, predicate=None):
+    # What FET used to do: expand the nodes with KG2 (as expand(kp=ARAX/KG2) does, with synonyms, leaving out
+    # self-edges) and count the edges of each node in the resulting KG
+    response = ARAXResponse()
+    response.data['parameters'] = {'enforce_directionality': False, 'use_synonyms': True}
+    qg = QueryGraph(nodes={"n00": QNode(id=curies, category=["biolink:ChemicalSubstance"]),
+                           "n01": QNode(category=[adjacent_category])},
+                    edges={"e00": QEdge(subject="n00", object="n01", predicate=[predicate] if predicate else None)})
+    answer_kg, _ = KG2Querier(response, "ARAX/KG2").answer_one_hop_query(qg)
+    assert response.status == 'OK'
+    edges = [edge for edge in answer_kg.edges_by_qg_id.get("e00", dict()).values() if edge.subject != edge.object]
+    return {curie: sum(1 for edge in edges if curie in {edge.subject, edge.object}) for curie in curies}
+
+
+@pytest.mark.parametrize("predicate", [None, "biolink:physically_interacts_with", "biolink:affects"])
+def test_counts_match_expand(neo4j, predicate):
+    curies = ["CHEMBL:1", "CHEMBL:2", "CHEMBL:3"]
+    response = ARAXResponse()
+    counts = AdjacencyCounter(response).get_adjacent_edge_counts(curies, "biolink:Protein", "ARAX/KG2", predicate)
+    assert response.status == 'OK'
+    assert counts == _count_adjacent_edges_using_expand(curies, "biolink:Protein", predicate)
+    if predicate is None:
+        assert counts == {"CHEMBL:1": 3, "CHEMBL:2": 1, "CHEMBL:3": 0}
+    # All of the nodes are counted with one query
+    assert len([query for query in neo4j.queries if query[0].startswith("UNWIND")]) == 1
+
+
+def test_counts_use_canonical_curies(neo4j):
+    response = ARAXResponse()
+    counts = AdjacencyCounter(response).get_adjacent_edge_counts(["DRUGBANK:DB1", "CHEMBL:3"], ["biolink:Protein", "biolink:Gene"], "ARAX/KG2c")
+    assert response.status == 'OK'
+    assert counts == {"DRUGBANK:DB1": 4, "CHEMBL:3": 0}
+    cypher_query, kg_name, parameters = neo4j.queries[-1]
+    assert kg_name == "KG2c"
+    assert parameters["curie_groups"] == [{"curie": "DRUGBANK:DB1", "curies": ["CHEMBL:1"]}, {"curie": "CHEMBL:3", "curies": ["CHEMBL:3"]}]
+    assert parameters["adjacent_categories"] == ["protein", "gene"]
+
+
+def test_counts_use_synonyms_in_kg1(neo4j):
+    response = ARAXResponse()
+    counts = AdjacencyCounter(response).get_adjacent_edge_counts(["DRUGBANK:DB1"], "biolink:Protein", "ARAX/KG1")
+    assert response.status == 'OK'
+    assert counts == {"DRUGBANK:DB1": 3}
+    cypher_query, kg_name, parameters = neo4j.queries[-1]
+    assert kg_name == "KG1"
+    assert "(n01:protein)" in cypher_query
+    assert parameters["curie_groups"] == [{"curie": "DRUGBANK:DB1", "curies": ["CHEMBL:1", "DRUGBANK:DB1"]}]
+
+
+def test_unsupported_kp(neo4j):
+    response = ARAXResponse()
+    assert AdjacencyCounter(response).get_adjacent_edge_counts(["CHEMBL:1"], "biolink:Protein", "BTE") is None
+    assert response.error_code == "UnsupportedKP"
+    assert not neo4j.queries
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_adjacency_counter.py'])
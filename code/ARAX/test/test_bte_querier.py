@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_bte_querier.py
+
+import asyncio
+import importlib
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from ARAX_response import ARAXResponse
+from openapi_server.models.query_graph import QueryGraph
+from openapi_server.models.q_node import QNode
+from openapi_server.models.q_edge import QEdge
+
+
+class _FakeDispatcher:
+    """
+    Stands in for biothings_explorer's SingleEdgeQueryDispatcher: answers each input curie with two chemicals of its own
+    """
+    calls = []
+    lock = threading.Lock()
+    fail_on = None
+
+    def __init__(self, input_cls, output_cls, pred, input_id, values, loop):
+        with self.lock:
+            self.calls.append({'input_cls': input_cls, 'output_cls': output_cls, 'pred': pred, 'input_id': input_id,
+                               'values': values, 'loop': loop})
+        self.input_curie = f"{input_id}:{values}"
+        self.values = values
+
+    def query(self):
+        if self.input_curie == self.fail_on:
+            raise ValueError(f"BTE fell over on {self.input_curie}")
+
+    def to_reasoner_std(self):
+        output_keys = [f"chemical:{self.values}-{index}" for index in range(2)]
+        edge_keys = [f"{self.input_curie}-{output_key}" for output_key in output_keys]
+        return {'results': {'node_bindings': [{'kg_id': self.input_curie, 'qg_id': 'n0'}] +
+                                             [{'kg_id': output_key, 'qg_id': 'n1'} for output_key in output_keys],
+                            'edge_bindings': [{'kg_id': edge_keys, 'qg_id': 'e1'}]},
+                'knowledge_graph': {'nodes': [{'id': self.input_curie, 'name': self.values, 'type': 'Gene',
+                                               'equivalent_identifiers': {}}] +
+                                             [{'id': output_key, 'name': output_key, 'type': 'ChemicalSubstance',
+                                               'equivalent_identifiers': {'CHEBI': [f"CHEBI:{output_key.split(':')[1]}"]}}
+                                              for output_key in output_keys],
+                                    'edges': [{'id': edge_key, 'type': 'physically_interacts_with', 'source_id': self.input_curie,
+                                               'target_id': output_key, 'edge_source': 'fake_api'}
+                                              for edge_key, output_key in zip(edge_keys, output_keys)]}}
+
+
+@pytest.fixture
+def bte_querier(monkeypatch):
+    # The querier only needs biothings_explorer for its dispatcher, which every test replaces
+    try:
+        importlib.import_module("biothings_explorer.user_query_dispatcher")
+    except ImportError:
+        user_query_dispatcher = types.ModuleType("biothings_explorer.user_query_dispatcher")
+        user_query_dispatcher.SingleEdgeQueryDispatcher = None
+        monkeypatch.setitem(sys.modules, "biothings_explorer", types.ModuleType("biothings_explorer"))
+        monkeypatch.setitem(sys.modules, "biothings_explorer.user_query_dispatcher", user_query_dispatcher)
+    from Expand import bte_querier
+    monkeypatch.setattr(bte_querier, "SingleEdgeQueryDispatcher", _FakeDispatcher)
+    monkeypatch.setattr(_FakeDispatcher, "calls", [])
+    monkeypatch.setattr(_FakeDispatcher, "fail_on", None)
+    return bte_querier
+
+
+def _run_query(bte_querier, curies):
+    response = ARAXResponse()
+    response.data['parameters'] = {'enforce_directionality': True, 'use_synonyms': False}
+    qg = QueryGraph(nodes={"n00": QNode(id=curies, category=["biolink:Gene", "biolink:Protein"]),
+                           "n01": QNode(category=["biolink:ChemicalSubstance"])},
+                    edges={"e00": QEdge(subject="n00", object="n01")})
+    querier = bte_querier.BTEQuerier(response)
+    querier.max_concurrent_queries = 3
+    answer_kg, edge_to_nodes_map = querier.answer_one_hop_query(qg)
+    return response, answer_kg, edge_to_nodes_map
+
+
+def test_one_dispatcher_per_curie(bte_querier):
+    curies = ["NCBIGene:1017", "NCBIGene:7157", "UniProtKB:P04637", "FAKE:123", "NCBIGene:672"]
+    response, answer_kg, edge_to_nodes_map = _run_query(bte_querier, curies)
+    assert response.status == 'OK'
+
+    # BTE takes a single input value, so there is one query per accepted curie and input category
+    calls = _FakeDispatcher.calls
+    assert all(isinstance(call['values'], str) for call in calls)
+    assert sorted((call['input_id'], call['values'], call['input_cls']) for call in calls) == sorted(
+        (prefix, local_id, input_cls) for prefix, local_id in [("NCBIGene", "1017"), ("NCBIGene", "7157"), ("UNIPROTKB", "P04637"), ("NCBIGene", "672")]
+        for input_cls in ["Gene", "Protein"])
+    assert {call['output_cls'] for call in calls} == {"ChemicalSubstance"}
+    # Each worker thread reuses its own event loop, and the loops are closed afterwards
+    loops = {id(call['loop']): call['loop'] for call in calls}.values()
+    assert len(loops) <= 3
+    assert all(isinstance(loop, asyncio.AbstractEventLoop) and loop.is_closed() for loop in loops)
+
+    # The answers to every curie end up in the KG, each edge attached to the curie it was queried for
+    assert set(answer_kg.nodes_by_qg_id["n00"]) == {"NCBIGene:1017", "NCBIGene:7157", "UniProtKB:P04637", "NCBIGene:672"}
+    assert set(answer_kg.nodes_by_qg_id["n01"]) == {f"CHEBI:{local_id}-{index}" for local_id in ["1017", "7157", "P04637", "672"] for index in range(2)}
+    assert len(answer_kg.edges_by_qg_id["e00"]) == 8
+    for edge_key, edge in answer_kg.edges_by_qg_id["e00"].items():
+        assert edge_to_nodes_map[edge_key] == {"n00": edge.subject, "n01": edge.object}
+        assert edge.object == f"CHEBI:{edge.subject.split(':')[1]}-{edge_key[-1]}"
+
+
+def test_dispatcher_error(bte_querier):
+    _FakeDispatcher.fail_on = "NCBIGene:7157"
+    response, answer_kg, edge_to_nodes_map = _run_query(bte_querier, ["NCBIGene:1017", "NCBIGene:7157", "NCBIGene:672"])
+    assert response.status == 'ERROR'
+    assert response.error_code == "ValueError"
+    assert "BTE fell over on NCBIGene:7157" in response.message
+    assert not edge_to_nodes_map
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_bte_querier.py'])
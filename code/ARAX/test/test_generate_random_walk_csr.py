@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_generate_random_walk_csr.py
+
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery/Overlay/GraphSage_train/py_scripts")
+from generate_random_walk_csr import load_csr_graph, save_csr_graph, random_walk_pairs, format_pairs, generate_walks
+
+# Training nodes 10, 20, 30, 40 and 60 (50 is a validation node and 70 a test node); 10 has a self-loop, 60 is isolated once
+# the edge to 70 is left out, and 10-20 appears twice (once in each direction)
+NODES = [(10, False, False), (20, False, False), (30, False, False), (40, False, False), (50, True, False), (60, False, False),
+         (70, False, True)]
+LINKS = [(10, 20), (20, 10), (10, 10), (20, 30), (30, 40), (40, 50), (60, 70)]
+
+
+def _write_graph_json(tmp_path, links_key='links'):
+    Gjson = str(tmp_path / 'data-G.json')
+    with open(Gjson, 'w') as output_file:
+        json.dump({'directed': False, 'nodes': [{'id': node_id, 'val': val, 'test': test} for node_id, val, test in NODES],
+                   links_key: [{'source': source, 'target': target} for source, target in LINKS]}, output_file)
+    return Gjson
+
+
+def _neighbors(indptr, indices, node):
+    return indices[indptr[node]:indptr[node + 1]].tolist()
+
+
+@pytest.mark.parametrize("links_key", ['links', 'edges'])
+def test_load_csr_graph(tmp_path, links_key):
+    ids, indptr, indices = load_csr_graph(_write_graph_json(tmp_path, links_key))
+    assert ids.tolist() == [10, 20, 30, 40, 60]
+    assert indptr.tolist() == [0, 2, 4, 6, 7, 7]
+    # the self-loop is one neighbor, the duplicate edge is kept once, and the edges to val/test nodes are left out
+    assert [_neighbors(indptr, indices, node) for node in range(len(ids))] == [[0, 1], [0, 2], [1, 3], [2], []]
+    assert indices.dtype == np.int32
+
+
+def test_load_csr_graph_without_edges(tmp_path):
+    Gjson = str(tmp_path / 'data-G.json')
+    with open(Gjson, 'w') as output_file:
+        json.dump({'nodes': [{'id': 1, 'val': False, 'test': False}, {'id': 2, 'val': True, 'test': False}], 'links': []}, output_file)
+    ids, indptr, indices = load_csr_graph(Gjson)
+    assert ids.tolist() == [1]
+    assert indptr.tolist() == [0, 0]
+    assert len(indices) == 0
+
+
+def test_random_walk_pairs(tmp_path):
+    ids, indptr, indices = load_csr_graph(_write_graph_json(tmp_path))
+    pairs = random_walk_pairs(indptr, indices, np.arange(len(ids)), 3, 5, np.random.default_rng(42))
+    # the same seed gives the same walks
+    assert np.array_equal(pairs, random_walk_pairs(indptr, indices, np.arange(len(ids)), 3, 5, np.random.default_rng(42)))
+    assert not np.array_equal(pairs, random_walk_pairs(indptr, indices, np.arange(len(ids)), 3, 5, np.random.default_rng(43)))
+    # pairs are grouped by start node, the isolated node has no walks, and there are no self co-occurrences
+    assert pairs[:, 0].tolist() == sorted(pairs[:, 0].tolist())
+    assert set(pairs[:, 0].tolist()) == {0, 1, 2, 3}
+    assert not np.any(pairs[:, 0] == pairs[:, 1])
+    # with 3 walks of 5 steps from each node, each node has at most 3 * 4 pairs
+    assert np.bincount(pairs[:, 0]).max() <= 12
+
+
+def test_random_walk_pairs_follow_edges():
+    # a path 0-1-2-3, on which the first step from either end has only one choice
+    indptr = np.array([0, 1, 3, 5, 6])
+    indices = np.array([1, 0, 2, 1, 3, 2], dtype=np.int32)
+    rng = np.random.default_rng(0)
+    pairs = random_walk_pairs(indptr, indices, np.array([0]), 50, 2, rng)
+    # with 2 steps, each walk from 0 visits 0 and then 1
+    assert pairs.tolist() == [[0, 1]] * 50
+    pairs = random_walk_pairs(indptr, indices, np.array([3]), 200, 3, rng)
+    # from 3: 3 -> 2 -> (1 or 3), and the visits to 3 itself are dropped
+    assert set(map(tuple, pairs.tolist())) == {(3, 2), (3, 1)}
+    assert pairs.tolist().count([3, 2]) == 200
+
+
+def test_format_pairs():
+    assert format_pairs(np.array([10, 20, 30]), np.array([[0, 2], [2, 1]])) == b'10\t30\n30\t20\n'
+
+
+def test_generate_walks(tmp_path):
+    ids, indptr, indices = load_csr_graph(_write_graph_json(tmp_path))
+    csr_prefix = str(tmp_path / 'data-G-csr')
+    save_csr_graph(csr_prefix, ids, indptr, indices)
+    outputs = dict()
+    for processes, batch_size in [(1, 2), (2, 2), (2, 3)]:
+        output_file_name = str(tmp_path / f'data-walks-{processes}-{batch_size}.txt')
+        num_pairs = generate_walks(csr_prefix, output_file_name, 4, 6, batch_size, processes=processes, seed=7)
+        with open(output_file_name, 'rb') as input_file:
+            outputs[(processes, batch_size)] = input_file.read()
+        assert outputs[(processes, batch_size)].count(b'\n') == num_pairs
+    # for a seed, the output doesn't depend on the number of processes, but does depend on the batch size
+    assert outputs[(1, 2)] == outputs[(2, 2)]
+    assert outputs[(2, 2)] != outputs[(2, 3)]
+    pairs = [tuple(map(int, line.split(b'\t'))) for line in outputs[(1, 2)].splitlines()]
+    # the pairs are written with the G.json ids, and the isolated node 60 is in none of them
+    assert {source for source, target in pairs} == {10, 20, 30, 40}
+    assert {target for source, target in pairs} <= {10, 20, 30, 40}
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_generate_random_walk_csr.py'])
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_node_synonymizer_snapshot.py
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../NodeSynonymizer")
+from node_synonymizer import NodeSynonymizer, NodeSynonymizerSnapshot
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    # A full database with one concept (two curies for type 2 diabetes), exported to a snapshot
+    synonymizer = NodeSynonymizer.__new__(NodeSynonymizer)
+    synonymizer.databaseLocation = str(tmp_path)
+    synonymizer.databaseName = "node_synonymizer.sqlite"
+    synonymizer.options = {'kg_name': 'KG2'}
+    synonymizer.connection = None
+    synonymizer.connect()
+    synonymizer.create_tables()
+    synonymizer.connection.executemany("INSERT INTO kg2_node VALUES (?,?,?,?,?,?,?)",
+                                       [(curie.upper(), curie, "type 2 diabetes", "type 2 diabetes", "disease", "DOID:9352", "KG1,KG2")
+                                        for curie in ["DOID:9352", "MONDO:0005148"]])
+    synonymizer.connection.execute("INSERT INTO kg2_unique_concept VALUES (?,?,?,?,?,?,?,?,?,?)",
+                                   ("DOID:9352", "DOID:9352", None, "DOID:9352", "DOID:9352", "type 2 diabetes", "disease", None, None, None))
+    synonymizer.connection.executemany("INSERT INTO kg2_curie VALUES (?,?,?,?,?)",
+                                       [(curie.upper(), curie, "DOID:9352", "disease", "KG2") for curie in ["DOID:9352", "MONDO:0005148"]])
+    synonymizer.connection.execute("INSERT INTO kg2_synonym VALUES (?,?,?,?)", ("type 2 diabetes", "type 2 diabetes", "DOID:9352", "KG2"))
+    synonymizer.connection.commit()
+    snapshot_path = synonymizer.export_snapshot(str(tmp_path / "node_synonymizer_snapshot.sqlite"))
+    synonymizer.disconnect()
+    return snapshot_path
+
+
+def test_snapshot_lookups(snapshot_path):
+    snapshot = NodeSynonymizerSnapshot(snapshot_path)
+    assert snapshot.get_canonical_curies("MONDO:0005148") == {"MONDO:0005148": {'preferred_curie': "DOID:9352",
+                                                                                'preferred_name': "type 2 diabetes",
+                                                                                'preferred_type': "disease"}}
+    assert snapshot.get_canonical_curies(names="Type 2 Diabetes")["Type 2 Diabetes"]['preferred_curie'] == "DOID:9352"
+    assert snapshot.get_equivalent_nodes(["DOID:9352"]) == {"DOID:9352": {"DOID:9352": "KG1,KG2", "MONDO:0005148": "KG1,KG2"}}
+    assert snapshot.export_snapshot(snapshot_path) == snapshot_path
+
+
+@pytest.mark.parametrize("method_name,args", [("get_curies_and_types", ("type 2 diabetes",)),
+                                              ("get_curies_and_types_and_names", ("type 2 diabetes",)),
+                                              ("get_names", ("DOID:9352",)),
+                                              ("get_curies", ("type 2 diabetes",)),
+                                              ("is_curie_present", ("DOID:9352",)),
+                                              ("get_KG1_curies", ("type 2 diabetes",)),
+                                              ("convert_curie", ("DOID:9352", "MONDO")),
+                                              ("get_normalizer_results", ("DOID:9352", "KG2")),
+                                              ("get_total_entity_count", ("disease",)),
+                                              ("test_select", ())])
+def test_snapshot_unsupported_lookups(snapshot_path, method_name, args):
+    snapshot = NodeSynonymizerSnapshot(snapshot_path)
+    with pytest.raises(NotImplementedError, match=f"NodeSynonymizerSnapshot \\({snapshot_path}\\).*{method_name}"):
+        getattr(snapshot, method_name)(*args)
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_node_synonymizer_snapshot.py'])
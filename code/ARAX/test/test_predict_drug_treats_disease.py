@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_predict_drug_treats_disease.py
+
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ARAXQuery")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../NodeSynonymizer")
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from ARAX_response import ARAXResponse
+from openapi_server.models.edge import Edge
+from openapi_server.models.knowledge_graph import KnowledgeGraph
+from openapi_server.models.message import Message
+from openapi_server.models.node import Node
+from openapi_server.models.q_node import QNode
+from openapi_server.models.query_graph import QueryGraph
+from Overlay.predict_drug_treats_disease import PredictDrugTreatsDisease
+from Overlay.predictor.predictor import EmbeddingStore, predictor
+
+# KG curie -> (preferred curie, preferred type); UMLS:C2 is typed as a disease in the KG but not by the synonymizer
+CANONICAL_CURIES = {'CHEBI:6801': ('CHEMBL.COMPOUND:CHEMBL1431', 'biolink:ChemicalSubstance'),
+                    'CHEBI:5441': ('CHEMBL.COMPOUND:CHEMBL1481', 'biolink:ChemicalSubstance'),
+                    'DOID:9352': ('MONDO:0005148', 'biolink:Disease'),
+                    'HP:0001250': ('HP:0001250', 'biolink:PhenotypicFeature'),
+                    'UMLS:C2': ('UMLS:C2', 'biolink:Gene')}
+PROBABILITIES = [('MONDO:0005148', 'CHEMBL.COMPOUND:CHEMBL1431', 0.9),
+                 ('MONDO:0005148', 'CHEMBL.COMPOUND:CHEMBL1481', 0.4),
+                 ('HP:0001250', 'CHEMBL.COMPOUND:CHEMBL1431', 0.0),
+                 ('UMLS:C2', 'CHEMBL.COMPOUND:CHEMBL1481', 0.7)]
+
+
+class _Synonymizer:
+    def __init__(self):
+        self.n_calls = 0
+
+    def get_canonical_curies(self, curies=None):
+        self.n_calls += 1
+        curies = [curies] if isinstance(curies, str) else curies
+        return {curie: {'preferred_curie': CANONICAL_CURIES[curie][0], 'preferred_type': CANONICAL_CURIES[curie][1]}
+                if curie in CANONICAL_CURIES else None for curie in curies}
+
+
+def _create_message() -> Message:
+    nodes = {'CHEBI:6801': Node(name='metformin', category=['biolink:ChemicalSubstance']),
+             'CHEBI:5441': Node(name='glyburide', category=['biolink:ChemicalSubstance']),
+             'CHEBI:1': Node(name='unknown drug', category=['biolink:ChemicalSubstance']),
+             'DOID:9352': Node(name='type 2 diabetes', category=['biolink:Disease']),
+             'HP:0001250': Node(name='seizure', category=['biolink:PhenotypicFeature']),
+             'UMLS:C2': Node(name='not a disease', category=['biolink:Disease'])}
+    for node_key, node in nodes.items():
+        node.qnode_keys = ['n00'] if node_key.startswith('CHEBI') else ['n01']
+    edges = {'e1': Edge(subject='CHEBI:6801', object='DOID:9352', predicate='biolink:treats'),
+             'e2': Edge(subject='DOID:9352', object='CHEBI:5441', predicate='biolink:related_to'),
+             'e3': Edge(subject='CHEBI:6801', object='HP:0001250', predicate='biolink:related_to'),
+             'e4': Edge(subject='CHEBI:5441', object='UMLS:C2', predicate='biolink:related_to'),
+             'e5': Edge(subject='CHEBI:6801', object='CHEBI:5441', predicate='biolink:related_to')}
+    query_graph = QueryGraph(nodes={'n00': QNode(category=['biolink:ChemicalSubstance']), 'n01': QNode(category=['biolink:Disease'])}, edges={})
+    return Message(query_graph=query_graph, knowledge_graph=KnowledgeGraph(nodes=nodes, edges=edges), results=[])
+
+
+@pytest.fixture
+def overlay(tmp_path):
+    connection = sqlite3.connect(f"{tmp_path}/DTD_probability_database.db")
+    connection.execute("CREATE TABLE DTD_PROBABILITY( disease VARCHAR(255), drug VARCHAR(255), probability FLOAT )")
+    connection.executemany("INSERT INTO DTD_PROBABILITY VALUES (?,?,?)", PROBABILITIES)
+    connection.commit()
+    connection.close()
+
+    # Skip the constructor, which copies the model files over and connects to the NodeSynonymizer
+    overlay = PredictDrugTreatsDisease.__new__(PredictDrugTreatsDisease)
+    overlay.response = ARAXResponse()
+    overlay.message = _create_message()
+    overlay.global_iter = 0
+    overlay.use_prob_db = True
+    overlay.pred = predictor(DTD_prob_file=f"{tmp_path}/DTD_probability_database.db", use_prob_db=True)
+    overlay.synonymizer = _Synonymizer()
+    return overlay
+
+
+def test_virtual_edges(overlay):
+    overlay.parameters = {'virtual_relation_label': 'P1', 'subject_qnode_key': 'n00', 'object_qnode_key': 'n01'}
+    overlay.predict_drug_treats_disease()
+    assert overlay.response.status == 'OK'
+    assert overlay.synonymizer.n_calls == 1
+    virtual_edges = {(edge.subject, edge.object): edge for edge_key, edge in overlay.message.knowledge_graph.edges.items() if edge_key.startswith('P1_')}
+    # Pairs with a probability of 0, or that the synonymizer doesn't see as a drug and a disease, get no edge
+    assert {pair: edge.attributes[0].value for pair, edge in virtual_edges.items()} == \
+        {('CHEBI:6801', 'DOID:9352'): '0.9', ('CHEBI:5441', 'DOID:9352'): '0.4'}
+    assert sorted(edge_key for edge_key in overlay.message.knowledge_graph.edges if edge_key.startswith('P1_')) == ['P1_0', 'P1_1']
+    assert all(edge.predicate == 'biolink:probably_treats' and edge.qedge_keys == ['P1'] for edge in virtual_edges.values())
+    assert overlay.message.query_graph.edges['P1'].subject == 'n00'
+
+
+def test_kg_edges(overlay):
+    overlay.parameters = {}
+    overlay.predict_drug_treats_disease()
+    assert overlay.response.status == 'OK'
+    assert overlay.synonymizer.n_calls == 1
+    edges = overlay.message.knowledge_graph.edges
+    # Edges are decorated whichever way round the drug and the disease are
+    assert [attribute.value for attribute in edges['e1'].attributes] == ['0.9']
+    assert [attribute.value for attribute in edges['e2'].attributes] == ['0.4']
+    assert edges['e3'].attributes == [] and edges['e4'].attributes == [] and edges['e5'].attributes == []
+
+
+@pytest.mark.parametrize("use_embedding_store", [False, True])
+def test_model_probabilities_for_pairs(tmp_path, use_embedding_store):
+    linear_model = pytest.importorskip("sklearn.linear_model")
+    rng = np.random.RandomState(0)
+    curies = ['CHEMBL.COMPOUND:CHEMBL1431', 'CHEMBL.COMPOUND:CHEMBL1481', 'MONDO:0005148', 'HP:0001250']
+    features = rng.rand(len(curies), 3).astype(np.float32)
+    connection = sqlite3.connect(f"{tmp_path}/GRAPH.sqlite")
+    connection.execute("CREATE TABLE GRAPH( curie VARCHAR(255), f1 FLOAT, f2 FLOAT, f3 FLOAT )")
+    connection.executemany("INSERT INTO GRAPH VALUES (?,?,?,?)", [(curie, *map(float, row)) for curie, row in zip(curies, features)])
+    connection.commit()
+    connection.close()
+    if use_embedding_store:
+        EmbeddingStore.save(f"{tmp_path}/GRAPH", curies, features)
+
+    model_predictor = predictor.__new__(predictor)
+    model_predictor.use_prob_db = False
+    model_predictor.model = linear_model.LogisticRegression().fit(rng.rand(20, 3), [0, 1] * 10)
+    model_predictor.import_file(None, graph_database=f"{tmp_path}/GRAPH.sqlite")
+    assert (model_predictor.embedding_store is not None) == use_embedding_store
+    assert model_predictor.get_feature('HP:0001250') == features[3].tolist()
+    assert model_predictor.get_feature('HP:0001251') is None
+    pairs = [(curies[0], curies[2]), (curies[1], curies[3]), (curies[0], 'MONDO:1')]
+    probabilities = model_predictor.prob_pairs(pairs)
+    assert list(probabilities) == pairs[:2]
+    for pair in pairs[:2]:
+        assert probabilities[pair] == pytest.approx(model_predictor.prob_single(*pair)[0])
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_predict_drug_treats_disease.py'])
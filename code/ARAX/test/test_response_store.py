@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_response_store.py
+
+import json
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../ResponseCache")
+from response_store import ResponseStore, PAYLOAD_DATABASE_FILENAME
+
+
+def _create_envelope(node_keys, num_edges: int) -> dict:
+    nodes = {node_key: {"name": f"name of {node_key}", "category": ["biolink:Disease"],
+                        "attributes": [{"name": "synonym", "type": "biolink:synonym", "value": [node_key.lower()]}]}
+             for node_key in node_keys}
+    edges = {f"e{index}": {"subject": node_keys[index % len(node_keys)], "object": node_keys[(index + 1) % len(node_keys)],
+                           "predicate": "biolink:related_to", "attributes": None}
+             for index in range(num_edges)}
+    return {"description": "test", "status": "Success", "logs": [{"level": "INFO", "message": "hello"}],
+            "message": {"query_graph": {"nodes": {"n00": {"id": node_keys[0]}, "n01": {}},
+                                        "edges": {"e00": {"subject": "n00", "object": "n01"}}},
+                        "knowledge_graph": {"nodes": nodes, "edges": edges},
+                        "results": [{"node_bindings": {"n00": [{"id": node_keys[0]}], "n01": [{"id": node_keys[1]}]},
+                                     "edge_bindings": {"e00": [{"id": "e0"}]}, "score": None}]}}
+
+
+def _count_payloads(response_dir: str) -> int:
+    connection = sqlite3.connect(f"{response_dir}/{PAYLOAD_DATABASE_FILENAME}")
+    num_payloads = connection.execute("SELECT COUNT(*) FROM payload").fetchone()[0]
+    connection.close()
+    return num_payloads
+
+
+def test_round_trip_and_streaming(tmp_path):
+    response_store = ResponseStore(str(tmp_path))
+    envelope = _create_envelope([f"MONDO:{index}" for index in range(50)], 120)
+    response_path = response_store.write_response(7, envelope)
+    assert response_path.endswith('.json.gz') or response_path.endswith('.json.zst')
+    assert response_store.has_response(7)
+    assert response_store.read_response(7) == envelope
+    assert json.loads(''.join(response_store.stream_response(7, chunk_size=100))) == envelope
+    assert response_store.read_response(8) is None
+    assert response_store.stream_response(8) is None
+
+
+@pytest.mark.parametrize("knowledge_graph", [None, {"nodes": None, "edges": None}, {"nodes": {}, "edges": {}}])
+def test_round_trip_without_knowledge_graph_content(tmp_path, knowledge_graph):
+    response_store = ResponseStore(str(tmp_path))
+    envelope = {"description": "empty", "status": "Success",
+                "message": {"query_graph": None, "knowledge_graph": knowledge_graph, "results": []}}
+    response_store.write_response(1, envelope)
+    assert response_store.read_response(1) == envelope
+    assert json.loads(''.join(response_store.stream_response(1))) == envelope
+
+
+def test_identical_payloads_are_stored_once(tmp_path):
+    response_store = ResponseStore(str(tmp_path))
+    response_store.write_response(1, _create_envelope([f"MONDO:{index}" for index in range(50)], 40))
+    num_payloads = _count_payloads(str(tmp_path))
+    # The second response has the same edges and five more nodes, so only those five nodes need storing
+    second_envelope = _create_envelope([f"MONDO:{index}" for index in range(55)], 40)
+    response_store.write_response(2, second_envelope)
+    assert _count_payloads(str(tmp_path)) == num_payloads + 5
+    assert response_store.read_response(2) == second_envelope
+
+
+def test_migrate_legacy_response(tmp_path):
+    envelope = _create_envelope([f"MONDO:{index}" for index in range(10)], 10)
+    with open(f"{tmp_path}/3.json", 'w') as outfile:
+        json.dump(envelope, outfile, sort_keys=True, indent=2)
+    response_store = ResponseStore(str(tmp_path))
+    assert response_store.get_legacy_response_ids() == ["3"]
+    assert response_store.read_response(3) == envelope
+    assert response_store.migrate_response(3, remove_legacy_file=True) is not None
+    assert not os.path.exists(f"{tmp_path}/3.json")
+    assert response_store.get_legacy_response_ids() == []
+    assert response_store.read_response(3) == envelope
+
+
+def test_missing_payload_is_reported_before_streaming(tmp_path):
+    response_store = ResponseStore(str(tmp_path))
+    response_store.write_response(1, _create_envelope([f"MONDO:{index}" for index in range(10)], 10))
+    connection = sqlite3.connect(f"{tmp_path}/{PAYLOAD_DATABASE_FILENAME}")
+    with connection:
+        connection.execute("DELETE FROM payload WHERE hash IN (SELECT hash FROM payload LIMIT 1)")
+    connection.close()
+    with pytest.raises(KeyError):
+        response_store.stream_response(1)
+
+
+def test_migrate_response_keeps_legacy_file_if_it_does_not_read_back(tmp_path, monkeypatch):
+    envelope = _create_envelope([f"MONDO:{index}" for index in range(10)], 10)
+    with open(f"{tmp_path}/3.json", 'w') as outfile:
+        json.dump(envelope, outfile)
+    response_store = ResponseStore(str(tmp_path))
+    monkeypatch.setattr(ResponseStore, "_split_envelope", lambda self, envelope: (dict(envelope, status="Garbled"), None, None, dict()))
+    with pytest.raises(ValueError):
+        response_store.migrate_response(3, remove_legacy_file=True)
+    assert os.path.exists(f"{tmp_path}/3.json")
+    assert response_store.read_response(3) == envelope
+
+
+def test_deleting_responses_removes_unused_payloads(tmp_path):
+    response_store = ResponseStore(str(tmp_path))
+    first_envelope = _create_envelope([f"MONDO:{index}" for index in range(50)], 40)
+    response_store.write_response(1, first_envelope)
+    num_payloads = _count_payloads(str(tmp_path))
+    response_store.write_response(2, _create_envelope([f"MONDO:{index}" for index in range(55)], 40))
+    # Only the five nodes response 1 doesn't have go
+    assert response_store.delete_response(2)
+    assert not response_store.has_response(2)
+    assert _count_payloads(str(tmp_path)) == num_payloads
+    assert response_store.read_response(1) == first_envelope
+    assert not response_store.delete_response(2)
+
+    # Responses deleted by hand are cleaned up by collect_garbage()
+    for filename in os.listdir(tmp_path):
+        if filename.startswith("1.json"):
+            os.remove(f"{tmp_path}/{filename}")
+    assert response_store.collect_garbage() == num_payloads
+    assert _count_payloads(str(tmp_path)) == 0
+
+
+def test_payload_refs_of_older_stores_are_recorded(tmp_path):
+    response_store = ResponseStore(str(tmp_path))
+    envelope = _create_envelope([f"MONDO:{index}" for index in range(20)], 20)
+    response_store.write_response(1, envelope)
+    response_store.write_response(2, _create_envelope([f"MONDO:{index}" for index in range(25)], 20))
+    response_store.close()
+    # A store written before payload references were kept
+    connection = sqlite3.connect(f"{tmp_path}/{PAYLOAD_DATABASE_FILENAME}")
+    with connection:
+        connection.execute("DROP TABLE payload_ref")
+    connection.close()
+
+    response_store = ResponseStore(str(tmp_path))
+    assert response_store.collect_garbage() == 0
+    assert response_store.delete_response(2)
+    assert response_store.read_response(1) == envelope
+    assert _count_payloads(str(tmp_path)) == 40
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_response_store.py'])
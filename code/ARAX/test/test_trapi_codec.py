@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_trapi_codec.py
+
+import copy
+import datetime
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../UI/OpenAPI/python-flask-server/")
+from openapi_server import codec
+from openapi_server import util
+from openapi_server.models.base_model_ import Model
+from openapi_server.models.edge import Edge
+from openapi_server.models.message import Message
+from openapi_server.models.node import Node
+from openapi_server.models.response import Response
+
+
+def _create_response_dict() -> dict:
+    return {"description": "test", "status": "OK", "reasoner_id": "ARAX",
+            "logs": [{"timestamp": "2021-03-01T00:00:00", "level": "INFO", "code": "", "message": "hello"}],
+            "message": {"query_graph": {"nodes": {"n00": {"id": ["MONDO:0005148"], "category": ["biolink:Disease"]},
+                                                  "n01": {"category": ["biolink:ChemicalSubstance"], "is_set": True}},
+                                        "edges": {"e00": {"subject": "n01", "object": "n00", "predicate": None}}},
+                        "knowledge_graph": {"nodes": {"MONDO:0005148": {"name": "type 2 diabetes mellitus", "category": ["biolink:Disease"],
+                                                                        "attributes": [{"name": "synonym", "type": "biolink:synonym",
+                                                                                        "value": ["T2D", "NIDDM"]}]},
+                                                      "CHEBI:6801": {"name": "metformin", "category": ["biolink:ChemicalSubstance"],
+                                                                     "attributes": [{"name": "xrefs", "type": "biolink:xref",
+                                                                                     "value": {"drugbank": "DB00331"}}]}},
+                                            "edges": {"KG2:1": {"subject": "CHEBI:6801", "object": "MONDO:0005148",
+                                                                "predicate": "biolink:treats", "relation": None,
+                                                                "attributes": [{"name": "probability", "type": "EDAM:data_0006", "value": 0.7},
+                                                                               {"name": "publications", "type": "biolink:publications",
+                                                                                "value": ["PMID:1", "PMID:2"]}]}}},
+                        "results": [{"node_bindings": {"n00": [{"id": "MONDO:0005148"}], "n01": [{"id": "CHEBI:6801"}]},
+                                     "edge_bindings": {"e00": [{"id": "KG2:1"}]}, "confidence": 0.5, "essence": "metformin"}]}}
+
+
+def _assert_same_model(first, second):
+    assert type(first) is type(second)
+    if isinstance(first, Model):
+        assert vars(first).keys() == vars(second).keys()
+        for attr in first.openapi_types:
+            _assert_same_model(getattr(first, attr), getattr(second, attr))
+    elif isinstance(first, list):
+        assert len(first) == len(second)
+        for first_item, second_item in zip(first, second):
+            _assert_same_model(first_item, second_item)
+    elif isinstance(first, dict):
+        assert first.keys() == second.keys()
+        for key in first:
+            _assert_same_model(first[key], second[key])
+    else:
+        assert first == second
+
+
+def test_decoding_matches_reflection():
+    response_dict = _create_response_dict()
+    original_dict = copy.deepcopy(response_dict)
+    envelope = codec.model_from_dict(response_dict, Response)
+    _assert_same_model(envelope, util.deserialize_model(response_dict, Response))
+    assert isinstance(envelope.message.knowledge_graph.edges["KG2:1"], Edge)
+    assert response_dict == original_dict
+    # Decoded objects are ordinary, independent model objects
+    envelope.message.knowledge_graph.nodes["CHEBI:6801"].name = "glucophage"
+    assert Response.from_dict(response_dict).message.knowledge_graph.nodes["CHEBI:6801"].name == "metformin"
+
+
+def test_required_attributes_are_still_validated():
+    with pytest.raises(ValueError):
+        codec.model_from_dict({"subject": None, "object": "MONDO:0005148"}, Edge)
+    with pytest.raises(ValueError):
+        Message.from_dict({"knowledge_graph": {"nodes": {}, "edges": None}})
+
+
+def test_encoding_to_dict_matches_reflection():
+    envelope = Response.from_dict(_create_response_dict())
+    envelope.message.knowledge_graph.nodes["X:1"] = Node(name="added later", category=["biolink:Gene"])
+    assert envelope.to_dict() == util.serialize_model(envelope)
+    assert envelope.message.knowledge_graph.to_dict() == util.serialize_model(envelope.message.knowledge_graph)
+
+
+@pytest.mark.parametrize("include_nulls", [False, True])
+def test_dumps_matches_encoder(include_nulls):
+    envelope = Response.from_dict(_create_response_dict())
+    envelope.logs[0].timestamp = datetime.datetime(2021, 3, 1, 12, 0, 0)
+
+    # What encoder.JSONEncoder.default() did for every model object before the codec
+    def default(o):
+        if isinstance(o, Model):
+            return {o.attribute_map[attr]: getattr(o, attr) for attr in o.openapi_types
+                    if getattr(o, attr) is not None or include_nulls}
+        if isinstance(o, datetime.datetime):
+            return o.isoformat() + 'Z'
+        raise TypeError(type(o))
+
+    expected = json.loads(json.dumps(envelope, default=default))
+    assert json.loads(codec.dumps(envelope, include_nulls=include_nulls)) == expected
+    assert codec.model_to_jsonable(json.loads(json.dumps(expected))) == expected
+    assert ("relation" in expected["message"]["knowledge_graph"]["edges"]["KG2:1"]) == include_nulls
+
+
+def test_iter_dumps_streams_the_same_json():
+    envelope = Response.from_dict(_create_response_dict())
+    for node_index in range(200):
+        envelope.message.knowledge_graph.nodes[f"X:{node_index}"] = Node(name=f"node {node_index}", category=["biolink:Gene"])
+    chunks = list(codec.iter_dumps(envelope, include_nulls=True, chunk_size=500))
+    assert len(chunks) > 10
+    assert max(len(chunk) for chunk in chunks[:-1]) < 1000
+    assert not any("\n" in chunk for chunk in chunks)
+    assert json.loads("".join(chunks)) == json.loads(codec.dumps(envelope, include_nulls=True))
+    assert json.loads("".join(codec.iter_dumps({"results": [], "n": None, 1: [{}]}))) == {"results": [], "n": None, "1": [{}]}
+
+
+def test_dumps_handles_non_json_types():
+    numpy = pytest.importorskip("numpy")
+    data = {"scores": numpy.array([0.5, 0.25]), "count": numpy.int64(3), "ids": {"A"}}
+    assert json.loads(codec.dumps(data)) == {"scores": [0.5, 0.25], "count": 3, "ids": ["A"]}
+    with pytest.raises(TypeError):
+        codec.dumps({"value": object()})
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_trapi_codec.py'])
@@ -9,8 +9,11 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../../ARAX/ARAXQuery")
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/../../../../reasoningtool/QuestionAnswering")
+from ARAX_legacy_query_pool import ARAXLegacyQueryPool
 
 def main():
+    # Start the workers for the legacy canned queries now, rather than when the first of those questions arrives
+    ARAXLegacyQueryPool.get_pool()
     app = connexion.App(__name__, specification_dir='./openapi/')
     app.app.json_encoder = encoder.JSONEncoder
     app.add_api('openapi.yaml',
@@ -0,0 +1,290 @@
+"""Fast (de)serialization of the openapi_server models.
+
+util.deserialize_model() and the original Model.to_dict() rediscover each model's attributes and their types (by
+instantiating the class and walking openapi_types) for every single object, which dominates the cost of converting
+large messages. Here that work is done once per model class: the first time a class is seen, a prototype instance is
+inspected and a list of per-attribute decoders is built, and after that objects are converted with plain loops.
+The results are the same as those of util.deserialize_model(), util.serialize_model() and encoder.JSONEncoder.
+"""
+import datetime
+import decimal
+import json
+
+import six
+import typing
+
+from openapi_server import typing_utils
+from openapi_server import util
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+T = typing.TypeVar('T')
+
+_PRIMITIVE_TYPES = (str, int, float, bool, type(None))
+_model_infos = {}
+
+
+class _ModelInfo(object):
+    """What we need to know about one model class to convert its objects"""
+
+    def __init__(self, klass):
+        from openapi_server.models.base_model_ import Model
+        prototype = klass()
+        self.klass = klass
+        self.is_plain = not prototype.openapi_types
+        # Every attribute __init__ sets (including openapi_types and attribute_map, which are never modified, so they
+        # can be shared by all objects we create)
+        self.template = dict(prototype.__dict__)
+        self.attrs = list(prototype.openapi_types)
+        self.json_keys = [prototype.attribute_map[attr] for attr in self.attrs]
+        # (json key, property setter, decoder) for each attribute
+        self.fields = []
+        for attr, attr_type in six.iteritems(prototype.openapi_types):
+            prop = getattr(klass, attr, None)
+            setter = prop.fset if isinstance(prop, property) and prop.fset is not None else _make_setattr(attr)
+            self.fields.append((prototype.attribute_map[attr], setter, _make_decoder(attr_type)))
+        # Objects whose class overrides to_dict() must still be converted with their own to_dict()
+        self.uses_default_to_dict = getattr(klass, 'to_dict', None) is Model.to_dict
+
+
+def _get_model_info(klass):
+    model_info = _model_infos.get(klass)
+    if model_info is None:
+        model_info = _ModelInfo(klass)
+        _model_infos[klass] = model_info
+    return model_info
+
+
+def _make_setattr(attr):
+    def set_attribute(instance, value):
+        setattr(instance, attr, value)
+    return set_attribute
+
+
+def _make_decoder(klass):
+    """Returns a function doing what util._deserialize(data, klass) does"""
+    if klass in six.integer_types or klass in (float, str, bool, bytearray):
+        def decode_primitive(data):
+            if data is None or type(data) is klass:
+                return data
+            return util._deserialize_primitive(data, klass)
+        return decode_primitive
+    if klass == object:
+        return lambda data: data
+    if klass in (datetime.date, datetime.datetime) or isinstance(klass, str):
+        return lambda data: util._deserialize(data, klass)
+    if typing_utils.is_generic(klass):
+        if typing_utils.is_list(klass):
+            decode_item = _make_decoder(klass.__args__[0])
+
+            def decode_list(data):
+                if data is None:
+                    return None
+                return [decode_item(item) for item in data]
+            return decode_list
+        if typing_utils.is_dict(klass):
+            decode_value = _make_decoder(klass.__args__[1])
+
+            def decode_dict(data):
+                if data is None:
+                    return None
+                return {key: decode_value(value) for key, value in six.iteritems(data)}
+            return decode_dict
+        return lambda data: util._deserialize(data, klass)
+    return lambda data: model_from_dict(data, klass)
+
+
+def model_from_dict(data, klass: typing.Type[T]) -> T:
+    """Deserializes a dict to a model object, like util.deserialize_model()"""
+    model_info = _get_model_info(klass)
+    if model_info.is_plain:
+        return data
+    if type(data) is not dict:
+        return util.deserialize_model(data, klass)
+    instance = klass.__new__(klass)
+    instance.__dict__.update(model_info.template)
+    for json_key, setter, decode in model_info.fields:
+        if json_key in data:
+            setter(instance, decode(data[json_key]))
+    return instance
+
+
+def _to_dict_or_self(value):
+    model_info = _model_infos.get(type(value))
+    if model_info is not None and model_info.uses_default_to_dict:
+        return _model_to_dict(value, model_info)
+    return value.to_dict() if hasattr(value, "to_dict") else value
+
+
+def _model_to_dict(model, model_info):
+    result = {}
+    for attr in model_info.attrs:
+        value = getattr(model, attr)
+        value_type = type(value)
+        if value_type in _PRIMITIVE_TYPES:
+            result[attr] = value
+        elif isinstance(value, list):
+            result[attr] = [_to_dict_or_self(item) for item in value]
+        elif hasattr(value, "to_dict"):
+            result[attr] = _to_dict_or_self(value)
+        elif isinstance(value, dict):
+            # Like the original to_dict(), this handles up to two levels of dicts/lists between model objects
+            result_dict = {}
+            for dict_key, dict_value in value.items():
+                if isinstance(dict_value, list):
+                    result_dict[dict_key] = [_to_dict_or_self(item) for item in dict_value]
+                elif isinstance(dict_value, dict):
+                    result_dict[dict_key] = {item_key: (_to_dict_or_self(item_value) if hasattr(item_value, "to_dict") else item_value)
+                                             for item_key, item_value in dict_value.items()}
+                elif hasattr(dict_value, "to_dict"):
+                    result_dict[dict_key] = _to_dict_or_self(dict_value)
+                else:
+                    result_dict[dict_key] = dict_value
+            result[attr] = result_dict
+        else:
+            result[attr] = value
+    return result
+
+
+def model_to_dict(model) -> dict:
+    """Returns the model properties as a dict, like the original (reflection-based) Model.to_dict()"""
+    return _model_to_dict(model, _get_model_info(type(model)))
+
+
+def model_to_jsonable(obj, include_nulls: bool = False):
+    """
+    Converts a model object (or a dict/list containing them, at any depth) to plain dicts and lists, the way
+    encoder.JSONEncoder would while serializing it: keys are the JSON attribute names and, unless include_nulls is set,
+    attributes that are None are left out. Values that aren't JSON types are returned as they are.
+    """
+    obj_type = type(obj)
+    if obj_type in _PRIMITIVE_TYPES:
+        return obj
+    if obj_type is dict:
+        return {key: model_to_jsonable(value, include_nulls) for key, value in obj.items()}
+    if obj_type is list or obj_type is tuple:
+        return [model_to_jsonable(item, include_nulls) for item in obj]
+    model_info = _model_infos.get(obj_type)
+    if model_info is None:
+        from openapi_server.models.base_model_ import Model
+        if not isinstance(obj, Model):
+            if isinstance(obj, dict):
+                return {key: model_to_jsonable(value, include_nulls) for key, value in obj.items()}
+            if isinstance(obj, (list, tuple)):
+                return [model_to_jsonable(item, include_nulls) for item in obj]
+            return obj
+        model_info = _get_model_info(obj_type)
+    result = {}
+    for attr, json_key in zip(model_info.attrs, model_info.json_keys):
+        value = getattr(obj, attr)
+        if value is None and not include_nulls:
+            continue
+        result[json_key] = model_to_jsonable(value, include_nulls)
+    return result
+
+
+def _default(obj):
+    """Serializes what orjson/json can't natively (NumPy scalars and arrays, float/int subclasses, sets, dates)"""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if isinstance(obj, bool):
+        return bool(obj)
+    if isinstance(obj, int):
+        return int(obj)
+    if isinstance(obj, float):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # As connexion's FlaskJSONEncoder does
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat() if obj.tzinfo else obj.isoformat() + 'Z'
+    if isinstance(obj, datetime.date):
+        return obj.isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _model_to_shallow_dict(model, include_nulls: bool) -> dict:
+    model_info = _get_model_info(type(model))
+    if include_nulls:
+        return {json_key: getattr(model, attr) for attr, json_key in zip(model_info.attrs, model_info.json_keys)}
+    result = {}
+    for attr, json_key in zip(model_info.attrs, model_info.json_keys):
+        value = getattr(model, attr)
+        if value is not None:
+            result[json_key] = value
+    return result
+
+
+def dumps(obj, include_nulls: bool = False) -> bytes:
+    """
+    Serializes a model object (or plain data containing them) to JSON bytes, with the same content the Flask
+    JSONEncoder would produce. Uses orjson when it is installed. Each model object is turned into a shallow dict of its
+    attributes only when the encoder reaches it, so no full plain-dict copy of the message is ever built.
+    """
+    from openapi_server.models.base_model_ import Model
+
+    def default(o):
+        if isinstance(o, Model):
+            return _model_to_shallow_dict(o, include_nulls)
+        return _default(o)
+
+    if orjson is not None:
+        return orjson.dumps(obj, default=default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    return json.dumps(obj, default=default).encode('utf-8')
+
+
+def iter_dumps(obj, include_nulls: bool = False, chunk_size: int = 65536, stream_depth: int = 4) -> typing.Iterator[str]:
+    """
+    Serializes a model object (or plain data containing them) to JSON like dumps(), but yields the text in chunks of
+    about chunk_size characters as it goes. Model objects, dicts and lists nested less than stream_depth levels deep
+    (for a Response: the message, the knowledge_graph, its nodes and edges, and the results) are written one member at
+    a time, and everything deeper is serialized whole with dumps(), so memory use is bounded by the chunk size and the
+    largest single node, edge or result rather than by the size of the message. No newlines are emitted.
+    """
+    from openapi_server.models.base_model_ import Model
+    buffer = []
+    buffer_size = 0
+
+    def encode_key(key):
+        return dumps(key if isinstance(key, str) else str(key)).decode('utf-8')
+
+    def iter_items(value, depth):
+        if depth < stream_depth:
+            if isinstance(value, Model):
+                members = _model_to_shallow_dict(value, include_nulls)
+            elif isinstance(value, dict):
+                members = value
+            elif isinstance(value, (list, tuple)):
+                yield '['
+                for index, item in enumerate(value):
+                    if index > 0:
+                        yield ','
+                    yield from iter_items(item, depth + 1)
+                yield ']'
+                return
+            else:
+                members = None
+            if members is not None:
+                yield '{'
+                for index, (key, member) in enumerate(members.items()):
+                    yield (',' if index > 0 else '') + encode_key(key) + ':'
+                    yield from iter_items(member, depth + 1)
+                yield '}'
+                return
+        yield dumps(value, include_nulls).decode('utf-8')
+
+    for text in iter_items(obj, 0):
+        buffer.append(text)
+        buffer_size += len(text)
+        if buffer_size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            buffer_size = 0
+    if buffer:
+        yield ''.join(buffer)
@@ -4,6 +4,9 @@ import six
 # Import to allow streaming of progress information
 from flask import stream_with_context, request, Response
 
+from openapi_server.models.base_model_ import Model
+from openapi_server import codec
+
 import os
 import sys
 
@@ -29,11 +32,17 @@ def query(request_body, bypass_cache=None):  # noqa: E501
     query = connexion.request.get_json()
     araxq = ARAXQuery()
 
+    # The bypass_cache URL parameter takes precedence over any bypass_cache in the body
+    if bypass_cache is not None:
+        query['bypass_cache'] = str(bypass_cache).lower()
+
     if "asynchronous" in query and query['asynchronous'].lower() == 'stream':
         # Return a stream of data to let the client know what's going on
         return Response(araxq.query_return_stream(query),mimetype='text/plain')
 
-    # Else perform the query and return the result
+    # Else perform the query and return the result, serialized with the fast codec rather than the Flask JSONEncoder
     else:
         envelope = araxq.query_return_message(query)
+        if isinstance(envelope, Model):
+            return Response(codec.dumps(envelope), mimetype='application/json')
         return envelope
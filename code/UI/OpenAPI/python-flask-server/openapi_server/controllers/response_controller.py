@@ -1,6 +1,9 @@
 import connexion
 import six
 
+# Import to allow streaming of large stored responses
+from flask import stream_with_context, Response as FlaskResponse
+
 from openapi_server.models.response import Response  # noqa: E501
 from openapi_server import util
 
@@ -22,6 +25,12 @@ def get_response(response_id):  # noqa: E501
     """
 
     response_cache = ResponseCache()
+
+    # Locally stored responses are streamed straight from the response store rather than loaded whole
+    response_stream = response_cache.get_response_stream(response_id)
+    if response_stream is not None:
+        return FlaskResponse(stream_with_context(response_stream), mimetype='application/json')
+
     envelope = response_cache.get_response(response_id)
     return envelope
 
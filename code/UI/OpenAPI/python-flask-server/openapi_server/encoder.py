@@ -1,7 +1,7 @@
 from connexion.apps.flask_app import FlaskJSONEncoder
-import six
 
 from openapi_server.models.base_model_ import Model
+from openapi_server import codec
 
 
 class JSONEncoder(FlaskJSONEncoder):
@@ -9,12 +9,6 @@ class JSONEncoder(FlaskJSONEncoder):
 
     def default(self, o):
         if isinstance(o, Model):
-            dikt = {}
-            for attr, _ in six.iteritems(o.openapi_types):
-                value = getattr(o, attr)
-                if value is None and not self.include_nulls:
-                    continue
-                attr = o.attribute_map[attr]
-                dikt[attr] = value
-            return dikt
+            # Convert the whole subtree at once rather than being called back for every nested model
+            return codec.model_to_jsonable(o, include_nulls=self.include_nulls)
         return FlaskJSONEncoder.default(self, o)
@@ -114,6 +114,69 @@ def deserialize_model(data, klass):
     return instance
 
 
+def serialize_model(model):
+    """Serializes a model to a dict by walking its openapi_types (what Model.to_dict() used to do).
+
+    codec.model_to_dict() gives the same result much faster; this is kept as the reference implementation.
+
+    :param model: model object.
+    :return: dict.
+    """
+    result = {}
+
+    for attr, _ in six.iteritems(model.openapi_types):
+        value = getattr(model, attr)
+        if isinstance(value, list):
+            result[attr] = list(map(
+                lambda x: _serialize_nested_model(x) if hasattr(x, "to_dict") else x,
+                value
+            ))
+        elif hasattr(value, "to_dict"):
+            result[attr] = _serialize_nested_model(value)
+        elif isinstance(value, dict):
+
+            #### This only can handle one level of lists or dicts between objects
+            #result[attr] = dict(map(
+            #    lambda item: (item[0], item[1].to_dict())
+            #    if hasattr(item[1], "to_dict") else item,
+            #    value.items()
+            #))
+
+            #### This is a little fancier in that it can handle two levels, a dict and then
+            #### another dict or list between objects. Not the ultimate solution but
+            #### perhaps adequate for now?
+            result_dict = {}
+            for dict_key, dict_value in value.items():
+                if isinstance(dict_value, list):
+                    result_dict[dict_key] = list(map(
+                        lambda x: _serialize_nested_model(x) if hasattr(x, "to_dict") else x,
+                        dict_value
+                    ))
+                elif isinstance(dict_value, dict):
+                    result_dict[dict_key] = dict(map(
+                        lambda dict_value_item: (dict_value_item[0], _serialize_nested_model(dict_value_item[1]))
+                        if hasattr(dict_value_item[1], "to_dict") else dict_value_item,
+                        dict_value.items()
+                    ))
+                elif hasattr(dict_value, "to_dict"):
+                    result_dict[dict_key] = _serialize_nested_model(dict_value)
+                else:
+                    result_dict[dict_key] = dict_value
+            result[attr] = result_dict
+
+        else:
+            result[attr] = value
+
+    return result
+
+
+def _serialize_nested_model(value):
+    from openapi_server.models.base_model_ import Model
+    if type(value).to_dict is Model.to_dict:
+        return serialize_model(value)
+    return value.to_dict()
+
+
 def _deserialize_list(data, boxed_type):
     """Deserializes a list and its elements.
 
@@ -275,6 +275,132 @@ def save_json(data, output_file_name: str, test_mode: bool = False):
     shutil.move(temp_output_file_name, output_file_name)
 
 
+def read_json_array_items(input_file_name: str, array_key: str, chunk_size: int = 1 << 20):
+    """Iterate over the items of the array stored under array_key in the top-level object of a JSON file (e.g., the
+    'nodes' or 'edges' of a KG2 JSON file), parsing them one at a time as the file is read rather than loading the
+    whole file with json.load(); the other top-level values are parsed and discarded."""
+    decoder = json.JSONDecoder()
+    non_whitespace = re.compile(r'\S')
+    if not input_file_name.endswith('.gz'):
+        input_file = open(input_file_name, 'r')
+    else:
+        input_file = gzip.open(input_file_name, 'rt')
+    buffer = ''
+    pos = 0
+    at_eof = False
+
+    def read_more():
+        nonlocal buffer, pos, at_eof
+        chunk = input_file.read(chunk_size)
+        if chunk == '':
+            at_eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def peek_char():
+        # skips whitespace and returns the next character ('' at the end of the file)
+        nonlocal pos
+        while True:
+            match = non_whitespace.search(buffer, pos)
+            if match is not None:
+                pos = match.start()
+                return buffer[pos]
+            pos = len(buffer)
+            if not read_more():
+                return ''
+
+    def read_char(expected_chars: str):
+        nonlocal pos
+        char = peek_char()
+        if char == '' or char not in expected_chars:
+            raise ValueError("invalid JSON in file " + input_file_name + ": expected one of '" + expected_chars +
+                             "' but found '" + char + "'")
+        pos += 1
+        return char
+
+    def read_value():
+        nonlocal pos
+        peek_char()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # a number that runs to the end of the buffer (or is followed by what could be more of a number)
+                # might continue in the next chunk
+                if at_eof or (end < len(buffer) and
+                              (not isinstance(value, (int, float)) or buffer[end] not in '.eE+-0123456789')):
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if at_eof:
+                    raise
+            read_more()
+
+    with input_file:
+        read_char('{')
+        if peek_char() == '}':
+            return
+        while True:
+            key = read_value()
+            read_char(':')
+            if peek_char() == '[':
+                # arrays are read item by item even when they are skipped, so that they are never held in memory
+                read_char('[')
+                if peek_char() == ']':
+                    read_char(']')
+                else:
+                    while True:
+                        item = read_value()
+                        if key == array_key:
+                            yield item
+                        if read_char(',]') == ']':
+                            break
+                if key == array_key:
+                    return
+            else:
+                read_value()
+                if key == array_key:
+                    raise ValueError("invalid JSON in file " + input_file_name + ": the value of '" + array_key +
+                                     "' is not an array")
+            if read_char(',}') == '}':
+                return
+
+
+def save_json_arrays(arrays: dict, output_file_name: str, test_mode: bool = False):
+    """Save an object whose values are arrays, like save_json(), but write the items of each array as they are
+    produced by the iterables in the arrays dict, so that they never have to be in memory all at once"""
+    keys = list(arrays.keys()) if not test_mode else sorted(arrays.keys())
+    temp_output_file_handle, temp_output_file_name = tempfile.mkstemp(prefix='kg2-')
+    os.close(temp_output_file_handle)
+    if not output_file_name.endswith('.gz'):
+        temp_output_file = open(temp_output_file_name, 'w')
+    else:
+        temp_output_file = gzip.open(temp_output_file_name, 'wt')
+    with temp_output_file:
+        if not test_mode:
+            # the same layout as json.dump() with the default separators
+            temp_output_file.write('{')
+            for key_index, key in enumerate(keys):
+                temp_output_file.write((', ' if key_index > 0 else '') + json.dumps(key) + ': [')
+                for item_index, item in enumerate(arrays[key]):
+                    temp_output_file.write((', ' if item_index > 0 else '') + json.dumps(item))
+                temp_output_file.write(']')
+            temp_output_file.write('}')
+        else:
+            # the same layout as json.dump() with indent=4 and sort_keys=True
+            temp_output_file.write('{' if len(keys) == 0 else '{\n')
+            for key_index, key in enumerate(keys):
+                temp_output_file.write((',\n' if key_index > 0 else '') + '    ' + json.dumps(key) + ': [')
+                item_index = -1
+                for item_index, item in enumerate(arrays[key]):
+                    item_json = json.dumps(item, indent=4, sort_keys=True).replace('\n', '\n        ')
+                    temp_output_file.write((',\n' if item_index > 0 else '\n') + '        ' + item_json)
+                temp_output_file.write(']' if item_index < 0 else '\n    ]')
+            temp_output_file.write('}' if len(keys) == 0 else '\n}')
+    shutil.move(temp_output_file_name, output_file_name)
+
+
 def get_file_last_modified_timestamp(file_name: str):
     return time.gmtime(os.path.getmtime(file_name))
 
@@ -443,8 +569,9 @@ def log_message(message: str,
     print(ont_str + message + node_str, file=output_stream)
 
 
-def merge_two_dicts(x: dict, y: dict, biolink_depth_getter: callable = None):
-    ret_dict = copy.deepcopy(x)
+def merge_two_dicts(x: dict, y: dict, biolink_depth_getter: callable = None, in_place: bool = False):
+    # in_place=True merges y into x itself (instead of a deep copy of it), for callers that don't need x afterwards
+    ret_dict = copy.deepcopy(x) if not in_place else x
     for key, value in y.items():
         stored_value = ret_dict.get(key, None)
         if stored_value is None:
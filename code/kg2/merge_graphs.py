@@ -3,7 +3,14 @@
 
    Usage: merge_graphs.py --kgFiles <kgFile1> ... <kgFile>
                          [--kgFileOrphanEdges <kgFileOrphanEdges>]
+                         [--tempDir <tempDir>]
                          <output.json>
+
+   The input files are read incrementally, the merged nodes are kept in an
+   on-disk SQLite store, edges are deduplicated using 64-bit hashes of their
+   keys, and the output is written as it is produced, so the memory needed
+   does not grow with the size of the KG (apart from 16-32 bytes per distinct
+   edge).
 '''
 
 __author__ = 'Stephen Ramsey'
@@ -16,9 +23,16 @@ __email__ = ''
 __status__ = 'Prototype'
 
 import argparse
-import kg2_util
+import hashlib
 import json
+import kg2_util
+import numpy
+import os
+import resource
+import shutil
+import sqlite3
 import sys
+import tempfile
 
 
 def make_arg_parser():
@@ -26,70 +40,174 @@ def make_arg_parser():
     arg_parser.add_argument('--test', dest='test', action="store_true", default=False)
     arg_parser.add_argument('--kgFileOrphanEdges', type=str, nargs='?', default=None)
     arg_parser.add_argument('--outputFile', type=str, nargs='?', default=None)
+    arg_parser.add_argument('--tempDir', type=str, nargs='?', default=None,
+                            help='directory for the on-disk node store (default: the directory of the output file)')
     arg_parser.add_argument('kgFiles', type=str, nargs='+')
     return arg_parser
 
 
-if __name__ == '__main__':
-    args = make_arg_parser().parse_args()
-    kg_file_names = args.kgFiles
-    test_mode = args.test
-    output_file_name = args.outputFile
-    kg_orphan_edges = {'nodes': [], 'edges': []}
-    nodes = dict()
-    rels = dict()
-    for kg_file_name in kg_file_names:
-        kg2_util.log_message("reading nodes from file",
-                             ontology_name=kg_file_name,
-                             output_stream=sys.stderr)
-        kg_to_add = json.load(open(kg_file_name, 'r'))
-        kg_to_add_nodes = kg_to_add['nodes']
-        for node in kg_to_add_nodes:
-            node_id = node['id']
-            if node_id not in nodes:
-                nodes[node_id] = node
-            else:
-                nodes[node_id] = kg2_util.merge_two_dicts(nodes[node_id], node)
-        kg2_util.log_message("number of nodes added: " + str(len(kg_to_add_nodes)),
-                             ontology_name=kg_file_name,
-                             output_stream=sys.stderr)
+class EdgeKeyHashSet:
+    '''A set of edge keys that stores only a 64-bit hash of each key, in an
+       open-addressing NumPy table (16 bytes per key at the maximum load).
+       Two different keys with the same hash would be taken for duplicates,
+       which is unlikely (p < 10^-4 for 50 million edges).'''
+
+    def __init__(self, initial_capacity: int = 1 << 20):
+        self.table = numpy.zeros(initial_capacity, dtype=numpy.uint64)
+        self.size = 0
+
+    @staticmethod
+    def hash_key(key: str):
+        key_hash = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        return key_hash if key_hash != 0 else 1  # 0 marks an empty slot
+
+    def add(self, key: str):
+        '''Adds the key, and returns False if it was already in the set'''
+        if 2 * (self.size + 1) > len(self.table):
+            self.grow()
+        key_hash = self.hash_key(key)
+        table = self.table
+        mask = len(table) - 1
+        slot = key_hash & mask
+        while True:
+            slot_hash = int(table[slot])
+            if slot_hash == 0:
+                table[slot] = key_hash
+                self.size += 1
+                return True
+            if slot_hash == key_hash:
+                return False
+            slot = (slot + 1) & mask
+
+    def grow(self):
+        key_hashes = self.table[self.table != 0]
+        self.table = numpy.zeros(2 * len(self.table), dtype=numpy.uint64)
+        mask = numpy.uint64(len(self.table) - 1)
+        slots = key_hashes & mask
+        # linear probing, for all of the hashes at once: in each round, every free slot is taken by the first
+        # hash that wants it, and the other hashes move on to the next slot
+        while len(key_hashes) > 0:
+            is_free = self.table[slots] == 0
+            free_slots, first_indices = numpy.unique(slots[is_free], return_index=True)
+            placed = numpy.flatnonzero(is_free)[first_indices]
+            self.table[free_slots] = key_hashes[placed]
+            is_unplaced = numpy.ones(len(key_hashes), dtype=bool)
+            is_unplaced[placed] = False
+            key_hashes = key_hashes[is_unplaced]
+            slots = (slots[is_unplaced] + numpy.uint64(1)) & mask
+
+
+def create_node_store(temp_dir: str):
+    store_file_handle, store_file_name = tempfile.mkstemp(prefix='kg2-merge-nodes-', suffix='.sqlite', dir=temp_dir)
+    os.close(store_file_handle)
+    connection = sqlite3.connect(store_file_name)
+    # the store is thrown away at the end, so it doesn't need to survive crashes
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    connection.execute('PRAGMA cache_size = -1048576')
+    connection.execute('CREATE TABLE nodes (id TEXT PRIMARY KEY, node TEXT)')
+    return connection
+
+
+def add_nodes(node_store: sqlite3.Connection, kg_file_name: str):
+    cursor = node_store.cursor()
+    ctr_nodes = 0
+    for node in kg2_util.read_json_array_items(kg_file_name, 'nodes'):
+        ctr_nodes += 1
+        node_id = node['id']
+        cursor.execute('INSERT OR IGNORE INTO nodes (id, node) VALUES (?, ?)', (node_id, json.dumps(node)))
+        if cursor.rowcount == 0:
+            stored_node = json.loads(cursor.execute('SELECT node FROM nodes WHERE id = ?', (node_id,)).fetchone()[0])
+            # the stored node was just parsed, so it can be merged into without copying it
+            merged_node = kg2_util.merge_two_dicts(stored_node, node, in_place=True)
+            cursor.execute('UPDATE nodes SET node = ? WHERE id = ?', (json.dumps(merged_node), node_id))
+    node_store.commit()
+    return ctr_nodes
+
+
+def iterate_nodes(node_store: sqlite3.Connection):
+    # rowid order is the order in which the nodes were first seen
+    for (node_json,) in node_store.execute('SELECT node FROM nodes ORDER BY rowid'):
+        yield json.loads(node_json)
+
+
+def iterate_merged_edges(kg_file_names: list, node_store: sqlite3.Connection, orphan_edges_file):
+    '''Yields the edges of the KG files whose subject and object are both
+       nodes, without duplicates; orphan edges are written to orphan_edges_file
+       (one per line) if it isn't None'''
+    cursor = node_store.cursor()
+    edge_keys = EdgeKeyHashSet()
     ctr_edges_added = 0
-    edges = []
-    last_edges_added = 0
-    last_orphan_edges = 0
-    edge_keys = set()
+    ctr_orphan_edges = 0
     for kg_file_name in kg_file_names:
-        kg_orphan_edges_new = []
+        last_edges_added = ctr_edges_added
+        last_orphan_edges = ctr_orphan_edges
         kg2_util.log_message("reading edges from file",
                              ontology_name=kg_file_name,
                              output_stream=sys.stderr)
-        kg_to_add = json.load(open(kg_file_name, 'r'))
-        kg_to_add_edges = kg_to_add['edges']
-        for rel_dict in kg_to_add_edges:
+        for rel_dict in kg2_util.read_json_array_items(kg_file_name, 'edges'):
             subject_curie = rel_dict['subject']
             object_curie = rel_dict['object']
-            if subject_curie in nodes and object_curie in nodes:
+            if cursor.execute('SELECT 1 FROM nodes WHERE id = ?', (subject_curie,)).fetchone() is not None and \
+               cursor.execute('SELECT 1 FROM nodes WHERE id = ?', (object_curie,)).fetchone() is not None:
                 ctr_edges_added += 1
-                edge_key = kg2_util.make_edge_key(rel_dict)
-                if edge_key not in edge_keys:
-                    edge_keys.add(edge_key)
-                    edges.append(rel_dict)
+                if edge_keys.add(kg2_util.make_edge_key(rel_dict)):
+                    yield rel_dict
             else:
-                kg_orphan_edges_new.append(rel_dict)
-        kg_orphan_edges['edges'] += kg_orphan_edges_new
+                ctr_orphan_edges += 1
+                if orphan_edges_file is not None:
+                    orphan_edges_file.write(json.dumps(rel_dict) + '\n')
         kg2_util.log_message("number of edges added: " + str(ctr_edges_added - last_edges_added),
                              ontology_name=kg_file_name,
                              output_stream=sys.stderr)
-        last_edges_added = ctr_edges_added
-        kg2_util.log_message("number of orphan edges: " + str(len(kg_orphan_edges['edges']) -
-                                                              last_orphan_edges),
+        kg2_util.log_message("number of orphan edges: " + str(ctr_orphan_edges - last_orphan_edges),
                              ontology_name=kg_file_name,
                              output_stream=sys.stderr)
-        last_orphan_edges = len(kg_orphan_edges['edges'])
-    kg = {'nodes': [node for node in nodes.values()],
-          'edges': edges}
-    del nodes
-    kg2_util.save_json(kg, output_file_name, test_mode)
+
+
+def iterate_json_lines(file_name: str):
+    with open(file_name, 'r') as input_file:
+        for line in input_file:
+            yield json.loads(line)
+
+
+def log_peak_memory(stage: str):
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    kg2_util.log_message("peak RSS after " + stage + ": " + str(round(peak_rss_mb)) + " MB",
+                         output_stream=sys.stderr)
+
+
+if __name__ == '__main__':
+    args = make_arg_parser().parse_args()
+    kg_file_names = args.kgFiles
+    test_mode = args.test
+    output_file_name = args.outputFile
     kg_file_orphan_edges = args.kgFileOrphanEdges
-    if kg_file_orphan_edges is not None:
-        kg2_util.save_json(kg_orphan_edges, kg_file_orphan_edges, test_mode)
+    temp_dir = tempfile.mkdtemp(prefix='kg2-merge-',
+                                dir=args.tempDir if args.tempDir is not None else os.path.dirname(os.path.abspath(output_file_name)))
+    try:
+        node_store = create_node_store(temp_dir)
+        for kg_file_name in kg_file_names:
+            kg2_util.log_message("reading nodes from file",
+                                 ontology_name=kg_file_name,
+                                 output_stream=sys.stderr)
+            ctr_nodes_added = add_nodes(node_store, kg_file_name)
+            kg2_util.log_message("number of nodes added: " + str(ctr_nodes_added),
+                                 ontology_name=kg_file_name,
+                                 output_stream=sys.stderr)
+        log_peak_memory("merging nodes")
+        orphan_edges_file_name = os.path.join(temp_dir, 'orphan-edges.jsonl')
+        with open(orphan_edges_file_name, 'w') as orphan_edges_file:
+            kg2_util.save_json_arrays({'nodes': iterate_nodes(node_store),
+                                       'edges': iterate_merged_edges(kg_file_names, node_store,
+                                                                     orphan_edges_file if kg_file_orphan_edges is not None else None)},
+                                      output_file_name, test_mode)
+        node_store.close()
+        if kg_file_orphan_edges is not None:
+            kg2_util.save_json_arrays({'nodes': [],
+                                       'edges': iterate_json_lines(orphan_edges_file_name)},
+                                      kg_file_orphan_edges, test_mode)
+        log_peak_memory("merging edges")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
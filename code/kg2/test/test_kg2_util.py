@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_kg2_util.py
+
+import gzip
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/..")
+import kg2_util
+
+# Strings with escapes and JSON punctuation in them, numbers that can be cut in two, and nested and empty arrays, so
+# that a small chunk size puts chunk boundaries everywhere
+DOCUMENT = '''{"build": {"version": "2.5", "note": "nodes: [\\"a\\", ]}"},
+  "skipped": [[1, [2, []]], {"edges": [3]}, "]", -0.5e+3],
+  "nodes" : [
+    {"id": "A:1", "name": "caf\\u00e9 \\"au lait\\" \\\\ , ] } [ {", "xrefs": [], "depth": 12345678901234567890},
+    {"id": "A:2", "synonym": [["nested", ["deeper"]], []], "score": -1.25E-10, "deprecated": false, "ref": null},
+    [],
+    "\\ud83d\\ude00 tab\\tnewline\\n slash\\/",
+    123.456e7
+  ],
+  "edges": [],
+  "empty": {}
+}'''
+
+
+def _write(tmp_path, text, file_name='kg.json'):
+    file_name = str(tmp_path / file_name)
+    if file_name.endswith('.gz'):
+        with gzip.open(file_name, 'wt') as output_file:
+            output_file.write(text)
+    else:
+        with open(file_name, 'w') as output_file:
+            output_file.write(text)
+    return file_name
+
+
+@pytest.mark.parametrize("chunk_size", list(range(1, 20)) + [64, 1 << 20])
+def test_read_json_array_items_across_chunk_boundaries(tmp_path, chunk_size):
+    file_name = _write(tmp_path, DOCUMENT)
+    expected = json.loads(DOCUMENT)
+    assert list(kg2_util.read_json_array_items(file_name, 'nodes', chunk_size)) == expected['nodes']
+    assert list(kg2_util.read_json_array_items(file_name, 'skipped', chunk_size)) == expected['skipped']
+    assert list(kg2_util.read_json_array_items(file_name, 'edges', chunk_size)) == []
+
+
+def test_read_json_array_items_compact_and_gzipped(tmp_path):
+    expected = json.loads(DOCUMENT)
+    file_name = _write(tmp_path, json.dumps(expected, separators=(',', ':')), 'kg.json.gz')
+    assert list(kg2_util.read_json_array_items(file_name, 'nodes', 7)) == expected['nodes']
+
+
+@pytest.mark.parametrize("text", ['{}', '{"nodes": [], "edges": []}', ' { "edges" : [ ] , "nodes" : [ ] } ',
+                                  '{"edges": [{"id": 1}]}'])
+def test_read_json_array_items_empty(tmp_path, text):
+    assert list(kg2_util.read_json_array_items(_write(tmp_path, text), 'nodes', 3)) == []
+
+
+def test_read_json_array_items_nested_arrays(tmp_path):
+    items = [[], [[]], [[1, 2], [3, [4, [5]]]], [{"a": [[]]}], [""], ["]", "[", ","]]
+    file_name = _write(tmp_path, json.dumps({"nodes": items, "edges": [[[]]]}))
+    for chunk_size in [1, 2, 5, 1 << 20]:
+        assert list(kg2_util.read_json_array_items(file_name, 'nodes', chunk_size)) == items
+        assert list(kg2_util.read_json_array_items(file_name, 'edges', chunk_size)) == [[[]]]
+
+
+@pytest.mark.parametrize("text", ['{"nodes": {"id": "A:1"}}', '{"nodes": [1 2]}', '{"nodes": [1,', '["nodes"]',
+                                  '{"nodes": [{"id": "A:1}]}'])
+def test_read_json_array_items_invalid(tmp_path, text):
+    with pytest.raises(ValueError):
+        list(kg2_util.read_json_array_items(_write(tmp_path, text), 'nodes', 4))
+
+
+@pytest.mark.parametrize("test_mode", [False, True])
+@pytest.mark.parametrize("data", [json.loads(DOCUMENT), {'nodes': [], 'edges': []}, {'edges': [{'b': 1, 'a': [2]}], 'nodes': []}, {}])
+def test_save_json_arrays_matches_save_json(tmp_path, data, test_mode):
+    data = {key: value for key, value in data.items() if isinstance(value, list)}
+    expected_file_name = str(tmp_path / 'expected.json')
+    kg2_util.save_json(data, expected_file_name, test_mode)
+    output_file_name = str(tmp_path / 'output.json')
+    # the arrays are consumed from iterators, as merge_graphs.py passes them
+    kg2_util.save_json_arrays({key: iter(value) for key, value in data.items()}, output_file_name, test_mode)
+    with open(expected_file_name) as expected_file, open(output_file_name) as output_file:
+        assert output_file.read() == expected_file.read()
+    for key, value in data.items():
+        assert list(kg2_util.read_json_array_items(output_file_name, key, 5)) == value
+
+
+def test_save_json_arrays_gzipped(tmp_path):
+    data = {'nodes': json.loads(DOCUMENT)['nodes'], 'edges': []}
+    output_file_name = str(tmp_path / 'output.json.gz')
+    kg2_util.save_json_arrays(data, output_file_name)
+    with gzip.open(output_file_name, 'rt') as output_file:
+        assert json.load(output_file) == data
+
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_kg2_util.py'])
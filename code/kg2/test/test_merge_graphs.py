@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# Usage:  pytest -v test_merge_graphs.py
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))+"/..")
+import kg2_util
+import merge_graphs
+
+MERGE_GRAPHS = os.path.dirname(os.path.abspath(__file__)) + "/../merge_graphs.py"
+
+# Three small KGs: A:1 is in all of them with properties to merge, A:2 in two, and there are duplicate edges (within
+# and across files) and edges to nodes that are in none of the files
+KGS = [{'build': {'version': '1'},
+        'nodes': [{'id': 'A:1', 'name': 'a one', 'category': 'biolink:NamedThing', 'synonym': ['x', 'y'],
+                   'xrefs': ['B:1'], 'description': 'first', 'update_date': '2020', 'deprecated': False},
+                  {'id': 'A:2', 'name': 'a two', 'publications': ['PMID:1']},
+                  {'id': 'A:3', 'name': 'a three', 'provided_by': 'OBO:x'}],
+        'edges': [{'subject': 'A:1', 'object': 'A:2', 'relation': 'R:1', 'provided_by': 'P:1', 'id': 'e1'},
+                  {'subject': 'A:1', 'object': 'A:2', 'relation': 'R:1', 'provided_by': 'P:1', 'id': 'e1-again'},
+                  {'subject': 'A:1', 'object': 'Z:1', 'relation': 'R:1', 'provided_by': 'P:1', 'id': 'orphan1'}]},
+       {'nodes': [{'id': 'A:4', 'name': 'a four'},
+                  {'id': 'A:1', 'name': 'a one', 'category': 'biolink:Disease', 'synonym': ['z', 'x'],
+                   'xrefs': ['B:2', 'B:1'], 'description': 'second', 'update_date': '2020-01', 'deprecated': True},
+                  {'id': 'A:2', 'name': 'a two', 'publications': ['PMID:2'], 'provided_by': 'UMLS:STY'}],
+        'edges': [{'subject': 'A:2', 'object': 'A:4', 'relation': 'R:2', 'provided_by': 'P:2', 'id': 'e2'},
+                  {'subject': 'A:1', 'object': 'A:2', 'relation': 'R:1', 'provided_by': 'P:1', 'id': 'e1-third'},
+                  {'subject': 'Z:2', 'object': 'A:3', 'relation': 'R:3', 'provided_by': 'P:2', 'id': 'orphan2'}]},
+       {'nodes': [{'id': 'A:1', 'xrefs': ['B:3'], 'publications': ['PMID:3']}],
+        'edges': [{'subject': 'A:3', 'object': 'A:1', 'relation': 'R:1', 'provided_by': 'P:3', 'id': 'e3'},
+                  {'subject': 'A:2', 'object': 'A:4', 'relation': 'R:2', 'provided_by': 'P:9', 'id': 'e2-other-source'}]}]
+
+
+def _merge_in_memory(kg_file_names, output_file_name, orphan_edges_file_name, test_mode):
+    # What merge_graphs.py did before it was made to stream: everything in dicts and lists, then save_json()
+    nodes = dict()
+    for kg_file_name in kg_file_names:
+        for node in json.load(open(kg_file_name, 'r'))['nodes']:
+            node_id = node['id']
+            if node_id not in nodes:
+                nodes[node_id] = node
+            else:
+                nodes[node_id] = kg2_util.merge_two_dicts(nodes[node_id], node)
+    edges = []
+    orphan_edges = []
+    edge_keys = set()
+    for kg_file_name in kg_file_names:
+        for rel_dict in json.load(open(kg_file_name, 'r'))['edges']:
+            if rel_dict['subject'] in nodes and rel_dict['object'] in nodes:
+                edge_key = kg2_util.make_edge_key(rel_dict)
+                if edge_key not in edge_keys:
+                    edge_keys.add(edge_key)
+                    edges.append(rel_dict)
+            else:
+                orphan_edges.append(rel_dict)
+    kg2_util.save_json({'nodes': list(nodes.values()), 'edges': edges}, output_file_name, test_mode)
+    kg2_util.save_json({'nodes': [], 'edges': orphan_edges}, orphan_edges_file_name, test_mode)
+
+
+@pytest.mark.parametrize("test_mode", [False, True])
+def test_merge_graphs_matches_in_memory_merge(tmp_path, test_mode):
+    kg_file_names = []
+    for index, kg in enumerate(KGS):
+        kg_file_names.append(str(tmp_path / f"kg{index}.json"))
+        kg2_util.save_json(kg, kg_file_names[-1], test_mode)
+    _merge_in_memory(kg_file_names, str(tmp_path / 'expected.json'), str(tmp_path / 'expected-orphans.json'), test_mode)
+    temp_dir = tmp_path / 'temp'
+    temp_dir.mkdir()
+    subprocess.run([sys.executable, MERGE_GRAPHS] + (['--test'] if test_mode else []) +
+                   ['--outputFile', str(tmp_path / 'output.json'), '--kgFileOrphanEdges', str(tmp_path / 'orphans.json'),
+                    '--tempDir', str(temp_dir)] + kg_file_names, check=True, capture_output=True)
+    for output_file_name, expected_file_name in [('output.json', 'expected.json'), ('orphans.json', 'expected-orphans.json')]:
+        with open(tmp_path / output_file_name) as output_file, open(tmp_path / expected_file_name) as expected_file:
+            assert output_file.read() == expected_file.read()
+    merged_kg = json.load(open(tmp_path / 'output.json'))
+    assert [node['id'] for node in merged_kg['nodes']] == ['A:1', 'A:2', 'A:3', 'A:4']
+    assert [edge['id'] for edge in merged_kg['edges']] == ['e1', 'e2', 'e3', 'e2-other-source']
+    assert [edge['id'] for edge in json.load(open(tmp_path / 'orphans.json'))['edges']] == ['orphan1', 'orphan2']
+    # the node store is removed
+    assert os.listdir(temp_dir) == []
+
+
+def test_node_store_merges_nodes(tmp_path):
+    kg_file_names = []
+    for index, kg in enumerate(KGS):
+        kg_file_names.append(str(tmp_path / f"kg{index}.json"))
+        kg2_util.save_json(kg, kg_file_names[-1])
+    node_store = merge_graphs.create_node_store(str(tmp_path))
+    assert [merge_graphs.add_nodes(node_store, kg_file_name) for kg_file_name in kg_file_names] == [3, 3, 1]
+    nodes = list(merge_graphs.iterate_nodes(node_store))
+    assert [node['id'] for node in nodes] == ['A:1', 'A:2', 'A:3', 'A:4']
+    expected_node = kg2_util.merge_two_dicts(kg2_util.merge_two_dicts(KGS[0]['nodes'][0], KGS[1]['nodes'][1]), KGS[2]['nodes'][0])
+    assert nodes[0] == expected_node
+    assert nodes[0]['xrefs'] == ['B:1', 'B:2', 'B:3']
+    assert nodes[1]['provided_by'] == 'UMLS:STY'
+
+    orphan_edges = []
+
+    class _OrphanEdgesFile:
+        def write(self, line):
+            orphan_edges.append(json.loads(line))
+
+    edges = list(merge_graphs.iterate_merged_edges(kg_file_names, node_store, _OrphanEdgesFile()))
+    node_store.close()
+    assert [edge['id'] for edge in edges] == ['e1', 'e2', 'e3', 'e2-other-source']
+    assert [edge['id'] for edge in orphan_edges] == ['orphan1', 'orphan2']
+
+
+def test_edge_key_hash_set_grows():
+    edge_keys = merge_graphs.EdgeKeyHashSet(initial_capacity=4)
+    keys = [f"A:{index}---B:{index % 7}---R:1---P:1" for index in range(1000)]
+    assert all(edge_keys.add(key) for key in keys)
+    assert edge_keys.size == 1000
+    assert len(edge_keys.table) == 2048
+    assert int((edge_keys.table != 0).sum()) == 1000
+    # after growing, every key is still found
+    assert not any(edge_keys.add(key) for key in keys)
+    assert edge_keys.add("A:1---B:1---R:1---P:2")
+    assert edge_keys.size == 1001
+
+
+def test_edge_key_hash_set_probes_past_collisions(monkeypatch):
+    # keys whose hashes fall in the same slot are kept apart, also after the table grows
+    hashes = {'a': 8, 'b': 16, 'c': 1, 'd': 9, 'e': 24}
+    monkeypatch.setattr(merge_graphs.EdgeKeyHashSet, 'hash_key', staticmethod(lambda key: hashes[key]))
+    edge_keys = merge_graphs.EdgeKeyHashSet(initial_capacity=8)
+    assert [edge_keys.add(key) for key in ['a', 'b', 'c', 'd']] == [True] * 4
+    assert [int(key_hash) for key_hash in edge_keys.table] == [8, 16, 1, 9, 0, 0, 0, 0]
+    assert edge_keys.add('e')
+    assert len(edge_keys.table) == 16
+    assert edge_keys.size == 5
+    assert [edge_keys.add(key) for key in ['a', 'b', 'c', 'd', 'e']] == [False] * 5
+    assert sorted(int(key_hash) for key_hash in edge_keys.table if key_hash != 0) == [1, 8, 9, 16, 24]
+
+if __name__ == "__main__":
+    pytest.main(['-v', 'test_merge_graphs.py'])
@@ -9,6 +9,7 @@ import WordnetDistance as wd
 import CustomExceptions
 import datetime
 import re
+import threading
 
 # get all the question templates we've made so far, import each as a Question class
 question_templates = []
@@ -19,6 +20,18 @@ with open(os.path.join(os.path.dirname(__file__), 'Questions.tsv'), 'r') as fid:
 		else:
 			question_templates.append(Question.Question(line))
 
+# the tagged synsets of the corpora of all the question templates, built when the first question is parsed
+template_index = None
+template_index_lock = threading.Lock()
+
+
+def get_template_index():
+	global template_index
+	with template_index_lock:
+		if template_index is None:
+			template_index = wd.SentenceIndex([question.corpus for question in question_templates])
+	return template_index
+
 
 class ParseQuestion:
 	def __init__(self):
@@ -34,24 +47,17 @@ class ParseQuestion:
 		:return: question (Question class, or None), parameters (dict or None), error_message (string or None), error_code (string or None)
 		"""
 		input_question = input_question.replace("?", "")
-		# first, compute the wordnet distance for each corpus
-		wd_distances = []
-		for question in self._question_templates:
-			ind, val = wd.max_in_corpus(input_question, question.corpus)
-			wd_distances.append(val)
-
-		# Sort the indices based on wd_distance
-		indicies = range(len(self._question_templates))
-		sorted_indicies = [x for _, x in sorted(zip(wd_distances, indicies), key=lambda pair: pair[0], reverse=True)]
+		# first, find the 5 templates whose corpora are the most similar (by wordnet distance) to the question
+		top_matches = get_template_index().top_k(input_question, 5)
 
 		# For each one of the questions, see if it can be fulfilled with the input_question
 		error_message = None
 		error_code = None
 		fulfilled = False
-		for ind in sorted_indicies[0:5]:  # only look at the top 5 similar questions
+		for ind, wd_distance in top_matches:  # only look at the top 5 similar questions
 			question = self._question_templates[ind]
 			#print(question.restated_question_template.template)
-			if wd_distances[ind] < 0.25:  # don't even bother with these low quality matches
+			if wd_distance < 0.25:  # don't even bother with these low quality matches
 				break
 			try:
 				parameters = question.get_parameters(input_question)
@@ -70,7 +76,7 @@ class ParseQuestion:
 
 		if not fulfilled:
 			# If the question was not fulfilled, get the question that was closest, try to fulfill it, and say what's missing
-			question = self._question_templates[sorted_indicies[0]]
+			question = self._question_templates[top_matches[0][0]]
 			parameters = question.get_parameters(input_question)
 			error_message = "The most similar question I can answer is: " + question.restate_question(parameters)
 			error_message += "\n But I was unable to fill the following parameters: " + str([key for key, value in parameters.items() if value is None])
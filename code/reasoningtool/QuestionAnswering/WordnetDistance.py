@@ -1,5 +1,9 @@
-from nltk import word_tokenize, pos_tag
+from nltk import word_tokenize
+from nltk.tag.perceptron import PerceptronTagger
 from nltk.corpus import wordnet as wn
+import functools
+import heapq
+import numpy as np
 
 
 def penn_to_wn(tag):
@@ -19,6 +23,22 @@ def penn_to_wn(tag):
 	return None
 
 
+@functools.lru_cache(maxsize=None)
+def get_tagger():
+	""" The tagger pos_tag uses, loaded once (pos_tag loads it again on every call in NLTK <= 3.5) """
+	return PerceptronTagger()
+
+
+def tag_sentence(sentence):
+	"""
+	Tokenize a sentence and tag the part of speech of each token, as pos_tag(word_tokenize(sentence)) does
+	:param sentence: input string
+	:return: list of (token, tag) tuples
+	"""
+	return get_tagger().tag(word_tokenize(sentence))
+
+
+@functools.lru_cache(maxsize=100000)
 def tagged_to_synset(word, tag):
 	"""
 	Get the wordnet set from a word and it's part of speech tag
@@ -40,6 +60,16 @@ def tagged_to_synset(word, tag):
 		return None
 
 
+def tagged_to_synsets(tagged_words):
+	"""
+	Get the wordnet sets of the words of a tagged sentence, leaving out the words that have none
+	:param tagged_words: list of (word, tag) tuples
+	:return: list of wordnet synsets
+	"""
+	synsets = [tagged_to_synset(*tagged_word) for tagged_word in tagged_words]
+	return [ss for ss in synsets if ss]
+
+
 def sentence_similarity(sentence1, sentence2):
 	"""
 	Copute sentence similarity based on wordnet
@@ -48,16 +78,12 @@ def sentence_similarity(sentence1, sentence2):
 	:return: float between 0 and 1 giving similarity of sentences
 	"""
 	# Tokenize and tag
-	sentence1_tagged = pos_tag(word_tokenize(sentence1))
-	sentence2_tagged = pos_tag(word_tokenize(sentence2))
-
-	# Get the synsets for the tagged words
-	synsets1 = [tagged_to_synset(*tagged_word) for tagged_word in sentence1_tagged]
-	synsets2 = [tagged_to_synset(*tagged_word) for tagged_word in sentence2_tagged]
+	sentence1_tagged = tag_sentence(sentence1)
+	sentence2_tagged = tag_sentence(sentence2)
 
-	# Filter out the Nones
-	synsets1 = [ss for ss in synsets1 if ss]
-	synsets2 = [ss for ss in synsets2 if ss]
+	# Get the synsets for the tagged words, and filter out the Nones
+	synsets1 = tagged_to_synsets(sentence1_tagged)
+	synsets2 = tagged_to_synsets(sentence2_tagged)
 
 	score, count = 0.0, 0
 
@@ -88,8 +114,8 @@ def sentence_similarity(sentence1, sentence2):
 
 	# If the number of synset's is small, no confidence in similarity
 	if count <= 3:
-		sentence1_set = set([i.lower() for i in word_tokenize(sentence1)])
-		sentence2_set = set([i.lower() for i in word_tokenize(sentence2)])
+		sentence1_set = set([word.lower() for word, tag in sentence1_tagged])
+		sentence2_set = set([word.lower() for word, tag in sentence2_tagged])
 		jaccard = len(sentence1_set.intersection(sentence2_set)) / float(len(sentence1_set.union(sentence2_set)))
 		score = jaccard
 	#return max(score, jaccard)
@@ -119,6 +145,111 @@ def max_in_corpus(sentence, corpus):
 	return (max_ind, max_val)
 
 
+def directed_similarity(best_scores, sentence1_set, sentence2_set):
+	"""
+	The end of sentence_similarity: average the similarity of each synset of the first sentence to the most similar synset
+	of the second one, or use the Jaccard index of their (lower case) tokens if there are too few of them
+	:param best_scores: list of floats, 0 where no similarity could be computed
+	:param sentence1_set: set of strings
+	:param sentence2_set: set of strings
+	:return: float between 0 and 1
+	"""
+	score, count = 0.0, 0
+	for best_score in best_scores:
+		if best_score > 0:
+			score += best_score
+			count += 1
+	if count != 0:
+		score /= count
+	else:
+		score = 0.0
+	if count <= 3:
+		score = len(sentence1_set.intersection(sentence2_set)) / float(len(sentence1_set.union(sentence2_set)))
+	return score
+
+
+class SentenceIndex:
+	"""
+	The tagged synsets and tokens of every sentence of a list of corpora, so that a sentence can be compared with all of
+	them (giving the same values as max_in_corpus) without tokenizing, tagging and looking up the corpus sentences again.
+	The path similarities of a synset to all of the distinct synsets of the index are computed once, as a row of a
+	matrix, and kept for the next sentences that have it.
+	"""
+	def __init__(self, corpus_list, max_cached_rows=4096):
+		"""
+		:param corpus_list: list of list of strings
+		:param max_cached_rows: the number of synsets whose similarity rows are kept
+		"""
+		self.corpus_sizes = [len(corpus) for corpus in corpus_list]
+		self.synsets = []  # the distinct synsets of the corpus sentences, one per column
+		synset_to_column = dict()
+		self.sentence_columns = []  # the column of each synset of each corpus sentence, in order and with repeats
+		self.sentence_sets = []  # the lower case tokens of each corpus sentence
+		for corpus in corpus_list:
+			for sentence in corpus:
+				sentence_tagged = tag_sentence(sentence)
+				columns = []
+				for synset in tagged_to_synsets(sentence_tagged):
+					if synset not in synset_to_column:
+						synset_to_column[synset] = len(self.synsets)
+						self.synsets.append(synset)
+					columns.append(synset_to_column[synset])
+				self.sentence_columns.append(np.array(columns, dtype=int))
+				self.sentence_sets.append(set([word.lower() for word, tag in sentence_tagged]))
+		self.similarity_row = functools.lru_cache(maxsize=max_cached_rows)(self._similarity_row)
+
+	def _similarity_row(self, synset):
+		# path_similarity is symmetric, so this is also the similarity of each synset of the index to this one
+		return np.array([synset.path_similarity(other) or 0.0 for other in self.synsets], dtype=float)
+
+	def similarities(self, sentence):
+		"""
+		Compute the symmetric_sentence_similarity of a sentence and every sentence of the index
+		:param sentence: input string
+		:return: list of floats, in the order of the corpus sentences
+		"""
+		sentence_tagged = tag_sentence(sentence)
+		sentence_set = set([word.lower() for word, tag in sentence_tagged])
+		synsets = tagged_to_synsets(sentence_tagged)
+		matrix = np.array([self.similarity_row(synset) for synset in synsets]).reshape(len(synsets), len(self.synsets))
+		values = []
+		for columns, corpus_sentence_set in zip(self.sentence_columns, self.sentence_sets):
+			sentence_matrix = matrix[:, columns]
+			# the best score of each synset of one sentence among the synsets of the other, in both directions
+			best_scores = sentence_matrix.max(axis=1) if len(columns) > 0 else np.zeros(len(synsets))
+			corpus_best_scores = sentence_matrix.max(axis=0) if len(synsets) > 0 else np.zeros(len(columns))
+			values.append((directed_similarity(best_scores.tolist(), sentence_set, corpus_sentence_set) +
+						   directed_similarity(corpus_best_scores.tolist(), corpus_sentence_set, sentence_set)) / 2)
+		return values
+
+	def max_in_corpora(self, sentence):
+		"""
+		Find the most similar sentence of each corpus, as max_in_corpus does
+		:param sentence: input string
+		:return: list of tuples (index of the most similar sentence in the corpus, its similarity), one per corpus
+		"""
+		values = self.similarities(sentence)
+		results = []
+		start = 0
+		for corpus_size in self.corpus_sizes:
+			corpus_values = values[start:start + corpus_size]
+			max_ind = max(range(corpus_size), key=corpus_values.__getitem__)  # the first one, if there are ties
+			results.append((max_ind, corpus_values[max_ind]))
+			start += corpus_size
+		return results
+
+	def top_k(self, sentence, k):
+		"""
+		Find the k corpora with the most similar sentences to the input sentence
+		:param sentence: input string
+		:param k: int
+		:return: list of tuples (index of the corpus, similarity of its most similar sentence), from the most similar
+		corpus, with ties in the order of the corpora
+		"""
+		maxima = [val for ind, val in self.max_in_corpora(sentence)]
+		return [(i, maxima[i]) for i in heapq.nlargest(k, range(len(maxima)), key=maxima.__getitem__)]
+
+
 def find_corpus(sentence, corpus_list):
 	"""
 	From a list of corpora (a corpus is a list of example questions), find the one that gives the largest
@@ -0,0 +1,81 @@
+# This script times the template matching step of ParseQuestion.parse_question on the questions of QuestionExamples.tsv:
+# comparing each question with the corpora of Questions.tsv by calling WordnetDistance.max_in_corpus for every template
+# (as parse_question used to), against the top-k search of a WordnetDistance.SentenceIndex of all the corpora (as it does
+# now), and checks that both give the same top matches. It only needs NLTK and its wordnet, punkt and
+# averaged_perceptron_tagger data (not Neo4j, since it doesn't import ParseQuestion).
+# Usage: python benchmark_parse_question.py [--top_k 5] [--repeats 2]
+
+import os
+import argparse
+import statistics
+import timeit
+import WordnetDistance as wd
+from QuestionExamples import QuestionExamples
+
+
+def read_templates():
+	"""
+	Read the query type id and corpus of each question template in Questions.tsv, as Question.Question does
+	:return: list of (query type id, list of strings) tuples
+	"""
+	templates = []
+	with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Questions.tsv'), 'r') as fid:
+		for line in fid.readlines():
+			if line[0] != "#":
+				row_split = line.strip().split("\t")
+				templates.append((row_split[0], eval(row_split[2])))
+	return templates
+
+
+def top_k_by_max_in_corpus(question, corpora, k):
+	wd_distances = [wd.max_in_corpus(question, corpus)[1] for corpus in corpora]
+	sorted_indicies = [x for _, x in sorted(zip(wd_distances, range(len(corpora))), key=lambda pair: pair[0], reverse=True)]
+	return [(ind, wd_distances[ind]) for ind in sorted_indicies[0:k]]
+
+
+def main():
+	parser = argparse.ArgumentParser(description="Benchmarks the matching of questions to the Questions.tsv templates")
+	parser.add_argument("--top_k", type=int, default=5)
+	parser.add_argument("--repeats", type=int, default=2, help="The number of times the indexed search goes through all of the questions")
+	args = parser.parse_args()
+
+	templates = read_templates()
+	corpora = [corpus for query_type_id, corpus in templates]
+	questions = [(example["query_type_id"], example["question_text"].replace("?", "")) for example in QuestionExamples().questions]
+	print("%d templates (%d corpus sentences), %d example questions" % (len(corpora), sum(len(corpus) for corpus in corpora), len(questions)))
+
+	wd.get_tagger()  # load the tagger and the wordnet corpus before timing anything
+	wd.tagged_to_synset("protein", "NN")
+	t0 = timeit.default_timer()
+	index = wd.SentenceIndex(corpora)
+	print("SentenceIndex built in %.2f s, %d distinct synsets" % (timeit.default_timer() - t0, len(index.synsets)))
+
+	latencies = {"max_in_corpus": [], "SentenceIndex": []}
+	top_matches = {"max_in_corpus": [], "SentenceIndex": []}
+	for query_type_id, question in questions:
+		t0 = timeit.default_timer()
+		top_matches["max_in_corpus"].append(top_k_by_max_in_corpus(question, corpora, args.top_k))
+		latencies["max_in_corpus"].append(timeit.default_timer() - t0)
+	for repeat in range(args.repeats):
+		# the first pass computes the similarity rows of the question synsets, the next ones reuse them
+		for query_type_id, question in questions:
+			t0 = timeit.default_timer()
+			matches = index.top_k(question, args.top_k)
+			latencies["SentenceIndex"].append(timeit.default_timer() - t0)
+			if repeat == 0:
+				top_matches["SentenceIndex"].append(matches)
+
+	num_questions = len(questions)
+	for name in ("max_in_corpus", "SentenceIndex"):
+		for repeat in range(len(latencies[name]) // num_questions):
+			these_latencies = latencies[name][repeat * num_questions:(repeat + 1) * num_questions]
+			num_correct = sum(1 for (query_type_id, question), matches in zip(questions, top_matches[name]) if templates[matches[0][0]][0] == query_type_id)
+			print("%s (pass %d): mean %.1f ms, median %.1f ms, max %.1f ms per question; best template is the expected one for %d/%d questions" % (
+				name, repeat + 1, 1000 * statistics.mean(these_latencies), 1000 * statistics.median(these_latencies),
+				1000 * max(these_latencies), num_correct, num_questions))
+	num_different = sum(1 for old, new in zip(top_matches["max_in_corpus"], top_matches["SentenceIndex"]) if old != new)
+	print("questions with different top %d matches: %d" % (args.top_k, num_different))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,117 @@
+# Usage: pytest -v test_WordnetDistance.py
+# Checks SentenceIndex against max_in_corpus and the sort ParseQuestion used, with a stand-in tokenizer, tagger and
+# WordNet (so that the NLTK data is not needed)
+import re
+import zlib
+
+import pytest
+
+import WordnetDistance as wd
+
+
+def stable_hash(text):
+	return zlib.crc32(text.encode())
+
+
+class FakeSynset:
+	def __init__(self, name):
+		self.name = name
+
+	def path_similarity(self, other):
+		# symmetric, and sometimes None or 0.0 as with real synsets
+		if self.name == other.name:
+			return 1.0
+		distance = (stable_hash(self.name) ^ stable_hash(other.name)) % 11
+		if distance == 0:
+			return None
+		if distance == 1:
+			return 0.0
+		return 1.0 / (distance + 1)
+
+
+class FakeWordNet:
+	def __init__(self):
+		self.synsets_by_name = dict()
+
+	def synset(self, name):
+		if name not in self.synsets_by_name:
+			self.synsets_by_name[name] = FakeSynset(name)
+		return self.synsets_by_name[name]
+
+	def synsets(self, word, pos=None):
+		word = word.lower()
+		# short words and some others have no synsets, and some words have none for their part of speech
+		if len(word) <= 2 or stable_hash(word) % 5 == 0:
+			return []
+		if pos is not None and stable_hash(word + pos) % 3 == 0:
+			return []
+		return [self.synset(word + '.' + (pos or 'x')), self.synset(word + '.z')]
+
+
+class FakeTagger:
+	def tag(self, tokens):
+		return [(token, ['NN', 'VB', 'JJ', 'RB', 'DT'][stable_hash(token) % 5]) for token in tokens]
+
+
+CORPORA = [
+	["What is an", "What is a", "what is"],
+	["what genetic conditions might offer protection against", "what genetic conditions protect against",
+	 "what genetic diseases might protect against", "what genetic conditions offer protection against"],
+	["what is the clinical outcome pathway of for the treatment", "what is the COP for the treatment of"],
+	["What proteins are the target of", "what proteins are targeted by", "what proteins are in the pathway",
+	 "what are the phenotypes of the disease", "what proteins are expressed in", "what proteins are expressed in",
+	 "what proteins interact with"],
+	["what is"],
+	["zz qq", "xx"],
+]
+
+QUESTIONS = [
+	"what are the protein physically_interacts_with of ibuprofen",
+	"What is the COP for the treatment of high blood pressure with tranilast",
+	"What genetic conditions protect against spastic ataxia",
+	"what is",
+	"What is a dog",
+	"CHEMBL154",
+	"what proteins are four score and seven years ago, our fathers",
+	"",
+]
+
+
+@pytest.fixture
+def fake_nltk(monkeypatch):
+	monkeypatch.setattr(wd, 'word_tokenize', lambda sentence: re.findall(r"\w+|[^\w\s]", sentence))
+	monkeypatch.setattr(wd, 'get_tagger', lambda: FakeTagger())
+	monkeypatch.setattr(wd, 'wn', FakeWordNet())
+	wd.tagged_to_synset.cache_clear()
+	yield
+	wd.tagged_to_synset.cache_clear()
+
+
+def old_top_k(sentence, corpus_list, k):
+	# how ParseQuestion ranked the corpora before SentenceIndex
+	dist = [wd.max_in_corpus(sentence, corpus)[1] for corpus in corpus_list]
+	corpus_ind = [x for _, x in sorted(zip(dist, range(len(dist))), key=lambda pair: pair[0], reverse=True)][:k]
+	return [(i, dist[i]) for i in corpus_ind]
+
+
+@pytest.mark.parametrize("question", QUESTIONS)
+def test_max_in_corpora(fake_nltk, question):
+	index = wd.SentenceIndex(CORPORA)
+	assert index.max_in_corpora(question) == [wd.max_in_corpus(question, corpus) for corpus in CORPORA]
+
+
+@pytest.mark.parametrize("question", QUESTIONS)
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_top_k(fake_nltk, question, k):
+	index = wd.SentenceIndex(CORPORA)
+	assert index.top_k(question, k) == old_top_k(question, CORPORA, k)
+
+
+def test_similarities(fake_nltk):
+	# the similarity rows are cached, so asking again (and after the cache is full) gives the same values
+	index = wd.SentenceIndex(CORPORA, max_cached_rows=2)
+	sentences = [sentence for corpus in CORPORA for sentence in corpus]
+	for question in QUESTIONS + QUESTIONS:
+		values = index.similarities(question)
+		assert values == [wd.symmetric_sentence_similarity(question, sentence) for sentence in sentences]
+	assert len(index.synsets) == len(set(index.synsets))